@@ -9,7 +9,8 @@ from sqlalchemy.orm import Session
 from app.core.database import get_db
 from app.core.security import decode_access_token
 # Use auth_models for SQLite compatibility (no Face model with ARRAY type)
-from app.models.auth_models import User, Role, Permission
+from app.models.auth_models import User
+from app.services.auth_cache import get_auth_cache
 
 # HTTP Bearer security scheme
 security = HTTPBearer()
@@ -36,6 +37,8 @@ async def get_current_user(
     
     Raises:
         HTTPException: 401 if token invalid, user not found, or user inactive
+    
+    User + permissions come from the auth cache (no SELECT on a cache hit).
     """
     token = credentials.credentials
     
@@ -50,23 +53,23 @@ async def get_current_user(
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    # Get user from database
-    user = db.query(User).filter(User.id == user_id).first()
+    # Get user from auth cache (database on miss)
+    principal = get_auth_cache().get_principal(db, user_id)
     
-    if user is None:
+    if principal is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="User not found",
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    if not user.is_active:
+    if not principal.is_active:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Inactive user"
         )
     
-    return user
+    return principal.attach(db)
 
 
 async def get_current_user_optional(
@@ -112,13 +115,13 @@ async def get_current_user_optional(
         if user_id is None:
             return None
         
-        # Get user from database
-        user = db.query(User).filter(User.id == user_id).first()
+        # Get user from auth cache (database on miss)
+        principal = get_auth_cache().get_principal(db, user_id)
         
-        if user is None or not user.is_active:
+        if principal is None or not principal.is_active:
             return None
         
-        return user
+        return principal.attach(db)
     
     except Exception:
         # Any error → return None (demo mode)
@@ -198,14 +201,16 @@ def require_roles(allowed_roles: List[str]):
             return {"message": "Admin area"}
     """
     async def check_roles(
-        current_user: User = Depends(get_current_user)
+        current_user: User = Depends(get_current_user),
+        db: Session = Depends(get_db)
     ) -> User:
         # Superuser has access to everything
         if current_user.is_superuser:
             return current_user
         
-        # Get user's role names
-        user_roles = [role.name for role in current_user.roles]
+        # Get user's role names (cached with the user)
+        principal = get_auth_cache().get_principal(db, current_user.id)
+        user_roles = principal.role_names if principal else frozenset()
         
         # Check if user has any of the allowed roles
         if not any(role in user_roles for role in allowed_roles):
@@ -257,21 +262,10 @@ def require_permission(resource: str, action: str):
         if current_user.is_superuser:
             return current_user
         
-        # Check if user has required permission through any of their roles
-        has_permission = False
+        # Permission set of all the user's roles, precomputed in the auth cache
+        principal = get_auth_cache().get_principal(db, current_user.id)
         
-        for role in current_user.roles:
-            permission = db.query(Permission).filter(
-                Permission.role_id == role.id,
-                Permission.resource == resource,
-                Permission.action == action
-            ).first()
-            
-            if permission:
-                has_permission = True
-                break
-        
-        if not has_permission:
+        if principal is None or not principal.has_permission(resource, action):
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail=f"Access denied. Requires permission: {action} on {resource}"
@@ -312,16 +306,11 @@ def require_any_permission(permissions: List[tuple]):
             return current_user
         
         # Check if user has any of the required permissions
-        for resource, action in permissions:
-            for role in current_user.roles:
-                permission = db.query(Permission).filter(
-                    Permission.role_id == role.id,
-                    Permission.resource == resource,
-                    Permission.action == action
-                ).first()
-                
-                if permission:
-                    return current_user
+        principal = get_auth_cache().get_principal(db, current_user.id)
+        if principal is not None and any(
+            principal.has_permission(resource, action) for resource, action in permissions
+        ):
+            return current_user
         
         # No permission found
         perm_strings = [f"{res}:{act}" for res, act in permissions]
@@ -294,9 +294,8 @@ async def test_api_key(key_id: int, db: Session = Depends(get_db)):
     
     try:
         if key.provider == "gemini":
-            import google.generativeai as genai
-            genai.configure(api_key=key.api_key)
-            model = genai.GenerativeModel("gemini-2.5-flash")
+            from app.services.gemini_client import get_gemini_client
+            model = get_gemini_client(key.api_key).model("gemini-2.5-flash")
             response = model.generate_content("Say 'OK' if you can read this.")
             result["status"] = "valid"
             result["response"] = response.text[:50]
@@ -33,6 +33,7 @@ from app.api.dependencies import (
     get_current_active_user
 )
 from app.services.activity_logger import log_auth_action
+from app.services.auth_cache import get_auth_cache
 
 router = APIRouter()
 
@@ -304,6 +305,7 @@ async def update_profile(
         current_user.address = profile_data.address
     
     db.commit()
+    get_auth_cache().invalidate_user(current_user.id)
     db.refresh(current_user)
     
     return UserResponse(
@@ -394,6 +396,7 @@ async def change_password(
     # Update password
     current_user.hashed_password = get_password_hash(password_data.new_password)
     db.commit()
+    get_auth_cache().invalidate_user(current_user.id)
     
     return PasswordChangeResponse(
         success=True,
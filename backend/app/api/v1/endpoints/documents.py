@@ -4,9 +4,10 @@ Modern Document Conversion API Endpoints (2025)
 
 from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Query, Depends, Header
 from fastapi.responses import FileResponse, StreamingResponse, Response
-from typing import List, Optional
+from typing import AsyncIterator, Callable, List, Optional
 from pathlib import Path
 from urllib.parse import quote
+from dataclasses import dataclass
 from datetime import datetime
 import zipfile
 import io
@@ -14,11 +15,22 @@ import asyncio
 import aiofiles
 import logging
 import time
+import json
 from sqlalchemy.orm import Session
-from app.core.database import get_db
+from app.core.database import get_db, SessionLocal
 
 from app.services.document_service import DocumentService
 from app.services.quota_service import QuotaService
+from app.services.batch_executor import BatchItemResult, get_batch_executor, summarize_results
+from app.services.zip_stream import ZipStreamWriter
+from app.services.provider_executor import run_blocking
+from app.services.pdf_pipeline import parse_pipeline
+from app.services.page_workers import IMAGE_FORMATS, count_pages, iter_page_images, render_page
+from app.services.page_preview import (
+    etag_matches, get_page_preview, normalize_preview_params, page_preview_etag, preview_headers,
+    register_preview_document
+)
+from app.services.result_cache import MISS_HEADERS, MISS_INFO, lookup_bytes, lookup_hash, store_bytes, store_file, store_json
 from app.api.dependencies import get_current_user, get_current_user_optional
 from app.models.auth_models import User
 from pathlib import Path
@@ -76,6 +88,24 @@ def encode_filename(filename: str) -> str:
     return quote(filename)
 
 
+def _technology_headers(response: Response) -> dict:
+    """X-Technology-* headers (lưu kèm result cache để trả lại khi cache hit)"""
+    return {k: v for k, v in response.headers.items() if k.lower().startswith("x-technology")}
+
+
+def _ai_usage_cost(provider: str, ai_usage: dict) -> float:
+    """Ước tính chi phí USD của 1 lần gọi AI (để báo số tiền tiết kiệm khi cache hit)"""
+    input_tokens = ai_usage.get("input_tokens", 0) or 0
+    output_tokens = ai_usage.get("output_tokens", 0) or 0
+    if provider == "claude":
+        # Claude Sonnet 4 pricing
+        pricing = {"input": 3.00, "output": 15.00}
+    else:
+        from app.services.document_service import GEMINI_MODELS
+        pricing = GEMINI_MODELS.get(ai_usage.get("model"), {}).get("pricing", {"input": 0.30, "output": 2.50})
+    return (input_tokens / 1_000_000 * pricing["input"]) + (output_tokens / 1_000_000 * pricing["output"])
+
+
 @router.get("/gemini/models")
 async def get_gemini_models():
     """
@@ -153,8 +183,20 @@ async def convert_word_to_pdf(
     logger.info(f"📥 Received Word file: {file.filename} (content_type: {file.content_type})")
     
     # Save uploaded file
-    input_path = await doc_service.save_upload_file(file)
-    logger.info(f"💾 Saved to: {input_path} (size: {input_path.stat().st_size} bytes)")
+    upload = await doc_service.ingest_upload(file)
+    input_path = upload.path
+    logger.info(f"💾 Saved to: {input_path} (size: {upload.size} bytes, type: {upload.mime_type})")
+    
+    # ♻️ File đã convert trước đó → trả kết quả cache, không gọi Gotenberg
+    cache_key, cache_hit = await lookup_hash(upload.sha256, "word_to_pdf", engine="gotenberg")
+    if cache_hit:
+        await doc_service.cleanup_file(input_path)
+        return FileResponse(
+            path=cache_hit.path,
+            media_type="application/pdf",
+            filename=Path(file.filename).stem + ".pdf",
+            headers=cache_hit.response_headers()
+        )
     
     try:
         # Convert
@@ -189,6 +231,9 @@ async def convert_word_to_pdf(
         response.headers["X-Technology-Quality"] = "8/10"
         response.headers["X-Technology-Type"] = "local"
         
+        await store_file(cache_key, output_path, operation="word_to_pdf", headers=_technology_headers(response))
+        response.headers.update(MISS_HEADERS)
+        
         logger.info(f"📤 Sending PDF response: {output_path.name}")
         return response
         
@@ -329,7 +374,30 @@ async def convert_pdf_to_word(
     logger.info("="*80)
     logger.info("")
     
-    input_path = await doc_service.save_upload_file(file)
+    upload = await doc_service.ingest_upload(file)
+    input_path = upload.path
+    
+    # ♻️ Cùng file + cùng tham số → trả kết quả cache (không tốn Adobe transaction / Gemini tokens)
+    cache_key, cache_hit = await lookup_hash(
+        upload.sha256,
+        "pdf_to_word",
+        start_page=start_page,
+        end_page=end_page,
+        enable_ocr=enable_ocr,
+        ocr_language=ocr_language,
+        auto_detect_scanned=auto_detect_scanned,
+        gemini_model=(gemini_model or doc_service.gemini_model_name) if use_gemini else None,
+        adobe=bool(doc_service.use_adobe and doc_service.adobe_credentials)
+    )
+    if cache_hit:
+        logger.info(f"♻️ Cache HIT - skipping conversion for {file.filename}")
+        await doc_service.cleanup_file(input_path)
+        return FileResponse(
+            path=cache_hit.path,
+            media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+            filename=Path(file.filename).stem + ".docx",
+            headers=cache_hit.response_headers()
+        )
     
     try:
         # Track which technology was used
@@ -340,7 +408,7 @@ async def convert_pdf_to_word(
         logger.info("📞 Calling doc_service.pdf_to_word()...")
         
         # Convert (priority: Gemini > Adobe > pdf2docx)
-        output_path = await doc_service.pdf_to_word(
+        conversion = await doc_service.pdf_to_word_result(
             input_path,
             start_page=start_page,
             end_page=end_page,
@@ -351,6 +419,7 @@ async def convert_pdf_to_word(
             gemini_model=gemini_model,
             db=db
         )
+        output_path = conversion.path
         
         logger.info("")
         logger.info(f"📨 Returned from pdf_to_word(): {output_path}")
@@ -358,19 +427,16 @@ async def convert_pdf_to_word(
         logger.info(f"   Output size: {output_path.stat().st_size if output_path.exists() else 0} bytes")
         logger.info("")
         
-        # Check which technology was actually used
-        if use_gemini and doc_service.use_gemini:
+        # Technology thực sự đã tạo file (Gemini/Adobe lỗi → engine dự phòng)
+        if conversion.engine == "gemini":
             used_gemini = True
             # Get actual model name used
             actual_model = gemini_model or doc_service.gemini_model_name
             logger.info(f"✅ Technology used: GEMINI ({actual_model})")
-        elif doc_service.use_adobe and doc_service.adobe_credentials:
+        elif conversion.engine in ("adobe", "hybrid"):
             used_adobe = True
-            # Check if OCR was enabled (either manually or auto-detected)
-            from app.services.document_service import is_pdf_scanned
-            if enable_ocr or (auto_detect_scanned and is_pdf_scanned(input_path)):
-                used_ocr = True
-            logger.info(f"✅ Technology used: ADOBE (OCR: {used_ocr})")
+            used_ocr = conversion.ocr
+            logger.info(f"✅ Technology used: ADOBE (OCR: {used_ocr}, engine: {conversion.engine})")
         else:
             logger.warning("⚠️  Technology used: UNKNOWN or pdf2docx")
         
@@ -421,6 +487,20 @@ async def convert_pdf_to_word(
             response.headers["X-Technology-Type"] = "local"
             response.headers["X-Technology-OCR"] = "false"
         
+        # Key theo engine được YÊU CẦU → chỉ cache khi không có fallback
+        # (file dự phòng lưu dưới key Gemini sẽ bị trả lại kèm header Gemini)
+        if conversion.fallback:
+            logger.warning(f"⚠️ Fell back to {conversion.engine} - result not cached")
+        else:
+            await store_file(
+                cache_key,
+                output_path,
+                operation="pdf_to_word",
+                adobe_transactions=1 if used_adobe else 0,
+                headers=_technology_headers(response)
+            )
+        response.headers.update(MISS_HEADERS)
+        
         logger.info("="*80)
         logger.info("✅ API RESPONSE: 200 OK")
         logger.info(f"   Technology: {response.headers.get('X-Technology-Engine', 'unknown')}")
@@ -486,7 +566,7 @@ async def convert_pdf_to_word_adobe_only(
     
     try:
         output_filename = input_path.stem + ".docx"
-        output_path = doc_service.output_dir / output_filename
+        output_path = doc_service.new_output_path(output_filename)
         
         logger.info("📞 Calling _pdf_to_word_adobe() directly (no fallback)...")
         logger.info("")
@@ -594,7 +674,7 @@ async def convert_pdf_to_word_pdf2docx_only(
     
     try:
         output_filename = input_path.stem + ".docx"
-        output_path = doc_service.output_dir / output_filename
+        output_path = doc_service.new_output_path(output_filename)
         
         logger.info("🔄 Starting pdf2docx conversion...")
         logger.info(f"   Input: {input_path}")
@@ -669,6 +749,7 @@ async def convert_pdf_to_word_pdf2docx_only(
 @router.post("/convert/pdf-to-excel")
 async def convert_pdf_to_excel(
     file: UploadFile = File(..., description="PDF file with tables"),
+    output_format: str = Form("xlsx", description="xlsx, csv hoặc parquet (csv/parquet: ZIP, mỗi bảng 1 file)"),
 ):
     """
     Convert PDF to Excel (.xlsx)
@@ -677,18 +758,24 @@ async def convert_pdf_to_excel(
     - Creates separate sheets for each page with tables
     - Auto-formats with headers, column widths
     - Falls back to text extraction if no tables found
+    - **output_format**: csv / parquet → ZIP với mỗi bảng 1 file (page_3_table_1.csv)
+    - Các trang được trích song song trên process pool, ghi dần (RAM không tăng theo số trang)
     """
     # Save uploaded file
     input_path = await doc_service.save_upload_file(file)
     
     try:
         # Convert
-        output_path = await doc_service.pdf_to_excel(input_path)
+        output_path = await doc_service.pdf_to_excel(input_path, output_format=output_format)
         
         # Return file with technology metadata
+        media_type = (
+            "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+            if output_path.suffix == ".xlsx" else "application/zip"
+        )
         response = FileResponse(
             path=output_path,
-            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            media_type=media_type,
             filename=output_path.name
         )
         
@@ -773,7 +860,7 @@ async def convert_pdf_to_word_hybrid_vietnamese(
         # Convert using hybrid approach
         output_path = await doc_service._pdf_to_word_hybrid_vietnamese(
             input_path,
-            doc_service.output_dir / f"hybrid_{file.filename.rsplit('.', 1)[0]}.docx",
+            doc_service.new_output_path(f"hybrid_{file.filename.rsplit('.', 1)[0]}.docx"),
             db=db
         )
         
@@ -1052,6 +1139,7 @@ async def get_powerpoint_info(
 async def compress_pdf(
     file: UploadFile = File(..., description="PDF file to compress"),
     quality: str = Form("medium", description="Compression quality: low, medium, high"),
+    target_size_kb: Optional[int] = Form(None, ge=1, description="Dung lượng mong muốn (KB) - nén ảnh tới khi đạt (engine local)"),
 ):
     """
     📦 Compress PDF file to reduce size - HYBRID (Adobe AI or pypdf)
@@ -1072,6 +1160,10 @@ async def compress_pdf(
     - Falls back to pypdf if Adobe unavailable
     - Returns which technology was used in headers
     
+    **Local engine (pypdf):** ảnh nhúng được downsample (high 200 / medium 150 /
+    low 110 DPI) và nén lại JPEG; scan đen trắng → CCITT G4; ảnh trùng chỉ giữ 1 bản.
+    `target_size_kb`: thử các mức nén tăng dần tới khi đạt dung lượng (luôn dùng local).
+    
     **Headers:**
     - `X-Technology-Engine`: adobe or pypdf
     - `X-Technology-Quality`: 10/10 or 7/10
@@ -1084,7 +1176,9 @@ async def compress_pdf(
         original_size = input_path.stat().st_size
         
         # Compress (returns tuple: output_path, technology_used)
-        output_path, technology = await doc_service.compress_pdf(input_path, quality)
+        output_path, technology = await doc_service.compress_pdf(
+            input_path, quality, target_size_kb=target_size_kb
+        )
         
         # Get compressed size
         compressed_size = output_path.stat().st_size
@@ -1366,9 +1460,11 @@ async def smart_pdf_ocr(
     **⚠️ REQUIRES AUTHENTICATION + AI QUOTA**
     
     **Smart Detection:**
-    - Automatically detects if PDF is scanned (image-based)
+    - Classifies EVERY page (text layer vs scanned image)
     - Uses direct text extraction for text-based PDFs (fast & free, no quota)
-    - Uses AI OCR (Gemini/Claude) only for scanned PDFs (uses quota)
+    - Uses AI OCR (Gemini/Claude) only for scanned pages (uses quota)
+    - Mixed PDFs (text body + scanned appendix/signature pages): only the
+      scanned pages are sent to AI, results merged in page order
     
     **AI Engines:**
     - `gemini`: Fast & cost-effective (~$0.000031/page)
@@ -1392,12 +1488,26 @@ async def smart_pdf_ocr(
         raise HTTPException(400, "File must be a PDF")
     
     # Save uploaded file
-    input_path = await doc_service.save_upload_file(file)
+    upload = await doc_service.ingest_upload(file)
+    input_path = upload.path
+    
+    # ♻️ Cache hit → không gọi AI, không trừ quota
+    cache_key, cache_hit = await lookup_hash(upload.sha256, "smart_pdf_ocr", ai_engine=ai_engine, language=language)
+    if cache_hit:
+        await doc_service.cleanup_file(input_path)
+        return {
+            "success": True,
+            "filename": file.filename,
+            "quota_used": None,
+            **cache_hit.read_json(),
+            "cache": cache_hit.to_dict()
+        }
     
     try:
-        # ✅ CHECK QUOTA FIRST (only if scanned PDF detected)
-        from app.services.document_service import is_pdf_scanned
-        is_scanned = is_pdf_scanned(input_path)
+        # ✅ CHECK QUOTA FIRST (only if scanned pages detected)
+        from app.services.page_workers import classify_pdf_pages
+        pages = await asyncio.to_thread(classify_pdf_pages, input_path)
+        is_scanned = any(page.scanned for page in pages)
         
         if is_scanned:
             # Check quota trước khi gọi AI
@@ -1410,18 +1520,23 @@ async def smart_pdf_ocr(
                 input_path, 
                 ai_engine=ai_engine,
                 language=language,
-                db=db
+                db=db,
+                pages=pages
             )
             
-            # ✅ COMMIT quota increment (AI call thành công)
-            if is_scanned:
-                db.commit()
+            await store_json(
+                cache_key,
+                result,
+                operation="smart_pdf_ocr",
+                cost_usd=result.get("ai_usage", {}).get("total_cost_usd", 0.0)
+            )
             
             return {
                 "success": True,
                 "filename": file.filename,
                 "quota_used": quota_info if is_scanned else None,
-                **result
+                **result,
+                "cache": MISS_INFO
             }
             
         except Exception as e:
@@ -1676,39 +1791,132 @@ async def html_to_pdf(
 async def pdf_to_images(
     file: UploadFile = File(..., description="PDF file"),
     format: str = Form("png", description="Image format: png or jpg"),
-    dpi: int = Form(200, description="Resolution in DPI (default: 200)"),
+    dpi: int = Form(200, ge=36, le=600, description="Resolution in DPI (36-600, default: 200)"),
+    page: Optional[int] = Form(None, ge=1, description="Chỉ render 1 trang (bắt đầu từ 1) → trả ảnh thay vì ZIP"),
 ):
     """
     Convert PDF pages to images
     
     - **format**: Output image format (png or jpg)
-    - **dpi**: Resolution (higher = better quality, larger file)
+    - **dpi**: Resolution 36-600 (higher = better quality, larger file); trang khổ lớn
+      bị hạ độ phân giải để không vượt PAGE_RENDER_MAX_PIXELS
+    - **page**: Lấy lazy từng trang (header X-Total-Pages cho biết tổng số trang)
     - Returns ZIP file containing all page images
+    
+    Các trang render song song trên page process pool và được ghi thẳng vào
+    ZIP đang stream theo thứ tự trang (không lưu ảnh nào xuống disk).
     """
+    format = format.lower()
+    if format not in IMAGE_FORMATS:
+        raise HTTPException(400, f"Invalid format. Must be one of: {sorted(IMAGE_FORMATS)}")
+    
     input_path = await doc_service.save_upload_file(file)
+    streaming = False
     
     try:
-        output_paths = await doc_service.pdf_to_images(input_path, format, dpi)
+        if input_path.suffix.lower() != ".pdf":
+            raise HTTPException(400, "File must be .pdf")
+        try:
+            total_pages = await asyncio.to_thread(count_pages, input_path)
+        except Exception as e:
+            raise HTTPException(400, f"Invalid PDF: {str(e)}")
         
-        # Create ZIP file
-        import zipfile
-        from pathlib import Path
+        media_type = "image/png" if format == "png" else "image/jpeg"
+        headers = {"X-Total-Pages": str(total_pages)}
         
-        zip_path = doc_service.output_dir / f"{input_path.stem}_images.zip"
+        if page is not None:
+            if page > total_pages:
+                raise HTTPException(400, f"Page {page} out of range (1-{total_pages})")
+            image_bytes = await render_page(input_path, page - 1, dpi, format)
+            headers["Content-Disposition"] = f"attachment; filename=page_{page}.{format}"
+            return Response(content=image_bytes, media_type=media_type, headers=headers)
         
-        with zipfile.ZipFile(zip_path, 'w') as zipf:
-            for img_path in output_paths:
-                zipf.write(img_path, img_path.name)
-                await doc_service.cleanup_file(img_path)
+        # Chờ trang đầu tiên trước khi trả response → lỗi render vẫn trả được HTTP 500
+        pages = iter_page_images(input_path, format, dpi)
+        try:
+            first_page = await pages.__anext__()
+        except StopAsyncIteration:
+            raise HTTPException(400, "PDF has no pages")
+        except Exception as e:
+            await pages.aclose()
+            raise HTTPException(500, f"PDF to images conversion failed: {str(e)}")
         
-        return FileResponse(
-            zip_path,
-            media_type="application/zip",
-            filename=zip_path.name
-        )
+        async def zip_chunks():
+            writer = ZipStreamWriter()
+            try:
+                page_index, image_bytes = first_page
+                while True:
+                    for chunk in writer.write_bytes(f"page_{page_index + 1}.{format}", image_bytes):
+                        yield chunk
+                    try:
+                        page_index, image_bytes = await pages.__anext__()
+                    except StopAsyncIteration:
+                        break
+                yield writer.close()
+                logger.info(f"🖼️ PDF→images: {total_pages} pages streamed ({writer.bytes_written} bytes)")
+            finally:
+                # Client ngắt kết nối giữa chừng → hủy các trang chưa render
+                await pages.aclose()
+                await doc_service.cleanup_file(input_path)
+        
+        zip_name = quote(f"{Path(file.filename or 'document').stem}_images.zip")
+        headers["Content-Disposition"] = f"attachment; filename*=UTF-8''{zip_name}"
+        streaming = True
+        return StreamingResponse(zip_chunks(), media_type="application/zip", headers=headers)
         
     finally:
-        await doc_service.cleanup_file(input_path)
+        if not streaming:
+            await doc_service.cleanup_file(input_path)
+
+
+@router.post("/pdf/preview")
+async def register_pdf_preview(
+    file: UploadFile = File(..., description="PDF file"),
+):
+    """
+    Đăng ký PDF để xem preview từng trang (split, rotate, merge, OCR review)
+    
+    - Upload 1 lần → document_id (SHA-256 nội dung) + kích thước từng trang (points)
+    - Sau đó GET /pdf/preview/{document_id}/pages/{page}?width=240 cho từng thumbnail
+    - Cùng nội dung → cùng document_id (upload lại không render lại trang đã cache)
+    """
+    from app.core.config import settings
+    
+    upload = await doc_service.ingest_upload(file)
+    try:
+        if upload.path.suffix.lower() != ".pdf":
+            raise HTTPException(400, "File must be .pdf")
+        document = await register_preview_document(upload)
+    finally:
+        await doc_service.cleanup_file(upload.path)
+    
+    result = document.to_dict()
+    result["page_url"] = f"{settings.API_PREFIX}/documents/pdf/preview/{document.document_id}/pages/{{page}}"
+    return result
+
+
+@router.get("/pdf/preview/{document_id}/pages/{page}")
+async def get_pdf_page_preview(
+    document_id: str,
+    page: int,
+    width: Optional[int] = Query(None, description="Chiều rộng ảnh (px), mặc định PREVIEW_DEFAULT_WIDTH"),
+    format: str = Query("png", description="Image format: png or jpg"),
+    if_none_match: Optional[str] = Header(None),
+):
+    """
+    Thumbnail / preview 1 trang (page bắt đầu từ 1) theo chiều rộng pixel
+    
+    - Render bằng pypdfium2 trên page process pool, cache trên disk (LRU)
+    - ETag + Cache-Control: browser gửi If-None-Match → 304, không render/đọc lại
+    - 404: document_id chưa đăng ký hoặc đã bị evict → POST /pdf/preview lại
+    """
+    width, format = normalize_preview_params(width, format)
+    etag = page_preview_etag(document_id, page, width, format)
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=preview_headers(etag))
+    
+    preview = await get_page_preview(document_id, page, width, format)
+    return Response(content=preview.content, media_type=preview.media_type, headers=preview.headers())
 
 
 @router.post("/pdf/add-page-numbers")
@@ -1738,6 +1946,49 @@ async def add_page_numbers(
         await doc_service.cleanup_file(input_path)
 
 
+@router.post("/pdf/pipeline")
+async def pdf_pipeline(
+    file: UploadFile = File(..., description="PDF file"),
+    operations: str = Form(..., description='JSON array, VD: [{"op": "watermark", "text": "MẬT"}, {"op": "page_numbers"}, {"op": "compress"}]'),
+):
+    """
+    🧩 Nhiều thao tác PDF trong 1 lần upload (1 lần đọc → biến đổi → ghi)
+
+    **Operations** (chạy theo thứ tự):
+    - `watermark`: text, position (center, top-left, ...), opacity, font_size
+    - `page_numbers`: position (bottom-center, top-right, ...), format ("Trang {page}/{total}"), font_size
+    - `rotate`: rotation (90, 180, 270), pages ([1, 3] hoặc bỏ trống = tất cả)
+    - `compress`: quality (low, medium, high) - nên đặt sau các bước stamp
+    - `protect`: user_password, owner_password - chỉ được là bước cuối
+
+    Thay cho chuỗi /pdf/watermark-text → /pdf/add-page-numbers → /pdf/compress:
+    chỉ 1 lần parse + 1 lần ghi file thay vì N lần.
+    """
+    try:
+        steps = json.loads(operations)
+        operation_list = parse_pipeline(steps)
+    except json.JSONDecodeError as e:
+        raise HTTPException(400, f"Invalid JSON operations: {str(e)}")
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+
+    input_path = await doc_service.save_upload_file(file)
+
+    try:
+        output_path = await doc_service.pdf_pipeline(input_path, operation_list)
+
+        response = FileResponse(
+            output_path,
+            media_type="application/pdf",
+            filename=output_path.name
+        )
+        response.headers["X-Pipeline-Steps"] = ",".join(step["op"] for step in steps)
+        return response
+
+    finally:
+        await doc_service.cleanup_file(input_path)
+
+
 @router.delete("/cleanup")
 async def cleanup_old_files(
     max_age_hours: int = 24
@@ -1756,15 +2007,111 @@ async def cleanup_old_files(
 
 # ==================== BATCH CONVERSION ENDPOINTS ====================
 
+def _batch_errors(results: List[BatchItemResult]) -> List[dict]:
+    """Danh sách lỗi theo format cũ: [{"file": ..., "error": ...}]"""
+    return [{"file": r.filename, "error": r.error} for r in results if not r.ok]
+
+
+async def _batch_zip_response(
+    results: AsyncIterator[BatchItemResult],
+    zip_filename: str,
+    label: str,
+    failure_message: str = "All conversions failed",
+    arcname_for: Callable[[Path], str] = lambda path: path.name,
+    report_name: Optional[str] = None,
+) -> StreamingResponse:
+    """
+    Stream ZIP về client theo thứ tự file convert xong (không build archive trong RAM)
+
+    - Chờ file thành công ĐẦU TIÊN trước khi trả response → nếu tất cả lỗi
+      vẫn trả được HTTP 500 như trước
+    - Mỗi output được ghi vào ZIP rồi xóa khỏi disk ngay
+    - File lỗi được liệt kê trong _batch_errors.json ở cuối archive
+    - report_name: thêm file report (stats + thời gian/lỗi từng item) ở cuối archive
+    """
+    started_at = time.perf_counter()
+    finished: List[BatchItemResult] = []
+    first_ok: Optional[BatchItemResult] = None
+
+    try:
+        async for result in results:
+            finished.append(result)
+            if result.ok:
+                first_ok = result
+                break
+    except BaseException:
+        await results.aclose()
+        raise
+
+    if first_ok is None:
+        raise HTTPException(500, f"{failure_message}. Errors: {_batch_errors(finished)}")
+
+    async def zip_chunks():
+        writer = ZipStreamWriter()
+        pending = [first_ok]
+        try:
+            while True:
+                for result in pending:
+                    for output_path in result.outputs:
+                        async for chunk in writer.write_file_async(output_path, arcname_for(output_path)):
+                            yield chunk
+                        await doc_service.cleanup_file(output_path)
+                try:
+                    result = await results.__anext__()
+                except StopAsyncIteration:
+                    break
+                finished.append(result)
+                pending = [result] if result.ok else []
+
+            errors = _batch_errors(finished)
+            if errors:
+                logger.warning(f"[{label}] ⚠ Completed with {len(errors)} errors: {errors}")
+                report = json.dumps(errors, ensure_ascii=False, indent=2).encode("utf-8")
+                for chunk in writer.write_bytes("_batch_errors.json", report):
+                    yield chunk
+
+            stats = summarize_results(finished, time.perf_counter() - started_at)
+            if report_name:
+                report = json.dumps(
+                    {"stats": stats, "items": [r.to_dict() for r in sorted(finished, key=lambda r: r.index)]},
+                    ensure_ascii=False, indent=2
+                ).encode("utf-8")
+                for chunk in writer.write_bytes(report_name, report):
+                    yield chunk
+
+            yield writer.close()
+
+            logger.info(f"[{label}] ✓ ZIP streamed! Size: {writer.bytes_written} bytes, stats: {stats}")
+        finally:
+            # Client ngắt kết nối giữa chừng → cancel các item còn đang chạy
+            await results.aclose()
+
+    return StreamingResponse(
+        zip_chunks(),
+        media_type="application/zip",
+        headers={"Content-Disposition": f"attachment; filename={zip_filename}"}
+    )
+
+
+async def _pdf_to_word_own_session(input_path: Path) -> Path:
+    """pdf_to_word với DB session riêng (chạy trên thread của batch executor)"""
+    db = SessionLocal()
+    try:
+        return await doc_service.pdf_to_word(input_path, db=db)
+    finally:
+        db.close()
+
+
 @router.post("/batch/word-to-pdf")
 async def batch_convert_word_to_pdf(
     files: List[UploadFile] = File(..., description="Multiple Word files"),
+    max_concurrency: Optional[int] = Query(None, ge=1, description="Số file xử lý song song (tối đa BATCH_MAX_CONCURRENCY)"),
 ):
     """
     **Batch Convert** nhiều file Word sang PDF cùng lúc
     
     - Upload nhiều file .docx, .doc
-    - Tự động convert tất cả
+    - Tự động convert tất cả (song song qua Gotenberg)
     - Download kết quả dưới dạng ZIP
     
     **Use case:**
@@ -1774,92 +2121,34 @@ async def batch_convert_word_to_pdf(
     if not files or len(files) == 0:
         raise HTTPException(400, "No files uploaded")
     
-    output_files = []
-    errors = []
+    async def convert_one(file: UploadFile) -> Path:
+        input_path = await doc_service.save_upload_file(file)
+        try:
+            return await doc_service.word_to_pdf(input_path)
+        finally:
+            await doc_service.cleanup_file(input_path)
     
     try:
-        # Process each file
-        for idx, file in enumerate(files, 1):
-            try:
-                print(f"[Batch Word→PDF] Processing file {idx}/{len(files)}: {file.filename}")
-                input_path = await doc_service.save_upload_file(file)
-                output_path = await doc_service.word_to_pdf(input_path)
-                output_files.append(output_path)
-                await doc_service.cleanup_file(input_path)
-                print(f"[Batch Word→PDF] ✓ Success: {file.filename} → {output_path.name}")
-            except Exception as e:
-                error_msg = str(e)
-                print(f"[Batch Word→PDF] ✗ Error: {file.filename} - {error_msg}")
-                errors.append({"file": file.filename, "error": error_msg})
-                # Cleanup input file even on error
-                try:
-                    if 'input_path' in locals():
-                        await doc_service.cleanup_file(input_path)
-                except:
-                    pass
-        
-        if not output_files:
-            raise HTTPException(500, f"All conversions failed. Errors: {errors}")
-        
-        print(f"[Batch Word→PDF] Creating ZIP with {len(output_files)} files...")
-        
-        # Create ZIP file
-        zip_buffer = io.BytesIO()
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-            for idx, output_path in enumerate(output_files, 1):
-                # Check if file still exists
-                if not output_path.exists():
-                    print(f"[Batch Word→PDF] ⚠ Warning: File not found: {output_path}")
-                    continue
-                
-                # Handle duplicate filenames in ZIP by adding index
-                zip_filename = output_path.name
-                if list(output_files).count(output_path) > 1 or any(
-                    f.name == output_path.name for f in output_files if f != output_path
-                ):
-                    # Add index to filename for duplicates
-                    stem = output_path.stem
-                    suffix = output_path.suffix
-                    zip_filename = f"{stem}_{idx}{suffix}"
-                
-                zip_file.write(output_path, zip_filename)
-                
-                # Cleanup after adding to ZIP
-                try:
-                    await doc_service.cleanup_file(output_path)
-                except Exception as e:
-                    print(f"[Batch Word→PDF] ⚠ Cleanup warning: {e}")
-        
-        zip_buffer.seek(0)
-        
-        print(f"[Batch Word→PDF] ✓ ZIP created! Size: {len(zip_buffer.getvalue())} bytes")
-        
-        if errors:
-            print(f"[Batch Word→PDF] ⚠ Completed with {len(errors)} errors: {errors}")
-        
-        return StreamingResponse(
-            zip_buffer,
-            media_type="application/zip",
-            headers={
-                "Content-Disposition": f"attachment; filename=converted_pdfs_{len(output_files)}_files.zip"
-            }
+        return await _batch_zip_response(
+            get_batch_executor().iter_completed(
+                files, convert_one, backend="gotenberg",
+                max_concurrency=max_concurrency, label="Batch Word→PDF"
+            ),
+            zip_filename=f"converted_pdfs_{len(files)}_files.zip",
+            label="Batch Word→PDF"
         )
-        
+    
     except HTTPException:
         raise
     except Exception as e:
         print(f"[Batch Word→PDF] ✗ Fatal error: {str(e)}")
-        for output_path in output_files:
-            try:
-                await doc_service.cleanup_file(output_path)
-            except:
-                pass
         raise HTTPException(500, f"Batch conversion failed: {str(e)}")
 
 
 @router.post("/batch/merge-word-to-pdf")
 async def merge_word_files_to_pdf(
     files: List[UploadFile] = File(..., description="Multiple Word files to merge"),
+    max_concurrency: Optional[int] = Query(None, ge=1, description="Số file convert song song (tối đa BATCH_MAX_CONCURRENCY)"),
 ):
     """
     **Merge & Convert** nhiều file Word thành 1 PDF duy nhất
@@ -1878,29 +2167,26 @@ async def merge_word_files_to_pdf(
         raise HTTPException(400, "No files uploaded")
     
     temp_pdf_files = []
-    errors = []
+    
+    async def convert_one(file: UploadFile) -> Path:
+        input_path = await doc_service.save_upload_file(file)
+        logger.info(f"💾 Saved to: {input_path}")
+        try:
+            return await doc_service.word_to_pdf(input_path)
+        finally:
+            await doc_service.cleanup_file(input_path)
     
     try:
         logger.info(f"🔄 [Merge Word→PDF] Starting merge of {len(files)} Word files")
         logger.info(f"📁 Files: {[f.filename for f in files]}")
         
-        # Step 1: Convert each Word to PDF
-        for idx, file in enumerate(files, 1):
-            try:
-                logger.info(f"📝 [{idx}/{len(files)}] Converting: {file.filename}")
-                input_path = await doc_service.save_upload_file(file)
-                logger.info(f"💾 Saved to: {input_path}")
-                
-                pdf_path = await doc_service.word_to_pdf(input_path)
-                logger.info(f"✅ Converted to PDF: {pdf_path}")
-                
-                temp_pdf_files.append(pdf_path)
-                await doc_service.cleanup_file(input_path)
-                logger.info(f"🗑️ Cleaned up input file: {input_path}")
-            except Exception as e:
-                error_msg = str(e)
-                logger.error(f"❌ Error converting {file.filename}: {error_msg}", exc_info=True)
-                errors.append({"file": file.filename, "error": error_msg})
+        # Step 1: Convert each Word to PDF (song song, kết quả giữ thứ tự upload)
+        results = await get_batch_executor().run(
+            files, convert_one, backend="gotenberg",
+            max_concurrency=max_concurrency, label="Merge Word→PDF"
+        )
+        temp_pdf_files = [path for r in results if r.ok for path in r.outputs]
+        errors = _batch_errors(results)
         
         if not temp_pdf_files:
             error_details = "\n".join([f"- {e['file']}: {e['error']}" for e in errors])
@@ -1926,7 +2212,7 @@ async def merge_word_files_to_pdf(
                 logger.warning(f"⚠️ PDF not found: {pdf_path}")
         
         # Save merged PDF
-        output_path = doc_service.output_dir / f"merged_{len(temp_pdf_files)}_files.pdf"
+        output_path = doc_service.new_output_path(f"merged_{len(temp_pdf_files)}_files.pdf")
         logger.info(f"💾 Writing merged PDF to: {output_path}")
         
         with open(output_path, 'wb') as output_file:
@@ -1951,7 +2237,7 @@ async def merge_word_files_to_pdf(
             filename=f"merged_{len(files)}_documents.pdf",
             background=None
         )
-        
+    
     except HTTPException:
         raise
     except Exception as e:
@@ -1968,7 +2254,7 @@ async def merge_word_files_to_pdf(
 @router.post("/batch/pdf-to-word")
 async def batch_convert_pdf_to_word(
     files: List[UploadFile] = File(..., description="Multiple PDF files"),
-    db: Session = Depends(get_db)
+    max_concurrency: Optional[int] = Query(None, ge=1, description="Số file xử lý song song (tối đa BATCH_MAX_CONCURRENCY)"),
 ):
     """
     **Batch Convert** nhiều file PDF sang Word cùng lúc
@@ -1980,145 +2266,76 @@ async def batch_convert_pdf_to_word(
     if not files or len(files) == 0:
         raise HTTPException(400, "No files uploaded")
     
-    output_files = []
-    errors = []
+    executor = get_batch_executor()
+    
+    async def convert_one(file: UploadFile) -> Path:
+        input_path = await doc_service.save_upload_file(file)
+        try:
+            # Adobe SDK là sync → chạy trên thread để các file thực sự song song
+            return await executor.offload(_pdf_to_word_own_session, input_path)
+        finally:
+            await doc_service.cleanup_file(input_path)
     
     try:
-        for idx, file in enumerate(files, 1):
-            try:
-                print(f"[Batch PDF→Word] Processing file {idx}/{len(files)}: {file.filename}")
-                input_path = await doc_service.save_upload_file(file)
-                output_path = await doc_service.pdf_to_word(input_path, db=db)
-                output_files.append(output_path)
-                await doc_service.cleanup_file(input_path)
-                print(f"[Batch PDF→Word] ✓ Success: {file.filename} → {output_path.name}")
-            except Exception as e:
-                error_msg = str(e)
-                print(f"[Batch PDF→Word] ✗ Error: {file.filename} - {error_msg}")
-                errors.append({"file": file.filename, "error": error_msg})
-                try:
-                    if 'input_path' in locals():
-                        await doc_service.cleanup_file(input_path)
-                except:
-                    pass
-        
-        if not output_files:
-            raise HTTPException(500, f"All conversions failed. Errors: {errors}")
-        
-        print(f"[Batch PDF→Word] Creating ZIP with {len(output_files)} files...")
-        
-        # Create ZIP
-        zip_buffer = io.BytesIO()
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-            for output_path in output_files:
-                zip_file.write(output_path, output_path.name)
-                await doc_service.cleanup_file(output_path)
-        
-        zip_buffer.seek(0)
-        
-        print(f"[Batch PDF→Word] ✓ ZIP created! Size: {len(zip_buffer.getvalue())} bytes")
-        
-        if errors:
-            print(f"[Batch PDF→Word] ⚠ Completed with {len(errors)} errors: {errors}")
-        
-        return StreamingResponse(
-            zip_buffer,
-            media_type="application/zip",
-            headers={
-                "Content-Disposition": f"attachment; filename=converted_word_{len(output_files)}_files.zip"
-            }
+        return await _batch_zip_response(
+            executor.iter_completed(
+                files, convert_one, backend="adobe" if doc_service.use_adobe else "local",
+                max_concurrency=max_concurrency, label="Batch PDF→Word"
+            ),
+            zip_filename=f"converted_word_{len(files)}_files.zip",
+            label="Batch PDF→Word"
         )
-        
+    
     except HTTPException:
         raise
     except Exception as e:
         print(f"[Batch PDF→Word] ✗ Fatal error: {str(e)}")
-        for output_path in output_files:
-            try:
-                await doc_service.cleanup_file(output_path)
-            except:
-                pass
         raise HTTPException(500, f"Batch conversion failed: {str(e)}")
 
 
 @router.post("/batch/excel-to-pdf")
 async def batch_convert_excel_to_pdf(
     files: List[UploadFile] = File(..., description="Multiple Excel files"),
+    max_concurrency: Optional[int] = Query(None, ge=1, description="Số file xử lý song song (tối đa BATCH_MAX_CONCURRENCY)"),
 ):
     """
     **Batch Convert** nhiều file Excel sang PDF cùng lúc
     
     - Upload nhiều file .xlsx, .xls
-    - Tự động convert tất cả
+    - Tự động convert tất cả (song song qua Gotenberg)
     - Download kết quả dưới dạng ZIP
     """
     if not files or len(files) == 0:
         raise HTTPException(400, "No files uploaded")
     
-    output_files = []
-    errors = []
+    async def convert_one(file: UploadFile) -> Path:
+        input_path = await doc_service.save_upload_file(file)
+        try:
+            return await doc_service.office_to_pdf(input_path)
+        finally:
+            await doc_service.cleanup_file(input_path)
     
     try:
-        for idx, file in enumerate(files, 1):
-            try:
-                print(f"[Batch Excel→PDF] Processing file {idx}/{len(files)}: {file.filename}")
-                input_path = await doc_service.save_upload_file(file)
-                output_path = await doc_service.office_to_pdf(input_path)
-                output_files.append(output_path)
-                await doc_service.cleanup_file(input_path)
-                print(f"[Batch Excel→PDF] ✓ Success: {file.filename} → {output_path.name}")
-            except Exception as e:
-                error_msg = str(e)
-                print(f"[Batch Excel→PDF] ✗ Error: {file.filename} - {error_msg}")
-                errors.append({"file": file.filename, "error": error_msg})
-                try:
-                    if 'input_path' in locals():
-                        await doc_service.cleanup_file(input_path)
-                except:
-                    pass
-        
-        if not output_files:
-            raise HTTPException(500, f"All conversions failed. Errors: {errors}")
-        
-        print(f"[Batch Excel→PDF] Creating ZIP with {len(output_files)} files...")
-        
-        # Create ZIP
-        zip_buffer = io.BytesIO()
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-            for output_path in output_files:
-                zip_file.write(output_path, output_path.name)
-                await doc_service.cleanup_file(output_path)
-        
-        zip_buffer.seek(0)
-        
-        print(f"[Batch Excel→PDF] ✓ ZIP created! Size: {len(zip_buffer.getvalue())} bytes")
-        
-        if errors:
-            print(f"[Batch Excel→PDF] ⚠ Completed with {len(errors)} errors: {errors}")
-        
-        return StreamingResponse(
-            zip_buffer,
-            media_type="application/zip",
-            headers={
-                "Content-Disposition": f"attachment; filename=converted_excel_pdf_{len(output_files)}_files.zip"
-            }
+        return await _batch_zip_response(
+            get_batch_executor().iter_completed(
+                files, convert_one, backend="gotenberg",
+                max_concurrency=max_concurrency, label="Batch Excel→PDF"
+            ),
+            zip_filename=f"converted_excel_pdf_{len(files)}_files.zip",
+            label="Batch Excel→PDF"
         )
-        
+    
     except HTTPException:
         raise
     except Exception as e:
         print(f"[Batch Excel→PDF] ✗ Fatal error: {str(e)}")
-        for output_path in output_files:
-            try:
-                await doc_service.cleanup_file(output_path)
-            except:
-                pass
         raise HTTPException(500, f"Batch conversion failed: {str(e)}")
 
 
 @router.post("/batch/image-to-pdf")
 async def batch_convert_image_to_pdf(
     files: List[UploadFile] = File(..., description="Multiple image files"),
+    max_concurrency: Optional[int] = Query(None, ge=1, description="Số file xử lý song song (tối đa BATCH_MAX_CONCURRENCY)"),
 ):
     """
     **Batch Convert** nhiều ảnh sang PDF cùng lúc
@@ -2130,64 +2347,30 @@ async def batch_convert_image_to_pdf(
     if not files or len(files) == 0:
         raise HTTPException(400, "No files uploaded")
     
-    output_files = []
-    errors = []
+    executor = get_batch_executor()
+    
+    async def convert_one(file: UploadFile) -> Path:
+        input_path = await doc_service.save_upload_file(file)
+        try:
+            # Pillow là CPU-bound → chạy trên thread
+            return await executor.offload(doc_service.image_to_pdf, input_path)
+        finally:
+            await doc_service.cleanup_file(input_path)
     
     try:
-        for idx, file in enumerate(files, 1):
-            try:
-                print(f"[Batch Image→PDF] Processing file {idx}/{len(files)}: {file.filename}")
-                input_path = await doc_service.save_upload_file(file)
-                output_path = await doc_service.image_to_pdf(input_path)
-                output_files.append(output_path)
-                await doc_service.cleanup_file(input_path)
-                print(f"[Batch Image→PDF] ✓ Success: {file.filename} → {output_path.name}")
-            except Exception as e:
-                error_msg = str(e)
-                print(f"[Batch Image→PDF] ✗ Error: {file.filename} - {error_msg}")
-                errors.append({"file": file.filename, "error": error_msg})
-                try:
-                    if 'input_path' in locals():
-                        await doc_service.cleanup_file(input_path)
-                except:
-                    pass
-        
-        if not output_files:
-            raise HTTPException(500, f"All conversions failed. Errors: {errors}")
-        
-        print(f"[Batch Image→PDF] Creating ZIP with {len(output_files)} files...")
-        
-        # Create ZIP
-        zip_buffer = io.BytesIO()
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-            for output_path in output_files:
-                zip_file.write(output_path, output_path.name)
-                await doc_service.cleanup_file(output_path)
-        
-        zip_buffer.seek(0)
-        
-        print(f"[Batch Image→PDF] ✓ ZIP created! Size: {len(zip_buffer.getvalue())} bytes")
-        
-        if errors:
-            print(f"[Batch Image→PDF] ⚠ Completed with {len(errors)} errors: {errors}")
-        
-        return StreamingResponse(
-            zip_buffer,
-            media_type="application/zip",
-            headers={
-                "Content-Disposition": f"attachment; filename=images_to_pdf_{len(output_files)}_files.zip"
-            }
+        return await _batch_zip_response(
+            executor.iter_completed(
+                files, convert_one, backend="local",
+                max_concurrency=max_concurrency, label="Batch Image→PDF"
+            ),
+            zip_filename=f"images_to_pdf_{len(files)}_files.zip",
+            label="Batch Image→PDF"
         )
-        
+    
     except HTTPException:
         raise
     except Exception as e:
         print(f"[Batch Image→PDF] ✗ Fatal error: {str(e)}")
-        for output_path in output_files:
-            try:
-                await doc_service.cleanup_file(output_path)
-            except:
-                pass
         raise HTTPException(500, f"Batch conversion failed: {str(e)}")
 
 
@@ -2195,6 +2378,7 @@ async def batch_convert_image_to_pdf(
 async def batch_compress_pdf(
     files: List[UploadFile] = File(..., description="Multiple PDF files"),
     quality: str = Form("medium", description="Compression quality: low, medium, high"),
+    max_concurrency: Optional[int] = Query(None, ge=1, description="Số file xử lý song song (tối đa BATCH_MAX_CONCURRENCY)"),
 ):
     """
     **Batch Compress** nhiều file PDF cùng lúc
@@ -2206,64 +2390,37 @@ async def batch_compress_pdf(
     if not files or len(files) == 0:
         raise HTTPException(400, "No files uploaded")
     
-    output_files = []
-    errors = []
+    from app.core.config import settings
+    
+    executor = get_batch_executor()
+    
+    async def convert_one(file: UploadFile) -> Path:
+        input_path = await doc_service.save_upload_file(file)
+        try:
+            # Adobe SDK / pypdf đều là sync → chạy trên thread
+            output_path, technology = await executor.offload(doc_service.compress_pdf, input_path, quality)
+            # BatchExecutor log thành công/thất bại của từng item, ở đây chỉ thêm engine đã dùng
+            logger.debug(f"[Batch Compress PDF] {file.filename} compressed with {technology}")
+            return output_path
+        finally:
+            await doc_service.cleanup_file(input_path)
     
     try:
-        for idx, file in enumerate(files, 1):
-            try:
-                print(f"[Batch Compress PDF] Processing file {idx}/{len(files)}: {file.filename}")
-                input_path = await doc_service.save_upload_file(file)
-                output_path, technology = await doc_service.compress_pdf(input_path, quality)
-                output_files.append(output_path)
-                await doc_service.cleanup_file(input_path)
-                print(f"[Batch Compress PDF] ✓ Success: {file.filename} → {output_path.name} ({technology})")
-            except Exception as e:
-                error_msg = str(e)
-                print(f"[Batch Compress PDF] ✗ Error: {file.filename} - {error_msg}")
-                errors.append({"file": file.filename, "error": error_msg})
-                try:
-                    if 'input_path' in locals():
-                        await doc_service.cleanup_file(input_path)
-                except:
-                    pass
-        
-        if not output_files:
-            raise HTTPException(500, f"All compressions failed. Errors: {errors}")
-        
-        print(f"[Batch Compress PDF] Creating ZIP with {len(output_files)} files...")
-        
-        # Create ZIP
-        zip_buffer = io.BytesIO()
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-            for output_path in output_files:
-                zip_file.write(output_path, output_path.name)
-                await doc_service.cleanup_file(output_path)
-        
-        zip_buffer.seek(0)
-        
-        print(f"[Batch Compress PDF] ✓ ZIP created! Size: {len(zip_buffer.getvalue())} bytes")
-        
-        if errors:
-            print(f"[Batch Compress PDF] ⚠ Completed with {len(errors)} errors: {errors}")
-        
-        return StreamingResponse(
-            zip_buffer,
-            media_type="application/zip",
-            headers={
-                "Content-Disposition": f"attachment; filename=compressed_pdfs_{len(output_files)}_files.zip"
-            }
+        use_adobe = doc_service.use_adobe and settings.should_use_adobe_first("compress")
+        return await _batch_zip_response(
+            executor.iter_completed(
+                files, convert_one, backend="adobe" if use_adobe else "local",
+                max_concurrency=max_concurrency, label="Batch Compress PDF"
+            ),
+            zip_filename=f"compressed_pdfs_{len(files)}_files.zip",
+            label="Batch Compress PDF",
+            failure_message="All compressions failed"
         )
-        
+    
     except HTTPException:
         raise
     except Exception as e:
         print(f"[Batch Compress PDF] ✗ Fatal error: {str(e)}")
-        for output_path in output_files:
-            try:
-                await doc_service.cleanup_file(output_path)
-            except:
-                pass
         raise HTTPException(500, f"Batch compression failed: {str(e)}")
 
 
@@ -2271,7 +2428,7 @@ async def batch_compress_pdf(
 async def batch_convert_pdf_to_multiple(
     files: List[UploadFile] = File(...),
     format: str = Query(..., description="Target format: word, excel, or image"),
-    db: Session = Depends(get_db)
+    max_concurrency: Optional[int] = Query(None, ge=1, description="Số file xử lý song song (tối đa BATCH_MAX_CONCURRENCY)"),
 ):
     """
     Bulk Convert: Chuyển đổi nhiều PDF sang định dạng mong muốn (Word/Excel/Image)
@@ -2282,11 +2439,12 @@ async def batch_convert_pdf_to_multiple(
     
     Examples:
     - Convert 5 PDFs → 5 Word files
-    - Convert 3 PDFs → 3 Excel files  
+    - Convert 3 PDFs → 3 Excel files
     - Convert 10 PDFs → 10 Image folders (mỗi PDF thành nhiều ảnh)
     """
-    output_files = []
-    errors = []
+    # Đường dẫn trong ZIP cho từng output file
+    arcnames = {}
+    executor = get_batch_executor()
     
     try:
         # Validate format
@@ -2299,100 +2457,60 @@ async def batch_convert_pdf_to_multiple(
         
         print(f"[Bulk PDF→{format_display}] Starting conversion of {len(files)} PDF(s)")
         
-        for idx, file in enumerate(files, 1):
+        async def convert_one(file: UploadFile) -> List[Path]:
+            # Validate PDF file
+            if not file.filename.lower().endswith('.pdf'):
+                raise ValueError("Not a PDF file")
+            
+            input_path = await doc_service.save_upload_file(file)
             try:
-                # Validate PDF file
-                if not file.filename.lower().endswith('.pdf'):
-                    errors.append({"file": file.filename, "error": "Not a PDF file"})
-                    continue
-                
-                print(f"[Bulk PDF→{format_display}] Processing file {idx}/{len(files)}: {file.filename}")
-                
-                input_path = await doc_service.save_upload_file(file)
-                
-                # Convert based on format
+                # Convert based on format (sync libs → chạy trên thread)
                 if format == "word":
-                    output_path = await doc_service.pdf_to_word(input_path, db=db)
-                    output_files.append(output_path)
-                    print(f"[Bulk PDF→Word] ✓ Success: {file.filename} → {output_path.name}")
-                    
-                elif format == "excel":
-                    output_path = await doc_service.pdf_to_excel(input_path)
-                    output_files.append(output_path)
-                    print(f"[Bulk PDF→Excel] ✓ Success: {file.filename} → {output_path.name}")
-                    
-                elif format == "image":
-                    # PDF to images returns list of image paths
-                    image_paths = await doc_service.pdf_to_images(input_path)
-                    output_files.extend(image_paths)
-                    print(f"[Bulk PDF→Images] ✓ Success: {file.filename} → {len(image_paths)} image(s)")
+                    output_path = await executor.offload(_pdf_to_word_own_session, input_path)
+                    arcnames[output_path] = output_path.name
+                    return [output_path]
                 
-                await doc_service.cleanup_file(input_path)
+                if format == "excel":
+                    output_path = await executor.offload(doc_service.pdf_to_excel, input_path)
+                    arcnames[output_path] = output_path.name
+                    return [output_path]
                 
-            except Exception as e:
-                error_msg = str(e)
-                print(f"[Bulk PDF→{format_display}] ✗ Error: {file.filename} - {error_msg}")
-                errors.append({"file": file.filename, "error": error_msg})
-                try:
-                    if 'input_path' in locals():
-                        await doc_service.cleanup_file(input_path)
-                except:
-                    pass
-        
-        if not output_files:
-            raise HTTPException(500, f"All conversions failed. Errors: {errors}")
-        
-        print(f"[Bulk PDF→{format_display}] Creating ZIP with {len(output_files)} file(s)...")
-        
-        # Create ZIP with all converted files
-        zip_buffer = io.BytesIO()
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-            for output_path in output_files:
-                # For images, preserve folder structure
-                if format == "image":
-                    # Get relative path (e.g., "filename/page_1.png")
-                    relative_path = output_path.relative_to(output_path.parent.parent)
-                    zip_file.write(output_path, str(relative_path))
-                else:
-                    zip_file.write(output_path, output_path.name)
-                
-                await doc_service.cleanup_file(output_path)
-        
-        zip_buffer.seek(0)
-        
-        print(f"[Bulk PDF→{format_display}] ✓ ZIP created! Size: {len(zip_buffer.getvalue())} bytes")
-        
-        if errors:
-            print(f"[Bulk PDF→{format_display}] ⚠ Completed with {len(errors)} errors: {errors}")
+                # PDF to images returns list of image paths
+                # Prefix theo tên file để các PDF chạy song song không ghi đè ảnh của nhau
+                image_paths = await executor.offload(
+                    doc_service.pdf_to_images, input_path,
+                    output_prefix=f"{input_path.stem}_page"
+                )
+                folder = Path(file.filename).stem
+                for page_num, image_path in enumerate(image_paths, 1):
+                    # Preserve folder structure: "filename/page_1.png"
+                    arcnames[image_path] = f"{folder}/page_{page_num}{image_path.suffix}"
+                return image_paths
+            finally:
+                await doc_service.cleanup_file(input_path)
         
         # Determine filename based on format
         format_names = {
             "word": "docx",
-            "excel": "xlsx", 
+            "excel": "xlsx",
             "image": "images"
         }
         
-        return StreamingResponse(
-            zip_buffer,
-            media_type="application/zip",
-            headers={
-                "Content-Disposition": f"attachment; filename=bulk_pdf_to_{format_names[format]}_{len(files)}_files.zip"
-            }
+        return await _batch_zip_response(
+            executor.iter_completed(
+                files, convert_one,
+                backend="adobe" if format == "word" and doc_service.use_adobe else "local",
+                max_concurrency=max_concurrency, label=f"Bulk PDF→{format_display}"
+            ),
+            zip_filename=f"bulk_pdf_to_{format_names[format]}_{len(files)}_files.zip",
+            label=f"Bulk PDF→{format_display}",
+            arcname_for=lambda path: arcnames.get(path, path.name)
         )
-        
+    
     except HTTPException:
         raise
     except Exception as e:
-        print(f"[Bulk PDF→{format_display}] ✗ Fatal error: {str(e)}")
-        for output_path in output_files:
-            try:
-                await doc_service.cleanup_file(output_path)
-            except:
-                pass
-        raise HTTPException(500, f"Bulk PDF conversion failed: {str(e)}")
-    except Exception as e:
-        for output_path in output_files:
-            await doc_service.cleanup_file(output_path)
+        print(f"[Bulk PDF→{format}] ✗ Fatal error: {str(e)}")
         raise HTTPException(500, f"Bulk PDF conversion failed: {str(e)}")
 
 
@@ -2778,21 +2896,27 @@ async def autotag_pdf(
         raise e
 
 
-@router.post("/pdf/generate", summary="Generate document from template (Adobe)")
+@router.post("/pdf/generate", summary="Generate document from template (Adobe / local)")
 async def generate_document(
     template_file: UploadFile = File(..., description="Word template (.docx)"),
     json_data: str = Form(..., description="JSON data as string"),
     output_format: str = Form("pdf", description="Output format: pdf or docx"),
+    engine: Optional[str] = Form(None, description="adobe | local (docxtpl). Mặc định: DOCGEN_ENGINE"),
     doc_service: DocumentService = Depends(get_document_service)
 ):
     """
     Generate PDF/DOCX from Word template + JSON data (Adobe Document Generation).
     
-    **Template Format:**
+    **Template Format (engine=adobe):**
     - Use {{variable}} for simple variables
     - Use {{#array}}...{{/array}} for loops
     - Use {{#condition}}...{{/condition}} for conditionals
     
+    **Template Format (engine=local - docxtpl/Jinja, không tốn Adobe quota):**
+    - Use {{ variable }} for simple variables
+    - Use {%tr for item in items %}...{%tr endfor %} for table row loops
+    - Use {%p if condition %}...{%p endif %} for conditionals
+    
     **Example JSON:**
     ```json
     {
@@ -2819,25 +2943,24 @@ async def generate_document(
     if output_format.lower() not in ['pdf', 'docx']:
         raise HTTPException(400, "Output format must be 'pdf' or 'docx'")
     
+    engine = doc_service.resolve_generation_engine(engine)
+    
     # Parse JSON data
     try:
         data_dict = json.loads(json_data)
     except json.JSONDecodeError as e:
         raise HTTPException(400, f"Invalid JSON data: {str(e)}")
     
-    # Save template file
-    template_path = doc_service.upload_dir / f"template_{template_file.filename}"
+    # Save template file (thư mục riêng/upload → request đồng thời không ghi đè nhau)
+    template_path = await doc_service.save_upload_file(template_file)
     
     try:
-        async with aiofiles.open(template_path, 'wb') as f:
-            content = await template_file.read()
-            await f.write(content)
-        
         # Generate document
         output_path = await doc_service.generate_document(
             template_path=template_path,
             json_data=data_dict,
-            output_format=output_format
+            output_format=output_format,
+            engine=engine
         )
         
         # Determine media type
@@ -2852,10 +2975,15 @@ async def generate_document(
             background=None
         )
         
-        response.headers["X-Technology-Engine"] = "adobe"
-        response.headers["X-Technology-Name"] = "Adobe Document Generation"
-        response.headers["X-Technology-Quality"] = "10/10"
-        response.headers["X-Template-Processing"] = "Mustache-based"
+        if engine == "local":
+            response.headers["X-Technology-Engine"] = "local"
+            response.headers["X-Technology-Name"] = "docxtpl (Jinja)"
+            response.headers["X-Template-Processing"] = "Jinja-based"
+        else:
+            response.headers["X-Technology-Engine"] = "adobe"
+            response.headers["X-Technology-Name"] = "Adobe Document Generation"
+            response.headers["X-Technology-Quality"] = "10/10"
+            response.headers["X-Template-Processing"] = "Mustache-based"
         
         
         # Cleanup template file
@@ -2868,12 +2996,33 @@ async def generate_document(
         raise e
 
 
-@router.post("/pdf/generate-batch", summary="Generate multiple documents from template (Adobe)")
+@dataclass
+class _GenerateItem:
+    """1 item của /pdf/generate-batch (filename = tên file trong ZIP)"""
+    filename: str
+    data: dict
+
+
+def _generated_arcname(data_dict: dict, idx: int, extension: str) -> str:
+    """Tên file trong ZIP: lấy từ field đầu tiên của data nếu có"""
+    try:
+        first_value = str(list(data_dict.values())[0])
+        # Sanitize filename
+        safe_name = "".join(c if c.isalnum() or c in (' ', '-', '_') else '_' for c in first_value)
+        safe_name = safe_name[:50]  # Limit length
+        return f"{safe_name}_{idx:03d}.{extension}"
+    except Exception:
+        return f"document_{idx:03d}.{extension}"
+
+
+@router.post("/pdf/generate-batch", summary="Generate multiple documents from template (Adobe / local)")
 async def generate_documents_batch(
     template_file: UploadFile = File(..., description="Word template (.docx)"),
     json_data: str = Form(..., description="JSON array with multiple data objects"),
     output_format: str = Form("pdf", description="Output format: pdf or docx"),
     merge_output: bool = Form(False, description="True: merge into 1 PDF, False: return ZIP with multiple files"),
+    max_concurrency: Optional[int] = Query(None, ge=1, description="Số merge job song song (tối đa BATCH_MAX_CONCURRENCY)"),
+    engine: Optional[str] = Form(None, description="adobe | local (docxtpl). Mặc định: DOCGEN_ENGINE"),
     doc_service: DocumentService = Depends(get_document_service)
 ):
     """
@@ -2897,8 +3046,17 @@ async def generate_documents_batch(
     ```
     
     **Output:**
-    - If `merge_output=true`: Single merged PDF
-    - If `merge_output=false`: ZIP file with multiple PDFs/DOCX
+    - If `merge_output=true`: Single merged PDF (item lỗi bị bỏ qua, xem header `X-Batch-Errors`)
+    - If `merge_output=false`: ZIP file with multiple PDFs/DOCX + `_batch_report.json`
+      (thời gian/lỗi từng item)
+    
+    **Performance:**
+    - Template upload lên Adobe 1 lần, asset dùng lại cho mọi item
+    - Merge jobs chạy song song (`max_concurrency`, giới hạn chung BATCH_ADOBE_CONCURRENCY)
+    - 1 item lỗi không làm hỏng cả batch
+    - `engine=local`: render docxtpl trên process pool (template parse/compile 1 lần),
+      PDF qua Gotenberg - không tốn Adobe quota, tối đa DOCGEN_LOCAL_MAX_ITEMS item
+      (cú pháp Jinja, xem /pdf/generate)
     
     **Use Cases:**
     - Batch invitations (thiệp mời hàng loạt)
@@ -2907,11 +3065,6 @@ async def generate_documents_batch(
     
     **Adobe API:** Document Generation + CombinePDF (if merge)
     """
-    import json
-    import io
-    import zipfile
-    from pathlib import Path
-    
     # Validate file extension
     if not template_file.filename.endswith('.docx'):
         raise HTTPException(400, "Template must be .docx file")
@@ -2920,6 +3073,11 @@ async def generate_documents_batch(
     if output_format.lower() not in ['pdf', 'docx']:
         raise HTTPException(400, "Output format must be 'pdf' or 'docx'")
     
+    from app.core.config import settings
+    
+    engine = doc_service.resolve_generation_engine(engine)
+    max_items = settings.DOCGEN_LOCAL_MAX_ITEMS if engine == "local" else 100
+    
     # Parse JSON data - expect array
     try:
         data_array = json.loads(json_data)
@@ -2927,131 +3085,136 @@ async def generate_documents_batch(
             raise ValueError("JSON must be an array of objects")
         if len(data_array) == 0:
             raise ValueError("JSON array cannot be empty")
-        if len(data_array) > 100:
-            raise ValueError("Maximum 100 items per batch")
+        if len(data_array) > max_items:
+            raise ValueError(f"Maximum {max_items} items per batch")
     except json.JSONDecodeError as e:
         raise HTTPException(400, f"Invalid JSON data: {str(e)}")
     except ValueError as e:
         raise HTTPException(400, str(e))
     
-    # Save template file
-    template_path = doc_service.upload_dir / f"template_{template_file.filename}"
-    generated_files = []
+    extension = output_format.lower()
+    items = [
+        _GenerateItem(filename=_generated_arcname(data_dict, idx, extension), data=data_dict)
+        for idx, data_dict in enumerate(data_array, 1)
+    ]
+    
+    # Save template file (thư mục riêng/upload → request đồng thời không ghi đè nhau)
+    template_path = await doc_service.save_upload_file(template_file)
     
     try:
-        async with aiofiles.open(template_path, 'wb') as f:
-            content = await template_file.read()
-            await f.write(content)
+        # Upload (Adobe) / parse (local) template 1 lần cho cả batch
+        template_asset = await doc_service.prepare_generation_template(template_path, engine)
+    except BaseException:
+        await doc_service.cleanup_file(template_path)
+        raise
+    
+    # Local: render trên process pool, giới hạn theo Gotenberg (PDF) hoặc CPU (DOCX)
+    backend = "adobe" if engine == "adobe" else ("gotenberg" if extension == "pdf" else "local")
+    technology_name = "Adobe Document Generation" if engine == "adobe" else "docxtpl (Jinja)"
+    logger.info(f"🔄 Batch generation: {len(items)} items, engine={engine}, merge={merge_output}")
+    
+    async def generate_one(item: _GenerateItem) -> Path:
+        return await doc_service.generate_document(
+            template_path=template_path,
+            json_data=item.data,
+            output_format=output_format,
+            template_asset=template_asset
+        )
+    
+    # OPTION 2: Stream ZIP with separate files (theo thứ tự hoàn thành)
+    if not (merge_output and extension == "pdf"):
+        arcnames = {}
         
-        logger.info(f"🔄 Batch generation: {len(data_array)} items, merge={merge_output}")
+        async def generate_for_zip(item: _GenerateItem) -> Path:
+            output_path = await generate_one(item)
+            arcnames[output_path] = item.filename
+            return output_path
         
-        # Generate document for each data item
-        for idx, data_dict in enumerate(data_array, 1):
-            logger.info(f"📄 Generating document {idx}/{len(data_array)}")
-            
-            output_path = await doc_service.generate_document(
-                template_path=template_path,
-                json_data=data_dict,
-                output_format=output_format
-            )
-            
-            generated_files.append(output_path)
-            logger.info(f"✅ Generated: {output_path.name} ({output_path.stat().st_size} bytes)")
+        async def results():
+            try:
+                async for result in get_batch_executor().iter_completed(
+                    items, generate_for_zip, backend=backend,
+                    max_concurrency=max_concurrency, label="Batch Generate"
+                ):
+                    yield result
+            finally:
+                await doc_service.cleanup_file(template_path)
+        
+        response = await _batch_zip_response(
+            results(),
+            zip_filename=f"batch_{len(items)}_files.zip",
+            label="Batch Generate",
+            failure_message="All document generations failed",
+            arcname_for=lambda path: arcnames.get(path, path.name),
+            report_name="_batch_report.json"
+        )
+        response.headers["X-Technology-Engine"] = engine
+        response.headers["X-Technology-Name"] = technology_name
+        response.headers["X-Batch-Count"] = str(len(items))
+        response.headers["X-Output-Type"] = "zip"
+        return response
+    
+    # OPTION 1: Merge into single PDF (giữ thứ tự input)
+    generated_files = []
+    try:
+        started_at = time.perf_counter()
+        results = await get_batch_executor().run(
+            items, generate_one, backend=backend,
+            max_concurrency=max_concurrency, label="Batch Generate"
+        )
+        stats = summarize_results(results, time.perf_counter() - started_at)
+        generated_files = [path for r in results if r.ok for path in r.outputs]
+        errors = _batch_errors(results)
         
-        logger.info(f"✅ All {len(generated_files)} documents generated")
+        if not generated_files:
+            raise HTTPException(500, f"All document generations failed. Errors: {errors}")
         
-        # OPTION 1: Merge into single PDF
-        if merge_output and output_format.lower() == "pdf":
-            logger.info("🔗 Merging all PDFs into one...")
-            
+        logger.info(f"🔗 Merging {len(generated_files)} PDFs into one...")
+        
+        if engine == "local":
+            # pypdf trên thread (không tốn Adobe transaction)
+            merged_path = await get_batch_executor().offload(
+                doc_service.merge_pdfs, generated_files, f"{generated_files[0].stem}_merged.pdf"
+            )
+        else:
             # Use CombinePDF to merge
             merged_path = await doc_service.combine_pdfs(
                 pdf_paths=generated_files,
                 page_ranges=None  # All pages from all files
             )
-            
-            logger.info(f"✅ Merged PDF: {merged_path.name} ({merged_path.stat().st_size} bytes)")
-            
-            # Cleanup individual files
-            for file_path in generated_files:
-                await doc_service.cleanup_file(file_path)
-            
-            # Return merged PDF
-            response = FileResponse(
-                path=merged_path,
-                media_type="application/pdf",
-                filename=f"batch_{len(data_array)}_merged.pdf",
-                background=None
-            )
-            
-            response.headers["X-Technology-Engine"] = "adobe"
-            response.headers["X-Technology-Name"] = "Adobe Document Generation + CombinePDF"
-            response.headers["X-Batch-Count"] = str(len(data_array))
-            response.headers["X-Output-Type"] = "merged"
-            
-            # Cleanup template and merged file after response
-            await doc_service.cleanup_file(template_path)
-            
-            return response
         
-        # OPTION 2: Return ZIP with separate files
-        else:
-            logger.info(f"📦 Creating ZIP with {len(generated_files)} files...")
-            
-            # Create ZIP in memory
-            zip_buffer = io.BytesIO()
-            with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-                for idx, file_path in enumerate(generated_files, 1):
-                    # Generate filename based on index or data
-                    arcname = f"document_{idx:03d}.{output_format.lower()}"
-                    
-                    # Try to get a better name from first field in data
-                    try:
-                        first_value = str(list(data_array[idx-1].values())[0])
-                        # Sanitize filename
-                        safe_name = "".join(c if c.isalnum() or c in (' ', '-', '_') else '_' for c in first_value)
-                        safe_name = safe_name[:50]  # Limit length
-                        arcname = f"{safe_name}_{idx:03d}.{output_format.lower()}"
-                    except:
-                        pass
-                    
-                    logger.info(f"📥 Adding to ZIP: {arcname} ({file_path.stat().st_size} bytes)")
-                    zip_file.write(file_path, arcname=arcname)
-            
-            # Get ZIP bytes
-            zip_bytes = zip_buffer.getvalue()
-            zip_size = len(zip_bytes)
-            zip_buffer.close()
-            
-            logger.info(f"📦 ZIP created: {zip_size} bytes with {len(generated_files)} files")
-            
-            # Cleanup all generated files
-            for file_path in generated_files:
-                await doc_service.cleanup_file(file_path)
-            await doc_service.cleanup_file(template_path)
-            
-            # Return ZIP
-            return Response(
-                content=zip_bytes,
-                media_type="application/zip",
-                headers={
-                    "Content-Disposition": f"attachment; filename=batch_{len(data_array)}_files.zip",
-                    "X-Technology-Engine": "adobe",
-                    "X-Technology-Name": "Adobe Document Generation",
-                    "X-Batch-Count": str(len(data_array)),
-                    "X-Output-Type": "zip",
-                    "Content-Length": str(zip_size)
-                }
-            )
+        logger.info(f"✅ Merged PDF: {merged_path.name} ({merged_path.stat().st_size} bytes)")
         
-    except Exception as e:
-        # Cleanup on error
-        await doc_service.cleanup_file(template_path)
-        for file_path in generated_files:
-            await doc_service.cleanup_file(file_path)
+        # Return merged PDF
+        response = FileResponse(
+            path=merged_path,
+            media_type="application/pdf",
+            filename=f"batch_{len(items)}_merged.pdf",
+            background=None
+        )
+        
+        response.headers["X-Technology-Engine"] = engine
+        response.headers["X-Technology-Name"] = f"{technology_name} + CombinePDF"
+        response.headers["X-Batch-Count"] = str(len(items))
+        response.headers["X-Batch-Succeeded"] = str(stats["succeeded"])
+        response.headers["X-Batch-Failed"] = str(stats["failed"])
+        response.headers["X-Batch-Wall-Seconds"] = str(stats["wall_seconds"])
+        response.headers["X-Output-Type"] = "merged"
+        if errors:
+            # ASCII-only JSON (HTTP header phải là latin-1)
+            response.headers["X-Batch-Errors"] = json.dumps(errors)
+        
+        return response
         
+    except HTTPException:
+        raise
+    except Exception as e:
         logger.error(f"❌ Batch generation error: {e}")
         raise HTTPException(500, f"Batch generation failed: {str(e)}")
+    finally:
+        for file_path in generated_files:
+            await doc_service.cleanup_file(file_path)
+        await doc_service.cleanup_file(template_path)
 
 
 @router.post("/pdf/seal", summary="Apply electronic seal to PDF (Adobe)")
@@ -3246,13 +3409,28 @@ async def text_to_word_smart(
         if language not in ["vi", "en", "zh", "ja", "ko", "fr", "de", "es"]:
             raise HTTPException(400, "Unsupported language code")
         
-        # Generate DOCX (using python-docx, not MHTML)
-        docx_bytes, ai_usage = await doc_service.text_to_word_mhtml(
-            text=text,
-            provider=provider,
-            model=model,
-            language=language
+        # ♻️ Cùng text + provider/model → trả DOCX đã tạo trước đó
+        cache_key, cache_hit = await lookup_bytes(
+            text.encode("utf-8"), "text_to_word", provider=provider, model=model, language=language
         )
+        if cache_hit:
+            docx_bytes = cache_hit.path.read_bytes()
+            ai_usage = cache_hit.meta.get("ai_usage", {})
+        else:
+            # Generate DOCX (using python-docx, not MHTML)
+            docx_bytes, ai_usage = await doc_service.text_to_word_mhtml(
+                text=text,
+                provider=provider,
+                model=model,
+                language=language
+            )
+            await store_bytes(
+                cache_key,
+                docx_bytes,
+                operation="text_to_word",
+                ai_usage=ai_usage,
+                cost_usd=_ai_usage_cost(provider, ai_usage)
+            )
         
         # Generate filename
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -3276,6 +3454,7 @@ async def text_to_word_smart(
         response.headers["X-Input-Tokens"] = str(ai_usage.get("input_tokens", 0))
         response.headers["X-Output-Tokens"] = str(ai_usage.get("output_tokens", 0))
         response.headers["X-Processing-Time-Ms"] = str(int(ai_usage.get("processing_time_ms", 0)))
+        response.headers.update(cache_hit.response_headers() if cache_hit else MISS_HEADERS)
         
         return response
         
@@ -3350,13 +3529,28 @@ async def generate_visualization(
         if language not in ["vi", "en", "zh", "ja", "ko", "fr", "de", "es"]:
             raise HTTPException(400, "Unsupported language code")
         
-        # Generate DOCX with charts (using text_to_word_mhtml which supports visualization)
-        docx_bytes, ai_usage = await doc_service.text_to_word_mhtml(
-            text=text_input,
-            provider=provider,
-            model=model,
-            language=language
+        # ♻️ Cùng text + provider/model → trả DOCX đã tạo trước đó (dùng chung cache với text-to-word)
+        cache_key, cache_hit = await lookup_bytes(
+            text_input.encode("utf-8"), "text_to_word", provider=provider, model=model, language=language
         )
+        if cache_hit:
+            docx_bytes = cache_hit.path.read_bytes()
+            ai_usage = cache_hit.meta.get("ai_usage", {})
+        else:
+            # Generate DOCX with charts (using text_to_word_mhtml which supports visualization)
+            docx_bytes, ai_usage = await doc_service.text_to_word_mhtml(
+                text=text_input,
+                provider=provider,
+                model=model,
+                language=language
+            )
+            await store_bytes(
+                cache_key,
+                docx_bytes,
+                operation="text_to_word",
+                ai_usage=ai_usage,
+                cost_usd=_ai_usage_cost(provider, ai_usage)
+            )
         
         # Generate filename
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -3382,6 +3576,7 @@ async def generate_visualization(
         response.headers["X-Input-Tokens"] = str(ai_usage.get("input_tokens", 0))
         response.headers["X-Output-Tokens"] = str(ai_usage.get("output_tokens", 0))
         response.headers["X-Processing-Time-Ms"] = str(int(ai_usage.get("processing_time_ms", 0)))
+        response.headers.update(cache_hit.response_headers() if cache_hit else MISS_HEADERS)
         
         logger.info(f"✅ Visualization created successfully: {filename}")
         return response
@@ -3654,13 +3849,10 @@ async def ocr_to_word(
         quota_incremented = False
         if not is_demo_user:
             logger.info(f"🔍 Checking AI quota for user {current_user.id} (using Gemini for perfect Vietnamese)...")
+            # Lượt quota được commit ngay trong check_ai_quota → không giữ transaction
+            # trong lúc gọi Gemini (30s-3min)
             quota_info_checked = QuotaService.check_ai_quota(current_user, db)
             quota_incremented = True
-            
-            # CRITICAL: Commit DB changes and close session BEFORE long Gemini API call
-            # This releases DB connection pool during OCR (30s-3min)
-            db.commit()
-            logger.info("✅ DB session committed - releasing connection for OCR processing")
         else:
             logger.info("🎭 Demo mode - skipping quota check")
         
@@ -3672,7 +3864,7 @@ async def ocr_to_word(
         
         extraction_start = time.time()
         try:
-            extracted_text = ocr_service.extract_text_from_pdf(temp_pdf_path, is_scanned)
+            extracted_text = await run_blocking("gemini", ocr_service.extract_text_from_pdf, temp_pdf_path, is_scanned)
             extraction_time = time.time() - extraction_start
             logger.info("="*80)
             logger.info(f"✅ GEMINI EXTRACTION COMPLETED in {extraction_time:.1f}s")
@@ -3691,7 +3883,6 @@ async def ocr_to_word(
                 try:
                     # Re-open DB session to rollback
                     QuotaService.rollback_quota_increment(current_user, db)
-                    db.commit()
                     logger.info("✅ Quota rollback successful")
                 except Exception as rollback_err:
                     logger.error(f"❌ Rollback failed: {rollback_err}")
@@ -3736,13 +3927,9 @@ async def ocr_to_word(
                 downloaded=False  # Will be updated when user downloads
             )
         
-        # Commit quota increment after successful AI extraction
-        if not is_demo_user and 'quota_incremented' in locals() and quota_incremented:
-            db.commit()
-
         # Refetch quota (updated after use) - only for authenticated users
         if not is_demo_user:
-            quota_info = QuotaService.get_user_quota_info(current_user)
+            quota_info = QuotaService.get_user_quota_info(current_user, db)
         else:
             quota_info = {"ai_usage_this_month": 0, "ai_quota_monthly": 0}
         
@@ -25,7 +25,7 @@ from app.schemas.gemini_keys import (
     UserUsageStats,
     KeyStatusEnum
 )
-from app.services.gemini_key_service import GeminiKeyService
+from app.services.gemini_key_service import GeminiKeyService, get_gemini_key_pool
 
 router = APIRouter(prefix="/gemini-keys", tags=["Gemini Keys Management (Admin)"])
 
@@ -185,6 +185,7 @@ async def update_gemini_key(
     
     db.commit()
     db.refresh(key)
+    get_gemini_key_pool().invalidate()  # status/priority thay đổi → chọn lại key
     
     monthly_quota = next(
         (q for q in key.quotas if q.quota_type == QuotaType.MONTHLY),
@@ -0,0 +1,243 @@
+"""
+Background Jobs API - Submit conversion dài, trả job_id ngay, poll status, tải kết quả
+
+Flow:
+    POST /api/v1/jobs/pdf-to-word      → {"job_id": "...", "status": "queued"}
+    GET  /api/v1/jobs/{job_id}         → {"status": "running", "progress": 10, ...}
+    GET  /api/v1/jobs/{job_id}/result  → file .docx / .json
+    DELETE /api/v1/jobs/{job_id}       → hủy + xóa file
+"""
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Depends
+from fastapi.responses import FileResponse
+from pathlib import Path
+import asyncio
+from typing import Any, Dict, Optional
+from urllib.parse import quote
+import aiofiles
+import logging
+from sqlalchemy.orm import Session
+
+from app.core.database import get_db
+from app.api.dependencies import get_current_user
+from app.models.auth_models import User
+from app.services.quota_service import QuotaService
+from app.jobs.queue import (
+    FINISHED_STATUSES,
+    JobStatus,
+    cancel_job,
+    create_job,
+    delete_job,
+    get_job_store,
+    job_dir,
+    new_job_id,
+    refund_job_quota,
+)
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+async def _save_job_input(file: UploadFile, job_id: str) -> Path:
+    """Lưu file upload vào thư mục của job (shared với worker)"""
+    target_dir = job_dir(job_id)
+    target_dir.mkdir(parents=True, exist_ok=True)
+    input_path = target_dir / f"input{Path(file.filename).suffix.lower()}"
+
+    async with aiofiles.open(input_path, "wb") as f:
+        while chunk := await file.read(1024 * 1024):
+            await f.write(chunk)
+    return input_path
+
+
+def _get_owned_job(job_id: str, current_user: User) -> Dict[str, Any]:
+    """Lấy job, chỉ chủ sở hữu (hoặc superuser) được xem"""
+    job = get_job_store().get(job_id)
+    if job is None:
+        raise HTTPException(404, f"Job {job_id} not found")
+    if job["user_id"] != current_user.id and not current_user.is_superuser:
+        raise HTTPException(404, f"Job {job_id} not found")
+    return job
+
+
+def _job_response(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Public view của job (ẩn đường dẫn nội bộ)"""
+    response = {
+        "job_id": job["id"],
+        "type": job["type"],
+        "status": job["status"],
+        "progress": job["progress"],
+        "message": job["message"],
+        "filename": job["input_filename"],
+        "error": job["error"],
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"],
+        "result_url": None,
+    }
+    if job["status"] == JobStatus.SUCCEEDED.value:
+        response["result_url"] = f"/api/v1/jobs/{job['id']}/result"
+        response["result_filename"] = job["result_filename"]
+        response["result_metadata"] = job["result_metadata"]
+    return response
+
+
+@router.post("/pdf-to-word")
+async def submit_pdf_to_word(
+    file: UploadFile = File(..., description="PDF file"),
+    start_page: int = Form(0, description="Start page (0-indexed)"),
+    end_page: Optional[int] = Form(None, description="End page (None = all)"),
+    enable_ocr: bool = Form(False, description="Enable OCR for scanned PDFs"),
+    ocr_language: str = Form("vi-VN", description="OCR language (vi-VN, en-US, ...)"),
+    auto_detect_scanned: bool = Form(True, description="Auto-detect scanned PDFs and enable OCR"),
+    use_gemini: bool = Form(False, description="Use Gemini API (best for Vietnamese + tables)"),
+    gemini_model: Optional[str] = Form(None, description="Gemini model to use"),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    📥 PDF → Word dạng background job (cho file lớn / Gemini / Adobe)
+
+    Giống `/documents/convert/pdf-to-word` nhưng trả về `job_id` ngay,
+    không bị giới hạn timeout 300s của request.
+    """
+    if not file.filename.lower().endswith('.pdf'):
+        raise HTTPException(400, "File must be a PDF")
+
+    job_id = new_job_id()
+    input_path = await _save_job_input(file, job_id)
+
+    job = create_job(
+        "pdf_to_word",
+        user_id=current_user.id,
+        input_path=input_path,
+        input_filename=file.filename,
+        params={
+            "start_page": start_page,
+            "end_page": end_page,
+            "enable_ocr": enable_ocr,
+            "ocr_language": ocr_language,
+            "auto_detect_scanned": auto_detect_scanned,
+            "use_gemini": use_gemini,
+            "gemini_model": gemini_model,
+        },
+        job_id=job_id
+    )
+    return _job_response(job)
+
+
+@router.post("/pdf/ocr-smart")
+async def submit_smart_pdf_ocr(
+    file: UploadFile = File(..., description="PDF file"),
+    ai_engine: str = Form("gemini", description="AI engine: gemini or claude"),
+    language: str = Form("vi", description="Language for OCR: vi, en"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    🤖 Smart PDF OCR dạng background job
+
+    **⚠️ REQUIRES AUTHENTICATION + AI QUOTA**
+
+    Quota được giữ ngay khi submit (PDF scan) và tự hoàn lại nếu job
+    thất bại hoặc bị hủy.
+    """
+    if not file.filename.lower().endswith('.pdf'):
+        raise HTTPException(400, "File must be a PDF")
+
+    job_id = new_job_id()
+    input_path = await _save_job_input(file, job_id)
+
+    try:
+        # Phân loại từng trang (giống /documents/pdf/ocr-smart): PDF text có vài trang scan
+        # ở cuối vẫn phải giữ quota
+        from app.services.page_workers import classify_pdf_pages
+        pages = await asyncio.to_thread(classify_pdf_pages, input_path)
+        is_scanned = any(page.scanned for page in pages)
+
+        if is_scanned:
+            # Giữ quota trước khi enqueue (worker hoàn lại nếu thất bại)
+            quota_info = QuotaService.check_ai_quota(current_user, db)
+            db.commit()
+            logger.info(f"User {current_user.email} queued AI OCR job. Quota: {quota_info}")
+    except Exception:
+        delete_job(job_id)
+        raise
+
+    job = create_job(
+        "smart_ocr",
+        user_id=current_user.id,
+        input_path=input_path,
+        input_filename=file.filename,
+        params={
+            "ai_engine": ai_engine,
+            "language": language,
+            "refund_quota": is_scanned,
+        },
+        job_id=job_id
+    )
+    return {
+        **_job_response(job),
+        "quota_used": quota_info if is_scanned else None,
+    }
+
+
+@router.get("/{job_id}")
+async def get_job_status(
+    job_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    """Trạng thái + tiến độ của job"""
+    return _job_response(_get_owned_job(job_id, current_user))
+
+
+@router.get("/{job_id}/result")
+async def download_job_result(
+    job_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    """Tải file kết quả (chỉ khi job đã succeeded)"""
+    job = _get_owned_job(job_id, current_user)
+
+    if job["status"] != JobStatus.SUCCEEDED.value:
+        raise HTTPException(409, f"Job is {job['status']}, result not available")
+
+    result_path = Path(job["result_path"])
+    if not result_path.exists():
+        raise HTTPException(410, "Result has expired")
+
+    return FileResponse(
+        path=result_path,
+        media_type=job["result_media_type"],
+        headers={
+            "Content-Disposition": f"attachment; filename*=UTF-8''{quote(job['result_filename'])}"
+        }
+    )
+
+
+@router.delete("/{job_id}")
+async def cancel_or_delete_job(
+    job_id: str,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Hủy job chưa xong, hoặc xóa job đã xong (kèm file kết quả)
+
+    Job đang chạy: đánh dấu cancelled, worker sẽ bỏ kết quả khi chạy xong.
+    """
+    job = _get_owned_job(job_id, current_user)
+
+    if job["status"] in FINISHED_STATUSES:
+        delete_job(job_id)
+        return {"job_id": job_id, "status": "deleted"}
+
+    job = cancel_job(job_id)
+    if job is None:
+        raise HTTPException(404, f"Job {job_id} not found")
+
+    # Job bị hủy khi chưa chạy → worker sẽ bỏ qua, hoàn quota ngay tại đây
+    # (job đang chạy: worker tự hoàn khi chạy xong; flag `refunded` chặn hoàn 2 lần)
+    if job["status"] == JobStatus.CANCELLED.value and job.get("started_at") is None:
+        refund_job_quota(job_id, db)
+
+    return _job_response(job)
@@ -2,9 +2,12 @@
 OCR Comparison API - Compare Adobe, Tesseract, and Gemini OCR engines
 """
 from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
+from fastapi.responses import StreamingResponse
 from pathlib import Path
+import asyncio
+import json
 import time
-from typing import Dict, Any
+from typing import AsyncIterator, Awaitable, Dict, Any, List, Tuple
 from loguru import logger
 from sqlalchemy.orm import Session
 
@@ -12,8 +15,10 @@ from app.core.config import settings
 from app.services.ocr_service import OCRService
 from app.services.gemini_service import GeminiService
 from app.services.document_service import DocumentService
+from app.services.provider_executor import run_blocking
+from app.services.upload_ingest import ingest_upload, remove_upload
 from app.services.ai_usage_service import get_api_key, get_primary_key, log_usage, check_budget_limit
-from app.core.database import get_db
+from app.core.database import get_db, SessionLocal
 from app.api.dependencies import get_current_user
 from app.models.auth_models import User
 
@@ -33,37 +38,130 @@ def get_ocr_service(
 document_service = DocumentService()
 
 
+async def _run_engine(engine_name: str, task: Awaitable[Dict[str, Any]], timeout: float) -> Dict[str, Any]:
+    """Chạy 1 engine với timeout riêng - engine bị treo không chặn các engine khác"""
+    try:
+        return await asyncio.wait_for(task, timeout=timeout)
+    except asyncio.TimeoutError:
+        logger.warning(f"⏰ {engine_name} OCR timed out after {timeout}s")
+        return {
+            "engine": engine_name,
+            "available": False,
+            "error": f"{engine_name} không phản hồi sau {timeout:.0f}s",
+            "timed_out": True,
+            "processing_time": timeout
+        }
+
+
+def _build_comparison(engines: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """So sánh tốc độ + độ chi tiết giữa các engine chạy thành công"""
+    available_engines = [
+        name for name, data in engines.items()
+        if data.get("available", False) and data.get("success", False)
+    ]
+    
+    if len(available_engines) < 2:
+        return {
+            "available_engines": available_engines,
+            "note": "Need at least 2 engines to compare"
+        }
+    
+    lengths = {name: engines[name].get("char_count", 0) for name in available_engines}
+    times = {name: engines[name].get("processing_time", 0) for name in available_engines}
+    
+    fastest = min(times, key=times.get) if times else None
+    most_detailed = max(lengths, key=lengths.get) if lengths else None
+    
+    return {
+        "available_engines": available_engines,
+        "fastest_engine": fastest,
+        "fastest_time": times.get(fastest, 0) if fastest else 0,
+        "most_detailed_engine": most_detailed,
+        "most_text": lengths.get(most_detailed, 0) if most_detailed else 0,
+        "char_counts": lengths,
+        "processing_times": times
+    }
+
+
+def _cleanup_temp_file(temp_file: Path):
+    # Xóa cả thư mục upload (gồm file _adobe.pdf tạm của Adobe engine)
+    remove_upload(temp_file, Path(settings.TEMP_DIR))
+
+
+def _sse_event(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def _stream_engine_results(
+    results: Dict[str, Any],
+    tasks: List[Tuple[str, Awaitable[Dict[str, Any]]]],
+    timeout: float,
+    temp_file: Path
+) -> AsyncIterator[str]:
+    """
+    Server-sent events: gửi kết quả từng engine ngay khi engine đó xong
+    
+    Events: start → engine (x N, theo thứ tự hoàn thành) → comparison → done
+    """
+    running = [
+        asyncio.create_task(_run_engine(engine_name, task, timeout))
+        for engine_name, task in tasks
+    ]
+    try:
+        yield _sse_event("start", {
+            "filename": results["filename"],
+            "file_size": results["file_size"],
+            "language": results["language"],
+            "engines": [engine_name for engine_name, _ in tasks]
+        })
+        
+        for next_done in asyncio.as_completed(running):
+            result = await next_done
+            results["engines"][result["engine"]] = result
+            yield _sse_event("engine", result)
+        
+        results["comparison"] = _build_comparison(results["engines"])
+        yield _sse_event("comparison", results["comparison"])
+        yield _sse_event("done", {"engines": len(results["engines"])})
+        logger.info(f"✅ OCR comparison streamed: {len(results['comparison']['available_engines'])} engines")
+    finally:
+        # Client ngắt kết nối → hủy các engine còn chạy
+        for task in running:
+            task.cancel()
+        _cleanup_temp_file(temp_file)
+
+
 @router.post("/compare-engines")
 async def compare_ocr_engines(
     file: UploadFile = File(...),
     language: str = "vi",
+    stream: bool = False,
     ocr_service: OCRService = Depends(get_ocr_service),
 ):
     """
-    Compare OCR results from Adobe, Tesseract, and Gemini
+    Compare OCR results from Adobe, Tesseract, Gemini and Claude
+    
+    Các engine chạy song song, mỗi engine có timeout riêng
+    (OCR_COMPARE_ENGINE_TIMEOUT_SECONDS) → tổng thời gian = engine chậm nhất.
     
     Args:
         file: Image file to OCR
         language: Language code (vi, en, etc.)
+        stream: True → trả về text/event-stream, mỗi engine 1 event khi xong
     
     Returns:
         Comparison results from all available engines
     """
     try:
-        # Save uploaded file
-        temp_dir = Path(settings.TEMP_DIR)
-        temp_dir.mkdir(parents=True, exist_ok=True)
-        
-        temp_file = temp_dir / f"ocr_compare_{int(time.time())}_{file.filename}"
-        with open(temp_file, "wb") as f:
-            content = await file.read()
-            f.write(content)
+        # Save uploaded file (streamed, unique temp dir per request)
+        upload = await ingest_upload(file, Path(settings.TEMP_DIR))
+        temp_file = upload.path
         
         logger.info(f"📄 Comparing OCR engines for: {file.filename}")
         
         results = {
             "filename": file.filename,
-            "file_size": len(content),
+            "file_size": upload.size,
             "language": language,
             "engines": {}
         }
@@ -134,7 +232,8 @@ async def compare_ocr_engines(
                 
                 # Upload PDF
                 with open(pdf_path, 'rb') as f:
-                    input_asset = pdf_services.upload(
+                    input_asset = await run_blocking(
+                        "adobe", pdf_services.upload,
                         input_stream=f,
                         mime_type=PDFServicesMediaType.PDF
                     )
@@ -150,15 +249,16 @@ async def compare_ocr_engines(
                 )
                 
                 # Execute job
-                location = pdf_services.submit(export_pdf_job)
-                pdf_services_response = pdf_services.get_job_result(
+                location = await run_blocking("adobe", pdf_services.submit, export_pdf_job)
+                pdf_services_response = await run_blocking(
+                    "adobe", pdf_services.get_job_result,
                     location,
                     ExportPDFResult
                 )
                 
                 # Download result
                 result_asset = pdf_services_response.get_result().get_asset()
-                stream_asset = pdf_services.get_content(result_asset)
+                stream_asset = await run_blocking("adobe", pdf_services.get_content, result_asset)
                 
                 # Save DOCX
                 docx_path = temp_file.parent / f"{temp_file.stem}_adobe.docx"
@@ -226,7 +326,7 @@ async def compare_ocr_engines(
         tasks.append(("tesseract", run_tesseract()))
         
         # 3. Gemini Vision AI
-        logger.info(f"Gemini check: use_gemini={document_service.use_gemini}, api_key_exists={bool(document_service.gemini_api_key)}")
+        logger.info(f"Gemini check: use_gemini={document_service.use_gemini}, model={document_service.gemini_model_name}")
         if document_service.use_gemini:
             async def run_gemini():
                 try:
@@ -246,8 +346,10 @@ YÊU CẦU:
 
 Trả về văn bản:"""
                     
-                    # Call Gemini API
-                    response = document_service.gemini_model.generate_content([prompt, image])
+                    # Call Gemini API (off the event loop - các engine khác chạy song song)
+                    gemini_client = await asyncio.to_thread(document_service._get_gemini_client)
+                    gemini_model = gemini_client.model(document_service.gemini_model_name)
+                    response = await run_blocking("gemini", gemini_model.generate_content, [prompt, image])
                     text = response.text.strip()
                     
                     elapsed = time.time() - start
@@ -304,8 +406,10 @@ Trả về văn bản:"""
             try:
                 # Try to get API key from database first, fallback to settings
                 db = SessionLocal()
-                claude_api_key = get_api_key("claude", db)
-                db.close()
+                try:
+                    claude_api_key = get_api_key("claude", db)
+                finally:
+                    db.close()
                 
                 if not claude_api_key:
                     # Fallback to .env settings
@@ -354,8 +458,9 @@ YÊU CẦU:
 
 Trả về văn bản:"""
                 
-                # Call Claude API
-                message = client.messages.create(
+                # Call Claude API (sync SDK → thread, không block các engine khác)
+                message = await asyncio.to_thread(
+                    client.messages.create,
                     model="claude-sonnet-4-20250514",
                     max_tokens=1024,
                     messages=[
@@ -430,46 +535,30 @@ Trả về văn bản:"""
                 }
         tasks.append(("claude", run_claude()))
         
-        # Execute all tasks
-        for engine_name, task in tasks:
-            result = await task
-            results["engines"][engine_name] = result
-        
-        # Calculate comparison metrics
-        available_engines = [
-            name for name, data in results["engines"].items() 
-            if data.get("available", False) and data.get("success", False)
-        ]
+        engine_names = [engine_name for engine_name, _ in tasks]
+        timeout = settings.OCR_COMPARE_ENGINE_TIMEOUT_SECONDS
         
-        if len(available_engines) >= 2:
-            lengths = {name: results["engines"][name].get("char_count", 0) for name in available_engines}
-            times = {name: results["engines"][name].get("processing_time", 0) for name in available_engines}
-            
-            fastest = min(times, key=times.get) if times else None
-            most_detailed = max(lengths, key=lengths.get) if lengths else None
-            
-            results["comparison"] = {
-                "available_engines": available_engines,
-                "fastest_engine": fastest,
-                "fastest_time": times.get(fastest, 0) if fastest else 0,
-                "most_detailed_engine": most_detailed,
-                "most_text": lengths.get(most_detailed, 0) if most_detailed else 0,
-                "char_counts": lengths,
-                "processing_times": times
-            }
-        else:
-            results["comparison"] = {
-                "available_engines": available_engines,
-                "note": "Need at least 2 engines to compare"
-            }
+        if stream:
+            return StreamingResponse(
+                _stream_engine_results(results, tasks, timeout, temp_file),
+                media_type="text/event-stream",
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+            )
         
-        # Cleanup
+        # Execute all engines concurrently (wall time = slowest engine)
         try:
-            temp_file.unlink()
-        except:
-            pass
+            engine_results = await asyncio.gather(*[
+                _run_engine(engine_name, task, timeout) for engine_name, task in tasks
+            ])
+        finally:
+            _cleanup_temp_file(temp_file)
+        
+        for engine_name, result in zip(engine_names, engine_results):
+            results["engines"][engine_name] = result
+        
+        results["comparison"] = _build_comparison(results["engines"])
         
-        logger.info(f"✅ OCR comparison complete: {len(available_engines)} engines")
+        logger.info(f"✅ OCR comparison complete: {len(results['comparison']['available_engines'])} engines")
         return results
         
     except Exception as e:
@@ -10,6 +10,7 @@ from app.core.database import get_db
 from app.api.dependencies import get_current_superuser
 from app.models.auth_models import User, Role, Permission
 from app.services.activity_logger import log_role_action
+from app.services.auth_cache import get_auth_cache
 
 
 router = APIRouter()
@@ -211,6 +212,7 @@ def update_role(
             db.add(permission)
     
     db.commit()
+    get_auth_cache().invalidate_all()
     db.refresh(role)
     
     # Log activity
@@ -266,6 +268,7 @@ def delete_role(
     
     db.delete(role)
     db.commit()
+    get_auth_cache().invalidate_all()
     
     return None
 
@@ -75,6 +75,8 @@ class Settings(BaseSettings):
     JWT_SECRET_KEY: str = "jwt-secret-key-change-this"
     JWT_ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 1440  # 24 hours
+    AUTH_CACHE_TTL_SECONDS: int = 30  # Cache user + permission set / process (0 = tắt)
+    AUTH_CACHE_MAX_USERS: int = 10000
     
     # CORS
     CORS_ORIGINS: list = [
@@ -85,7 +87,7 @@ class Settings(BaseSettings):
     ]
     
     # File Upload
-    MAX_UPLOAD_SIZE: int = 52428800  # 50MB
+    MAX_UPLOAD_SIZE: int = 209715200  # 200MB (enforced while streaming uploads, see upload_ingest.py)
     UPLOAD_DIR: str = "./uploads"
     TEMP_DIR: str = "./temp"
     ALLOWED_IMAGE_EXTENSIONS: list = ["jpg", "jpeg", "png", "gif", "bmp", "webp"]
@@ -106,14 +108,83 @@ class Settings(BaseSettings):
     # Default: "tesseract,adobe" = Try Tesseract first (free), fallback to Adobe
     OCR_PRIORITY: str = "tesseract,adobe"  # User can change to "adobe,tesseract"
     
+    # OCR Compare: timeout riêng cho từng engine (các engine chạy song song)
+    OCR_COMPARE_ENGINE_TIMEOUT_SECONDS: int = 120
+    
+    # Page process pool (Tesseract OCR, render theo trang) - 0 = số CPU
+    PAGE_WORKERS: int = 0
+    TESSERACT_OCR_DPI: int = 300
+    PAGE_RENDER_MAX_PIXELS: int = 50_000_000  # Trang khổ lớn (bản vẽ A0, poster) bị hạ scale cho vừa (~200MB RGBA)
+    
+    # Result cache: kết quả conversion theo SHA-256 của file + tham số
+    RESULT_CACHE_ENABLED: bool = True
+    RESULT_CACHE_DIR: str = "./uploads/result_cache"
+    RESULT_CACHE_MAX_MB: int = 2048
+    RESULT_CACHE_REDIS_INDEX: bool = False  # true: LRU index dùng chung qua Redis
+    
+    # Page preview / thumbnail (/documents/pdf/preview) - cache ảnh render riêng, LRU theo dung lượng
+    PREVIEW_CACHE_DIR: str = "./uploads/preview_cache"
+    PREVIEW_CACHE_MAX_MB: int = 512
+    PREVIEW_MAX_WIDTH: int = 2000
+    PREVIEW_DEFAULT_WIDTH: int = 240
+    PREVIEW_HTTP_MAX_AGE_SECONDS: int = 86400  # Cache-Control cho browser (URL theo nội dung → không đổi)
+    
+    # AI vision OCR theo trang (Claude/Gemini) - xem page_fanout.py
+    AI_OCR_PAGE_CONCURRENCY_CLAUDE: int = 4  # Số trang gọi Claude song song (mọi request)
+    AI_OCR_PAGE_CONCURRENCY_GEMINI: int = 8
+    AI_OCR_PER_KEY_CONCURRENCY: int = 4  # Số request song song trên cùng 1 API key
+    AI_OCR_PAGE_RETRIES: int = 2  # Retry riêng trang lỗi (backoff 1s, 2s, ...)
+    AI_OCR_RENDER_DPI: int = 200
+    OCR_PAGE_MIN_TEXT_CHARS: int = 50  # Trang ít text hơn (và có ảnh phủ) → coi là scan
+    OCR_PAGE_MIN_IMAGE_COVERAGE: float = 0.5  # Tỉ lệ diện tích trang là ảnh để coi là scan
+    
     # Rate Limiting
     RATE_LIMIT_PER_MINUTE: int = 60
     RATE_LIMIT_PER_HOUR: int = 1000
-    
+
+    # Batch Processing (/documents/batch/*)
+    # Per-request = files of ONE upload processed in parallel
+    # Global = all batch items in this worker process
+    # Per-backend = protect Gotenberg / Adobe / Gemini / local CPU from overload
+    BATCH_MAX_CONCURRENCY: int = 4
+    BATCH_GLOBAL_CONCURRENCY: int = 16
+    BATCH_GOTENBERG_CONCURRENCY: int = 8
+    BATCH_ADOBE_CONCURRENCY: int = 4
+    BATCH_GEMINI_CONCURRENCY: int = 4
+    BATCH_LOCAL_CONCURRENCY: int = max(1, os.cpu_count() or 1)
+
+    # Gotenberg (Word/Excel/PPT → PDF)
+    # GOTENBERG_URLS: nhiều instance, phân tách bằng dấu phẩy (trống → GOTENBERG_URL)
+    GOTENBERG_URL: str = "http://gotenberg:3000"
+    GOTENBERG_URLS: str = ""
+    GOTENBERG_MAX_CONNECTIONS: int = 32  # Tổng connection (mọi instance) / event loop
+    GOTENBERG_FAILURE_THRESHOLD: int = 2  # Lỗi kết nối liên tiếp → tạm loại instance
+    GOTENBERG_COOLDOWN_SECONDS: float = 30.0
+
+    # Outbound HTTP (connection pool dùng chung, xem http_clients.py)
+    HTTP_CONNECT_TIMEOUT_SECONDS: float = 5.0
+    HTTP_KEEPALIVE_SECONDS: float = 15.0  # < idle timeout của upstream → tránh connection đã bị đóng
+    HTTP_PROVIDER_MAX_CONNECTIONS: int = 10
+
+    # External SDK calls (Gemini / Adobe SDK đồng bộ → thread pool riêng, không block event loop)
+    GEMINI_MAX_WORKERS: int = 8
+    GEMINI_CALL_TIMEOUT_SECONDS: int = 180
+    ADOBE_MAX_WORKERS: int = 4
+    ADOBE_CALL_TIMEOUT_SECONDS: int = 240
+
     # Celery
     CELERY_BROKER_URL: Optional[str] = None
     CELERY_RESULT_BACKEND: Optional[str] = None
-    
+
+    # Background Jobs (/api/v1/jobs - long-running conversions)
+    # "local" = built-in process pool (single node, no Redis needed)
+    # "redis" = Celery workers + Redis (run: celery -A app.jobs.celery_app worker)
+    JOB_QUEUE_BACKEND: str = "local"
+    JOB_WORKERS: int = 2
+    JOB_DIR: str = "./uploads/jobs"
+    JOB_RESULT_TTL_HOURS: int = 24
+    JOB_MAX_ATTEMPTS: int = 2  # Celery giao lại job khi worker chết; quá số lần → FAILED + hoàn quota
+
     # Email (optional)
     SMTP_HOST: Optional[str] = None
     SMTP_PORT: int = 587
@@ -126,6 +197,12 @@ class Settings(BaseSettings):
     ENABLE_SENTRY: bool = False
     SENTRY_DSN: Optional[str] = None
     
+    # Usage/audit log write-behind (activity, AI usage, Gemini key usage, OCR analytics)
+    LOG_BUFFER_ENABLED: bool = True  # False = ghi DB ngay trong request (như cũ)
+    LOG_BUFFER_MAX_SIZE: int = 10000  # Hàng đợi đầy → record được ghi trực tiếp
+    LOG_BUFFER_BATCH_SIZE: int = 500  # Số record tối đa / transaction
+    LOG_BUFFER_FLUSH_SECONDS: float = 2.0  # Chu kỳ flush nền
+    
     # Adobe PDF Services API
     USE_ADOBE_PDF_API: bool = False
     PDF_SERVICES_CLIENT_ID: Optional[str] = None
@@ -136,6 +213,13 @@ class Settings(BaseSettings):
     USE_GEMINI_API: bool = False
     GEMINI_API_KEY: Optional[str] = None
     GEMINI_MODEL: str = "gemini-1.5-flash"  # or gemini-1.5-pro
+    GEMINI_KEY_POOL_TTL_SECONDS: int = 60  # Cache key đã giải mã trong RAM (0 = tắt cache)
+    GEMINI_CHUNK_PAGES: int = 10  # PDF dài hơn → cắt thành chunk N trang (tránh cắt cụt output)
+    GEMINI_CHUNK_CONCURRENCY: int = 4  # Số chunk gọi Gemini song song / request
+    
+    # Document Generation (template .docx + JSON)
+    DOCGEN_ENGINE: str = "adobe"  # adobe (Document Merge API) | local (docxtpl, không tốn quota)
+    DOCGEN_LOCAL_MAX_ITEMS: int = 1000  # Số item tối đa / batch với engine local (Adobe: 100)
     
     # Anthropic Claude AI
     USE_CLAUDE_API: bool = False
@@ -0,0 +1,36 @@
+"""
+Celery app cho JOB_QUEUE_BACKEND="redis"
+
+Chạy worker:
+    cd backend
+    celery -A app.jobs.celery_app worker --loglevel=info --concurrency=2
+"""
+from celery import Celery
+
+from app.core.config import settings
+from app.jobs.tasks import execute_job
+
+celery_app = Celery(
+    "utility_jobs",
+    broker=settings.CELERY_BROKER_URL,
+    backend=settings.CELERY_RESULT_BACKEND,
+)
+
+celery_app.conf.update(
+    task_serializer="json",
+    accept_content=["json"],
+    result_serializer="json",
+    # Job dài (Gemini/Adobe) → chỉ ack khi xong, mỗi worker chỉ giữ 1 job
+    task_acks_late=True,
+    task_reject_on_worker_lost=True,
+    worker_prefetch_multiplier=1,
+    result_expires=settings.JOB_RESULT_TTL_HOURS * 3600,
+)
+
+
+@celery_app.task(name="jobs.execute", bind=True)
+def execute_job_task(self, job_id: str):
+    """Celery entry point - state/result lưu trong job store, không dùng Celery result"""
+    # Worker chết giữa chừng → message được giao lại, job vẫn đang RUNNING
+    redelivered = bool((self.request.delivery_info or {}).get("redelivered"))
+    return execute_job(job_id, redelivered=redelivered)
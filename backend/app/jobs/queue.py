@@ -0,0 +1,501 @@
+"""
+Background Job Queue - Chạy conversion dài (Gemini, Adobe, OCR) ngoài request
+
+Usage:
+    from app.jobs.queue import create_job, get_job_store
+
+    job = create_job("pdf_to_word", user_id=1, input_path=path, params={...})
+    # → trả job["id"] cho client ngay, client poll GET /api/v1/jobs/{id}
+
+Backends (config JOB_QUEUE_BACKEND):
+- "local": ProcessPoolExecutor trong API process + job state là JSON trên disk
+  (dùng được cho nhiều uvicorn worker trên cùng 1 node, không cần Redis)
+- "redis": Celery worker riêng + job state trong Redis
+  (chạy worker: celery -A app.jobs.celery_app worker --concurrency=2)
+
+Input/result files luôn nằm trong JOB_DIR/<job_id>/ (shared volume với worker).
+
+Job state được API (cancel) và worker (progress / kết quả) cùng ghi → mọi thay đổi
+đi qua update_job() = compare-and-set (lock file / Redis WATCH), có điều kiện theo status.
+"""
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+from enum import Enum
+from pathlib import Path
+from typing import Any, Callable, Collection, Dict, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class JobStatus(str, Enum):
+    """Trạng thái của job"""
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+
+FINISHED_STATUSES = {JobStatus.SUCCEEDED.value, JobStatus.FAILED.value, JobStatus.CANCELLED.value}
+ACTIVE_STATUSES = {JobStatus.QUEUED.value, JobStatus.RUNNING.value}
+
+# Hàm sửa job tại chỗ, trả False = không ghi (điều kiện compare-and-set không khớp)
+JobMutation = Callable[[Dict[str, Any]], bool]
+
+
+def job_dir(job_id: str) -> Path:
+    """Thư mục chứa input/result của 1 job"""
+    return Path(settings.JOB_DIR) / job_id
+
+
+# ==================== JOB STORES ====================
+
+class FileJobStore:
+    """Job state lưu dưới dạng JOB_DIR/<job_id>/job.json (ghi atomic)"""
+
+    def _path(self, job_id: str) -> Path:
+        return job_dir(job_id) / "job.json"
+
+    @contextmanager
+    def _locked(self, job_id: str):
+        """Lock độc quyền giữa các process (API + worker) trên JOB_DIR/<job_id>/job.lock"""
+        with open(job_dir(job_id) / "job.lock", "a+b") as lock_file:
+            if os.name == "nt":
+                import msvcrt
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if os.name == "nt":
+                    lock_file.seek(0)
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+                else:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def save(self, job: Dict[str, Any]) -> None:
+        path = self._path(job["id"])
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        tmp_path.write_text(json.dumps(job, ensure_ascii=False, default=str), encoding="utf-8")
+        os.replace(tmp_path, path)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        path = self._path(job_id)
+        if not path.exists():
+            return None
+        try:
+            return json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not read job {job_id}: {e}")
+            return None
+
+    def modify(self, job_id: str, mutate: JobMutation) -> Optional[Dict[str, Any]]:
+        """Read-modify-write dưới lock, trả job mới hoặc None (không tồn tại / mutate từ chối)"""
+        if not self._path(job_id).exists():
+            return None
+        with self._locked(job_id):
+            job = self.get(job_id)
+            if job is None or not mutate(job):
+                return None
+            self.save(job)
+            return job
+
+    def delete(self, job_id: str) -> None:
+        self._path(job_id).unlink(missing_ok=True)
+
+
+class RedisJobStore:
+    """Job state lưu trong Redis (key job:<id>, tự hết hạn sau JOB_RESULT_TTL_HOURS)"""
+
+    def __init__(self):
+        import redis
+
+        kwargs = {"decode_responses": True}
+        if settings.REDIS_PASSWORD:
+            kwargs["password"] = settings.REDIS_PASSWORD
+        self.client = redis.Redis.from_url(settings.REDIS_URL, **kwargs)
+        self.ttl_seconds = settings.JOB_RESULT_TTL_HOURS * 3600
+
+    def save(self, job: Dict[str, Any]) -> None:
+        self.client.set(
+            f"job:{job['id']}",
+            json.dumps(job, ensure_ascii=False, default=str),
+            ex=self.ttl_seconds
+        )
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        data = self.client.get(f"job:{job_id}")
+        return json.loads(data) if data else None
+
+    def modify(self, job_id: str, mutate: JobMutation) -> Optional[Dict[str, Any]]:
+        """Read-modify-write bằng WATCH/MULTI (key bị ghi giữa chừng → đọc lại, thử lại)"""
+        from redis.exceptions import WatchError
+
+        key = f"job:{job_id}"
+        with self.client.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(key)
+                    data = pipe.get(key)
+                    if not data:
+                        return None
+                    job = json.loads(data)
+                    if not mutate(job):
+                        return None
+                    pipe.multi()
+                    pipe.set(key, json.dumps(job, ensure_ascii=False, default=str), ex=self.ttl_seconds)
+                    pipe.execute()
+                    return job
+                except WatchError:
+                    continue
+
+    def delete(self, job_id: str) -> None:
+        self.client.delete(f"job:{job_id}")
+
+
+def update_job(
+    job_id: str,
+    expected_status: Optional[Collection[str]] = None,
+    **fields
+) -> Optional[Dict[str, Any]]:
+    """
+    Cập nhật job state (compare-and-set)
+
+    expected_status: chỉ ghi nếu status hiện tại thuộc tập này, vd tick progress chỉ ghi
+    khi RUNNING → không bao giờ ghi đè CANCELLED do API vừa set.
+
+    Returns:
+        Job sau khi cập nhật, None nếu job không tồn tại hoặc status không khớp
+    """
+    def mutate(job: Dict[str, Any]) -> bool:
+        if expected_status is not None and job["status"] not in expected_status:
+            return False
+        job.update(fields)
+        job["updated_at"] = datetime.utcnow().isoformat()
+        return True
+
+    return get_job_store().modify(job_id, mutate)
+
+
+def refund_job_quota(job_id: str, db) -> bool:
+    """
+    Hoàn quota AI đã giữ lúc submit (job thất bại / bị hủy) - tối đa 1 lần / job
+
+    Flag `refunded` được set bằng compare-and-set TRƯỚC khi hoàn, nên API (hủy job đang chờ)
+    và worker (job thất bại / bị hủy khi đang chạy) không thể cùng hoàn.
+
+    Returns:
+        True nếu lần gọi này đã hoàn quota
+    """
+    def claim(job: Dict[str, Any]) -> bool:
+        if job.get("refunded") or not job["params"].get("refund_quota") or not job.get("user_id"):
+            return False
+        job["refunded"] = True
+        return True
+
+    job = get_job_store().modify(job_id, claim)
+    if job is None:
+        return False
+
+    try:
+        from app.models.auth_models import User
+        from app.services.quota_service import QuotaService
+
+        user = db.query(User).filter(User.id == job["user_id"]).first()
+        if user:
+            QuotaService.rollback_quota_increment(user, db)
+        return True
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Could not refund quota for job {job_id}: {e}")
+        return False
+
+
+def fail_job(job_id: str, error: str) -> Optional[Dict[str, Any]]:
+    """
+    Đánh dấu job đang chờ / đang chạy là FAILED và hoàn quota
+
+    Dùng khi không còn worker nào chạy job (worker process chết, API restart).
+
+    Returns:
+        Job sau khi cập nhật, None nếu job không tồn tại hoặc đã kết thúc
+    """
+    from app.core.database import SessionLocal
+
+    job = update_job(
+        job_id,
+        expected_status=ACTIVE_STATUSES,
+        status=JobStatus.FAILED.value,
+        message="Thất bại",
+        error=error,
+        finished_at=datetime.utcnow().isoformat()
+    )
+    if job is not None:
+        db = SessionLocal()
+        try:
+            refund_job_quota(job_id, db)
+        finally:
+            db.close()
+    return job
+
+
+# ==================== QUEUE BACKENDS ====================
+
+class LocalJobQueue:
+    """
+    Built-in queue: process pool (spawn) trong API process
+
+    Dùng "spawn" thay vì fork để process con không thừa hưởng
+    event loop / DB connections / threads của uvicorn.
+    """
+
+    def __init__(self, max_workers: int):
+        self.max_workers = max(1, max_workers)
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._pool
+
+    def submit(self, job_id: str) -> None:
+        from app.jobs.tasks import execute_job
+
+        # Job chỉ sống trong pool của process này → recover_local_jobs() biết job nào mồ côi
+        update_job(job_id, expected_status=ACTIVE_STATUSES, owner_pid=os.getpid())
+
+        def _on_done(future):
+            # execute_job tự bắt lỗi conversion; tới đây là worker process chết
+            error = future.exception()
+            if error:
+                logger.error(f"❌ Job {job_id} crashed in worker process: {error}")
+                fail_job(job_id, str(error))
+
+        self._get_pool().submit(execute_job, job_id).add_done_callback(_on_done)
+
+    def cancel(self, job_id: str) -> None:
+        # Job đang chờ sẽ tự bỏ qua khi worker thấy status=cancelled
+        pass
+
+
+class CeleryJobQueue:
+    """Celery + Redis: worker chạy ở container/process riêng"""
+
+    def submit(self, job_id: str) -> None:
+        from app.jobs.celery_app import celery_app
+
+        celery_app.send_task("jobs.execute", args=[job_id], task_id=job_id)
+
+    def cancel(self, job_id: str) -> None:
+        from app.jobs.celery_app import celery_app
+
+        celery_app.control.revoke(job_id)
+
+
+_job_store = None
+_job_queue = None
+
+
+def get_job_store():
+    """Get job store theo JOB_QUEUE_BACKEND"""
+    global _job_store
+    if _job_store is None:
+        if settings.JOB_QUEUE_BACKEND.lower() == "redis":
+            _job_store = RedisJobStore()
+        else:
+            _job_store = FileJobStore()
+    return _job_store
+
+
+def get_job_queue():
+    """Get job queue theo JOB_QUEUE_BACKEND"""
+    global _job_queue
+    if _job_queue is None:
+        if settings.JOB_QUEUE_BACKEND.lower() == "redis":
+            _job_queue = CeleryJobQueue()
+            logger.info("✅ Job queue: Celery + Redis")
+        else:
+            _job_queue = LocalJobQueue(settings.JOB_WORKERS)
+            logger.info(f"✅ Job queue: local process pool ({settings.JOB_WORKERS} workers)")
+    return _job_queue
+
+
+# ==================== PUBLIC API ====================
+
+def new_job_id() -> str:
+    return uuid.uuid4().hex
+
+
+def create_job(
+    job_type: str,
+    user_id: Optional[int],
+    input_path: Path,
+    input_filename: str,
+    params: Optional[Dict[str, Any]] = None,
+    job_id: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Tạo job record và đẩy vào queue
+
+    input_path phải nằm trong job_dir(job_id) (worker đọc từ shared volume).
+    """
+    purge_expired_jobs()
+
+    now = datetime.utcnow().isoformat()
+    job = {
+        "id": job_id or new_job_id(),
+        "type": job_type,
+        "status": JobStatus.QUEUED.value,
+        "progress": 0,
+        "message": "Đang chờ xử lý",
+        "user_id": user_id,
+        "input_filename": input_filename,
+        "input_path": str(input_path),
+        "params": params or {},
+        "result_path": None,
+        "result_filename": None,
+        "result_media_type": None,
+        "result_metadata": None,
+        "error": None,
+        "refunded": False,
+        "attempts": 0,
+        "created_at": now,
+        "updated_at": now,
+        "started_at": None,
+        "finished_at": None,
+    }
+    get_job_store().save(job)
+    get_job_queue().submit(job["id"])
+
+    logger.info(f"📥 Job {job['id']} queued: {job_type} ({input_filename})")
+    return job
+
+
+def cancel_job(job_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Hủy job đang chờ (job đang chạy sẽ chạy hết nhưng kết quả bị bỏ)
+
+    Job bị hủy khi chưa chạy có started_at = None: worker sẽ không bao giờ chạy nó
+    (QUEUED → RUNNING cũng là compare-and-set).
+    """
+    job = update_job(
+        job_id,
+        expected_status=ACTIVE_STATUSES,
+        status=JobStatus.CANCELLED.value,
+        message="Đã hủy",
+        finished_at=datetime.utcnow().isoformat()
+    )
+    if job is None:
+        # Không tồn tại hoặc vừa kết thúc → trả trạng thái hiện tại
+        return get_job_store().get(job_id)
+    get_job_queue().cancel(job_id)
+    return job
+
+
+def _process_alive(pid: int) -> bool:
+    if os.name == "nt":
+        import ctypes
+
+        PROCESS_QUERY_LIMITED_INFORMATION = 0x1000
+        handle = ctypes.windll.kernel32.OpenProcess(PROCESS_QUERY_LIMITED_INFORMATION, False, pid)
+        if not handle:
+            return False
+        ctypes.windll.kernel32.CloseHandle(handle)
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # Process của user khác
+    return True
+
+
+def recover_local_jobs() -> Dict[str, int]:
+    """
+    [API startup, JOB_QUEUE_BACKEND="local"] Xử lý job mồ côi sau restart / redeploy
+
+    Job của backend local chỉ sống trong process pool của API process đã submit nó
+    (owner_pid). Owner không còn chạy (hoặc là chính process này - pid được dùng lại):
+    - QUEUED → submit lại vào pool của process này
+    - RUNNING → FAILED + hoàn quota (không biết đã chạy tới đâu)
+    Job của uvicorn worker khác còn sống thì để nguyên.
+
+    Returns:
+        {"requeued": n, "failed": n}
+    """
+    stats = {"requeued": 0, "failed": 0}
+    root = Path(settings.JOB_DIR)
+    if not root.exists():
+        return stats
+
+    pid = os.getpid()
+    store = get_job_store()
+    for path in root.iterdir():
+        if not path.is_dir():
+            continue
+        job = store.get(path.name)
+        if job is None or job["status"] not in ACTIVE_STATUSES:
+            continue
+        owner_pid = job.get("owner_pid")
+        if owner_pid and owner_pid != pid and _process_alive(owner_pid):
+            continue
+
+        if job["status"] == JobStatus.QUEUED.value:
+            # Compare-and-set theo owner: nhiều worker cùng khởi động chỉ 1 worker nhận job
+            def adopt(current: Dict[str, Any]) -> bool:
+                if current["status"] != JobStatus.QUEUED.value or current.get("owner_pid") != owner_pid:
+                    return False
+                current["owner_pid"] = pid
+                return True
+
+            if store.modify(job["id"], adopt):
+                get_job_queue().submit(job["id"])
+                stats["requeued"] += 1
+        elif fail_job(job["id"], "Server restarted while the job was running - please resubmit"):
+            stats["failed"] += 1
+
+    if stats["requeued"] or stats["failed"]:
+        logger.info(f"♻️ Recovered orphaned jobs: {stats['requeued']} requeued, {stats['failed']} failed")
+    return stats
+
+
+def delete_job(job_id: str) -> None:
+    """Xóa job record + toàn bộ file input/result"""
+    get_job_store().delete(job_id)
+    shutil.rmtree(job_dir(job_id), ignore_errors=True)
+
+
+def purge_expired_jobs() -> int:
+    """Xóa thư mục job cũ hơn JOB_RESULT_TTL_HOURS"""
+    root = Path(settings.JOB_DIR)
+    if not root.exists():
+        return 0
+
+    max_age_seconds = settings.JOB_RESULT_TTL_HOURS * 3600
+    now = time.time()
+    count = 0
+    for path in root.iterdir():
+        if path.is_dir() and now - path.stat().st_mtime > max_age_seconds:
+            delete_job(path.name)
+            count += 1
+    if count:
+        logger.info(f"🗑️ Purged {count} expired jobs")
+    return count
@@ -0,0 +1,228 @@
+"""
+Job handlers - Code chạy trong worker process (local process pool hoặc Celery worker)
+
+Mỗi handler nhận (service, job, input_path, out_dir, db, progress) và trả về
+dict mô tả kết quả: {"path": Path, "filename": str, "media_type": str, "metadata": dict}
+"""
+import json
+import logging
+import shutil
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.jobs.queue import JobStatus, get_job_store, job_dir, refund_job_quota, update_job
+from app.services.http_clients import run_on_thread_loop
+
+logger = logging.getLogger(__name__)
+
+DOCX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+# DocumentService khởi tạo tốn thời gian (Adobe/Gemini clients) → cache 1 instance / process
+_doc_service = None
+
+
+def _get_doc_service():
+    global _doc_service
+    if _doc_service is None:
+        # Import models để SQLAlchemy resolve relationships trong process mới (spawn)
+        from app import models as _models
+        from app.services.document_service import DocumentService
+
+        logger.debug(f"Loaded {len(_models.__all__)} models in job worker")
+
+        _doc_service = DocumentService(upload_dir="./uploads/documents")
+    return _doc_service
+
+
+# ==================== HANDLERS ====================
+
+async def _handle_pdf_to_word(service, job, input_path: Path, out_dir: Path, db, progress) -> Dict[str, Any]:
+    params = job["params"]
+    progress(10, "Đang chuyển đổi PDF → Word")
+
+    output_path = await service.pdf_to_word(
+        input_path,
+        start_page=params.get("start_page", 0),
+        end_page=params.get("end_page"),
+        enable_ocr=params.get("enable_ocr", False),
+        ocr_language=params.get("ocr_language", "vi-VN"),
+        auto_detect_scanned=params.get("auto_detect_scanned", True),
+        use_gemini=params.get("use_gemini", False),
+        gemini_model=params.get("gemini_model"),
+        db=db
+    )
+
+    progress(90, "Đang lưu kết quả")
+    result_path = out_dir / f"{Path(job['input_filename']).stem}.docx"
+    shutil.move(str(output_path), result_path)
+
+    return {
+        "path": result_path,
+        "filename": result_path.name,
+        "media_type": DOCX_MEDIA_TYPE,
+        "metadata": None,
+    }
+
+
+async def _handle_smart_ocr(service, job, input_path: Path, out_dir: Path, db, progress) -> Dict[str, Any]:
+    params = job["params"]
+    progress(10, "Đang OCR tài liệu")
+
+    result = await service.smart_pdf_ocr(
+        input_path,
+        ai_engine=params.get("ai_engine", "gemini"),
+        language=params.get("language", "vi"),
+        db=db
+    )
+
+    progress(90, "Đang lưu kết quả")
+    result_path = out_dir / "result.json"
+    result_path.write_text(json.dumps(result, ensure_ascii=False, default=str), encoding="utf-8")
+
+    return {
+        "path": result_path,
+        "filename": f"{Path(job['input_filename']).stem}_ocr.json",
+        "media_type": "application/json",
+        # Metadata nhỏ để status endpoint trả về ngay (không cần tải file)
+        "metadata": {
+            "processing": result.get("processing"),
+            "ai_usage": result.get("ai_usage"),
+        },
+    }
+
+
+JOB_HANDLERS: Dict[str, Callable] = {
+    "pdf_to_word": _handle_pdf_to_word,
+    "smart_ocr": _handle_smart_ocr,
+}
+
+
+# ==================== EXECUTION ====================
+
+def _claim_job(job_id: str, redelivered: bool) -> Optional[Dict[str, Any]]:
+    """
+    QUEUED → RUNNING (compare-and-set: job vừa bị hủy thì không chạy)
+
+    Message được Celery giao lại (acks_late: worker chết giữa chừng) được nhận lại job
+    đang RUNNING - worker cũ đã chết nên không ai khác cập nhật job nữa.
+    Quá JOB_MAX_ATTEMPTS lần → FAILED (job làm chết worker mỗi lần chạy).
+    """
+    claimable = {JobStatus.QUEUED.value}
+    if redelivered:
+        claimable.add(JobStatus.RUNNING.value)
+    now = datetime.utcnow().isoformat()
+
+    def claim(job: Dict[str, Any]) -> bool:
+        if job["status"] not in claimable:
+            return False
+        job["attempts"] = job.get("attempts", 0) + 1
+        if job["attempts"] > settings.JOB_MAX_ATTEMPTS:
+            job.update(
+                status=JobStatus.FAILED.value,
+                message="Thất bại",
+                error=f"Worker stopped while processing ({job['attempts'] - 1} attempts)",
+                finished_at=now
+            )
+        else:
+            job.update(status=JobStatus.RUNNING.value, progress=5, message="Đang xử lý", started_at=now)
+        job["updated_at"] = now
+        return True
+
+    return get_job_store().modify(job_id, claim)
+
+
+def execute_job(job_id: str, redelivered: bool = False) -> Optional[str]:
+    """
+    Chạy 1 job (entry point của worker process)
+
+    Args:
+        redelivered: Celery giao lại message sau khi worker trước chết giữa chừng
+
+    Returns:
+        Status cuối cùng của job, None nếu job không tồn tại
+    """
+    started_at = datetime.utcnow()
+    job = _claim_job(job_id, redelivered)
+    if job is None:
+        current = get_job_store().get(job_id)
+        if current is None:
+            logger.warning(f"Job {job_id} not found - skipped")
+            return None
+        logger.info(f"Job {job_id} is {current['status']} - skipped")
+        return current["status"]
+
+    if job["status"] == JobStatus.FAILED.value:
+        logger.error(f"❌ Job {job_id} ({job['type']}) failed: {job['error']}")
+        db = SessionLocal()
+        try:
+            refund_job_quota(job_id, db)
+        finally:
+            Path(job["input_path"]).unlink(missing_ok=True)
+            db.close()
+        return JobStatus.FAILED.value
+    if job["attempts"] > 1:
+        logger.warning(f"🔁 Job {job_id} redelivered - attempt {job['attempts']}/{settings.JOB_MAX_ATTEMPTS}")
+
+    handler = JOB_HANDLERS.get(job["type"])
+    running = {JobStatus.RUNNING.value}
+
+    def progress(percent: int, message: str) -> None:
+        update_job(job_id, expected_status=running, progress=percent, message=message)
+
+    db = SessionLocal()
+    try:
+        if handler is None:
+            raise ValueError(f"Unknown job type '{job['type']}'")
+
+        out_dir = job_dir(job_id)
+        out_dir.mkdir(parents=True, exist_ok=True)
+        # Loop sống lâu của worker (asyncio.run mỗi job bỏ lại HTTP client không đóng)
+        result = run_on_thread_loop(
+            handler, _get_doc_service(), job, Path(job["input_path"]), out_dir, db, progress
+        )
+
+        duration = (datetime.utcnow() - started_at).total_seconds()
+        finished = update_job(
+            job_id,
+            expected_status=running,
+            status=JobStatus.SUCCEEDED.value,
+            progress=100,
+            message="Hoàn thành",
+            result_path=str(result["path"]),
+            result_filename=result["filename"],
+            result_media_type=result["media_type"],
+            result_metadata=result["metadata"],
+            finished_at=datetime.utcnow().isoformat()
+        )
+        if finished is None:
+            # Job bị hủy trong lúc chạy → bỏ kết quả
+            logger.info(f"Job {job_id} was cancelled while running - result discarded")
+            Path(result["path"]).unlink(missing_ok=True)
+            refund_job_quota(job_id, db)
+            return JobStatus.CANCELLED.value
+
+        logger.info(f"✅ Job {job_id} ({job['type']}) succeeded in {duration:.1f}s")
+        return JobStatus.SUCCEEDED.value
+
+    except Exception as e:
+        db.rollback()
+        error = str(getattr(e, "detail", None) or e)
+        logger.error(f"❌ Job {job_id} ({job['type']}) failed: {error}")
+        refund_job_quota(job_id, db)
+        failed = update_job(
+            job_id,
+            expected_status=running,
+            status=JobStatus.FAILED.value,
+            message="Thất bại",
+            error=error,
+            finished_at=datetime.utcnow().isoformat()
+        )
+        return JobStatus.FAILED.value if failed else JobStatus.CANCELLED.value
+
+    finally:
+        # Input không cần nữa sau khi xử lý (kết quả nằm trong job dir)
+        Path(job["input_path"]).unlink(missing_ok=True)
+        db.close()
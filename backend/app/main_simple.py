@@ -17,9 +17,12 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.exceptions import RequestValidationError
 from fastapi.responses import JSONResponse
 from app.core.config import settings
-from app.api.v1.endpoints import auth, users, roles, activity_logs, documents, images, ocr, ocr_compare, ai_admin, deployment, subscription, vb_hanh_chinh, adobe_usage, gemini_keys
+from app.api.v1.endpoints import auth, users, roles, activity_logs, documents, images, ocr, ocr_compare, ai_admin, deployment, subscription, vb_hanh_chinh, adobe_usage, gemini_keys, jobs
 from app.api.v1.endpoints import settings as settings_router
 from app.routers import mau_2c
+from app.services.log_buffer import get_log_buffer
+from app.services.http_clients import close_http_clients
+from app.jobs.queue import recover_local_jobs
 import logging
 from dotenv import load_dotenv
 from pathlib import Path
@@ -101,7 +104,7 @@ class TimeoutMiddleware(BaseHTTPMiddleware):
         
         # Apply extended timeout for file processing endpoints
         if any(path in str(request.url) for path in [
-            '/documents/', '/ocr/', '/convert/', '/upload/'
+            '/documents/', '/ocr/', '/convert/', '/upload/', '/jobs/'
         ]):
             timeout = self.timeout
             logger.info(f"⏰ Extended timeout: {timeout}s for file processing")
@@ -159,8 +162,25 @@ app.include_router(subscription.router, prefix=f"{settings.API_PREFIX}/subscript
 app.include_router(settings_router.router, prefix=f"{settings.API_PREFIX}/settings", tags=["⚙️ Settings & Configuration"])
 app.include_router(adobe_usage.router, prefix=f"{settings.API_PREFIX}", tags=["📊 Adobe Usage Tracking"])
 app.include_router(deployment.router, prefix=f"{settings.API_PREFIX}", tags=["🚀 Deployment Monitor"])
+app.include_router(jobs.router, prefix=f"{settings.API_PREFIX}/jobs", tags=["⏳ Background Jobs"])
 app.include_router(mau_2c.router, tags=["📋 Mẫu 2C - Sơ Yếu Lý Lịch"])
 
+@app.on_event("startup")
+async def recover_background_jobs():
+    """Job local của process trước (restart / redeploy): chạy lại job đang chờ, job chạy dở → FAILED"""
+    if settings.JOB_QUEUE_BACKEND.lower() == "local":
+        await asyncio.to_thread(recover_local_jobs)
+
+@app.on_event("shutdown")
+async def flush_log_buffer():
+    """Ghi nốt usage/audit log còn trong hàng đợi trước khi tắt"""
+    await asyncio.to_thread(get_log_buffer().stop)
+
+@app.on_event("shutdown")
+async def shutdown_http_clients():
+    """Đóng connection pool dùng chung (Gotenberg, AI providers)"""
+    await close_http_clients()
+
 @app.get("/")
 async def root():
     return {"message": "Utility Server API is running"}
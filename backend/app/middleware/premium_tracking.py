@@ -4,8 +4,8 @@ Middleware to track premium AI requests usage
 from fastapi import Request, HTTPException
 from sqlalchemy.orm import Session
 from app.core.database import SessionLocal
-from app.models.subscription import Subscription
 from app.models.auth_models import User
+from app.services.quota_service import QuotaService
 import logging
 
 logger = logging.getLogger(__name__)
@@ -32,35 +32,25 @@ async def track_premium_request(request: Request, user: User):
     
     db: Session = SessionLocal()
     try:
-        # Get user's subscription
-        subscription = db.query(Subscription).filter(
-            Subscription.user_id == user.id,
-            Subscription.status.in_(['active', 'trial'])
-        ).first()
+        # 1 câu UPDATE atomic: kiểm tra limit + tăng bộ đếm (không mất lượt khi request đồng thời)
+        reserved = QuotaService.reserve_subscription_request(user.id, db, paid_only=False)
         
-        if not subscription:
-            raise HTTPException(
-                status_code=403,
-                detail="Bạn cần đăng ký gói dịch vụ để sử dụng tính năng này"
-            )
-        
-        # Check if user has premium requests available
-        limit = subscription.premium_requests_limit or 0
-        used = subscription.premium_requests_used or 0
-        
-        if limit > 0 and used >= limit:
+        if reserved is None:
+            limit = QuotaService.get_subscription_limit(user.id, db, paid_only=False)
+            if limit is None:
+                raise HTTPException(
+                    status_code=403,
+                    detail="Bạn cần đăng ký gói dịch vụ để sử dụng tính năng này"
+                )
+            
             raise HTTPException(
                 status_code=429,
                 detail=f"Bạn đã dùng hết {limit} lượt AI tháng này. Vui lòng nâng cấp gói hoặc đợi tháng sau."
             )
         
-        # Increment counter
-        subscription.premium_requests_used = used + 1
-        db.commit()
-        
         logger.info(
             f"Premium request tracked: user_id={user.id}, "
-            f"used={subscription.premium_requests_used}/{limit}, "
+            f"used={reserved.premium_requests_used}/{reserved.premium_requests_limit or 0}, "
             f"endpoint={path}"
         )
         
@@ -5,14 +5,25 @@ API Router for Mẫu 2C-TCTW-98
 """
 
 from fastapi import APIRouter, HTTPException
-from fastapi.responses import FileResponse
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
-from app.services.mau_2c_service import Mau2CService
+from typing import AsyncIterator, List, Optional, Dict, Any, Tuple
+from urllib.parse import quote
+from collections import deque
+from concurrent.futures.process import BrokenProcessPool
+from app.services.mau_2c_service import Mau2CService, render_mau_2c
+from app.services.page_workers import PAGES_IN_FLIGHT_PER_WORKER, get_page_pool
+from app.services.zip_stream import ZipStreamWriter
+import asyncio
+import json
 import os
+import re
 
 router = APIRouter(prefix="/api/mau-2c", tags=["Mẫu 2C"])
 
+DOCX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+MAX_BATCH_ITEMS = 500
+
 # Pydantic models
 class HocTapItem(BaseModel):
     ten_truong: str
@@ -144,7 +155,7 @@ async def generate_mau_2c(data: Mau2CData):
     """
     try:
         service = Mau2CService()
-        output_path = service.generate(data.dict())
+        output_path = await asyncio.to_thread(service.generate, data.dict())
         
         return {
             "success": True,
@@ -159,22 +170,125 @@ async def generate_mau_2c(data: Mau2CData):
 async def generate_and_download(data: Mau2CData):
     """
     Generate Mẫu 2C and return file for download
+    
+    Render thẳng vào bộ nhớ (không ghi file tạm ra disk)
     """
     try:
         service = Mau2CService()
-        output_path = service.generate(data.dict())
-        
-        if not os.path.exists(output_path):
-            raise HTTPException(status_code=404, detail="Generated file not found")
+        content = await asyncio.to_thread(service.render_bytes, data.dict())
+        filename = f"Mau_2C_{_safe_name(data.ho_ten)}.docx"
         
-        return FileResponse(
-            path=output_path,
-            filename=os.path.basename(output_path),
-            media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+        return Response(
+            content=content,
+            media_type=DOCX_MEDIA_TYPE,
+            headers={"Content-Disposition": f"attachment; filename*=UTF-8''{quote(filename)}"}
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+async def _render_batch(items: List[Mau2CData]) -> AsyncIterator[Tuple[int, Optional[bytes], Optional[str]]]:
+    """
+    Render batch trên page process pool, yield (index, content, error) theo thứ tự input
+
+    Chỉ (số worker x PAGES_IN_FLIGHT_PER_WORKER) hồ sơ được render / chờ ghi cùng lúc
+    → 500 hồ sơ không chiếm hết pool dùng chung, RAM chỉ giữ vài file .docx.
+    """
+    page_pool = get_page_pool()
+    window = page_pool.max_workers * PAGES_IN_FLIGHT_PER_WORKER
+    loop = asyncio.get_running_loop()
+    pending = deque()
+    next_item = 0
+    with page_pool.acquire() as pool:
+        try:
+            while next_item < len(items) or pending:
+                while next_item < len(items) and len(pending) < window:
+                    future = loop.run_in_executor(pool, render_mau_2c, items[next_item].dict())
+                    pending.append((next_item, future))
+                    next_item += 1
+
+                index, future = pending.popleft()
+                try:
+                    content = await future
+                except BrokenProcessPool:
+                    raise
+                except Exception as e:
+                    yield index, None, str(e)
+                else:
+                    yield index, content, None
+        finally:
+            # Client ngắt kết nối → bỏ các hồ sơ chưa render
+            for _, future in pending:
+                future.cancel()
+
+
+@router.post("/generate-batch")
+async def generate_batch(items: List[Mau2CData]):
+    """
+    Generate nhiều sơ yếu lý lịch trong 1 lần gọi → ZIP (stream)
+    
+    - Render song song trên process pool (mỗi worker parse template 1 lần), cửa sổ giới hạn
+    - ZIP được stream theo thứ tự input ngay khi từng file render xong
+    - Hồ sơ lỗi được liệt kê trong _batch_errors.json ở cuối ZIP
+      (không hồ sơ nào thành công → HTTP 500)
+    - Tối đa MAX_BATCH_ITEMS hồ sơ / request
+    """
+    if not items:
+        raise HTTPException(status_code=400, detail="Danh sách hồ sơ rỗng")
+    if len(items) > MAX_BATCH_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Tối đa {MAX_BATCH_ITEMS} hồ sơ / lần")
+    
+    def arcname(index: int) -> str:
+        return f"{index + 1:03d}_Mau_2C_{_safe_name(items[index].ho_ten)}.docx"
+    
+    results = _render_batch(items)
+    errors: List[Dict[str, Any]] = []
+    first_ok = None
+    
+    # Chờ hồ sơ thành công ĐẦU TIÊN trước khi trả response → tất cả lỗi vẫn trả được HTTP 500
+    try:
+        async for index, content, error in results:
+            if error is None:
+                first_ok = (index, content)
+                break
+            errors.append({"file": arcname(index), "ho_ten": items[index].ho_ten, "error": error})
+    except BaseException:
+        await results.aclose()
+        raise
+    
+    if first_ok is None:
+        raise HTTPException(status_code=500, detail=f"Failed to generate Mẫu 2C: {errors}")
+    
+    async def zip_chunks():
+        writer = ZipStreamWriter()
+        try:
+            index, content = first_ok
+            for chunk in writer.write_bytes(arcname(index), content):
+                yield chunk
+            async for index, content, error in results:
+                if error is not None:
+                    errors.append({"file": arcname(index), "ho_ten": items[index].ho_ten, "error": error})
+                    continue
+                for chunk in writer.write_bytes(arcname(index), content):
+                    yield chunk
+            
+            if errors:
+                report = json.dumps(errors, ensure_ascii=False, indent=2).encode("utf-8")
+                for chunk in writer.write_bytes("_batch_errors.json", report):
+                    yield chunk
+            yield writer.close()
+        finally:
+            await results.aclose()
+    
+    return StreamingResponse(
+        zip_chunks(),
+        media_type="application/zip",
+        headers={"Content-Disposition": f"attachment; filename=Mau_2C_batch_{len(items)}.zip"}
+    )
+
+def _safe_name(name: str) -> str:
+    """Tên người → tên file (bỏ ký tự không hợp lệ, giữ tiếng Việt)"""
+    return re.sub(r'[\\/:*?"<>|\s]+', '_', name or "").strip('_')[:50] or "ho_so"
+
 @router.get("/sample-templates")
 async def get_sample_templates():
     """Get list of available sample templates"""
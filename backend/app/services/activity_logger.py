@@ -8,6 +8,7 @@ import json
 from typing import Optional, Any
 
 from app.models.auth_models import ActivityLog
+from app.services.log_buffer import get_log_buffer
 
 
 def log_activity(
@@ -18,21 +19,22 @@ def log_activity(
     resource_id: Optional[int] = None,
     details: Optional[dict] = None,
     request: Optional[Request] = None
-) -> ActivityLog:
+) -> None:
     """
     Log an activity to the database
     
+    Write-behind: the row is queued and inserted in batches by the log buffer
+    (no commit in the request path). With LOG_BUFFER_ENABLED=False it is
+    written and committed through `db` right away.
+    
     Args:
-        db: Database session
+        db: Database session (the log goes to the same database)
         user_id: ID of the user performing the action
         action: Action type (create, update, delete, login, logout)
         resource_type: Type of resource (user, role, permission)
         resource_id: ID of the affected resource
         details: Additional details as dictionary
         request: FastAPI request object (for IP and user agent)
-    
-    Returns:
-        ActivityLog: Created activity log entry
     """
     # Get IP address and user agent from request
     ip_address = None
@@ -56,22 +58,16 @@ def log_activity(
         except (TypeError, ValueError):
             details_str = str(details)
     
-    # Create log entry
-    log = ActivityLog(
-        user_id=user_id,
-        action=action,
-        resource_type=resource_type,
-        resource_id=resource_id,
-        details=details_str,
-        ip_address=ip_address,
-        user_agent=user_agent
-    )
-    
-    db.add(log)
-    db.commit()
-    db.refresh(log)
-    
-    return log
+    # Queue log entry
+    get_log_buffer().add(ActivityLog, {
+        "user_id": user_id,
+        "action": action,
+        "resource_type": resource_type,
+        "resource_id": resource_id,
+        "details": details_str,
+        "ip_address": ip_address,
+        "user_agent": user_agent
+    }, db=db)
 
 
 def log_user_action(
@@ -85,7 +85,7 @@ class AIReportGenerator:
         }
         """
         try:
-            import google.generativeai as genai
+            from app.services.gemini_client import get_gemini_client
             
             # Get API key
             api_key = None
@@ -98,8 +98,7 @@ class AIReportGenerator:
             if not api_key:
                 raise HTTPException(500, "Gemini API key not configured")
                 
-            genai.configure(api_key=api_key)
-            model = genai.GenerativeModel("gemini-2.0-flash-exp")
+            model = get_gemini_client(api_key).model("gemini-2.0-flash-exp")
             
             # Prompt for comparison analysis
             lang_desc = "Vietnamese" if language == "vi" else "English"
@@ -133,54 +133,38 @@ def log_usage(
     user_id: int = None,
     request_metadata: Dict[str, Any] = None
 ):
-    """Log AI API usage"""
-    from app.models.models import AIProviderKey, AIUsageLog
+    """
+    Log AI API usage (write-behind)
+
+    Queued on the log buffer: provider key lookup, insert and the key's
+    last_used_at / error_count update happen in the background batch flush
+    (on the same database as `db`).
+    """
+    from app.services.log_buffer import get_log_buffer
     
     try:
-        # Get provider key
-        key = get_primary_key(provider, db)
-        if not key:
-            return None
-        
         # Calculate costs (pass provider to check free tier)
         costs = calculate_cost(model, input_tokens, output_tokens, provider)
         
-        # Create log entry
-        log = AIUsageLog(
-            provider_key_id=key.id,
-            user_id=user_id,
-            operation=endpoint,
-            model=model,
-            request_id=request_id,
-            input_tokens=input_tokens,
-            output_tokens=output_tokens,
-            total_tokens=input_tokens + output_tokens,
-            input_cost=costs["input_cost"],
-            output_cost=costs["output_cost"],
-            total_cost=costs["total_cost"],
-            processing_time_ms=processing_time * 1000 if processing_time else None,
-            status=status,
-            error_message=error_message,
-            request_metadata=json.dumps(request_metadata) if request_metadata else None
-        )
-        
-        db.add(log)
-        
-        # Update key's last_used_at
-        key.last_used_at = datetime.utcnow()
-        if status == "error":
-            key.error_count += 1
-            key.last_error = error_message
-        
-        db.commit()
-        db.refresh(log)
-        
-        return log
+        get_log_buffer().add_provider_usage(provider, {
+            "user_id": user_id,
+            "operation": endpoint,
+            "model": model,
+            "request_id": request_id,
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens,
+            "input_cost": costs["input_cost"],
+            "output_cost": costs["output_cost"],
+            "total_cost": costs["total_cost"],
+            "processing_time_ms": processing_time * 1000 if processing_time else None,
+            "status": status,
+            "error_message": error_message,
+            "request_metadata": json.dumps(request_metadata) if request_metadata else None
+        }, db=db)
     
     except Exception as e:
-        db.rollback()
         print(f"Error logging AI usage: {e}")
-        return None
 
 
 def get_current_month_spend(provider: str, db: Session = None) -> float:
@@ -0,0 +1,167 @@
+"""
+Auth Cache - Cache user đã xác thực + permission set (get_current_user, require_permission)
+
+Usage:
+    from app.services.auth_cache import get_auth_cache
+
+    principal = get_auth_cache().get_principal(db, user_id)   # None nếu user không tồn tại
+    user = principal.attach(db)                     # User gắn vào session, KHÔNG SELECT
+    principal.has_permission("document", "write")   # set lookup, không query Permission
+
+    # Sau khi sửa user / role / permission
+    get_auth_cache().invalidate_user(user_id)
+    get_auth_cache().invalidate_all()
+
+Tại sao:
+- Mỗi request có auth: SELECT users
+- require_permission: lazy-load roles + 1 query Permission / role
+- require_any_permission: (số permission x số role) query
+- Cache hit: 0 query; miss: 1 query user + roles + permissions (selectinload)
+
+Nhất quán:
+- Mỗi process có cache riêng → TTL ngắn (AUTH_CACHE_TTL_SECONDS) giới hạn độ trễ
+  giữa các worker; process sửa user/role thì invalidate ngay
+- Cột hay đổi / nhạy cảm (quota, hashed_password, updated_at) KHÔNG nằm trong
+  snapshot → tự load lại từ DB khi được truy cập
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, FrozenSet, Optional, Tuple
+
+from sqlalchemy import inspect
+from sqlalchemy.orm import Session, make_transient_to_detached, selectinload
+
+from app.core.config import settings
+from app.models.auth_models import Role, User
+
+logger = logging.getLogger(__name__)
+
+# Không cache: đổi liên tục (quota) hoặc phải luôn mới nhất (password)
+UNCACHED_COLUMNS = frozenset({
+    "hashed_password",
+    "subscription_tier",
+    "ai_quota_monthly",
+    "ai_usage_this_month",
+    "quota_reset_date",
+    "updated_at",
+})
+
+
+@dataclass(frozen=True)
+class AuthPrincipal:
+    """User đã xác thực: cờ + role + permission tính sẵn, kèm snapshot User (detached)"""
+    user_id: int
+    is_active: bool
+    is_superuser: bool
+    role_names: FrozenSet[str]
+    permissions: FrozenSet[Tuple[str, str]]  # (resource, action)
+    snapshot: Any
+    generation: int
+    expires_at: float
+
+    def has_permission(self, resource: str, action: str) -> bool:
+        return self.is_superuser or (resource, action) in self.permissions
+
+    def attach(self, db: Session) -> User:
+        """
+        User gắn vào session của request mà không SELECT
+
+        merge(load=False) copy snapshot sang instance mới trong session
+        → snapshot dùng chung không bao giờ bị sửa; endpoint sửa + commit bình thường.
+        """
+        return db.merge(self.snapshot, load=False)
+
+
+def _snapshot(user: User) -> User:
+    values = {
+        attr.key: getattr(user, attr.key)
+        for attr in inspect(User).column_attrs
+        if attr.key not in UNCACHED_COLUMNS
+    }
+    snapshot = User(**values)
+    # Cột không set → expired → load lại khi truy cập sau khi attach
+    make_transient_to_detached(snapshot)
+    return snapshot
+
+
+class AuthCache:
+    """Cache AuthPrincipal theo user_id (TTL + LRU, thread-safe)"""
+
+    def __init__(self, ttl_seconds: int, max_users: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_users = max(1, max_users)
+        self._principals: "OrderedDict[int, AuthPrincipal]" = OrderedDict()
+        # Tăng mỗi lần invalidate → bỏ kết quả load từ DB trước lúc invalidate
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def invalidate_user(self, user_id: int) -> None:
+        """Gọi sau khi sửa/xóa user hoặc đổi role của user"""
+        with self._lock:
+            self._generation += 1
+            self._principals.pop(user_id, None)
+
+    def invalidate_all(self) -> None:
+        """Gọi sau khi sửa/xóa role hoặc permission (ảnh hưởng nhiều user)"""
+        with self._lock:
+            self._generation += 1
+            self._principals.clear()
+
+    def get_principal(self, db: Session, user_id: int) -> Optional[AuthPrincipal]:
+        now = time.monotonic()
+        with self._lock:
+            principal = self._principals.get(user_id)
+            if principal is not None and principal.expires_at > now and principal.generation == self._generation:
+                self._principals.move_to_end(user_id)
+                return principal
+            generation = self._generation
+
+        user = (
+            db.query(User)
+            .options(selectinload(User.roles).selectinload(Role.permissions))
+            .filter(User.id == user_id)
+            .first()
+        )
+        if user is None:
+            return None
+
+        principal = AuthPrincipal(
+            user_id=user.id,
+            is_active=user.is_active,
+            is_superuser=user.is_superuser,
+            role_names=frozenset(role.name for role in user.roles),
+            permissions=frozenset(
+                (permission.resource, permission.action)
+                for role in user.roles
+                for permission in role.permissions
+            ),
+            snapshot=_snapshot(user),
+            generation=generation,
+            expires_at=now + self.ttl_seconds,
+        )
+
+        if self.ttl_seconds > 0:
+            with self._lock:
+                if generation == self._generation:
+                    self._principals[user_id] = principal
+                    self._principals.move_to_end(user_id)
+                    while len(self._principals) > self.max_users:
+                        self._principals.popitem(last=False)
+        return principal
+
+
+_auth_cache: Optional[AuthCache] = None
+
+
+def get_auth_cache() -> AuthCache:
+    """Get process-wide auth cache"""
+    global _auth_cache
+    if _auth_cache is None:
+        _auth_cache = AuthCache(
+            ttl_seconds=settings.AUTH_CACHE_TTL_SECONDS,
+            max_users=settings.AUTH_CACHE_MAX_USERS,
+        )
+    return _auth_cache
@@ -0,0 +1,264 @@
+"""
+Batch Executor - Bounded-parallel engine cho các endpoint /documents/batch/*
+
+Usage:
+    from app.services.batch_executor import get_batch_executor
+
+    executor = get_batch_executor()
+    results = await executor.run(files, convert_one, backend="gotenberg")
+    # ✅ Files chạy song song, giới hạn theo request / process / backend
+
+Giới hạn concurrency (3 tầng, cấu hình trong config.py):
+- Per-request: BATCH_MAX_CONCURRENCY (1 upload không chiếm hết worker)
+- Global: BATCH_GLOBAL_CONCURRENCY (tổng số item đang chạy trong process)
+- Per-backend: BATCH_{GOTENBERG,ADOBE,GEMINI,LOCAL}_CONCURRENCY
+"""
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Sequence, Union
+
+from app.core.config import settings
+from app.services.http_clients import run_on_thread_loop
+
+logger = logging.getLogger(__name__)
+
+
+BACKENDS = ("gotenberg", "adobe", "gemini", "local")
+
+# Worker trả về 1 file output hoặc danh sách file output (VD: PDF → nhiều ảnh)
+WorkerResult = Union[Path, List[Path], None]
+Worker = Callable[[Any], Awaitable[WorkerResult]]
+
+
+@dataclass
+class BatchItemResult:
+    """Kết quả xử lý 1 file trong batch (thành công hoặc lỗi - không bao giờ raise)"""
+    index: int
+    filename: str
+    backend: str
+    outputs: List[Path] = field(default_factory=list)
+    error: Optional[str] = None
+    queued_seconds: float = 0.0
+    duration_seconds: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "index": self.index,
+            "file": self.filename,
+            "backend": self.backend,
+            "ok": self.ok,
+            "error": self.error,
+            "outputs": [p.name for p in self.outputs],
+            "queued_seconds": round(self.queued_seconds, 3),
+            "duration_seconds": round(self.duration_seconds, 3),
+        }
+
+
+class BatchExecutor:
+    """
+    Chạy nhiều conversion song song với giới hạn concurrency
+
+    Features:
+    - Per-request, global và per-backend semaphores
+    - Per-file error isolation (1 file lỗi không làm hỏng cả batch)
+    - Timing metrics cho từng item (thời gian chờ + thời gian xử lý)
+    - offload(): chạy 1 bước sync/CPU-bound (pypdf, Pillow, Adobe SDK) trên
+      thread riêng để không block event loop
+    """
+
+    def __init__(
+        self,
+        global_limit: int,
+        backend_limits: Dict[str, int],
+        default_request_limit: int,
+    ):
+        self.global_limit = max(1, global_limit)
+        self.backend_limits = {name: max(1, limit) for name, limit in backend_limits.items()}
+        self.default_request_limit = max(1, default_request_limit)
+
+        # Semaphores tạo lazy (cần event loop đang chạy)
+        self._global_semaphore: Optional[asyncio.Semaphore] = None
+        self._backend_semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._thread_pool: Optional[ThreadPoolExecutor] = None
+
+    def _get_global_semaphore(self) -> asyncio.Semaphore:
+        if self._global_semaphore is None:
+            self._global_semaphore = asyncio.Semaphore(self.global_limit)
+        return self._global_semaphore
+
+    def _get_backend_semaphore(self, backend: str) -> asyncio.Semaphore:
+        if backend not in self.backend_limits:
+            raise ValueError(f"Unknown batch backend '{backend}'. Available: {', '.join(BACKENDS)}")
+        if backend not in self._backend_semaphores:
+            self._backend_semaphores[backend] = asyncio.Semaphore(self.backend_limits[backend])
+        return self._backend_semaphores[backend]
+
+    def _get_thread_pool(self) -> ThreadPoolExecutor:
+        if self._thread_pool is None:
+            self._thread_pool = ThreadPoolExecutor(
+                max_workers=self.global_limit,
+                thread_name_prefix="batch-worker"
+            )
+        return self._thread_pool
+
+    async def offload(self, func: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        """
+        Chạy coroutine function trên thread pool (event loop riêng của thread)
+
+        Dùng cho các method async nhưng bên trong là code sync
+        (VD: DocumentService.image_to_pdf, compress_pdf) để các item
+        trong batch thực sự chạy song song.
+
+        Mỗi thread giữ 1 event loop cho mọi item (không asyncio.run() mỗi item)
+        → HTTP client dùng chung của loop đó không bị bỏ lại mà không đóng.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._get_thread_pool(),
+            lambda: run_on_thread_loop(func, *args, **kwargs)
+        )
+
+    async def _run_item(
+        self,
+        index: int,
+        item: Any,
+        worker: Worker,
+        backend: str,
+        request_semaphore: asyncio.Semaphore,
+        label: str,
+    ) -> BatchItemResult:
+        filename = getattr(item, "filename", None) or str(item)
+        result = BatchItemResult(index=index, filename=filename, backend=backend)
+        queued_at = time.perf_counter()
+
+        # Thứ tự acquire: request → backend → global
+        # (item chờ backend bận sẽ không giữ slot global)
+        async with request_semaphore:
+            async with self._get_backend_semaphore(backend):
+                async with self._get_global_semaphore():
+                    started_at = time.perf_counter()
+                    result.queued_seconds = started_at - queued_at
+                    try:
+                        outputs = await worker(item)
+                        if outputs is None:
+                            result.outputs = []
+                        elif isinstance(outputs, Path):
+                            result.outputs = [outputs]
+                        else:
+                            result.outputs = list(outputs)
+                        logger.info(
+                            f"[{label}] ✓ {filename} ({backend}) in {time.perf_counter() - started_at:.2f}s"
+                        )
+                    except asyncio.CancelledError:
+                        raise
+                    except Exception as e:
+                        result.error = str(getattr(e, "detail", None) or e)
+                        logger.warning(f"[{label}] ✗ {filename} ({backend}): {result.error}")
+                    finally:
+                        result.duration_seconds = time.perf_counter() - started_at
+
+        return result
+
+    async def iter_completed(
+        self,
+        items: Sequence[Any],
+        worker: Worker,
+        backend: str,
+        max_concurrency: Optional[int] = None,
+        label: str = "Batch",
+    ) -> AsyncIterator[BatchItemResult]:
+        """
+        Chạy batch và yield từng kết quả NGAY KHI item hoàn thành (thứ tự hoàn thành)
+
+        Nếu consumer dừng giữa chừng (VD: client ngắt kết nối), các item
+        còn lại sẽ bị cancel.
+        """
+        limit = min(max_concurrency or self.default_request_limit, self.default_request_limit)
+        request_semaphore = asyncio.Semaphore(max(1, limit))
+
+        tasks = [
+            asyncio.create_task(
+                self._run_item(index, item, worker, backend, request_semaphore, label)
+            )
+            for index, item in enumerate(items)
+        ]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def run(
+        self,
+        items: Sequence[Any],
+        worker: Worker,
+        backend: str,
+        max_concurrency: Optional[int] = None,
+        label: str = "Batch",
+    ) -> List[BatchItemResult]:
+        """Chạy batch và trả về tất cả kết quả theo thứ tự input"""
+        started_at = time.perf_counter()
+        results = [
+            result async for result in self.iter_completed(
+                items, worker, backend,
+                max_concurrency=max_concurrency, label=label
+            )
+        ]
+        results.sort(key=lambda r: r.index)
+
+        stats = summarize_results(results, time.perf_counter() - started_at)
+        logger.info(
+            f"[{label}] Done: {stats['succeeded']}/{stats['total']} ok in {stats['wall_seconds']}s "
+            f"(sum of items {stats['busy_seconds']}s, speedup x{stats['speedup']})"
+        )
+        return results
+
+
+def summarize_results(results: List[BatchItemResult], wall_seconds: float) -> Dict[str, Any]:
+    """Tổng hợp metrics của batch (dùng cho log và response header)"""
+    busy_seconds = sum(r.duration_seconds for r in results)
+    return {
+        "total": len(results),
+        "succeeded": sum(1 for r in results if r.ok),
+        "failed": sum(1 for r in results if not r.ok),
+        "wall_seconds": round(wall_seconds, 3),
+        "busy_seconds": round(busy_seconds, 3),
+        "speedup": round(busy_seconds / wall_seconds, 2) if wall_seconds > 0 else 0.0,
+    }
+
+
+# Global executor (1 instance per process - semaphores được chia sẻ giữa các request)
+_batch_executor: Optional[BatchExecutor] = None
+
+
+def get_batch_executor() -> BatchExecutor:
+    """
+    Get shared batch executor
+
+    Example:
+        executor = get_batch_executor()
+        results = await executor.run(files, convert_one, backend="local")
+    """
+    global _batch_executor
+    if _batch_executor is None:
+        _batch_executor = BatchExecutor(
+            global_limit=settings.BATCH_GLOBAL_CONCURRENCY,
+            backend_limits={
+                "gotenberg": settings.BATCH_GOTENBERG_CONCURRENCY,
+                "adobe": settings.BATCH_ADOBE_CONCURRENCY,
+                "gemini": settings.BATCH_GEMINI_CONCURRENCY,
+                "local": settings.BATCH_LOCAL_CONCURRENCY,
+            },
+            default_request_limit=settings.BATCH_MAX_CONCURRENCY,
+        )
+    return _batch_executor
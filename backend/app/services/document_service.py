@@ -13,8 +13,9 @@ from pathlib import Path
 from dotenv import load_dotenv
 import json
 import zipfile
+from dataclasses import dataclass
 from datetime import datetime
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Union
 import time
 import asyncio
 from io import BytesIO
@@ -39,6 +40,18 @@ import pypdf
 from pptx import Presentation
 from openpyxl import load_workbook
 import pypdfium2 as pdfium
+from app.services.provider_executor import run_blocking
+from app.services.page_workers import IMAGE_FORMATS, PageClassification, iter_page_images
+from app.services.docx_render import DocxTemplateRef, prepare_docx_template, render_docx
+from app.services.pdf_chunks import PdfChunk, chunk_context_prompt, remove_chunks, run_chunks, split_pdf_chunks, stitch_chunk_texts
+from app.services.upload_ingest import (
+    IngestedUpload, ingest_upload, is_ingest_dir, new_output_dir, remove_output, remove_upload, safe_filename
+)
+from app.services.gotenberg_client import get_gotenberg_pool
+from app.services.pdf_tables import TABLE_OUTPUT_FORMATS, parquet_available, pdf_tables_to_archive, pdf_tables_to_xlsx
+from app.services.pdf_pipeline import (
+    COMPRESSION_LEVELS, CompressOp, PageNumbersOp, PipelineOp, ProtectOp, RotateOp, WatermarkOp, run_pdf_pipeline
+)
 
 # Adobe PDF Services (optional)
 try:
@@ -66,6 +79,7 @@ try:
     import json
     import asyncio
     from app.services.gemini_service import get_gemini_service, GeminiService
+    from app.services.gemini_client import get_gemini_client
     GEMINI_AVAILABLE = True
 except ImportError:
     GEMINI_AVAILABLE = False
@@ -217,6 +231,22 @@ def is_pdf_scanned(pdf_path: Path, min_text_chars: int = 50) -> bool:
         return False
 
 
+@dataclass
+class PdfToWordResult:
+    """Kết quả PDF → Word + engine THỰC SỰ đã tạo ra file (có thể khác engine được yêu cầu)"""
+    path: Path
+    engine: str  # "gemini" | "hybrid" | "adobe" | "pdf2docx"
+    ocr: bool = False
+    fallback: bool = False  # Engine ưu tiên thất bại → file do engine dự phòng tạo
+
+
+@dataclass
+class AdobeTemplateAsset:
+    """Word template đã upload lên Adobe (dùng lại cho nhiều DocumentMergeJob)"""
+    pdf_services: Any
+    asset: Any
+
+
 class DocumentService:
     """Modern document processing service sử dụng Gotenberg + Adobe PDF Services"""
     
@@ -232,12 +262,16 @@ class DocumentService:
         self.output_dir = Path("uploads/outputs")
         self.output_dir.mkdir(parents=True, exist_ok=True)
         
+        from app.core.config import settings
+
         # Gotenberg URL - auto-detect environment
         if gotenberg_url:
             self.gotenberg_url = gotenberg_url
         else:
             # Production: Gotenberg container, Dev: có thể dùng local LibreOffice
-            self.gotenberg_url = os.getenv("GOTENBERG_URL", "http://gotenberg:3000")
+            self.gotenberg_url = settings.GOTENBERG_URL
+        # Nhiều instance (GOTENBERG_URLS) + failover, connection pool dùng chung
+        self.gotenberg = get_gotenberg_pool([gotenberg_url] if gotenberg_url else None)
         
         # Adobe PDF Services - optional but recommended for better quality
         self.use_adobe = os.getenv("USE_ADOBE_PDF_API", "false").lower() == "true"
@@ -295,12 +329,12 @@ class DocumentService:
         """Get information about a specific Gemini model"""
         return GEMINI_MODELS.get(model_name, {})
     
-    def set_gemini_model(self, model_name: str):
+    def resolve_gemini_model(self, model_name: Optional[str] = None) -> str:
         """
-        Change Gemini model dynamically
+        Validate model cho 1 request (KHÔNG đổi default của service dùng chung)
         
-        Args:
-            model_name: Model identifier (e.g., "gemini-2.5-flash")
+        Returns:
+            model_name nếu hợp lệ, hoặc model mặc định nếu None
         
         Raises:
             ValueError: If model not found or Gemini not configured
@@ -308,10 +342,30 @@ class DocumentService:
         if not self.use_gemini:
             raise ValueError("Gemini API not available. Install: pip install google-generativeai")
         
+        if not model_name:
+            return self.gemini_model_name
+        
         if model_name not in GEMINI_MODELS:
             available = ", ".join(GEMINI_MODELS.keys())
             raise ValueError(f"Model '{model_name}' not found. Available models: {available}")
         
+        return model_name
+    
+    def set_gemini_model(self, model_name: str):
+        """
+        Change DEFAULT Gemini model (admin/config only)
+        
+        ⚠️ Không gọi per-request: doc_service là singleton dùng chung giữa các
+        request đồng thời → dùng resolve_gemini_model() + truyền model theo call
+        
+        Args:
+            model_name: Model identifier (e.g., "gemini-2.5-flash")
+        
+        Raises:
+            ValueError: If model not found or Gemini not configured
+        """
+        self.resolve_gemini_model(model_name)
+        
         try:
             self.gemini_model_name = model_name
             # No need to create model here - GeminiService will handle it per-request
@@ -322,15 +376,38 @@ class DocumentService:
             logger.error(f"Failed to switch model: {e}")
             raise ValueError(f"Failed to initialize model '{model_name}': {str(e)}")
     
-    async def save_upload_file(self, upload_file: UploadFile) -> Path:
-        """Save uploaded file async"""
-        file_path = self.upload_dir / upload_file.filename
+    def _get_gemini_client(self, gemini_service=None, api_key: Optional[str] = None):
+        """
+        Gemini client gắn với 1 key cho cả flow upload → generate → delete
         
-        async with aiofiles.open(file_path, 'wb') as out_file:
-            content = await upload_file.read()
-            await out_file.write(content)
-            
-        return file_path
+        Ưu tiên key của gemini_service (để usage log đúng key), sau đó api_key
+        truyền vào, cuối cùng tự chọn key tốt nhất từ database.
+        """
+        if gemini_service is not None:
+            return gemini_service.client
+        if api_key:
+            return get_gemini_client(api_key)
+        
+        from app.core.database import SessionLocal
+        from app.services.gemini_key_service import GeminiKeyService
+        
+        db = SessionLocal()
+        try:
+            selected_key = GeminiKeyService(db).select_best_key()
+        finally:
+            db.close()
+        if not selected_key:
+            raise HTTPException(500, "Không tìm thấy Gemini API key nào khả dụng. Vui lòng thêm key tại Admin > AI Keys.")
+        return get_gemini_client(selected_key.api_key_decrypted)
+    
+    async def save_upload_file(self, upload_file: UploadFile) -> Path:
+        """Save uploaded file async (streamed, unique path per upload)"""
+        upload = await self.ingest_upload(upload_file)
+        return upload.path
+    
+    async def ingest_upload(self, upload_file: UploadFile) -> IngestedUpload:
+        """Save uploaded file + SHA-256/MIME tính trong cùng 1 lần ghi"""
+        return await ingest_upload(upload_file, self.upload_dir)
     
     # ==================== Word → PDF (Gotenberg) ====================
     
@@ -351,34 +428,16 @@ class DocumentService:
             raise HTTPException(400, "File phải là .docx hoặc .doc")
         
         output_filename = output_filename or input_file.stem + ".pdf"
-        output_path = self.output_dir / output_filename
+        output_path = self.new_output_path(output_filename)
         
         try:
-            # Gọi Gotenberg API để convert
-            async with httpx.AsyncClient(timeout=60.0) as client:
-                # Đọc file Word
-                async with aiofiles.open(input_file, 'rb') as f:
-                    file_content = await f.read()
-                
-                # POST đến Gotenberg LibreOffice endpoint
-                files = {
-                    'files': (input_file.name, file_content, 'application/vnd.openxmlformats-officedocument.wordprocessingml.document')
-                }
-                
-                response = await client.post(
-                    f"{self.gotenberg_url}/forms/libreoffice/convert",
-                    files=files
-                )
-                
-                if response.status_code != 200:
-                    raise HTTPException(
-                        500,
-                        f"Gotenberg conversion failed: {response.status_code} - {response.text}"
-                    )
-                
-                # Lưu PDF output
-                async with aiofiles.open(output_path, 'wb') as f:
-                    await f.write(response.content)
+            # Gọi Gotenberg API để convert (stream upload/download, failover giữa các instance)
+            await self.gotenberg.convert_office(
+                input_file,
+                output_path,
+                'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+                timeout=60.0
+            )
                 
             if not output_path.exists() or output_path.stat().st_size == 0:
                 raise HTTPException(500, "File PDF không được tạo ra hoặc rỗng")
@@ -387,7 +446,7 @@ class DocumentService:
             
         except httpx.ConnectError:
             # Gotenberg không khả dụng - fallback to LibreOffice local (dev only)
-            return await self._word_to_pdf_libreoffice_fallback(input_file, output_filename)
+            return await self._word_to_pdf_libreoffice_fallback(input_file, output_path)
         except HTTPException:
             raise
         except Exception as e:
@@ -396,7 +455,7 @@ class DocumentService:
     async def _word_to_pdf_libreoffice_fallback(
         self,
         input_file: Path,
-        output_filename: str
+        output_path: Path
     ) -> Path:
         """
         Fallback method: Dùng LibreOffice local nếu Gotenberg không có
@@ -404,7 +463,8 @@ class DocumentService:
         Cài LibreOffice: https://www.libreoffice.org/download/download/
         """
         logger.info(f"🔄 Starting LibreOffice conversion: {input_file.name}")
-        output_path = self.output_dir / output_filename
+        # soffice ghi <stem>.pdf vào --outdir → dùng thư mục riêng của output này
+        output_dir = output_path.parent
         
         # Tìm LibreOffice trong các đường dẫn phổ biến
         libreoffice_paths = [
@@ -434,13 +494,13 @@ class DocumentService:
         try:
             # Log input file info
             logger.info(f"📄 Input file: {input_file} (size: {input_file.stat().st_size} bytes)")
-            logger.info(f"📂 Output dir: {self.output_dir}")
+            logger.info(f"📂 Output dir: {output_dir}")
             
             cmd = [
                 soffice_path,
                 "--headless",
                 "--convert-to", "pdf",
-                "--outdir", str(self.output_dir),
+                "--outdir", str(output_dir),
                 str(input_file)
             ]
             
@@ -464,12 +524,12 @@ class DocumentService:
                 raise HTTPException(500, f"LibreOffice conversion failed (code {result.returncode}): {result.stderr}")
             
             # Check generated PDF
-            generated_pdf = self.output_dir / (input_file.stem + ".pdf")
+            generated_pdf = output_dir / (input_file.stem + ".pdf")
             logger.info(f"🔍 Looking for: {generated_pdf}")
             
             if not generated_pdf.exists():
                 # List all files in output dir for debugging
-                all_files = list(self.output_dir.glob("*"))
+                all_files = list(output_dir.glob("*"))
                 logger.error(f"❌ PDF not found! Files in output dir: {[f.name for f in all_files]}")
                 raise HTTPException(500, f"PDF file not generated: {generated_pdf}")
             
@@ -513,40 +573,23 @@ class DocumentService:
             raise HTTPException(400, f"File phải là Office file: {', '.join(supported_extensions)}")
         
         output_filename = output_filename or input_file.stem + ".pdf"
-        output_path = self.output_dir / output_filename
+        output_path = self.new_output_path(output_filename)
         
         try:
-            # Gọi Gotenberg API
-            async with httpx.AsyncClient(timeout=120.0) as client:  # Excel/PPT có thể mất thời gian hơn
-                async with aiofiles.open(input_file, 'rb') as f:
-                    file_content = await f.read()
-                
-                # Determine MIME type
-                mime_types = {
-                    '.xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-                    '.xls': 'application/vnd.ms-excel',
-                    '.pptx': 'application/vnd.openxmlformats-officedocument.presentationml.presentation',
-                    '.ppt': 'application/vnd.ms-powerpoint',
-                    '.odt': 'application/vnd.oasis.opendocument.text',
-                    '.ods': 'application/vnd.oasis.opendocument.spreadsheet',
-                    '.odp': 'application/vnd.oasis.opendocument.presentation'
-                }
-                mime_type = mime_types.get(input_file.suffix.lower(), 'application/octet-stream')
-                
-                files = {
-                    'files': (input_file.name, file_content, mime_type)
-                }
-                
-                response = await client.post(
-                    f"{self.gotenberg_url}/forms/libreoffice/convert",
-                    files=files
-                )
-                
-                if response.status_code != 200:
-                    raise HTTPException(500, f"Gotenberg conversion failed: {response.status_code}")
-                
-                async with aiofiles.open(output_path, 'wb') as f:
-                    await f.write(response.content)
+            # Determine MIME type
+            mime_types = {
+                '.xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+                '.xls': 'application/vnd.ms-excel',
+                '.pptx': 'application/vnd.openxmlformats-officedocument.presentationml.presentation',
+                '.ppt': 'application/vnd.ms-powerpoint',
+                '.odt': 'application/vnd.oasis.opendocument.text',
+                '.ods': 'application/vnd.oasis.opendocument.spreadsheet',
+                '.odp': 'application/vnd.oasis.opendocument.presentation'
+            }
+            mime_type = mime_types.get(input_file.suffix.lower(), 'application/octet-stream')
+            
+            # Gọi Gotenberg API (Excel/PPT có thể mất thời gian hơn)
+            await self.gotenberg.convert_office(input_file, output_path, mime_type, timeout=120.0)
                 
             if not output_path.exists() or output_path.stat().st_size == 0:
                 raise HTTPException(500, "File PDF không được tạo ra hoặc rỗng")
@@ -555,7 +598,7 @@ class DocumentService:
             
         except httpx.ConnectError:
             # Fallback to LibreOffice local
-            return await self._office_to_pdf_libreoffice_fallback(input_file, output_filename)
+            return await self._office_to_pdf_libreoffice_fallback(input_file, output_path)
         except HTTPException:
             raise
         except Exception as e:
@@ -564,10 +607,10 @@ class DocumentService:
     async def _office_to_pdf_libreoffice_fallback(
         self,
         input_file: Path,
-        output_filename: str
+        output_path: Path
     ) -> Path:
         """Fallback: Use LibreOffice for Office files"""
-        return await self._word_to_pdf_libreoffice_fallback(input_file, output_filename)
+        return await self._word_to_pdf_libreoffice_fallback(input_file, output_path)
 
     # ==================== PDF → Word ====================
     
@@ -584,8 +627,36 @@ class DocumentService:
         gemini_model: Optional[str] = None,
         db = None  # SQLAlchemy session for auto-logging
     ) -> Path:
+        """Convert PDF to Word (.docx) - xem pdf_to_word_result()"""
+        result = await self.pdf_to_word_result(
+            input_file,
+            output_filename=output_filename,
+            start_page=start_page,
+            end_page=end_page,
+            enable_ocr=enable_ocr,
+            ocr_language=ocr_language,
+            auto_detect_scanned=auto_detect_scanned,
+            use_gemini=use_gemini,
+            gemini_model=gemini_model,
+            db=db
+        )
+        return result.path
+
+    async def pdf_to_word_result(
+        self,
+        input_file: Path,
+        output_filename: Optional[str] = None,
+        start_page: int = 0,
+        end_page: Optional[int] = None,
+        enable_ocr: bool = False,
+        ocr_language: str = "vi-VN",
+        auto_detect_scanned: bool = True,
+        use_gemini: bool = False,
+        gemini_model: Optional[str] = None,
+        db = None  # SQLAlchemy session for auto-logging
+    ) -> PdfToWordResult:
         """
-        Convert PDF to Word (.docx)
+        Convert PDF to Word (.docx), trả kèm engine thực sự đã dùng
         
         Strategy:
         1. Gemini API (if use_gemini=True) - Best for tables/layout, 100+ languages, multiple models
@@ -619,7 +690,9 @@ class DocumentService:
             raise HTTPException(400, "File must be .pdf")
         
         output_filename = output_filename or input_file.stem + ".docx"
-        output_path = self.output_dir / output_filename
+        output_path = self.new_output_path(output_filename)
+        # True khi 1 engine ưu tiên thất bại và file do engine dự phòng tạo ra
+        fallback = False
         
         # ========== DECISION LOGIC - LOG EVERYTHING ==========
         logger.info("")
@@ -656,8 +729,9 @@ class DocumentService:
                 )
                 logger.info(f"📨 Returned from _pdf_to_word_gemini(): {result}")
                 logger.info("")
-                return result
+                return PdfToWordResult(path=result, engine="gemini")
             except Exception as e:
+                fallback = True
                 logger.error("")
                 logger.error("="*70)
                 logger.error(f"❌ GEMINI API - CONVERSION FAILED")
@@ -705,8 +779,9 @@ class DocumentService:
                 )
                 logger.info(f"📨 Returned from _pdf_to_word_hybrid_vietnamese(): {result}")
                 logger.info("")
-                return result
+                return PdfToWordResult(path=result, engine="hybrid", ocr=True, fallback=fallback)
             except Exception as e:
+                fallback = True
                 logger.error("")
                 logger.error("="*70)
                 logger.error(f"❌ HYBRID APPROACH - CONVERSION FAILED")
@@ -758,8 +833,9 @@ class DocumentService:
                 logger.info("="*60)
                 logger.info("")
                 
-                return result
+                return PdfToWordResult(path=result, engine="adobe", ocr=needs_ocr, fallback=fallback)
             except Exception as e:
+                fallback = True
                 logger.error("")
                 logger.error("="*60)
                 logger.error(f"❌ ADOBE PDF SERVICES - CONVERSION FAILED")
@@ -801,7 +877,7 @@ class DocumentService:
             result = await self._pdf_to_word_local(input_file, output_path, start_page, end_page)
             logger.error("❓ UNEXPECTED: _pdf_to_word_local() returned without error!")
             logger.error(f"   This should not happen (pdf2docx is disabled)")
-            return result
+            return PdfToWordResult(path=result, engine="pdf2docx", fallback=fallback)
         except HTTPException as e:
             logger.error("")
             logger.error("="*70)
@@ -878,7 +954,8 @@ class DocumentService:
         # Upload file to Adobe
         logger.info("   ☁️  Step 3/5: Uploading to Adobe cloud...")
         upload_start = time.time()
-        input_asset = pdf_services.upload(
+        input_asset = await run_blocking(
+            "adobe", pdf_services.upload,
             input_stream=input_stream,
             mime_type=PDFServicesMediaType.PDF
         )
@@ -938,12 +1015,12 @@ class DocumentService:
             )
         
         job_start = time.time()
-        location = pdf_services.submit(export_pdf_job)
+        location = await run_blocking("adobe", pdf_services.submit, export_pdf_job)
         logger.info(f"   ✓ Job submitted to: {location}")
         
         # Get result (polling handled by SDK)
         logger.info("   ⏳ Polling for result (Adobe processing)...")
-        pdf_services_response = pdf_services.get_job_result(location, ExportPDFResult)
+        pdf_services_response = await run_blocking("adobe", pdf_services.get_job_result, location, ExportPDFResult)
         job_time = time.time() - job_start
         logger.info(f"   ✓ Job completed ({job_time:.2f}s)")
         
@@ -951,7 +1028,7 @@ class DocumentService:
         logger.info("   💾 Step 5/5: Downloading result...")
         download_start = time.time()
         result_asset: CloudAsset = pdf_services_response.get_result().get_asset()
-        stream_asset: StreamAsset = pdf_services.get_content(result_asset)
+        stream_asset: StreamAsset = await run_blocking("adobe", pdf_services.get_content, result_asset)
         
         # Save to file
         async with aiofiles.open(output_path, "wb") as f:
@@ -992,7 +1069,8 @@ class DocumentService:
             pdf_services = PDFServices(credentials=self.adobe_credentials)
             
             # Upload file
-            input_asset = pdf_services.upload(
+            input_asset = await run_blocking(
+                "adobe", pdf_services.upload,
                 input_stream=input_stream,
                 mime_type=PDFServicesMediaType.PDF
             )
@@ -1019,17 +1097,17 @@ class DocumentService:
                 ocr_pdf_params=ocr_pdf_params
             )
             
-            location = pdf_services.submit(ocr_pdf_job)
+            location = await run_blocking("adobe", pdf_services.submit, ocr_pdf_job)
             
             # Get result
-            pdf_services_response = pdf_services.get_job_result(location, OCRPDFResult)
+            pdf_services_response = await run_blocking("adobe", pdf_services.get_job_result, location, OCRPDFResult)
             
             # Download OCR'd PDF
             result_asset: CloudAsset = pdf_services_response.get_result().get_asset()
-            stream_asset: StreamAsset = pdf_services.get_content(result_asset)
+            stream_asset: StreamAsset = await run_blocking("adobe", pdf_services.get_content, result_asset)
             
             # Save OCR'd PDF to temp file
-            ocr_output = self.output_dir / f"ocr_temp_{input_file.name}"
+            ocr_output = self.new_output_path(f"ocr_temp_{input_file.name}")
             async with aiofiles.open(ocr_output, "wb") as f:
                 await f.write(stream_asset.get_input_stream())
             
@@ -1166,14 +1244,19 @@ class DocumentService:
         if not self.use_gemini:
             raise HTTPException(500, "Gemini API not configured")
         
+        # Use GeminiService for auto-logging if db available
+        from app.services.gemini_service import get_gemini_service
+        gemini_service = get_gemini_service(db) if db else None
+        gemini_client = self._get_gemini_client(gemini_service)
+        
         logger.info("   📤 Uploading PDF to Gemini...")
-        pdf_file = genai.upload_file(str(input_file))
+        pdf_file = await run_blocking("gemini", gemini_client.upload_file, str(input_file))
         
         logger.info("   ⏳ Waiting for Gemini preprocessing...")
         import asyncio
         while pdf_file.state.name == "PROCESSING":
             await asyncio.sleep(1)
-            pdf_file = genai.get_file(pdf_file.name)
+            pdf_file = await run_blocking("gemini", gemini_client.get_file, pdf_file.name)
         
         if pdf_file.state.name == "FAILED":
             raise ValueError(f"Gemini preprocessing failed: {pdf_file.state.name}")
@@ -1194,12 +1277,8 @@ Ngôn ngữ: {language}
         
         logger.info("   🧠 Extracting text with Gemini AI...")
         
-        # Use GeminiService for auto-logging if db available
-        from app.services.gemini_service import get_gemini_service
-        gemini_service = get_gemini_service(db) if db else None
-        
         if gemini_service:
-            response = gemini_service.generate_content(
+            response = await gemini_service.agenerate_content(
                 prompt=[pdf_file, prompt],
                 model=self.gemini_model_name,
                 operation="pdf-text-extraction",
@@ -1210,15 +1289,15 @@ Ngôn ngữ: {language}
                 }
             )
         else:
-            model_obj = genai.GenerativeModel(self.gemini_model_name)
-            response = model_obj.generate_content([pdf_file, prompt])
+            model_obj = gemini_client.model(self.gemini_model_name)
+            response = await run_blocking("gemini", model_obj.generate_content, [pdf_file, prompt])
         
         extracted_text = response.text.strip()
         logger.info(f"   ✓ Extracted {len(extracted_text)} characters")
         
         # Cleanup
         try:
-            genai.delete_file(pdf_file.name)
+            await run_blocking("gemini", gemini_client.delete_file, pdf_file.name)
         except Exception as e:
             logger.warning(f"   ⚠️  Cleanup warning: {e}")
         
@@ -1273,42 +1352,23 @@ Ngôn ngữ: {language}
         if not self.use_gemini:
             raise HTTPException(500, "Gemini API không khả dụng. Vui lòng thêm API keys tại Admin > AI Keys")
         
-        # Switch model if specified
-        original_model = self.gemini_model_name
-        if model_name and model_name != self.gemini_model_name:
-            try:
-                self.set_gemini_model(model_name)
-            except ValueError as e:
-                raise HTTPException(400, str(e))
+        # Model theo request (không đổi default của doc_service dùng chung)
+        try:
+            model_name = self.resolve_gemini_model(model_name)
+        except ValueError as e:
+            raise HTTPException(400, str(e))
         
         try:
-            model_info = GEMINI_MODELS.get(self.gemini_model_name, {})
+            model_info = GEMINI_MODELS.get(model_name, {})
             
             logger.info("="*60)
             logger.info("🤖 GEMINI API - STARTING CONVERSION")
-            logger.info(f"   Model: {model_info.get('name', self.gemini_model_name)}")
+            logger.info(f"   Model: {model_info.get('name', model_name)}")
             logger.info(f"   Quality: {model_info.get('quality', '?')}/10")
             logger.info(f"   Speed: {model_info.get('speed', '?')}/10")
             logger.info(f"   Language: {ocr_language}")
             logger.info("="*60)
             
-            # Upload PDF to Gemini
-            logger.info("   📤 Step 1/4: Uploading PDF to Gemini...")
-            upload_start = time.time()
-            pdf_file = genai.upload_file(str(input_file))
-            
-            # Wait for processing
-            logger.info("   ⏳ Step 2/4: Waiting for Gemini preprocessing...")
-            while pdf_file.state.name == "PROCESSING":
-                await asyncio.sleep(1)
-                pdf_file = genai.get_file(pdf_file.name)
-            
-            if pdf_file.state.name == "FAILED":
-                raise ValueError(f"PDF processing failed: {pdf_file.state.name}")
-            
-            upload_time = time.time() - upload_start
-            logger.info(f"   ✓ Upload complete ({upload_time:.2f}s) - File ID: {pdf_file.name}")
-            
             # Enhanced prompt for Gemini - Preserve layout and formatting
             prompt = f"""BẠN LÀ CHUYÊN GIA TRÍCH XUẤT VĂN BẢN TỪ PDF.
 
@@ -1369,49 +1429,35 @@ Bắt đầu trích xuất:
 """
             
             # Generate content with optimized config using GeminiService wrapper
-            logger.info("   🧠 Step 3/4: Extracting content with Gemini AI...")
+            # (PDF lớn → chunk N trang song song, mỗi chunk 1 key)
+            logger.info("   🧠 Step 1/2: Extracting content with Gemini AI...")
             api_start = time.time()
             
-            # Create GeminiService for auto-logging
-            gemini_service = get_gemini_service(db) if db else None
-            
-            if gemini_service:
-                # Use wrapper for auto-logging
-                response = gemini_service.generate_content(
-                    prompt=[pdf_file, prompt],
-                    model=self.gemini_model_name,
-                    operation="pdf-to-word",
-                    metadata={
-                        "file_name": input_file.name,
-                        "ocr_language": ocr_language,
-                        "conversion_type": "pdf_to_word_gemini"
-                    },
-                    generation_config={
-                        "temperature": 0.0,
-                        "top_p": 0.95,
-                        "top_k": 40,
-                        "max_output_tokens": 8192
-                    }
-                )
-                logger.info("   ✓ Usage automatically logged to database")
-            else:
-                # Fallback to direct API call (no logging)
-                logger.warning("   ⚠️  No db session - API call will NOT be logged")
-                model_obj = genai.GenerativeModel(self.gemini_model_name)
-                response = model_obj.generate_content(
-                    [pdf_file, prompt],
-                    generation_config=genai.GenerationConfig(
-                        temperature=0.0,
-                        top_p=0.95,
-                        top_k=40,
-                        max_output_tokens=8192
-                    )
-                )
+            generation_config = {
+                "temperature": 0.0,
+                "top_p": 0.95,
+                "top_k": 40,
+                "max_output_tokens": 8192
+            }
+            metadata = {
+                "file_name": input_file.name,
+                "ocr_language": ocr_language,
+                "conversion_type": "pdf_to_word_gemini"
+            }
+            responses = await self._gemini_generate_from_pdf_chunked(
+                input_file,
+                prompt,
+                model_name,
+                operation="pdf-to-word",
+                metadata=metadata,
+                generation_config=generation_config,
+                db=db
+            )
             
             api_time = time.time() - api_start
             
             # Get plain text response from Gemini
-            extracted_text = response.text.strip()
+            extracted_text = stitch_chunk_texts([response.text for response in responses])
             logger.info(f"   ✓ Extraction complete ({api_time:.2f}s) - {len(extracted_text)} characters")
             
             # Create simple document structure
@@ -1422,26 +1468,19 @@ Bắt đầu trích xuất:
             }
             
             # Convert to Word
-            logger.info("   📝 Step 4/4: Creating Word document...")
+            logger.info("   📝 Step 2/2: Creating Word document...")
             word_start = time.time()
             word_path = await self._create_word_from_text(document_data, output_path)
             word_time = time.time() - word_start
             logger.info(f"   ✓ Word created ({word_time:.2f}s)")
             
-            # Cleanup
-            try:
-                genai.delete_file(pdf_file.name)
-                logger.info("   ✓ Cleanup complete")
-            except Exception as e:
-                logger.warning(f"   ⚠️  Cleanup warning: {e}")
-            
             total_time = time.time() - start_time
             logger.info("")
             logger.info("="*60)
             logger.info("✅ GEMINI API - CONVERSION SUCCESS")
             logger.info(f"   Output: {output_path.name}")
             logger.info(f"   Size: {output_path.stat().st_size / 1024:.2f} KB")
-            logger.info(f"   Total time: {total_time:.2f}s (upload: {upload_time:.2f}s, AI: {api_time:.2f}s, Word: {word_time:.2f}s)")
+            logger.info(f"   Total time: {total_time:.2f}s (upload + AI: {api_time:.2f}s, {len(responses)} chunk(s), Word: {word_time:.2f}s)")
             logger.info("="*60)
             logger.info("")
             
@@ -1455,14 +1494,113 @@ Bắt đầu trích xuất:
             logger.error("="*60)
             logger.error("")
             raise HTTPException(500, f"Gemini conversion failed: {str(e)}")
+    
+    async def _gemini_generate_from_pdf(
+        self,
+        pdf_path: Path,
+        prompt: str,
+        model_name: str,
+        operation: str,
+        metadata: dict,
+        generation_config: Optional[dict] = None,
+        gemini_service=None,
+        gemini_client=None
+    ):
+        """Upload PDF → chờ Gemini xử lý → generate → xóa file (cùng 1 key)"""
+        client = gemini_service.client if gemini_service is not None else gemini_client
+        
+        pdf_file = await run_blocking("gemini", client.upload_file, str(pdf_path))
+        try:
+            while pdf_file.state.name == "PROCESSING":
+                await asyncio.sleep(1)
+                pdf_file = await run_blocking("gemini", client.get_file, pdf_file.name)
+            
+            if pdf_file.state.name == "FAILED":
+                raise ValueError(f"PDF processing failed: {pdf_file.state.name}")
+            
+            if gemini_service is not None:
+                # Use wrapper for auto-logging
+                return await gemini_service.agenerate_content(
+                    prompt=[pdf_file, prompt],
+                    model=model_name,
+                    operation=operation,
+                    metadata=metadata,
+                    generation_config=generation_config
+                )
+            
+            # Fallback to direct API call (no logging)
+            model_obj = client.model(model_name)
+            return await run_blocking(
+                "gemini", model_obj.generate_content,
+                [pdf_file, prompt],
+                generation_config=genai.GenerationConfig(**generation_config) if generation_config else None
+            )
         finally:
-            # Restore original model if we switched
-            if model_name and model_name != original_model:
-                try:
-                    self.set_gemini_model(original_model)
-                    logger.info(f"Restored original model: {original_model}")
-                except Exception as e:
-                    logger.warning(f"Failed to restore original model: {e}")
+            try:
+                await run_blocking("gemini", client.delete_file, pdf_file.name)
+            except Exception as e:
+                logger.warning(f"   ⚠️  Cleanup warning: {e}")
+    
+    async def _gemini_generate_from_pdf_chunked(
+        self,
+        input_file: Path,
+        prompt: str,
+        model_name: str,
+        operation: str,
+        metadata: dict,
+        generation_config: Optional[dict] = None,
+        db = None
+    ) -> list:
+        """
+        Gemini cho PDF bất kỳ độ dài: ≤ GEMINI_CHUNK_PAGES trang → 1 lần gọi,
+        dài hơn → cắt chunk, gọi song song (mỗi chunk 1 key), trả response theo thứ tự trang
+        
+        db: có → usage được log (mỗi chunk 1 session riêng vì các chunk chạy trên nhiều thread)
+        """
+        from app.core.config import settings
+        from app.core.database import SessionLocal
+        from app.services.page_workers import count_pages
+        
+        page_count = await asyncio.to_thread(count_pages, input_file)
+        if page_count <= settings.GEMINI_CHUNK_PAGES:
+            gemini_service = get_gemini_service(db) if db else None
+            if not gemini_service:
+                logger.warning("   ⚠️  No db session - API call will NOT be logged")
+            response = await self._gemini_generate_from_pdf(
+                input_file, prompt, model_name, operation, metadata, generation_config,
+                gemini_service=gemini_service,
+                gemini_client=self._get_gemini_client(gemini_service)
+            )
+            return [response]
+        
+        chunks = await asyncio.to_thread(split_pdf_chunks, input_file, settings.GEMINI_CHUNK_PAGES)
+        
+        async def extract_chunk(chunk: PdfChunk):
+            chunk_metadata = {**metadata, "chunk": chunk.index + 1, "pages": f"{chunk.start_page}-{chunk.end_page}"}
+            chunk_prompt = prompt + chunk_context_prompt(chunk)
+            
+            if not db:
+                # Key pool xoay vòng → các chunk rơi vào các key khác nhau
+                client = await asyncio.to_thread(self._get_gemini_client)
+                return await self._gemini_generate_from_pdf(
+                    chunk.path, chunk_prompt, model_name, operation, chunk_metadata, generation_config,
+                    gemini_client=client
+                )
+            
+            chunk_db = SessionLocal()
+            try:
+                gemini_service = await asyncio.to_thread(get_gemini_service, chunk_db)
+                return await self._gemini_generate_from_pdf(
+                    chunk.path, chunk_prompt, model_name, operation, chunk_metadata, generation_config,
+                    gemini_service=gemini_service
+                )
+            finally:
+                chunk_db.close()
+        
+        try:
+            return await run_chunks(chunks, extract_chunk)
+        finally:
+            remove_chunks(chunks)
     
     async def _create_word_from_text(
         self,
@@ -1749,94 +1887,44 @@ Bắt đầu trích xuất:
     async def pdf_to_excel(
         self,
         input_file: Path,
-        output_filename: Optional[str] = None
+        output_filename: Optional[str] = None,
+        output_format: str = "xlsx"  # xlsx, csv, parquet
     ) -> Path:
         """
         Convert PDF to Excel (.xlsx)
         Extracts tables from PDF using pdfplumber
+        
+        Trích bảng song song trên page process pool (xem pdf_tables.py):
+        - xlsx: workbook write-only, 1 sheet / trang có bảng
+        - csv / parquet: ZIP, mỗi bảng 1 file
         """
         if input_file.suffix.lower() != '.pdf':
             raise HTTPException(400, "File must be .pdf")
         
-        output_filename = output_filename or input_file.stem + ".xlsx"
-        output_path = self.output_dir / output_filename
+        output_format = output_format.lower()
+        if output_format not in TABLE_OUTPUT_FORMATS:
+            raise HTTPException(400, f"Invalid output format. Must be one of: {list(TABLE_OUTPUT_FORMATS)}")
+        if output_format == "parquet" and not parquet_available():
+            raise HTTPException(500, "Parquet output requires pyarrow (pip install pyarrow)")
+        
+        suffix = ".xlsx" if output_format == "xlsx" else f"_{output_format}.zip"
+        output_filename = output_filename or input_file.stem + suffix
+        output_path = self.new_output_path(output_filename)
         
         try:
-            import pdfplumber
-            from openpyxl import Workbook
-            from openpyxl.styles import Font, PatternFill, Alignment
-            
-            # Create Excel workbook
-            wb = Workbook()
-            wb.remove(wb.active)  # Remove default sheet
-            
-            # Open PDF
-            with pdfplumber.open(input_file) as pdf:
-                for page_num, page in enumerate(pdf.pages, start=1):
-                    # Extract tables from page
-                    tables = page.extract_tables()
-                    
-                    if tables:
-                        # Create sheet for each page with tables
-                        ws = wb.create_sheet(title=f"Page {page_num}")
-                        
-                        # Write all tables from this page
-                        current_row = 1
-                        for table_num, table in enumerate(tables, start=1):
-                            # Add table header
-                            if len(tables) > 1:
-                                header_cell = ws.cell(row=current_row, column=1, value=f"Table {table_num}")
-                                header_cell.font = Font(bold=True, size=12)
-                                header_cell.fill = PatternFill(start_color="CCCCCC", end_color="CCCCCC", fill_type="solid")
-                                current_row += 1
-                            
-                            # Write table data
-                            for row_data in table:
-                                for col_num, cell_value in enumerate(row_data, start=1):
-                                    cell = ws.cell(row=current_row, column=col_num, value=cell_value)
-                                    cell.alignment = Alignment(wrap_text=True, vertical='top')
-                                    
-                                    # Bold first row (header)
-                                    if current_row == 1 or (len(tables) > 1 and current_row == 2):
-                                        cell.font = Font(bold=True)
-                                        cell.fill = PatternFill(start_color="E0E0E0", end_color="E0E0E0", fill_type="solid")
-                                
-                                current_row += 1
-                            
-                            # Add spacing between tables
-                            current_row += 1
-                        
-                        # Auto-adjust column widths
-                        for column in ws.columns:
-                            max_length = 0
-                            column_letter = column[0].column_letter
-                            for cell in column:
-                                try:
-                                    if cell.value:
-                                        max_length = max(max_length, len(str(cell.value)))
-                                except:
-                                    pass
-                            adjusted_width = min(max_length + 2, 50)
-                            ws.column_dimensions[column_letter].width = adjusted_width
-                    else:
-                        # No tables found, extract text
-                        text = page.extract_text()
-                        if text and text.strip():
-                            ws = wb.create_sheet(title=f"Page {page_num} (Text)")
-                            ws.cell(row=1, column=1, value=text)
-                            ws.column_dimensions['A'].width = 100
-            
-            # If no content was extracted at all
-            if len(wb.sheetnames) == 0:
-                ws = wb.create_sheet(title="No Data")
-                ws.cell(row=1, column=1, value="No tables or text found in PDF")
-            
-            # Save workbook
-            wb.save(output_path)
+            if output_format == "xlsx":
+                await asyncio.to_thread(pdf_tables_to_xlsx, input_file, output_path)
+            else:
+                await asyncio.to_thread(pdf_tables_to_archive, input_file, output_path, output_format)
             
             return output_path
             
+        except HTTPException:
+            # Page pool hỏng → 503 (giữ nguyên status)
+            output_path.unlink(missing_ok=True)
+            raise
         except Exception as e:
+            output_path.unlink(missing_ok=True)
             raise HTTPException(500, f"PDF to Excel conversion failed: {str(e)}")
     
     # ==================== PDF Operations ====================
@@ -1847,7 +1935,7 @@ Bắt đầu trích xuất:
         output_filename: str = "merged.pdf"
     ) -> Path:
         """Merge multiple PDFs into one (using modern pypdf)"""
-        output_path = self.output_dir / output_filename
+        output_path = self.new_output_path(output_filename)
         
         try:
             merger = pypdf.PdfWriter()
@@ -1881,6 +1969,7 @@ Bắt đầu trích xuất:
         
         try:
             output_files = []
+            run_dir = new_output_dir(self.output_dir)
             
             with open(input_file, 'rb') as f:
                 pdf_reader = pypdf.PdfReader(f)
@@ -1892,7 +1981,7 @@ Bắt đầu trích xuất:
                         if page_num < len(pdf_reader.pages):
                             pdf_writer.add_page(pdf_reader.pages[page_num])
                     
-                    output_path = self.output_dir / f"{output_prefix}_{idx+1}.pdf"
+                    output_path = run_dir / f"{output_prefix}_{idx+1}.pdf"
                     with open(output_path, 'wb') as output_file:
                         pdf_writer.write(output_file)
                     
@@ -1936,21 +2025,11 @@ Bắt đầu trích xuất:
             raise HTTPException(400, "Rotation must be 90, 180, or 270 degrees")
         
         output_filename = output_filename or input_file.stem + "_rotated.pdf"
-        output_path = self.output_dir / output_filename
+        output_path = self.new_output_path(output_filename)
         
         try:
-            with open(input_file, 'rb') as f:
-                pdf_reader = pypdf.PdfReader(f)
-                pdf_writer = pypdf.PdfWriter()
-                
-                for page_num, page in enumerate(pdf_reader.pages):
-                    if pages is None or (page_num + 1) in pages:
-                        page.rotate(rotation)
-                    pdf_writer.add_page(page)
-                
-                with open(output_path, 'wb') as output_file:
-                    pdf_writer.write(output_file)
-                    
+            operation = RotateOp(rotation, frozenset(pages) if pages is not None else None)
+            await asyncio.to_thread(run_pdf_pipeline, input_file, output_path, [operation])
             return output_path
             
         except Exception as e:
@@ -2061,7 +2140,8 @@ Bắt đầu trích xuất:
         self,
         input_file: Path,
         quality: str = "medium",  # low, medium, high
-        output_filename: Optional[str] = None
+        output_filename: Optional[str] = None,
+        target_size_kb: Optional[int] = None
     ) -> tuple[Path, str]:
         """
         Compress PDF - HYBRID STRATEGY
@@ -2075,6 +2155,8 @@ Bắt đầu trích xuất:
             input_file: Path to PDF file
             quality: Compression level (low, medium, high)
             output_filename: Optional output filename
+            target_size_kb: Nén ảnh tới khi file ≈ dung lượng này (chỉ engine local,
+                Adobe không có chế độ target size)
         
         Returns:
             Tuple of (output_path, technology_used)
@@ -2089,7 +2171,7 @@ Bắt đầu trích xuất:
             raise HTTPException(400, "File must be .pdf")
         
         output_filename = output_filename or input_file.stem + "_compressed.pdf"
-        output_path = self.output_dir / output_filename
+        output_path = self.new_output_path(output_filename)
         
         # Import settings here to avoid circular imports
         from app.core.config import settings
@@ -2101,7 +2183,7 @@ Bắt đầu trích xuất:
         for tech in priorities:
             if tech.lower() == "adobe":
                 # Try Adobe if enabled
-                if self.use_adobe and self.adobe_credentials and ADOBE_AVAILABLE:
+                if self.use_adobe and self.adobe_credentials and ADOBE_AVAILABLE and not target_size_kb:
                     try:
                         logger.info(f"Trying Adobe compress for {input_file.name}")
                         await self._compress_pdf_adobe(input_file, quality, output_path)
@@ -2118,7 +2200,7 @@ Bắt đầu trích xuất:
                 # Try pypdf (always available)
                 try:
                     logger.info(f"Using pypdf compress for {input_file.name}")
-                    await self._compress_pdf_local(input_file, quality, output_path)
+                    await self._compress_pdf_local(input_file, quality, output_path, target_size_kb)
                     logger.info(f"pypdf compression successful: {output_path}")
                     return (output_path, "pypdf")
                 except Exception as e:
@@ -2167,7 +2249,8 @@ Bắt đầu trích xuất:
             pdf_services = PDFServices(credentials=self.adobe_credentials)
             
             # Upload file
-            input_asset = pdf_services.upload(
+            input_asset = await run_blocking(
+                "adobe", pdf_services.upload,
                 input_stream=input_stream,
                 mime_type=PDFServicesMediaType.PDF
             )
@@ -2183,12 +2266,12 @@ Bắt đầu trích xuất:
                 compress_pdf_params=compress_params
             )
             
-            location = pdf_services.submit(compress_job)
-            pdf_services_response = pdf_services.get_job_result(location, CompressPDFResult)
+            location = await run_blocking("adobe", pdf_services.submit, compress_job)
+            pdf_services_response = await run_blocking("adobe", pdf_services.get_job_result, location, CompressPDFResult)
             
             # Download result
             result_asset: CloudAsset = pdf_services_response.get_result().get_asset()
-            stream_asset: StreamAsset = pdf_services.get_content(result_asset)
+            stream_asset: StreamAsset = await run_blocking("adobe", pdf_services.get_content, result_asset)
             
             # Save to file
             async with aiofiles.open(output_path, "wb") as f:
@@ -2206,38 +2289,24 @@ Bắt đầu trích xuất:
         self,
         input_file: Path,
         quality: str,
-        output_path: Path
+        output_path: Path,
+        target_size_kb: Optional[int] = None
     ) -> None:
         """
-        Compress PDF using pypdf library
-        Basic compression with 7/10 quality (existing code)
+        Compress PDF locally (pypdf + Pillow, không gọi cloud)
+
+        - Ảnh nhúng: downsample về DPI mục tiêu + JPEG / CCITT G4 (pdf_compress.py)
+        - Ảnh trùng lặp chỉ giữ 1 bản
+        - Content stream: compress_content_streams
         """
-        # Quality settings for pypdf compression
-        quality_map = {
-            "low": 4,      # More compression
-            "medium": 2,   # Balanced
-            "high": 0      # Less compression
-        }
-        
-        compression_level = quality_map.get(quality, 2)
+        # Quality không hợp lệ → medium (balanced)
+        operation = CompressOp(
+            quality if quality in COMPRESSION_LEVELS else "medium",
+            target_size_kb=target_size_kb
+        )
         
         try:
-            with open(input_file, 'rb') as f:
-                pdf_reader = pypdf.PdfReader(f)
-                pdf_writer = pypdf.PdfWriter()
-                
-                # Copy all pages
-                for page in pdf_reader.pages:
-                    pdf_writer.add_page(page)
-                
-                # Compress images
-                for page in pdf_writer.pages:
-                    page.compress_content_streams(level=compression_level)
-                
-                # Write compressed PDF
-                with open(output_path, 'wb') as output_file:
-                    pdf_writer.write(output_file)
-                    
+            await asyncio.to_thread(run_pdf_pipeline, input_file, output_path, [operation])
         except Exception as e:
             raise HTTPException(500, f"pypdf compression failed: {str(e)}")
     
@@ -2255,7 +2324,7 @@ Bắt đầu trích xuất:
             raise HTTPException(400, f"File must be one of: {', '.join(allowed_extensions)}")
         
         output_filename = output_filename or input_file.stem + ".pdf"
-        output_path = self.output_dir / output_filename
+        output_path = self.new_output_path(output_filename)
         
         try:
             # Use Pillow to convert image to PDF
@@ -2301,7 +2370,7 @@ Bắt đầu trích xuất:
             raise HTTPException(400, "No images provided")
         
         output_filename = output_filename or f"images_combined_{len(input_files)}_pages.pdf"
-        output_path = self.output_dir / output_filename
+        output_path = self.new_output_path(output_filename)
         
         try:
             from PIL import Image
@@ -2368,7 +2437,7 @@ Bắt đầu trích xuất:
             raise HTTPException(400, "File must be .pdf")
         
         output_filename = output_filename or input_file.stem + "_watermarked.pdf"
-        output_path = self.output_dir / output_filename
+        output_path = self.new_output_path(output_filename)
         
         # Import settings
         from app.core.config import settings
@@ -2481,49 +2550,9 @@ Bắt đầu trích xuất:
         Basic watermark with 8/10 quality (existing code)
         """
         try:
-            from reportlab.pdfgen import canvas
-            from reportlab.lib.pagesizes import letter
-            from reportlab.lib.colors import Color
-            import io
-            
-            # Read input PDF
-            with open(input_file, 'rb') as f:
-                pdf_reader = pypdf.PdfReader(f)
-                pdf_writer = pypdf.PdfWriter()
-                
-                # Create watermark
-                packet = io.BytesIO()
-                can = canvas.Canvas(packet, pagesize=letter)
-                
-                # Position mapping
-                positions = {
-                    'center': (300, 400),
-                    'top-left': (50, 750),
-                    'top-right': (450, 750),
-                    'bottom-left': (50, 50),
-                    'bottom-right': (450, 50)
-                }
-                x, y = positions.get(position, (300, 400))
-                
-                # Set watermark properties
-                can.setFillColor(Color(0, 0, 0, alpha=opacity))
-                can.setFont("Helvetica", 40)
-                can.drawString(x, y, watermark_text)
-                can.save()
-                
-                # Move to beginning of BytesIO
-                packet.seek(0)
-                watermark_pdf = pypdf.PdfReader(packet)
-                watermark_page = watermark_pdf.pages[0]
-                
-                # Apply watermark to all pages
-                for page in pdf_reader.pages:
-                    page.merge_page(watermark_page)
-                    pdf_writer.add_page(page)
-                
-                # Write output
-                with open(output_path, 'wb') as output_file:
-                    pdf_writer.write(output_file)
+            # Overlay tạo 1 lần cho mỗi kích thước trang (pdf_pipeline.py)
+            operation = WatermarkOp(watermark_text, position, opacity)
+            await asyncio.to_thread(run_pdf_pipeline, input_file, output_path, [operation])
                     
         except Exception as e:
             raise HTTPException(500, f"pypdf watermark failed: {str(e)}")
@@ -2542,31 +2571,15 @@ Bắt đầu trích xuất:
             raise HTTPException(400, "File must be .pdf")
         
         output_filename = output_filename or input_file.stem + "_protected.pdf"
-        output_path = self.output_dir / output_filename
+        output_path = self.new_output_path(output_filename)
         
         if not owner_password:
             owner_password = user_password + "_owner"
         
         try:
-            with open(input_file, 'rb') as f:
-                pdf_reader = pypdf.PdfReader(f)
-                pdf_writer = pypdf.PdfWriter()
-                
-                # Copy all pages
-                for page in pdf_reader.pages:
-                    pdf_writer.add_page(page)
-                
-                # Encrypt with password
-                pdf_writer.encrypt(
-                    user_password=user_password,
-                    owner_password=owner_password,
-                    permissions_flag=0b0100  # Allow printing
-                )
-                
-                # Write encrypted PDF
-                with open(output_path, 'wb') as output_file:
-                    pdf_writer.write(output_file)
-                    
+            # Encrypt with password (allow printing)
+            operation = ProtectOp(user_password, owner_password)
+            await asyncio.to_thread(run_pdf_pipeline, input_file, output_path, [operation])
             return output_path
             
         except Exception as e:
@@ -2583,7 +2596,7 @@ Bắt đầu trích xuất:
             raise HTTPException(400, "File must be .pdf")
         
         output_filename = output_filename or input_file.stem + "_unlocked.pdf"
-        output_path = self.output_dir / output_filename
+        output_path = self.new_output_path(output_filename)
         
         try:
             with open(input_file, 'rb') as f:
@@ -2623,50 +2636,32 @@ Bắt đầu trích xuất:
         dpi: int = 200,
         output_prefix: str = "page"
     ) -> List[Path]:
-        """Convert PDF pages to images using pypdfium2 (no Poppler needed!)"""
+        """
+        Convert PDF pages to images using pypdfium2 (no Poppler needed!)
+
+        Các trang render song song trên page process pool (iter_page_images),
+        mỗi ảnh được ghi ra disk ngay khi xong. Endpoint /pdf/to-images stream
+        thẳng vào ZIP thay vì gọi hàm này; hàm này cho caller cần file (batch).
+        """
         if input_file.suffix.lower() != '.pdf':
             raise HTTPException(400, "File must be .pdf")
+        if format.lower() not in IMAGE_FORMATS:
+            raise HTTPException(400, f"Invalid format. Must be one of: {sorted(IMAGE_FORMATS)}")
         
+        # Prefix riêng mỗi lần gọi → request song song cùng tên file không ghi đè nhau
+        run_prefix = f"{output_prefix}_{uuid.uuid4().hex[:8]}"
+        output_files = []
         try:
-            import pypdfium2 as pdfium
-            from PIL import Image
-            
-            output_files = []
-            
-            # Open PDF with pypdfium2
-            pdf = pdfium.PdfDocument(input_file)
-            
-            # Calculate scale for DPI (default 72 DPI, scale up to requested DPI)
-            scale = dpi / 72.0
-            
-            # Convert each page
-            for page_num in range(len(pdf)):
-                page = pdf[page_num]
-                
-                # Render page to PIL Image with specified DPI
-                pil_image = page.render(
-                    scale=scale,
-                    rotation=0,
-                    crop=(0, 0, 0, 0)
-                ).to_pil()
-                
-                # Save image
-                output_filename = f"{output_prefix}_{page_num + 1}.{format}"
-                output_path = self.output_dir / output_filename
-                
-                # Convert RGBA to RGB if saving as JPEG
-                if format.lower() in ['jpg', 'jpeg'] and pil_image.mode == 'RGBA':
-                    rgb_image = Image.new('RGB', pil_image.size, (255, 255, 255))
-                    rgb_image.paste(pil_image, mask=pil_image.split()[3])
-                    pil_image = rgb_image
-                
-                pil_image.save(output_path, format.upper() if format.upper() != 'JPG' else 'JPEG', quality=95)
+            async for page_index, image_bytes in iter_page_images(input_file, format, dpi):
+                output_path = self.output_dir / f"{run_prefix}_{page_index + 1}.{format}"
+                async with aiofiles.open(output_path, "wb") as f:
+                    await f.write(image_bytes)
                 output_files.append(output_path)
-            
-            pdf.close()
             return output_files
             
         except Exception as e:
+            for output_path in output_files:
+                output_path.unlink(missing_ok=True)
             raise HTTPException(500, f"PDF to images conversion failed: {str(e)}")
     
     # ==================== Add Page Numbers ====================
@@ -2683,54 +2678,46 @@ Bắt đầu trích xuất:
             raise HTTPException(400, "File must be .pdf")
         
         output_filename = output_filename or input_file.stem + "_numbered.pdf"
-        output_path = self.output_dir / output_filename
+        output_path = self.new_output_path(output_filename)
         
         try:
-            from reportlab.pdfgen import canvas
-            from reportlab.lib.pagesizes import letter
-            import io
-            
-            with open(input_file, 'rb') as f:
-                pdf_reader = pypdf.PdfReader(f)
-                pdf_writer = pypdf.PdfWriter()
-                total_pages = len(pdf_reader.pages)
-                
-                for page_num, page in enumerate(pdf_reader.pages, start=1):
-                    # Create page number overlay
-                    packet = io.BytesIO()
-                    can = canvas.Canvas(packet, pagesize=letter)
-                    
-                    # Position mapping
-                    positions = {
-                        'bottom-center': (300, 30),
-                        'bottom-right': (520, 30),
-                        'bottom-left': (80, 30)
-                    }
-                    x, y = positions.get(position, (300, 30))
-                    
-                    # Format page number text
-                    page_text = format.replace('{page}', str(page_num))
-                    page_text = page_text.replace('{total}', str(total_pages))
-                    
-                    can.setFont("Helvetica", 10)
-                    can.drawString(x, y, page_text)
-                    can.save()
-                    
-                    # Merge with original page
-                    packet.seek(0)
-                    overlay_pdf = pypdf.PdfReader(packet)
-                    page.merge_page(overlay_pdf.pages[0])
-                    pdf_writer.add_page(page)
-                
-                # Write output
-                with open(output_path, 'wb') as output_file:
-                    pdf_writer.write(output_file)
-                    
+            # 1 canvas cho mọi trang (không phải 1 canvas + 1 PdfReader / trang)
+            operation = PageNumbersOp(position, format)
+            await asyncio.to_thread(run_pdf_pipeline, input_file, output_path, [operation])
             return output_path
             
         except Exception as e:
             raise HTTPException(500, f"Add page numbers failed: {str(e)}")
-    
+
+    # ==================== PDF Pipeline (nhiều thao tác, 1 lần đọc/ghi) ====================
+
+    async def pdf_pipeline(
+        self,
+        input_file: Path,
+        operations: List[PipelineOp],
+        output_filename: Optional[str] = None
+    ) -> Path:
+        """
+        Áp dụng chuỗi thao tác (watermark, page_numbers, rotate, compress, protect)
+        theo thứ tự trong 1 lần parse + 1 lần ghi
+
+        Args:
+            operations: Kết quả parse_pipeline() (đã kiểm tra tham số + thứ tự)
+        """
+        if input_file.suffix.lower() != '.pdf':
+            raise HTTPException(400, "File must be .pdf")
+
+        output_filename = output_filename or input_file.stem + "_processed.pdf"
+        output_path = self.new_output_path(output_filename)
+
+        try:
+            await asyncio.to_thread(run_pdf_pipeline, input_file, output_path, operations)
+            return output_path
+
+        except Exception as e:
+            output_path.unlink(missing_ok=True)
+            raise HTTPException(500, f"PDF pipeline failed: {str(e)}")
+
     # ==================== ADOBE-ONLY FEATURES ====================
     
     async def ocr_pdf(
@@ -2785,7 +2772,7 @@ Bắt đầu trích xuất:
             raise HTTPException(400, "File must be .pdf")
         
         output_filename = output_filename or input_file.stem + "_ocr.pdf"
-        output_path = self.output_dir / output_filename
+        output_path = self.new_output_path(output_filename)
         
         try:
             # Read input file
@@ -2817,7 +2804,8 @@ Bắt đầu trích xuất:
             pdf_services = PDFServices(credentials=self.adobe_credentials)
             
             # Upload file
-            input_asset = pdf_services.upload(
+            input_asset = await run_blocking(
+                "adobe", pdf_services.upload,
                 input_stream=input_stream,
                 mime_type=PDFServicesMediaType.PDF
             )
@@ -2834,15 +2822,15 @@ Bắt đầu trích xuất:
                 ocr_pdf_params=ocr_params
             )
             
-            location = pdf_services.submit(ocr_job)
+            location = await run_blocking("adobe", pdf_services.submit, ocr_job)
             logger.info(f"Adobe OCR job submitted for {input_file.name}")
             
             # Get result (polling handled by SDK)
-            pdf_services_response = pdf_services.get_job_result(location, OCRPDFResult)
+            pdf_services_response = await run_blocking("adobe", pdf_services.get_job_result, location, OCRPDFResult)
             
             # Download result
             result_asset: CloudAsset = pdf_services_response.get_result().get_asset()
-            stream_asset: StreamAsset = pdf_services.get_content(result_asset)
+            stream_asset: StreamAsset = await run_blocking("adobe", pdf_services.get_content, result_asset)
             
             # Save to file
             async with aiofiles.open(output_path, "wb") as f:
@@ -2870,27 +2858,27 @@ Bắt đầu trích xuất:
         Quality: 7/10 (Good for basic OCR, but not perfect layout preservation)
         Features: Extract text, basic recognition, multiple languages
         Limitation: Creates new PDF with text layer (doesn't preserve exact layout)
+        
+        Pages are rendered lazily with pypdfium2 and OCR'd on the page process
+        pool (all cores) - RAM giới hạn theo cửa sổ trang, không theo số trang.
         """
-        try:
-            from pdf2image import convert_from_path
-            from PIL import Image
-            import pytesseract
-            from reportlab.lib.pagesizes import letter
-            from reportlab.pdfgen import canvas
-            from reportlab.lib.utils import ImageReader
-            import io
-        except ImportError as e:
+        import importlib.util
+        from app.services.page_workers import ocr_pdf_to_searchable_pdf
+
+        # pytesseract / reportlab chỉ được import trong worker → kiểm tra trước cho lỗi rõ ràng
+        missing = [name for name in ("pytesseract", "reportlab") if importlib.util.find_spec(name) is None]
+        if missing:
             raise HTTPException(
                 500, 
-                f"Tesseract OCR dependencies not installed: {e}. "
-                "Install: pip install pdf2image pytesseract pillow reportlab"
+                f"Tesseract OCR dependencies not installed: {', '.join(missing)}. "
+                "Install: pip install pytesseract pillow reportlab"
             )
         
         if input_file.suffix.lower() != '.pdf':
             raise HTTPException(400, "File must be .pdf")
         
         output_filename = output_filename or input_file.stem + "_ocr_tesseract.pdf"
-        output_path = self.output_dir / output_filename
+        output_path = self.new_output_path(output_filename)
         
         try:
             # Map language codes to Tesseract format
@@ -2907,50 +2895,12 @@ Bắt đầu trích xuất:
             }
             tesseract_lang = lang_map.get(language, "eng")
             
-            logger.info(f"Converting PDF to images for OCR...")
-            # Convert PDF pages to images
-            images = convert_from_path(str(input_file), dpi=300)
-            
-            logger.info(f"Performing OCR on {len(images)} pages...")
-            # Create new PDF with OCR text
-            c = canvas.Canvas(str(output_path), pagesize=letter)
-            
-            for i, image in enumerate(images):
-                logger.info(f"  Processing page {i+1}/{len(images)}...")
-                
-                # OCR the image
-                text = pytesseract.image_to_string(image, lang=tesseract_lang)
-                
-                # Convert PIL image to bytes for ReportLab
-                img_buffer = io.BytesIO()
-                image.save(img_buffer, format='PNG')
-                img_buffer.seek(0)
-                img_reader = ImageReader(img_buffer)
-                
-                # Get image dimensions
-                img_width, img_height = image.size
-                
-                # Scale to fit page (8.5 x 11 inches = 612 x 792 points)
-                page_width, page_height = letter
-                scale = min(page_width / img_width, page_height / img_height)
-                scaled_width = img_width * scale
-                scaled_height = img_height * scale
-                
-                # Draw image on page
-                c.drawImage(img_reader, 0, 0, width=scaled_width, height=scaled_height)
-                
-                # Add invisible text layer (for searchability)
-                c.setFillColorRGB(1, 1, 1, alpha=0.01)  # Almost invisible
-                c.setFont("Helvetica", 8)
-                text_object = c.beginText(10, page_height - 20)
-                for line in text.split('\n'):
-                    text_object.textLine(line)
-                c.drawText(text_object)
-                
-                c.showPage()  # Next page
+            start_time = time.time()
+            page_count = await asyncio.to_thread(
+                ocr_pdf_to_searchable_pdf, input_file, output_path, tesseract_lang
+            )
             
-            c.save()
-            logger.info(f"✅ Tesseract OCR successful: {output_path}")
+            logger.info(f"✅ Tesseract OCR successful: {output_path} ({page_count} pages in {time.time() - start_time:.1f}s)")
             return output_path
             
         except Exception as e:
@@ -3018,7 +2968,8 @@ Bắt đầu trích xuất:
             pdf_services = PDFServices(credentials=self.adobe_credentials)
             
             # Upload file
-            input_asset = pdf_services.upload(
+            input_asset = await run_blocking(
+                "adobe", pdf_services.upload,
                 input_stream=input_stream,
                 mime_type=PDFServicesMediaType.PDF
             )
@@ -3041,25 +2992,26 @@ Bắt đầu trích xuất:
                 extract_pdf_params=extract_params
             )
             
-            location = pdf_services.submit(extract_job)
+            location = await run_blocking("adobe", pdf_services.submit, extract_job)
             logger.info(f"Adobe Extract job submitted for {input_file.name}")
             
             # Get result
-            pdf_services_response = pdf_services.get_job_result(location, ExtractPDFResult)
+            pdf_services_response = await run_blocking("adobe", pdf_services.get_job_result, location, ExtractPDFResult)
             
             # Download result (returns ZIP with JSON + images)
             result_asset: CloudAsset = pdf_services_response.get_result().get_resource()
-            stream_asset: StreamAsset = pdf_services.get_content(result_asset)
+            stream_asset: StreamAsset = await run_blocking("adobe", pdf_services.get_content, result_asset)
             
             # Save ZIP file temporarily
             import zipfile
             import json
-            zip_path = self.output_dir / f"{input_file.stem}_extract.zip"
+            run_dir = new_output_dir(self.output_dir)
+            zip_path = run_dir / f"{input_file.stem}_extract.zip"
             async with aiofiles.open(zip_path, "wb") as f:
                 await f.write(stream_asset.get_input_stream())
             
             # Extract ZIP and parse JSON
-            extract_dir = self.output_dir / f"{input_file.stem}_extracted"
+            extract_dir = run_dir / f"{input_file.stem}_extracted"
             extract_dir.mkdir(exist_ok=True)
             
             with zipfile.ZipFile(zip_path, 'r') as zip_ref:
@@ -3092,8 +3044,8 @@ Bắt đầu trích xuất:
                     elif element.get("Path") and "Figure" in element.get("Path", ""):
                         result["images"].append(element)
             
-            # Cleanup ZIP file
-            zip_path.unlink()
+            # Cleanup ZIP + thư mục giải nén
+            shutil.rmtree(run_dir, ignore_errors=True)
             
             logger.info(f"Adobe Extract successful: extracted {len(result['text'])} text elements, "
                        f"{len(result['tables'])} tables, {len(result['images'])} images")
@@ -3138,7 +3090,7 @@ Bắt đầu trích xuất:
               consider enabling Adobe PDF Services API.
         """
         output_filename = output_filename or "document.pdf"
-        output_path = self.output_dir / output_filename
+        output_path = self.new_output_path(output_filename)
         
         try:
             from reportlab.lib.pagesizes import A4, LETTER, LEGAL, landscape
@@ -3289,12 +3241,14 @@ Bắt đầu trích xuất:
             pdf_services = PDFServices(credentials=self.adobe_credentials)
             
             # Upload both files
-            input_asset = pdf_services.upload(
+            input_asset = await run_blocking(
+                "adobe", pdf_services.upload,
                 input_stream=source_stream,
                 mime_type=PDFServicesMediaType.PDF
             )
             
-            watermark_asset = pdf_services.upload(
+            watermark_asset = await run_blocking(
+                "adobe", pdf_services.upload,
                 input_stream=watermark_stream,
                 mime_type=PDFServicesMediaType.PDF
             )
@@ -3306,15 +3260,15 @@ Bắt đầu trích xuất:
             )
             
             # Submit and get result
-            location = pdf_services.submit(watermark_job)
-            response = pdf_services.get_job_result(location, PDFWatermarkResult)
+            location = await run_blocking("adobe", pdf_services.submit, watermark_job)
+            response = await run_blocking("adobe", pdf_services.get_job_result, location, PDFWatermarkResult)
             
             # Get content
             result_asset: CloudAsset = response.get_result().get_asset()
-            stream_asset: StreamAsset = pdf_services.get_content(result_asset)
+            stream_asset: StreamAsset = await run_blocking("adobe", pdf_services.get_content, result_asset)
             
             # Save output
-            output_path = self.output_dir / f"watermarked_{pdf_path.name}"
+            output_path = self.new_output_path(f"watermarked_{pdf_path.name}")
             with open(output_path, "wb") as f:
                 f.write(stream_asset.get_input_stream())
             
@@ -3361,7 +3315,8 @@ Bắt đầu trích xuất:
                 with open(pdf_path, 'rb') as f:
                     stream = f.read()
                 
-                asset = pdf_services.upload(
+                asset = await run_blocking(
+                    "adobe", pdf_services.upload,
                     input_stream=stream,
                     mime_type=PDFServicesMediaType.PDF
                 )
@@ -3390,15 +3345,15 @@ Bắt đầu trích xuất:
             combine_job = CombinePDFJob(combine_pdf_params=combine_pdf_params)
             
             # Submit and get result
-            location = pdf_services.submit(combine_job)
-            response = pdf_services.get_job_result(location, CombinePDFResult)
+            location = await run_blocking("adobe", pdf_services.submit, combine_job)
+            response = await run_blocking("adobe", pdf_services.get_job_result, location, CombinePDFResult)
             
             # Get content
             result_asset: CloudAsset = response.get_result().get_asset()
-            stream_asset: StreamAsset = pdf_services.get_content(result_asset)
+            stream_asset: StreamAsset = await run_blocking("adobe", pdf_services.get_content, result_asset)
             
             # Save output
-            output_path = self.output_dir / "combined.pdf"
+            output_path = self.new_output_path("combined.pdf")
             with open(output_path, "wb") as f:
                 f.write(stream_asset.get_input_stream())
             
@@ -3440,7 +3395,8 @@ Bắt đầu trích xuất:
             pdf_services = PDFServices(credentials=self.adobe_credentials)
             
             # Upload file
-            input_asset = pdf_services.upload(
+            input_asset = await run_blocking(
+                "adobe", pdf_services.upload,
                 input_stream=stream,
                 mime_type=PDFServicesMediaType.PDF
             )
@@ -3474,8 +3430,8 @@ Bắt đầu trích xuất:
             
             # Create and submit job
             split_job = SplitPDFJob(input_asset=input_asset, split_pdf_params=split_params)
-            location = pdf_services.submit(split_job)
-            response = pdf_services.get_job_result(location, SplitPDFResult)
+            location = await run_blocking("adobe", pdf_services.submit, split_job)
+            response = await run_blocking("adobe", pdf_services.get_job_result, location, SplitPDFResult)
             
             # Get all result assets
             result_assets = response.get_result().get_assets()
@@ -3483,13 +3439,14 @@ Bắt đầu trích xuất:
             
             # Save all output files
             output_paths = []
+            run_dir = new_output_dir(self.output_dir)
             for idx, result_asset in enumerate(result_assets):
-                stream_asset: StreamAsset = pdf_services.get_content(result_asset)
+                stream_asset: StreamAsset = await run_blocking("adobe", pdf_services.get_content, result_asset)
                 content_bytes = stream_asset.get_input_stream()
                 
                 logger.info(f"📄 Split file {idx+1}: Content size = {len(content_bytes)} bytes")
                 
-                output_path = self.output_dir / f"split_{idx+1}_{pdf_path.name}"
+                output_path = run_dir / f"split_{idx+1}_{pdf_path.name}"
                 with open(output_path, "wb") as f:
                     f.write(content_bytes)
                 
@@ -3525,6 +3482,7 @@ Bắt đầu trích xuất:
             import pypdf
             
             output_paths = []
+            run_dir = new_output_dir(self.output_dir)
             
             with open(pdf_path, 'rb') as f:
                 pdf_reader = pypdf.PdfReader(f)
@@ -3548,7 +3506,7 @@ Bắt đầu trích xuất:
                             pdf_writer.add_page(pdf_reader.pages[page_num])
                     
                     # Save output file
-                    output_path = self.output_dir / f"split_{idx+1}_{pdf_path.name}"
+                    output_path = run_dir / f"split_{idx+1}_{pdf_path.name}"
                     with open(output_path, 'wb') as output_file:
                         pdf_writer.write(output_file)
                     
@@ -3602,7 +3560,8 @@ Bắt đầu trích xuất:
             pdf_services = PDFServices(credentials=self.adobe_credentials)
             
             # Upload file
-            input_asset = pdf_services.upload(
+            input_asset = await run_blocking(
+                "adobe", pdf_services.upload,
                 input_stream=stream,
                 mime_type=PDFServicesMediaType.PDF
             )
@@ -3636,15 +3595,15 @@ Bắt đầu trích xuất:
             
             # Create and submit job
             protect_job = ProtectPDFJob(input_asset=input_asset, protect_pdf_params=protect_params)
-            location = pdf_services.submit(protect_job)
-            response = pdf_services.get_job_result(location, ProtectPDFResult)
+            location = await run_blocking("adobe", pdf_services.submit, protect_job)
+            response = await run_blocking("adobe", pdf_services.get_job_result, location, ProtectPDFResult)
             
             # Get content
             result_asset: CloudAsset = response.get_result().get_asset()
-            stream_asset: StreamAsset = pdf_services.get_content(result_asset)
+            stream_asset: StreamAsset = await run_blocking("adobe", pdf_services.get_content, result_asset)
             
             # Save output
-            output_path = self.output_dir / f"protected_{pdf_path.name}"
+            output_path = self.new_output_path(f"protected_{pdf_path.name}")
             with open(output_path, "wb") as f:
                 f.write(stream_asset.get_input_stream())
             
@@ -3683,22 +3642,23 @@ Bắt đầu trích xuất:
             pdf_services = PDFServices(credentials=self.adobe_credentials)
             
             # Upload file
-            input_asset = pdf_services.upload(
+            input_asset = await run_blocking(
+                "adobe", pdf_services.upload,
                 input_stream=stream,
                 mime_type=PDFServicesMediaType.PDF
             )
             
             # Create and submit job
             linearize_job = LinearizePDFJob(input_asset=input_asset)
-            location = pdf_services.submit(linearize_job)
-            response = pdf_services.get_job_result(location, LinearizePDFResult)
+            location = await run_blocking("adobe", pdf_services.submit, linearize_job)
+            response = await run_blocking("adobe", pdf_services.get_job_result, location, LinearizePDFResult)
             
             # Get content
             result_asset: CloudAsset = response.get_result().get_asset()
-            stream_asset: StreamAsset = pdf_services.get_content(result_asset)
+            stream_asset: StreamAsset = await run_blocking("adobe", pdf_services.get_content, result_asset)
             
             # Save output
-            output_path = self.output_dir / f"linearized_{pdf_path.name}"
+            output_path = self.new_output_path(f"linearized_{pdf_path.name}")
             with open(output_path, "wb") as f:
                 f.write(stream_asset.get_input_stream())
             
@@ -3738,7 +3698,8 @@ Bắt đầu trích xuất:
             pdf_services = PDFServices(credentials=self.adobe_credentials)
             
             # Upload file
-            input_asset = pdf_services.upload(
+            input_asset = await run_blocking(
+                "adobe", pdf_services.upload,
                 input_stream=stream,
                 mime_type=PDFServicesMediaType.PDF
             )
@@ -3748,16 +3709,16 @@ Bắt đầu trích xuất:
                 input_asset=input_asset,
                 generate_report=generate_report
             )
-            location = pdf_services.submit(autotag_job)
-            response = pdf_services.get_job_result(location, AutotagPDFResult)
+            location = await run_blocking("adobe", pdf_services.submit, autotag_job)
+            response = await run_blocking("adobe", pdf_services.get_job_result, location, AutotagPDFResult)
             
             # Get tagged PDF
             result = response.get_result()
             tagged_asset: CloudAsset = result.get_tagged_pdf()
-            stream_asset: StreamAsset = pdf_services.get_content(tagged_asset)
+            stream_asset: StreamAsset = await run_blocking("adobe", pdf_services.get_content, tagged_asset)
             
             # Save tagged PDF
-            output_path = self.output_dir / f"tagged_{pdf_path.name}"
+            output_path = self.new_output_path(f"tagged_{pdf_path.name}")
             with open(output_path, "wb") as f:
                 f.write(stream_asset.get_input_stream())
             
@@ -3765,9 +3726,9 @@ Bắt đầu trích xuất:
             report_path = None
             if generate_report:
                 report_asset: CloudAsset = result.get_report()
-                report_stream: StreamAsset = pdf_services.get_content(report_asset)
+                report_stream: StreamAsset = await run_blocking("adobe", pdf_services.get_content, report_asset)
                 
-                report_path = self.output_dir / f"accessibility_report_{pdf_path.stem}.xlsx"
+                report_path = output_path.parent / f"accessibility_report_{pdf_path.stem}.xlsx"
                 with open(report_path, "wb") as f:
                     f.write(report_stream.get_input_stream())
             
@@ -3779,11 +3740,72 @@ Bắt đầu trích xuất:
             status_code, friendly_msg = get_friendly_error_message(e)
             raise HTTPException(status_code, friendly_msg)
     
+    async def upload_generation_template(self, template_path: Path) -> AdobeTemplateAsset:
+        """
+        Upload Word template lên Adobe 1 lần → asset dùng lại cho nhiều merge job
+        
+        Dùng cho batch: N item chỉ tốn 1 lần đọc file + 1 lần upload thay vì N lần.
+        """
+        if not self.adobe_credentials:
+            raise HTTPException(
+                status_code=500,
+                detail="Adobe PDF Services credentials not configured"
+            )
+        
+        try:
+            from adobe.pdfservices.operation.pdf_services import PDFServices
+            from adobe.pdfservices.operation.pdf_services_media_type import PDFServicesMediaType
+            
+            pdf_services = PDFServices(credentials=self.adobe_credentials)
+            
+            # Read template file
+            async with aiofiles.open(template_path, 'rb') as template_file:
+                input_stream = await template_file.read()
+            
+            # Upload template
+            input_asset = await run_blocking(
+                "adobe", pdf_services.upload,
+                input_stream=input_stream,
+                mime_type=PDFServicesMediaType.DOCX
+            )
+            return AdobeTemplateAsset(pdf_services=pdf_services, asset=input_asset)
+            
+        except Exception as e:
+            logger.error(f"Template upload error: {e}")
+            raise HTTPException(
+                status_code=500,
+                detail=f"Template upload failed: {str(e)}"
+            )
+    
+    def resolve_generation_engine(self, engine: Optional[str] = None) -> str:
+        """Engine tạo văn bản theo request (mặc định DOCGEN_ENGINE)"""
+        from app.core.config import settings
+        
+        engine = (engine or settings.DOCGEN_ENGINE).lower()
+        if engine not in ("adobe", "local"):
+            raise HTTPException(400, "Engine must be 'adobe' or 'local'")
+        return engine
+    
+    async def prepare_generation_template(
+        self,
+        template_path: Path,
+        engine: Optional[str] = None
+    ) -> Union[AdobeTemplateAsset, DocxTemplateRef]:
+        """Chuẩn bị template 1 lần cho cả batch (Adobe: upload, local: parse + kiểm tra cú pháp)"""
+        if self.resolve_generation_engine(engine) == "local":
+            try:
+                return await asyncio.to_thread(prepare_docx_template, template_path)
+            except ValueError as e:
+                raise HTTPException(400, str(e))
+        return await self.upload_generation_template(template_path)
+    
     async def generate_document(
         self,
         template_path: Path,
         json_data: dict,
-        output_format: str = "pdf"
+        output_format: str = "pdf",
+        template_asset: Optional[Union[AdobeTemplateAsset, DocxTemplateRef]] = None,
+        engine: Optional[str] = None
     ) -> Path:
         """
         Generate PDF/DOCX from Word template + JSON data.
@@ -3792,37 +3814,32 @@ Bắt đầu trích xuất:
             template_path: Path to .docx template file
             json_data: Dictionary with merge data
             output_format: "pdf" or "docx"
+            template_asset: Template đã chuẩn bị (prepare_generation_template) → bỏ qua upload/parse
+            engine: "adobe" (Document Merge API) hoặc "local" (docxtpl), mặc định DOCGEN_ENGINE
             
         Returns:
             Path to generated file
         """
+        if isinstance(template_asset, DocxTemplateRef) or self.resolve_generation_engine(engine) == "local":
+            return await self._generate_document_local(template_path, json_data, output_format, template_asset)
+        
         if not self.adobe_credentials:
             raise HTTPException(
                 status_code=500,
                 detail="Adobe PDF Services credentials not configured"
             )
+        
+        if template_asset is None:
+            template_asset = await self.upload_generation_template(template_path)
             
         try:
             # Import Adobe SDK components
-            from adobe.pdfservices.operation.pdf_services import PDFServices
-            from adobe.pdfservices.operation.pdf_services_media_type import PDFServicesMediaType
             from adobe.pdfservices.operation.pdfjobs.jobs.document_merge_job import DocumentMergeJob
             from adobe.pdfservices.operation.pdfjobs.params.documentmerge.document_merge_params import DocumentMergeParams
             from adobe.pdfservices.operation.pdfjobs.params.documentmerge.output_format import OutputFormat
             from adobe.pdfservices.operation.pdfjobs.result.document_merge_result import DocumentMergePDFResult
             
-            # Initialize PDF Services
-            pdf_services = PDFServices(credentials=self.adobe_credentials)
-            
-            # Read template file
-            with open(template_path, 'rb') as template_file:
-                input_stream = template_file.read()
-            
-            # Upload template
-            input_asset = pdf_services.upload(
-                input_stream=input_stream,
-                mime_type=PDFServicesMediaType.DOCX
-            )
+            pdf_services = template_asset.pdf_services
             
             # Set output format
             if output_format.lower() == "pdf":
@@ -3838,24 +3855,25 @@ Bắt đầu trích xuất:
             
             # Create and submit job
             document_merge_job = DocumentMergeJob(
-                input_asset=input_asset,
+                input_asset=template_asset.asset,
                 document_merge_params=document_merge_params
             )
             
-            location = pdf_services.submit(document_merge_job)
-            pdf_services_response = pdf_services.get_job_result(
+            location = await run_blocking("adobe", pdf_services.submit, document_merge_job)
+            pdf_services_response = await run_blocking(
+                "adobe", pdf_services.get_job_result,
                 location,
                 DocumentMergePDFResult
             )
             
             # Get result asset
             result_asset = pdf_services_response.get_result().get_asset()
-            stream_asset = pdf_services.get_content(result_asset)
+            stream_asset = await run_blocking("adobe", pdf_services.get_content, result_asset)
             
             # Save output file
             output_file_path = self.output_dir / f"generated_document_{uuid.uuid4()}.{output_format.lower()}"
-            with open(output_file_path, "wb") as output_file:
-                output_file.write(stream_asset.get_input_stream())
+            async with aiofiles.open(output_file_path, "wb") as output_file:
+                await output_file.write(stream_asset.get_input_stream())
             
             logger.info(f"Document generation successful: {output_file_path}")
             return output_file_path
@@ -3867,6 +3885,32 @@ Bắt đầu trích xuất:
                 detail=f"Document generation failed: {str(e)}"
             )
     
+    async def _generate_document_local(
+        self,
+        template_path: Path,
+        json_data: dict,
+        output_format: str = "pdf",
+        template: Optional[DocxTemplateRef] = None
+    ) -> Path:
+        """Render template bằng docxtpl (process pool), PDF qua Gotenberg/LibreOffice"""
+        if template is None:
+            template = await self.prepare_generation_template(template_path, engine="local")
+        
+        docx_path = self.output_dir / f"generated_document_{uuid.uuid4()}.docx"
+        try:
+            await render_docx(template, json_data, docx_path)
+        except Exception as e:
+            logger.error(f"Local document generation error: {e}")
+            raise HTTPException(500, f"Document generation failed: {str(e)}")
+        
+        if output_format.lower() != "pdf":
+            return docx_path
+        
+        try:
+            return await self.word_to_pdf(docx_path, output_filename=f"{docx_path.stem}.pdf")
+        finally:
+            await self.cleanup_file(docx_path)
+    
     async def electronic_seal_pdf(
         self,
         pdf_path: Path,
@@ -3927,7 +3971,8 @@ Bắt đầu trích xuất:
             with open(pdf_path, 'rb') as pdf_file:
                 pdf_stream = pdf_file.read()
             
-            pdf_asset = pdf_services.upload(
+            pdf_asset = await run_blocking(
+                "adobe", pdf_services.upload,
                 input_stream=pdf_stream,
                 mime_type=PDFServicesMediaType.PDF
             )
@@ -3947,7 +3992,8 @@ Bắt đầu trích xuất:
                 else:
                     raise HTTPException(400, "Seal image must be PNG or JPEG")
                 
-                seal_image_asset = pdf_services.upload(
+                seal_image_asset = await run_blocking(
+                    "adobe", pdf_services.upload,
                     input_stream=img_stream,
                     mime_type=mime_type
                 )
@@ -3997,12 +4043,12 @@ Bắt đầu trích xuất:
                 )
             
             # Submit and get result
-            location = pdf_services.submit(seal_job)
-            pdf_services_response = pdf_services.get_job_result(location, ESealPDFResult)
+            location = await run_blocking("adobe", pdf_services.submit, seal_job)
+            pdf_services_response = await run_blocking("adobe", pdf_services.get_job_result, location, ESealPDFResult)
             
             # Get result asset
             result_asset = pdf_services_response.get_result().get_asset()
-            stream_asset = pdf_services.get_content(result_asset)
+            stream_asset = await run_blocking("adobe", pdf_services.get_content, result_asset)
             
             # Save output
             output_file_path = self.output_dir / f"sealed_{uuid.uuid4()}.pdf"
@@ -4026,20 +4072,24 @@ Bắt đầu trích xuất:
         input_file: Path,
         ai_engine: str = "gemini",
         language: str = "vi",
-        db = None
+        db = None,
+        pages: Optional[List[PageClassification]] = None
     ) -> dict:
         """
-        Smart PDF OCR - Uses AI only for scanned PDFs, direct extraction for text-based PDFs
+        Smart PDF OCR - Uses AI only for scanned pages, direct extraction for text pages
         
         Logic:
-        1. Detect if PDF is scanned using is_pdf_scanned()
-        2. If scanned → Use AI OCR (Gemini/Claude) 
-        3. If text-based → Use direct text extraction (fast & free)
+        1. Classify EVERY page (text layer chars + image coverage, pypdfium2)
+        2. All pages scanned → AI OCR (Gemini/Claude) cho cả file
+        3. No scanned page → direct extraction (fast & free)
+        4. Mixed → chỉ OCR các trang scan, trang text trích xuất trực tiếp,
+           ghép lại theo thứ tự trang (chi phí AI tỉ lệ với số trang scan)
         
         Args:
             input_file: Path to PDF file
             ai_engine: AI engine to use (gemini or claude)
             language: Language for OCR (vi, en)
+            pages: Kết quả classify_pdf_pages() nếu caller đã phân loại (tránh làm lại)
             
         Returns:
             Dict with extraction results and metadata
@@ -4050,30 +4100,43 @@ Bắt đầu trích xuất:
         start_time = time.time()
         
         try:
-            # Step 1: Detect PDF type
-            logger.info(f"🔍 Analyzing PDF type: {input_file.name}")
-            pdf_is_scanned = is_pdf_scanned(input_file)
-            
-            if pdf_is_scanned:
-                # PDF is scanned → Use AI OCR
+            # Step 1: Classify pages
+            logger.info(f"🔍 Analyzing PDF pages: {input_file.name}")
+            if pages is None:
+                from app.services.page_workers import classify_pdf_pages
+                pages = await asyncio.to_thread(classify_pdf_pages, input_file)
+            scanned_pages = [page.page_index for page in pages if page.scanned]
+            
+            if scanned_pages and len(scanned_pages) == len(pages):
+                # Toàn bộ PDF là scan → Use AI OCR
                 logger.info(f"📄 PDF is scanned - using {ai_engine.upper()} OCR")
                 result = await self._ocr_scanned_pdf(input_file, ai_engine, language, db=db)
+                method, pdf_type = "ai_ocr", "scanned"
+            elif scanned_pages:
+                logger.info(
+                    f"🧩 Mixed PDF - {ai_engine.upper()} OCR for {len(scanned_pages)}/{len(pages)} scanned pages, "
+                    f"direct extraction for the rest"
+                )
+                result = await self._ocr_mixed_pdf(input_file, pages, ai_engine, language)
+                method, pdf_type = "hybrid", "mixed"
             else:
                 # PDF has text layer → Direct extraction
                 logger.info("📝 PDF has text layer - using direct extraction")
-                result = await self._extract_text_based_pdf(input_file)
+                result = await self._extract_text_based_pdf(input_file, pages=pages)
+                method, pdf_type = "direct_extraction", "text_based"
                 
             # Add processing metadata
             processing_time = time.time() - start_time
             result["processing"] = {
                 "time_seconds": round(processing_time, 2),
-                "method": "ai_ocr" if pdf_is_scanned else "direct_extraction",
-                "engine": ai_engine if pdf_is_scanned else "pypdf",
-                "pdf_type": "scanned" if pdf_is_scanned else "text_based"
+                "method": method,
+                "engine": ai_engine if scanned_pages else "pypdfium2",
+                "pdf_type": pdf_type,
+                "scanned_pages": [page_index + 1 for page_index in scanned_pages]
             }
             
             # Track AI usage if OCR was used
-            if pdf_is_scanned and "ai_usage" in result:
+            if scanned_pages and "ai_usage" in result:
                 await self._track_ocr_usage(ai_engine, result, processing_time)
             
             return result
@@ -4090,102 +4153,132 @@ Bắt đầu trích xuất:
                 logger.info("📄 Using Gemini native PDF processing (no image conversion needed)")
                 return await self._ocr_pdf_with_gemini(input_file, language, db=db)
             
-            # Claude requires image conversion
-            logger.info("🖼️ Converting PDF to images for Claude...")
-            
-            # Import pdf2image
-            try:
-                from pdf2image import convert_from_path
-            except ImportError:
-                raise HTTPException(
-                    500,
-                    "pdf2image not installed. Run: pip install pdf2image"
-                )
-            
-            # Check if poppler is available by testing with first page
-            try:
-                test_images = convert_from_path(str(input_file), first_page=1, last_page=1)
-            except Exception as e:
-                if "poppler" in str(e).lower() or "Unable to get page count" in str(e):
-                    raise HTTPException(
-                        500,
-                        "⚠️ Poppler not found!\n\n"
-                        "Poppler is required to convert PDF to images for Claude OCR.\n\n"
-                        "📥 Install Poppler for Windows:\n"
-                        "1. Download: https://github.com/oschwartz10612/poppler-windows/releases/\n"
-                        "2. Extract poppler-xx.xx.x to C:\\poppler\n"
-                        "3. Add C:\\poppler\\Library\\bin to System PATH\n"
-                        "4. Restart terminal/IDE\n\n"
-                        "Or use Chocolatey: choco install poppler\n\n"
-                        "💡 Tip: Use Gemini instead - it can read PDF directly without poppler!"
-                    )
-                raise
+            # Claude requires image conversion → render + OCR từng trang song song
+            from app.services.page_workers import count_pages
             
-            # Convert all pages to images
-            images = convert_from_path(str(input_file))
+            page_count = await asyncio.to_thread(count_pages, input_file)
+            page_results = await self._ocr_pages_with_ai(input_file, list(range(page_count)), ai_engine, language)
             
-            logger.info(f"📄 Converted PDF to {len(images)} images")
-            
-            all_text = ""
-            page_texts = []
-            total_cost = 0.0
-            total_tokens = 0
-            
-            for i, image in enumerate(images):
-                logger.info(f"🔍 Processing page {i+1}/{len(images)} with {ai_engine}")
-                
-                # Save image temporarily
-                temp_img_path = input_file.parent / f"temp_page_{i+1}.png"
-                image.save(temp_img_path, 'PNG')
-                
-                try:
-                    if ai_engine.lower() == "gemini":
-                        page_result = await self._ocr_with_gemini(temp_img_path, language)
-                    elif ai_engine.lower() == "claude":
-                        page_result = await self._ocr_with_claude(temp_img_path, language)
-                    else:
-                        raise HTTPException(400, "AI engine must be 'gemini' or 'claude'")
-                        
-                    page_text = page_result.get("text", "")
-                    page_texts.append({
-                        "page": i + 1,
-                        "text": page_text,
-                        "char_count": len(page_text),
-                        "tokens": page_result.get("tokens", 0),
-                        "cost_usd": page_result.get("cost", 0.0)
-                    })
-                    
-                    all_text += f"\\n\\n--- Page {i+1} ---\\n" + page_text
-                    total_tokens += page_result.get("tokens", 0)
-                    total_cost += page_result.get("cost", 0.0)
-                    
-                finally:
-                    # Cleanup temp image
-                    if temp_img_path.exists():
-                        temp_img_path.unlink()
-                        
-            return {
-                "text": all_text.strip(),
-                "pages": page_texts,
-                "total_pages": len(images),
-                "char_count": len(all_text),
-                "word_count": len(all_text.split()),
-                "ai_usage": {
-                    "engine": ai_engine,
-                    "total_tokens": total_tokens,
-                    "total_cost_usd": round(total_cost, 6),
-                    "cost_per_page": round(total_cost / len(images), 6) if images else 0
-                }
-            }
+            return self._merge_page_results(
+                [{"page": i + 1, **page_result} for i, page_result in enumerate(page_results)],
+                ai_engine
+            )
             
+        except HTTPException:
+            raise
         except Exception as e:
             logger.error(f"AI OCR failed: {e}")
             raise HTTPException(500, f"AI OCR failed: {str(e)}")
+    
+    async def _ocr_mixed_pdf(self, input_file: Path, pages: List[PageClassification], ai_engine: str, language: str) -> dict:
+        """OCR chỉ các trang scan, trang có text layer dùng text đã trích xuất"""
+        try:
+            scanned_pages = [page.page_index for page in pages if page.scanned]
+            ocr_results = dict(zip(
+                scanned_pages,
+                await self._ocr_pages_with_ai(input_file, scanned_pages, ai_engine, language)
+            ))
+            
+            merged = []
+            for page in pages:
+                if page.scanned:
+                    merged.append({"page": page.page_index + 1, "source": "ai_ocr", **ocr_results[page.page_index]})
+                else:
+                    merged.append({"page": page.page_index + 1, "source": "text_layer", "text": page.text})
             
-    async def _extract_text_based_pdf(self, input_file: Path) -> dict:
+            return self._merge_page_results(merged, ai_engine)
+            
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f"Hybrid OCR failed: {e}")
+            raise HTTPException(500, f"Hybrid OCR failed: {str(e)}")
+    
+    async def _ocr_pages_with_ai(
+        self,
+        input_file: Path,
+        page_indices: List[int],
+        ai_engine: str,
+        language: str
+    ) -> List[dict]:
+        """Render + OCR các trang (0-based) bằng AI vision, song song qua page fan-out"""
+        engine = ai_engine.lower()
+        if engine not in ("gemini", "claude"):
+            raise HTTPException(400, "AI engine must be 'gemini' or 'claude'")
+        
+        from app.core.config import settings
+        from app.services.ai_usage_service import get_api_key
+        from app.services.page_fanout import get_page_fanout
+        from app.services.page_workers import render_page
+        
+        # 1 key cho cả tài liệu (giới hạn concurrency tính theo key)
+        api_key = await asyncio.to_thread(get_api_key, engine)
+        if not api_key:
+            raise HTTPException(500, f"{engine.capitalize()} API key not configured")
+        
+        dpi = settings.AI_OCR_RENDER_DPI
+        logger.info(f"🖼️ OCR {len(page_indices)} pages with {engine} (render {dpi}dpi, page fan-out)")
+        
+        async def render(page_index: int) -> bytes:
+            return await render_page(input_file, page_index, dpi)
+        
+        async def ocr(page_index: int, image_bytes: bytes) -> dict:
+            if engine == "gemini":
+                return await self._ocr_with_gemini(image_bytes, language, api_key=api_key)
+            return await self._ocr_with_claude(image_bytes, language, api_key=api_key)
+        
+        return await get_page_fanout().run(engine, api_key, page_indices, render, ocr)
+    
+    def _merge_page_results(self, page_results: List[dict], ai_engine: str) -> dict:
+        """Ghép kết quả từng trang (theo thứ tự) → format response của smart OCR"""
+        all_text = ""
+        page_texts = []
+        total_cost = 0.0
+        total_tokens = 0
+        ocr_pages = 0
+        
+        for page_result in page_results:
+            page_text = page_result.get("text", "")
+            page_entry = {
+                "page": page_result["page"],
+                "text": page_text,
+                "char_count": len(page_text),
+                "tokens": page_result.get("tokens", 0),
+                "cost_usd": page_result.get("cost", 0.0)
+            }
+            if "source" in page_result:
+                page_entry["source"] = page_result["source"]
+            if page_result.get("source", "ai_ocr") == "ai_ocr":
+                ocr_pages += 1
+            page_texts.append(page_entry)
+            
+            all_text += f"\\n\\n--- Page {page_result['page']} ---\\n" + page_text
+            total_tokens += page_result.get("tokens", 0)
+            total_cost += page_result.get("cost", 0.0)
+        
+        return {
+            "text": all_text.strip(),
+            "pages": page_texts,
+            "total_pages": len(page_results),
+            "char_count": len(all_text),
+            "word_count": len(all_text.split()),
+            "ai_usage": {
+                "engine": ai_engine,
+                "ocr_pages": ocr_pages,
+                "total_tokens": total_tokens,
+                "total_cost_usd": round(total_cost, 6),
+                "cost_per_page": round(total_cost / ocr_pages, 6) if ocr_pages else 0
+            }
+        }
+            
+    async def _extract_text_based_pdf(self, input_file: Path, pages: Optional[List[PageClassification]] = None) -> dict:
         """Extract text from text-based PDF using direct method"""
         try:
-            text = await self.extract_pdf_text(input_file)
+            if pages is not None:
+                # Text đã có sẵn từ bước phân loại trang → không parse PDF lần 2
+                text = "\n\n".join(page.text for page in pages).strip()
+            else:
+                text = await self.extract_pdf_text(input_file)
             
             return {
                 "text": text,
@@ -4201,22 +4294,6 @@ Bắt đầu trích xuất:
     async def _ocr_pdf_with_gemini(self, pdf_path: Path, language: str, db = None) -> dict:
         """🤖 OCR PDF directly using Gemini native PDF support with auto-logging"""
         try:
-            import google.generativeai as genai
-            from app.services.gemini_service import get_gemini_service
-            
-            # Get API key
-            from app.services.ai_usage_service import get_api_key
-            api_key = get_api_key("gemini")
-            if not api_key:
-                raise HTTPException(500, "Gemini API key not configured")
-                
-            genai.configure(api_key=api_key)
-            
-            # Upload PDF to Gemini Files API
-            logger.info(f"📤 Uploading PDF to Gemini Files API...")
-            uploaded_file = genai.upload_file(str(pdf_path))
-            logger.info(f"✅ PDF uploaded: {uploaded_file.name}")
-            
             # OCR prompt
             prompt = """Trích xuất TOÀN BỘ văn bản trong tài liệu PDF này.
 
@@ -4227,51 +4304,36 @@ YÊU CẦU:
 
 Trả về văn bản:"""
             
-            # Use GeminiService for auto-logging
-            gemini_service = get_gemini_service(db) if db else None
-            
-            if gemini_service:
-                # Auto-logging enabled
-                response = gemini_service.generate_content(
-                    prompt=[uploaded_file, prompt],
-                    model="gemini-2.0-flash-exp",
-                    operation="pdf-ocr",
-                    metadata={
-                        "file_name": pdf_path.name,
-                        "language": language,
-                        "ocr_type": "pdf_native"
-                    }
-                )
-                logger.info("✅ Usage automatically logged to database")
-            else:
-                # Fallback without logging
-                logger.warning("⚠️ No db session - OCR will NOT be logged")
-                model = genai.GenerativeModel("gemini-2.0-flash-exp")
-                response = model.generate_content([uploaded_file, prompt])
+            # PDF lớn → chunk song song (output 1 lần gọi có giới hạn token)
+            responses = await self._gemini_generate_from_pdf_chunked(
+                pdf_path,
+                prompt,
+                "gemini-2.0-flash-exp",
+                operation="pdf-ocr",
+                metadata={
+                    "file_name": pdf_path.name,
+                    "language": language,
+                    "ocr_type": "pdf_native"
+                },
+                db=db
+            )
             
-            text = response.text.strip()
+            text = stitch_chunk_texts([response.text for response in responses])
             
             # Calculate usage (safely handle missing usage_metadata)
             total_tokens = 0
             cost = 0.0
-            if hasattr(response, 'usage_metadata') and response.usage_metadata:
-                usage = response.usage_metadata
-                prompt_tokens = getattr(usage, 'prompt_token_count', 0)
-                candidates_tokens = getattr(usage, 'candidates_token_count', 0)
-                total_tokens = prompt_tokens + candidates_tokens
-                cost = (prompt_tokens / 1_000_000 * 0.075) + (candidates_tokens / 1_000_000 * 0.30)
-            
-            # Clean up uploaded file
-            try:
-                genai.delete_file(uploaded_file.name)
-                logger.info(f"🗑️ Cleaned up uploaded file")
-            except:
-                pass
+            for response in responses:
+                if hasattr(response, 'usage_metadata') and response.usage_metadata:
+                    usage = response.usage_metadata
+                    prompt_tokens = getattr(usage, 'prompt_token_count', 0)
+                    candidates_tokens = getattr(usage, 'candidates_token_count', 0)
+                    total_tokens += prompt_tokens + candidates_tokens
+                    cost += (prompt_tokens / 1_000_000 * 0.075) + (candidates_tokens / 1_000_000 * 0.30)
             
             # Get page count
-            from pypdf import PdfReader
-            reader = PdfReader(pdf_path)
-            page_count = len(reader.pages)
+            from app.services.page_workers import count_pages
+            page_count = await asyncio.to_thread(count_pages, pdf_path)
             
             return {
                 "text": text,
@@ -4290,23 +4352,22 @@ Trả về văn bản:"""
             logger.error(f"Gemini PDF OCR failed: {e}")
             raise HTTPException(500, f"Gemini PDF OCR failed: {str(e)}")
             
-    async def _ocr_with_gemini(self, image_path: Path, language: str) -> dict:
-        """OCR image using Gemini API"""
+    async def _ocr_with_gemini(self, image_bytes: bytes, language: str, api_key: Optional[str] = None) -> dict:
+        """OCR image (PNG bytes) using Gemini API"""
         try:
-            import google.generativeai as genai
             from PIL import Image as PILImage
             
             # Get API key
-            from app.services.ai_usage_service import get_api_key
-            api_key = get_api_key("gemini")
+            if not api_key:
+                from app.services.ai_usage_service import get_api_key
+                api_key = await asyncio.to_thread(get_api_key, "gemini")
             if not api_key:
                 raise HTTPException(500, "Gemini API key not configured")
                 
-            genai.configure(api_key=api_key)
-            model = genai.GenerativeModel("gemini-2.5-flash")
+            model = self._get_gemini_client(api_key=api_key).model("gemini-2.5-flash")
             
             # Prepare image
-            image = PILImage.open(image_path)
+            image = PILImage.open(BytesIO(image_bytes))
             
             # OCR prompt
             prompt = f"""Trích xuất TOÀN BỘ văn bản trong ảnh này.
@@ -4319,7 +4380,7 @@ YÊU CẦU:
 Trả về văn bản:"""
             
             # Generate content
-            response = model.generate_content([prompt, image])
+            response = await run_blocking("gemini", model.generate_content, [prompt, image])
             text = response.text.strip()
             
             # Calculate usage (safely handle missing usage_metadata)
@@ -4344,22 +4405,22 @@ Trả về văn bản:"""
             logger.error(f"Gemini OCR failed: {e}")
             raise HTTPException(500, f"Gemini OCR failed: {str(e)}")
             
-    async def _ocr_with_claude(self, image_path: Path, language: str) -> dict:
-        """OCR image using Claude API"""
+    async def _ocr_with_claude(self, image_bytes: bytes, language: str, api_key: Optional[str] = None) -> dict:
+        """OCR image (PNG bytes) using Claude API"""
         try:
             import anthropic
             
             # Get API key
-            from app.services.ai_usage_service import get_api_key
-            api_key = get_api_key("claude")
+            if not api_key:
+                from app.services.ai_usage_service import get_api_key
+                api_key = await asyncio.to_thread(get_api_key, "claude")
             if not api_key:
                 raise HTTPException(500, "Claude API key not configured")
                 
             client = anthropic.Anthropic(api_key=api_key)
             
             # Encode image
-            with open(image_path, "rb") as img_file:
-                image_data = base64.standard_b64encode(img_file.read()).decode("utf-8")
+            image_data = base64.standard_b64encode(image_bytes).decode("utf-8")
                 
             # OCR prompt
             prompt = """Trích xuất TOÀN BỘ văn bản trong ảnh này.
@@ -4371,8 +4432,9 @@ YÊU CẦU:
 
 Trả về văn bản:"""
             
-            # Call Claude API
-            message = client.messages.create(
+            # Call Claude API (sync SDK → thread, các trang khác chạy song song)
+            message = await asyncio.to_thread(
+                client.messages.create,
                 model="claude-sonnet-4-20250514",
                 max_tokens=1024,
                 messages=[{
@@ -4465,10 +4527,16 @@ Trả về văn bản:"""
     
     # ==================== Cleanup ====================
     
+    def new_output_path(self, filename: str) -> Path:
+        """outputs/<uuid>/<filename>: request song song cùng tên file không ghi đè / xóa output của nhau"""
+        return new_output_dir(self.output_dir) / safe_filename(filename)
+    
     async def cleanup_file(self, file_path: Path) -> None:
-        """Delete a file"""
-        if file_path.exists():
-            file_path.unlink()
+        """Delete a file (+ thư mục upload / output riêng của nó)"""
+        if Path(file_path).parent.parent.resolve() == self.output_dir.resolve():
+            remove_output(file_path, self.output_dir)
+        else:
+            remove_upload(file_path, self.upload_dir)
     
     async def cleanup_old_files(self, max_age_hours: int = 24) -> int:
         """Delete files older than max_age_hours"""
@@ -4485,6 +4553,12 @@ Trả về văn bản:"""
                     if file_age > max_age_seconds:
                         file_path.unlink()
                         count += 1
+                elif is_ingest_dir(file_path):
+                    # uploads/documents/<uuid>/<filename>, uploads/outputs/<uuid>/<filename>
+                    dir_age = current_time - file_path.stat().st_mtime
+                    if dir_age > max_age_seconds:
+                        shutil.rmtree(file_path, ignore_errors=True)
+                        count += 1
                         
         return count
 
@@ -4501,7 +4575,7 @@ Trả về văn bản:"""
             raise HTTPException(400, "File must be .pdf")
         
         start_time = time.time()
-        output_file = self.output_dir / f"{input_file.stem}_converted.docx"
+        output_file = self.new_output_path(f"{input_file.stem}_converted.docx")
         
         try:
             # Step 1: Upload PDF to Gemini and generate Markdown
@@ -4531,8 +4605,6 @@ Trả về văn bản:"""
     async def _pdf_to_markdown_gemini(self, pdf_path: Path, language: str) -> dict:
         
         try:
-            import google.generativeai as genai
-            
             # Get API key - with fallback to env
             api_key = None
             try:
@@ -4545,14 +4617,14 @@ Trả về văn bản:"""
             if not api_key:
                 raise HTTPException(500, "Gemini API key not configured")
                 
-            genai.configure(api_key=api_key)
+            gemini_client = self._get_gemini_client(api_key=api_key)
             
             # Upload PDF
             logger.info("Uploading PDF to Gemini...")
-            uploaded_file = genai.upload_file(str(pdf_path))
+            uploaded_file = await run_blocking("gemini", gemini_client.upload_file, str(pdf_path))
             
             # Create model
-            model = genai.GenerativeModel("gemini-2.0-flash-exp")
+            model = gemini_client.model("gemini-2.0-flash-exp")
             
             # Prompt for Markdown generation - SIMPLIFIED
             lang_desc = "Tiếng Việt" if language == "vi" else "English"
@@ -4591,7 +4663,7 @@ Output ONLY the Markdown text, NO explanations.
 
 Markdown:"""
 
-            response = model.generate_content([uploaded_file, prompt])
+            response = await run_blocking("gemini", model.generate_content, [uploaded_file, prompt])
             markdown = response.text.strip()
             
             # Calculate usage (safely handle missing usage_metadata)
@@ -4606,7 +4678,7 @@ Markdown:"""
             
             # Cleanup
             try:
-                genai.delete_file(uploaded_file.name)
+                await run_blocking("gemini", gemini_client.delete_file, uploaded_file.name)
             except:
                 pass
             
@@ -4921,18 +4993,16 @@ Markdown:"""
             if not GEMINI_AVAILABLE:
                 raise HTTPException(400, "Gemini library not installed")
             
-            genai.configure(api_key=api_key)
-            
             # Use specified model or default
             model = model or self.gemini_model_name or DEFAULT_GEMINI_MODEL
-            gemini_model = genai.GenerativeModel(model)
+            gemini_model = get_gemini_client(api_key).model(model)
             
             prompt = self._build_format_prompt(text, language)
             start_time = time.time()
             
             # Configure with longer timeout for complex text processing
-            response = await asyncio.to_thread(
-                gemini_model.generate_content,
+            response = await run_blocking(
+                "gemini", gemini_model.generate_content,
                 prompt,
                 generation_config={
                     "temperature": 0.3,
@@ -0,0 +1,170 @@
+"""
+Gemini Client Pool - Mỗi API key 1 client riêng, không dùng genai.configure() global
+
+Usage:
+    from app.services.gemini_client import get_gemini_client
+
+    client = get_gemini_client(api_key)
+    model = client.model("gemini-2.5-flash")
+    response = model.generate_content(prompt)
+
+    pdf = client.upload_file(pdf_path, mime_type="application/pdf")
+    pdf = client.wait_until_active(pdf)
+    ...
+    client.delete_file(pdf.name)
+
+Tại sao:
+- genai.configure() ghi đè state global của SDK → request đồng thời dùng
+  nhầm key của nhau (load balancing giữa các key vô nghĩa)
+- File upload thuộc về project của key → upload, generate, delete phải
+  dùng CÙNG 1 key
+
+SDK không có API public cho client theo key → dùng _ClientManager / GenerativeModel._client
+(nội bộ). requirements-prod.txt pin đúng SUPPORTED_SDK_VERSION; SDK khác version thiếu các
+API này → GeminiClient báo lỗi rõ ràng thay vì âm thầm dùng nhầm key.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, List, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+# Version đã kiểm tra với các API nội bộ bên dưới (khớp requirements-prod.txt)
+SUPPORTED_SDK_VERSION = "0.8.3"
+
+try:
+    import google.generativeai as genai
+    GEMINI_SDK_AVAILABLE = True
+except ImportError:
+    GEMINI_SDK_AVAILABLE = False
+
+# None = SDK dùng được, ngược lại = lý do không tương thích
+SDK_INCOMPATIBLE_REASON: Optional[str] = None
+if GEMINI_SDK_AVAILABLE:
+    try:
+        from google.generativeai import client as genai_client
+        from google.generativeai import protos
+        from google.generativeai.types import file_types
+
+        if not hasattr(getattr(genai_client, "_ClientManager", None), "get_default_client"):
+            raise ImportError("google.generativeai.client._ClientManager.get_default_client not found")
+    except ImportError as e:
+        SDK_INCOMPATIBLE_REASON = (
+            f"google-generativeai {getattr(genai, '__version__', '?')} is not supported ({e}). "
+            f"Install google-generativeai=={SUPPORTED_SDK_VERSION}"
+        )
+        logger.error(f"❌ Gemini SDK: {SDK_INCOMPATIBLE_REASON}")
+    else:
+        if getattr(genai, "__version__", None) != SUPPORTED_SDK_VERSION:
+            logger.warning(
+                f"⚠️ google-generativeai {getattr(genai, '__version__', '?')} != {SUPPORTED_SDK_VERSION} "
+                "(gemini_client uses SDK internals - verify before upgrading)"
+            )
+
+# Số client giữ lại (mỗi client giữ connection/channel riêng)
+MAX_POOLED_CLIENTS = 32
+
+
+class GeminiClient:
+    """
+    Client Gemini gắn với 1 API key
+
+    Dùng _ClientManager của SDK (cùng cơ chế với genai.configure) nhưng
+    mỗi key 1 instance riêng, nên không ảnh hưởng request khác.
+    """
+
+    def __init__(self, api_key: str):
+        if not GEMINI_SDK_AVAILABLE:
+            raise RuntimeError("google-generativeai not installed. Run: pip install google-generativeai")
+        if SDK_INCOMPATIBLE_REASON:
+            raise RuntimeError(SDK_INCOMPATIBLE_REASON)
+        self._manager = genai_client._ClientManager()
+        self._manager.configure(api_key=api_key)
+
+    def _client(self, name: str):
+        return self._manager.get_default_client(name)
+
+    def model(self, model_name: str, **kwargs) -> "genai.GenerativeModel":
+        """GenerativeModel gắn với key của client này (model name theo từng call)"""
+        model_obj = genai.GenerativeModel(model_name, **kwargs)
+        # GenerativeModel chỉ lấy default client khi _client còn None
+        if not hasattr(model_obj, "_client"):
+            # Không gắn được key → model sẽ dùng client global (key của request khác)
+            raise RuntimeError(
+                f"GenerativeModel._client not found in google-generativeai "
+                f"{getattr(genai, '__version__', '?')}. Install google-generativeai=={SUPPORTED_SDK_VERSION}"
+            )
+        model_obj._client = self._client("generative")
+        return model_obj
+
+    def upload_file(
+        self,
+        path: Union[str, Path],
+        mime_type: Optional[str] = None,
+        display_name: Optional[str] = None,
+    ) -> Any:
+        """Tương đương genai.upload_file() nhưng dùng key của client này"""
+        path = Path(path)
+        if mime_type is None:
+            import mimetypes
+            mime_type, _ = mimetypes.guess_type(path)
+        response = self._client("file").create_file(
+            path=path,
+            mime_type=mime_type,
+            display_name=display_name or path.name
+        )
+        return file_types.File(response)
+
+    def get_file(self, name: str) -> Any:
+        return file_types.File(self._client("file").get_file(name=name))
+
+    def delete_file(self, name: str) -> None:
+        self._client("file").delete_file(request=protos.DeleteFileRequest(name=name))
+
+    def wait_until_active(self, uploaded_file: Any, poll_seconds: float = 1.0) -> Any:
+        """Chờ Gemini xử lý xong file (state PROCESSING → ACTIVE)"""
+        while uploaded_file.state.name == "PROCESSING":
+            time.sleep(poll_seconds)
+            uploaded_file = self.get_file(uploaded_file.name)
+        if uploaded_file.state.name == "FAILED":
+            raise ValueError(f"Gemini file processing failed: {uploaded_file.name}")
+        return uploaded_file
+
+    def list_models(self) -> List[Any]:
+        return list(self._client("model").list_models())
+
+
+class GeminiClientPool:
+    """LRU pool: api_key → GeminiClient (tái sử dụng connection giữa các request)"""
+
+    def __init__(self, max_size: int = MAX_POOLED_CLIENTS):
+        self.max_size = max_size
+        self._clients: "OrderedDict[str, GeminiClient]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, api_key: str) -> GeminiClient:
+        with self._lock:
+            client = self._clients.get(api_key)
+            if client is not None:
+                self._clients.move_to_end(api_key)
+                return client
+
+            client = GeminiClient(api_key)
+            self._clients[api_key] = client
+            if len(self._clients) > self.max_size:
+                self._clients.popitem(last=False)
+            return client
+
+
+_client_pool: Optional[GeminiClientPool] = None
+
+
+def get_gemini_client(api_key: str) -> GeminiClient:
+    """Get pooled Gemini client for 1 API key"""
+    global _client_pool
+    if _client_pool is None:
+        _client_pool = GeminiClientPool()
+    return _client_pool.get(api_key)
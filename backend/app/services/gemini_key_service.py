@@ -4,6 +4,9 @@ Core logic: Key selection, rotation, quota tracking, encryption
 """
 import os
 import logging
+import threading
+import time
+from dataclasses import dataclass
 from typing import Optional, List, Tuple
 from datetime import datetime, timedelta
 from sqlalchemy.orm import Session
@@ -11,6 +14,7 @@ from sqlalchemy import func, desc, and_, or_
 from cryptography.fernet import Fernet
 import base64
 
+from app.core.config import settings
 from app.models.gemini_keys import (
     GeminiAPIKey, 
     GeminiKeyQuota, 
@@ -28,6 +32,135 @@ from app.schemas.gemini_keys import (
 
 logger = logging.getLogger(__name__)
 
+# Tối thiểu 10k tokens mới được chọn
+SELECTION_THRESHOLD = 10_000
+
+
+@dataclass
+class _PooledKey:
+    """Snapshot của 1 key ACTIVE + monthly quota (đã giải mã)"""
+    id: int
+    key_name: str
+    api_key_decrypted: str
+    priority: int
+    quota_remaining: int
+    reset_at: Optional[datetime]
+    last_used_at: Optional[datetime]
+
+    def to_selected(self) -> SelectedKeyInfo:
+        return SelectedKeyInfo(
+            id=self.id,
+            key_name=self.key_name,
+            api_key_decrypted=self.api_key_decrypted,
+            priority=self.priority,
+            quota_remaining=self.quota_remaining
+        )
+
+
+class GeminiKeyPool:
+    """
+    Cache trong RAM các key ACTIVE (đã giải mã) + quota snapshot
+
+    - Refresh bằng 1 query khi hết TTL hoặc sau invalidate()
+    - select() chạy hoàn toàn trong RAM (không query DB, không decrypt)
+    - record_usage() trừ quota trong snapshot để cân bằng tải giữa các lần refresh
+    - Mỗi process có pool riêng → TTL giới hạn độ trễ giữa các worker
+    """
+
+    def __init__(self, ttl_seconds: int):
+        self.ttl_seconds = ttl_seconds
+        self._keys: List[_PooledKey] = []
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+
+    def invalidate(self) -> None:
+        """Buộc refresh ở lần select tiếp theo (gọi khi key được tạo/sửa/xóa/rotate)"""
+        with self._lock:
+            self._expires_at = 0.0
+
+    def _refresh(self, key_service: "GeminiKeyService") -> None:
+        rows = (
+            key_service.db.query(GeminiAPIKey, GeminiKeyQuota)
+            .join(GeminiKeyQuota, GeminiAPIKey.id == GeminiKeyQuota.key_id)
+            .filter(
+                and_(
+                    GeminiAPIKey.status == KeyStatus.ACTIVE,
+                    GeminiKeyQuota.quota_type == QuotaType.MONTHLY
+                )
+            )
+            .all()
+        )
+
+        keys = []
+        for db_key, quota in rows:
+            try:
+                api_key = key_service.decrypt_api_key(db_key.api_key_encrypted)
+            except ValueError:
+                logger.error(f"Skipping key {db_key.key_name}: cannot decrypt")
+                continue
+            keys.append(_PooledKey(
+                id=db_key.id,
+                key_name=db_key.key_name,
+                api_key_decrypted=api_key,
+                priority=db_key.priority,
+                quota_remaining=quota.quota_remaining,
+                reset_at=quota.reset_at,
+                last_used_at=db_key.last_used_at
+            ))
+
+        self._keys = keys
+        self._expires_at = time.monotonic() + self.ttl_seconds
+        logger.info(f"🔑 Gemini key pool refreshed: {len(keys)} active keys")
+
+    def select(self, key_service: "GeminiKeyService") -> Optional[SelectedKeyInfo]:
+        """
+        Chọn key tốt nhất (cùng tiêu chí với query cũ):
+        priority ASC → quota_remaining DESC → last_used_at ASC (NULL trước)
+        """
+        with self._lock:
+            if time.monotonic() >= self._expires_at:
+                self._refresh(key_service)
+
+            candidates = [k for k in self._keys if k.quota_remaining > SELECTION_THRESHOLD]
+            if candidates:
+                best = min(candidates, key=lambda k: (
+                    k.priority,
+                    -k.quota_remaining,
+                    k.last_used_at or datetime.min
+                ))
+            else:
+                logger.warning("⚠️ NO AVAILABLE KEYS! All keys exhausted or inactive")
+
+                # Fallback: Tìm key sắp reset (trong 1 giờ tới)
+                reset_deadline = datetime.utcnow() + timedelta(hours=1)
+                resetting = [k for k in self._keys if k.reset_at and k.reset_at < reset_deadline]
+                if not resetting:
+                    return None
+                best = min(resetting, key=lambda k: k.priority)
+
+            # Cân bằng tải: key vừa chọn xuống cuối hàng trong cùng priority
+            best.last_used_at = datetime.utcnow()
+            return best.to_selected()
+
+    def record_usage(self, key_id: int, tokens: int) -> None:
+        """Trừ quota trong snapshot (DB được update bởi log buffer)"""
+        with self._lock:
+            for key in self._keys:
+                if key.id == key_id:
+                    key.quota_remaining -= tokens
+                    break
+
+
+_key_pool: Optional[GeminiKeyPool] = None
+
+
+def get_gemini_key_pool() -> GeminiKeyPool:
+    """Get process-wide Gemini key pool"""
+    global _key_pool
+    if _key_pool is None:
+        _key_pool = GeminiKeyPool(ttl_seconds=settings.GEMINI_KEY_POOL_TTL_SECONDS)
+    return _key_pool
+
 
 class GeminiKeyService:
     """
@@ -149,6 +282,7 @@ class GeminiKeyService:
         
         self.db.commit()
         self.db.refresh(db_key)
+        get_gemini_key_pool().invalidate()
         
         logger.info(f"✅ Created new Gemini key: {key_data.key_name} (ID: {db_key.id})")
         return db_key
@@ -173,6 +307,7 @@ class GeminiKeyService:
         old_status = db_key.status
         db_key.status = new_status
         self.db.commit()
+        get_gemini_key_pool().invalidate()
         
         logger.info(f"Updated key {db_key.key_name}: {old_status} → {new_status}")
         return db_key
@@ -185,6 +320,7 @@ class GeminiKeyService:
         
         self.db.delete(db_key)
         self.db.commit()
+        get_gemini_key_pool().invalidate()
         
         logger.info(f"🗑️ Deleted key: {db_key.key_name}")
         return True
@@ -200,68 +336,13 @@ class GeminiKeyService:
         3. priority ASC (key có priority thấp = ưu tiên cao)
         4. quota_remaining DESC (key còn nhiều quota nhất)
         5. last_used_at ASC (cân bằng tải)
-        """
-        THRESHOLD = 10_000  # Tối thiểu 10k tokens
         
-        # Query với join quota table
-        result = (
-            self.db.query(
-                GeminiAPIKey,
-                GeminiKeyQuota.quota_remaining
-            )
-            .join(GeminiKeyQuota, GeminiAPIKey.id == GeminiKeyQuota.key_id)
-            .filter(
-                and_(
-                    GeminiAPIKey.status == KeyStatus.ACTIVE,
-                    GeminiKeyQuota.quota_type == QuotaType.MONTHLY,
-                    GeminiKeyQuota.quota_remaining > THRESHOLD
-                )
-            )
-            .order_by(
-                GeminiAPIKey.priority.asc(),
-                GeminiKeyQuota.quota_remaining.desc(),
-                GeminiAPIKey.last_used_at.asc().nulls_first()
-            )
-            .first()
-        )
-        
-        if not result:
-            logger.warning("⚠️ NO AVAILABLE KEYS! All keys exhausted or inactive")
-            
-            # Fallback: Tìm key sắp reset (trong 1 giờ tới)
-            fallback = (
-                self.db.query(GeminiAPIKey, GeminiKeyQuota)
-                .join(GeminiKeyQuota)
-                .filter(
-                    and_(
-                        GeminiAPIKey.status == KeyStatus.ACTIVE,
-                        GeminiKeyQuota.quota_type == QuotaType.MONTHLY,
-                        GeminiKeyQuota.reset_at < datetime.utcnow() + timedelta(hours=1)
-                    )
-                )
-                .order_by(GeminiAPIKey.priority.asc())
-                .first()
-            )
-            
-            if not fallback:
-                return None
-            
-            result = fallback
-        
-        db_key, quota_remaining = result
-        
-        # Decrypt key
-        api_key_decrypted = self.decrypt_api_key(db_key.api_key_encrypted)
-        
-        logger.info(f"✅ Selected key: {db_key.key_name} (quota remaining: {quota_remaining:,})")
-        
-        return SelectedKeyInfo(
-            id=db_key.id,
-            key_name=db_key.key_name,
-            api_key_decrypted=api_key_decrypted,
-            priority=db_key.priority,
-            quota_remaining=quota_remaining
-        )
+        Dùng GeminiKeyPool (cache trong RAM, refresh theo TTL)
+        """
+        selected = get_gemini_key_pool().select(self)
+        if selected:
+            logger.info(f"✅ Selected key: {selected.key_name} (quota remaining: {selected.quota_remaining:,})")
+        return selected
     
     # ========== AUTO ROTATION ==========
     
@@ -312,64 +393,20 @@ class GeminiKeyService:
     
     # ========== QUOTA TRACKING ==========
     
-    def track_usage(self, usage_data: UsageLogCreate) -> GeminiKeyUsageLog:
+    def track_usage(self, usage_data: UsageLogCreate) -> None:
         """
-        Track usage sau mỗi API call
+        Track usage sau mỗi API call (write-behind qua log buffer)
         1. Insert usage log
-        2. Update quota (monthly & daily)
-        3. Check threshold → Auto-rotate if needed
+        2. Update quota (monthly & daily) - cộng dồn, UPDATE atomic khi flush
+        3. Check threshold → Auto-rotate if needed (khi flush)
         """
-        # Insert log
-        usage_log = GeminiKeyUsageLog(**usage_data.model_dump())
-        self.db.add(usage_log)
-        
-        # Update monthly quota
-        monthly_quota = (
-            self.db.query(GeminiKeyQuota)
-            .filter(
-                and_(
-                    GeminiKeyQuota.key_id == usage_data.key_id,
-                    GeminiKeyQuota.quota_type == QuotaType.MONTHLY
-                )
-            )
-            .first()
-        )
-        
-        if monthly_quota:
-            monthly_quota.quota_used += usage_data.total_tokens
-            monthly_quota.quota_remaining = monthly_quota.quota_limit - monthly_quota.quota_used
-            monthly_quota.last_updated = datetime.utcnow()
-            
-            # Check threshold (< 5% → rotate)
-            if monthly_quota.quota_remaining < monthly_quota.quota_limit * 0.05:
-                logger.warning(f"⚠️ Key {usage_data.key_id} gần hết quota: {monthly_quota.quota_remaining:,} tokens")
-                self.rotate_key(usage_data.key_id, "quota_exceeded")
-        
-        # Update daily quota
-        daily_quota = (
-            self.db.query(GeminiKeyQuota)
-            .filter(
-                and_(
-                    GeminiKeyQuota.key_id == usage_data.key_id,
-                    GeminiKeyQuota.quota_type == QuotaType.DAILY
-                )
-            )
-            .first()
-        )
-        
-        if daily_quota:
-            daily_quota.quota_used += usage_data.total_tokens
-            daily_quota.quota_remaining = daily_quota.quota_limit - daily_quota.quota_used
-            daily_quota.last_updated = datetime.utcnow()
-        
-        # Update last_used_at
-        db_key = self.get_key_by_id(usage_data.key_id)
-        if db_key:
-            db_key.last_used_at = datetime.utcnow()
-        
-        self.db.commit()
+        from app.services.log_buffer import get_log_buffer
         
-        return usage_log
+        log_buffer = get_log_buffer()
+        log_buffer.add(GeminiKeyUsageLog, usage_data.model_dump(), db=self.db)
+        if usage_data.total_tokens:
+            log_buffer.add_gemini_quota(usage_data.key_id, usage_data.total_tokens, db=self.db)
+        get_gemini_key_pool().record_usage(usage_data.key_id, usage_data.total_tokens)
     
     # ========== QUOTA RESET (Cronjob) ==========
     
@@ -404,6 +441,7 @@ class GeminiKeyService:
             reset_count += 1
         
         self.db.commit()
+        get_gemini_key_pool().invalidate()
         logger.info(f"🔄 Reset {reset_count} monthly quotas")
         
         return reset_count
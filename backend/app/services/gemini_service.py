@@ -12,12 +12,14 @@ import google.generativeai as genai
 from sqlalchemy.orm import Session
 from typing import Optional, Dict, Any, List
 import time
-from datetime import datetime
 from pathlib import Path
 
 from app.core.config import settings
-from app.services.gemini_key_service import GeminiKeyService
-from app.models.gemini_keys import GeminiKeyUsageLog, UsageStatus, GeminiKeyQuota, QuotaType
+from app.services.gemini_key_service import GeminiKeyService, get_gemini_key_pool
+from app.services.gemini_client import get_gemini_client
+from app.services.provider_executor import run_blocking
+from app.services.log_buffer import get_log_buffer
+from app.models.gemini_keys import GeminiKeyUsageLog, UsageStatus
 from app.core.pricing import GEMINI_MODELS
 from app.schemas.gemini_keys import UsageLogCreate, UsageStatusEnum
 
@@ -57,8 +59,9 @@ class GeminiService:
         api_key = selected_key.api_key_decrypted
         self.current_key_id = selected_key.id
         
-        # Configure Gemini
-        genai.configure(api_key=api_key)
+        # Client riêng cho key này (KHÔNG dùng genai.configure global -
+        # request đồng thời có thể dùng key khác nhau)
+        self.client = get_gemini_client(api_key)
     
     def _log_gemini_usage(
         self,
@@ -71,7 +74,14 @@ class GeminiService:
         error_message: str = None,
         metadata: Dict[str, Any] = None
     ):
-        """Log usage vào gemini_key_usage_log table"""
+        """
+        Log usage vào gemini_key_usage_log table (write-behind qua log buffer)
+
+        Quota (monthly + daily) được cộng dồn và UPDATE atomic khi flush.
+        """
+        if not self.current_key_id:
+            return
+        
         try:
             # Calculate cost
             model_info = GEMINI_MODELS.get(model, {})
@@ -80,42 +90,29 @@ class GeminiService:
             input_cost = (input_tokens / 1_000_000) * pricing.get("input", 0)
             output_cost = (output_tokens / 1_000_000) * pricing.get("output", 0)
             total_cost = input_cost + output_cost
-            
-            # Create log
-            usage_log = GeminiKeyUsageLog(
-                key_id=self.current_key_id,
-                user_id=self.user_id,
-                model=model,
-                prompt_tokens=input_tokens,
-                completion_tokens=output_tokens,
-                total_tokens=input_tokens + output_tokens,
-                cost_usd=total_cost,
-                request_type=operation,
-                status=UsageStatus.SUCCESS if status == "success" else UsageStatus.FAILED,
-                error_message=error_message,
-                response_time_ms=int(processing_time * 1000) if processing_time else None
-            )
-            
-            self.db.add(usage_log)
+            total_tokens = input_tokens + output_tokens
+            
+            log_buffer = get_log_buffer()
+            log_buffer.add(GeminiKeyUsageLog, {
+                "key_id": self.current_key_id,
+                "user_id": self.user_id,
+                "model": model,
+                "prompt_tokens": input_tokens,
+                "completion_tokens": output_tokens,
+                "total_tokens": total_tokens,
+                "cost_usd": total_cost,
+                "request_type": operation,
+                "status": UsageStatus.SUCCESS if status == "success" else UsageStatus.FAILED,
+                "error_message": error_message,
+                "response_time_ms": int(processing_time * 1000) if processing_time else None
+            }, db=self.db)
             
             # Update key's usage count
-            if self.current_key_id:
-                from app.models.gemini_keys import GeminiKeyQuota, QuotaType
-                
-                # Update monthly quota
-                monthly_quota = self.db.query(GeminiKeyQuota).filter(
-                    GeminiKeyQuota.key_id == self.current_key_id,
-                    GeminiKeyQuota.quota_type == QuotaType.MONTHLY
-                ).first()
-                
-                if monthly_quota:
-                    monthly_quota.quota_used += input_tokens + output_tokens
-                    monthly_quota.last_updated = datetime.utcnow()
-            
-            self.db.commit()
+            if total_tokens:
+                log_buffer.add_gemini_quota(self.current_key_id, total_tokens, db=self.db)
+                get_gemini_key_pool().record_usage(self.current_key_id, total_tokens)
             
         except Exception as e:
-            self.db.rollback()
             print(f"Error logging Gemini usage: {e}")
     
     def generate_content(
@@ -148,7 +145,7 @@ class GeminiService:
         
         try:
             # Create model
-            model_obj = genai.GenerativeModel(model)
+            model_obj = self.client.model(model)
             
             # Generate content
             response = model_obj.generate_content(prompt, **kwargs)
@@ -222,7 +219,7 @@ class GeminiService:
         
         try:
             # Create model
-            model_obj = genai.GenerativeModel(model)
+            model_obj = self.client.model(model)
             
             # Generate content with streaming
             response_stream = model_obj.generate_content(prompt, stream=True, **kwargs)
@@ -275,7 +272,7 @@ class GeminiService:
         Returns:
             Token count
         """
-        model_obj = genai.GenerativeModel(model)
+        model_obj = self.client.model(model)
         return model_obj.count_tokens(text).total_tokens
     
     def list_models(self) -> List[str]:
@@ -285,7 +282,7 @@ class GeminiService:
         Returns:
             List of model names
         """
-        models = genai.list_models()
+        models = self.client.list_models()
         return [m.name for m in models if 'generateContent' in m.supported_generation_methods]
     
     def generate_content_with_pdf(
@@ -328,8 +325,8 @@ class GeminiService:
             
             # Check if upload_file is available (newer versions)
             if hasattr(genai, 'upload_file'):
-                print("📤 Using genai.upload_file() method (recommended)", flush=True)
-                uploaded_file = genai.upload_file(pdf_path, mime_type="application/pdf")
+                print("📤 Using File API upload (recommended)", flush=True)
+                uploaded_file = self.client.upload_file(pdf_path, mime_type="application/pdf")
                 print(f"✅ File uploaded to Gemini: {uploaded_file.name}", flush=True)
                 
                 # Wait for processing
@@ -337,13 +334,13 @@ class GeminiService:
                 while uploaded_file.state.name == "PROCESSING":
                     print("⏳ Waiting for Gemini to process PDF...", flush=True)
                     time_module.sleep(1)
-                    uploaded_file = genai.get_file(uploaded_file.name)
+                    uploaded_file = self.client.get_file(uploaded_file.name)
                 
                 if uploaded_file.state.name == "FAILED":
                     raise ValueError(f"PDF upload failed: {uploaded_file.state}")
                 
                 # Create model
-                model_obj = genai.GenerativeModel(model)
+                model_obj = self.client.model(model)
                 print(f"🤖 Model created: {model}", flush=True)
                 
                 # Generate content with PDF
@@ -363,7 +360,7 @@ class GeminiService:
                 print(f"📄 PDF encoded: {len(pdf_base64)} characters", flush=True)
                 
                 # Create content with inline data
-                model_obj = genai.GenerativeModel(model)
+                model_obj = self.client.model(model)
                 print(f"🤖 Model created: {model}", flush=True)
                 
                 print(f"💬 Sending prompt + PDF (base64) to Gemini...", flush=True)
@@ -450,9 +447,9 @@ class GeminiService:
             raise
         finally:
             # Cleanup uploaded file (only if using upload_file method)
-            if uploaded_file and hasattr(genai, 'delete_file'):
+            if uploaded_file:
                 try:
-                    genai.delete_file(uploaded_file.name)
+                    self.client.delete_file(uploaded_file.name)
                     print(f"🗑️ Cleaned up uploaded file: {uploaded_file.name}", flush=True)
                 except Exception as cleanup_error:
                     print(f"⚠️ Cleanup warning: {cleanup_error}", flush=True)
@@ -481,7 +478,6 @@ class GeminiService:
         Returns:
             GenerateContentResponse
         """
-        import google.generativeai as genai
         from PIL import Image
         import io
         import base64
@@ -496,7 +492,7 @@ class GeminiService:
             image = Image.open(io.BytesIO(img_bytes))
             
             # Create model (must support vision)
-            model_obj = genai.GenerativeModel(model)
+            model_obj = self.client.model(model)
             
             # Generate content with image
             response = model_obj.generate_content([prompt, image], **kwargs)
@@ -540,6 +536,30 @@ class GeminiService:
             # Re-raise exception
             raise
     
+    # ========== ASYNC FACADE (dùng trong async def - không block event loop) ==========
+    
+    async def agenerate_content(self, *args, timeout: Any = None, **kwargs) -> Any:
+        """
+        Async generate_content: chạy trên thread pool "gemini" với timeout
+        
+        Args:
+            timeout: Giây, None = GEMINI_CALL_TIMEOUT_SECONDS
+        """
+        return await self._run_async(self.generate_content, args, kwargs, timeout)
+    
+    async def agenerate_content_with_pdf(self, *args, timeout: Any = None, **kwargs) -> Any:
+        """Async generate_content_with_pdf (upload + chờ xử lý + generate trên 1 thread)"""
+        return await self._run_async(self.generate_content_with_pdf, args, kwargs, timeout)
+    
+    async def agenerate_content_with_image(self, *args, timeout: Any = None, **kwargs) -> Any:
+        """Async generate_content_with_image"""
+        return await self._run_async(self.generate_content_with_image, args, kwargs, timeout)
+    
+    async def _run_async(self, func, args, kwargs, timeout) -> Any:
+        if timeout is None:
+            return await run_blocking("gemini", func, *args, **kwargs)
+        return await run_blocking("gemini", func, *args, timeout=timeout, **kwargs)
+    
     def _calculate_cost(self, model: str, input_tokens: int, output_tokens: int) -> float:
         """
         Tính cost dựa trên pricing của Gemini models
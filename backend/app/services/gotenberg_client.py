@@ -0,0 +1,216 @@
+"""
+Gotenberg Client - Office → PDF qua nhiều instance Gotenberg (failover + stream)
+
+Usage:
+    from app.services.gotenberg_client import get_gotenberg_pool
+
+    await get_gotenberg_pool().convert_office(input_file, output_path, mime_type, timeout=60.0)
+    # httpx.ConnectError → không instance nào khả dụng (caller fallback LibreOffice local)
+
+Cấu hình:
+- GOTENBERG_URLS="http://gotenberg-1:3000,http://gotenberg-2:3000"
+  (trống → GOTENBERG_URL, 1 instance như trước)
+
+Tại sao:
+- Đọc cả file vào RAM rồi POST, response.content giữ cả PDF trong RAM
+  → batch N file lớn song song = N x (input + output) trong RAM
+- Upload: file object được httpx đọc theo chunk; download: ghi từng chunk ra đĩa
+- Connection pool dùng chung (http_clients.py) thay vì client mới mỗi lần convert
+
+Health (passive, không cần thread probe):
+- Lỗi kết nối / 502-504 → thử instance khác ngay trong request đó
+- GOTENBERG_FAILURE_THRESHOLD lỗi liên tiếp → tạm loại instance
+  GOTENBERG_COOLDOWN_SECONDS; hết cooldown → request kế tiếp thử lại (half-open)
+- Tất cả instance đang cooldown → httpx.ConnectError ngay (fallback không phải chờ)
+- Lỗi convert (file hỏng → 4xx/500) KHÔNG failover: instance khác cũng sẽ lỗi
+"""
+import itertools
+import logging
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import aiofiles
+import httpx
+from fastapi import HTTPException
+
+from app.core.config import settings
+from app.services.http_clients import get_http_client
+
+logger = logging.getLogger(__name__)
+
+# Instance chết / đang restart / quá tải sau proxy
+FAILOVER_ERRORS = (
+    httpx.ConnectError,
+    httpx.ConnectTimeout,
+    httpx.RemoteProtocolError,
+    httpx.ReadError,
+    httpx.WriteError,
+)
+FAILOVER_STATUS_CODES = {502, 503, 504}
+
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+
+class _InstanceUnavailable(Exception):
+    pass
+
+
+@dataclass
+class GotenbergInstance:
+    url: str
+    consecutive_failures: int = 0
+    down_until: float = 0.0
+    in_flight: int = 0
+
+    def is_healthy(self, now: float) -> bool:
+        return self.down_until <= now
+
+
+class GotenbergPool:
+    """Chọn instance khỏe, ít request đang chạy nhất (bằng nhau → xoay vòng)"""
+
+    def __init__(self, urls: List[str], failure_threshold: int, cooldown_seconds: float):
+        if not urls:
+            raise ValueError("Cần ít nhất 1 Gotenberg URL")
+        self.instances = [GotenbergInstance(url.rstrip("/")) for url in urls]
+        self.failure_threshold = max(1, failure_threshold)
+        self.cooldown_seconds = cooldown_seconds
+        self._round_robin = itertools.count()
+
+    def status(self) -> List[Dict]:
+        now = time.monotonic()
+        return [
+            {
+                "url": instance.url,
+                "healthy": instance.is_healthy(now),
+                "in_flight": instance.in_flight,
+                "consecutive_failures": instance.consecutive_failures,
+            }
+            for instance in self.instances
+        ]
+
+    def _pick(self, tried: Dict[str, int]) -> Optional[GotenbergInstance]:
+        now = time.monotonic()
+        candidates = [instance for instance in self.instances if instance.is_healthy(now)]
+        if not candidates:
+            # Tất cả đang cooldown → caller fallback ngay, không chờ connect timeout
+            return None
+
+        offset = next(self._round_robin) % len(candidates)
+        rotated = candidates[offset:] + candidates[:offset]
+        return min(rotated, key=lambda i: (tried.get(i.url, 0), i.in_flight))
+
+    def _mark_failure(self, instance: GotenbergInstance, error: Exception) -> None:
+        instance.consecutive_failures += 1
+        if instance.consecutive_failures >= self.failure_threshold:
+            instance.down_until = time.monotonic() + self.cooldown_seconds
+            logger.warning(
+                f"⚠️ Gotenberg {instance.url} down for {self.cooldown_seconds:.0f}s "
+                f"({instance.consecutive_failures} failures, last: {error!r})"
+            )
+        else:
+            logger.warning(f"⚠️ Gotenberg {instance.url} failed: {error!r}")
+
+    def _mark_success(self, instance: GotenbergInstance) -> None:
+        if instance.consecutive_failures >= self.failure_threshold:
+            logger.info(f"✅ Gotenberg {instance.url} recovered")
+        instance.consecutive_failures = 0
+        instance.down_until = 0.0
+
+    async def convert_office(
+        self,
+        input_file: Path,
+        output_path: Path,
+        mime_type: str,
+        timeout: float = 60.0
+    ) -> Path:
+        """
+        POST /forms/libreoffice/convert, stream PDF ra output_path
+
+        Raises:
+            httpx.ConnectError: Không instance nào khả dụng
+            HTTPException: Gotenberg trả lỗi convert
+        """
+        tried: Dict[str, int] = {}
+        last_error: Optional[Exception] = None
+        # Tối thiểu 2 lần: 1 instance + connection keep-alive vừa bị server đóng
+        for _ in range(max(2, len(self.instances))):
+            instance = self._pick(tried)
+            if instance is None:
+                break
+            tried[instance.url] = tried.get(instance.url, 0) + 1
+
+            instance.in_flight += 1
+            try:
+                await self._convert_on(instance, input_file, output_path, mime_type, timeout)
+            except (_InstanceUnavailable, *FAILOVER_ERRORS) as e:
+                self._mark_failure(instance, e)
+                last_error = e
+                continue
+            except BaseException:
+                output_path.unlink(missing_ok=True)
+                raise
+            finally:
+                instance.in_flight -= 1
+
+            self._mark_success(instance)
+            return output_path
+
+        output_path.unlink(missing_ok=True)
+        reason = f"last error: {last_error!r}" if last_error else "all instances cooling down"
+        raise httpx.ConnectError(f"No Gotenberg instance available ({reason})")
+
+    async def _convert_on(
+        self,
+        instance: GotenbergInstance,
+        input_file: Path,
+        output_path: Path,
+        mime_type: str,
+        timeout: float
+    ) -> None:
+        client = get_http_client("gotenberg")
+        # File object → httpx đọc theo chunk khi gửi (không đọc cả file vào RAM)
+        with open(input_file, "rb") as f:
+            async with client.stream(
+                "POST",
+                f"{instance.url}/forms/libreoffice/convert",
+                files={"files": (input_file.name, f, mime_type)},
+                timeout=httpx.Timeout(timeout, connect=settings.HTTP_CONNECT_TIMEOUT_SECONDS),
+            ) as response:
+                if response.status_code in FAILOVER_STATUS_CODES:
+                    raise _InstanceUnavailable(f"HTTP {response.status_code}")
+                if response.status_code != 200:
+                    detail = (await response.aread()).decode("utf-8", errors="replace")[:500]
+                    raise HTTPException(
+                        500,
+                        f"Gotenberg conversion failed: {response.status_code} - {detail}"
+                    )
+
+                async with aiofiles.open(output_path, "wb") as out:
+                    async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                        await out.write(chunk)
+
+
+def gotenberg_urls() -> List[str]:
+    """GOTENBERG_URLS (phân tách bằng dấu phẩy), trống → [GOTENBERG_URL]"""
+    urls = [url.strip() for url in settings.GOTENBERG_URLS.split(",") if url.strip()]
+    return urls or [settings.GOTENBERG_URL]
+
+
+_gotenberg_pools: Dict[tuple, GotenbergPool] = {}
+
+
+def get_gotenberg_pool(urls: Optional[List[str]] = None) -> GotenbergPool:
+    """Get process-wide Gotenberg pool (mặc định theo settings, health dùng chung)"""
+    key = tuple(urls or gotenberg_urls())
+    pool = _gotenberg_pools.get(key)
+    if pool is None:
+        pool = _gotenberg_pools[key] = GotenbergPool(
+            list(key),
+            failure_threshold=settings.GOTENBERG_FAILURE_THRESHOLD,
+            cooldown_seconds=settings.GOTENBERG_COOLDOWN_SECONDS,
+        )
+        logger.info(f"📄 Gotenberg pool: {', '.join(instance.url for instance in pool.instances)}")
+    return pool
@@ -0,0 +1,108 @@
+"""
+HTTP Clients - httpx.AsyncClient dùng chung theo upstream (connection pool + keep-alive)
+
+Usage:
+    from app.services.http_clients import get_http_client
+
+    client = get_http_client("providers")
+    response = await client.get(url, timeout=10.0)
+
+    # Shutdown (main_simple.py)
+    await close_http_clients()
+
+    # Code sync (thread pool / job worker) cần chạy coroutine
+    result = run_on_thread_loop(service.compress_pdf, input_path)
+
+Tại sao:
+- `async with httpx.AsyncClient()` mỗi lần gọi → TCP (+ TLS) handshake mới,
+  connection bị đóng ngay sau response
+- Client dùng chung: connection được giữ lại (keep-alive) và tái sử dụng,
+  số connection tới mỗi upstream có giới hạn (không dồn ứ khi batch lớn)
+
+Event loop:
+- Connection của httpx gắn với event loop tạo ra nó → mỗi loop có bộ client riêng
+- asyncio.run() mỗi item / job tạo loop mới → client của loop cũ không bao giờ
+  được đóng (rò connection) và không tái sử dụng được keep-alive
+  → run_on_thread_loop(): mỗi thread 1 loop sống lâu, client tạo 1 lần / thread
+"""
+import asyncio
+import logging
+import threading
+import weakref
+from typing import Any, Awaitable, Callable, Dict
+
+import httpx
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def _upstream_limits() -> Dict[str, httpx.Limits]:
+    return {
+        # Gotenberg: nhiều instance (gotenberg_client.py), giới hạn tổng connection
+        "gotenberg": httpx.Limits(
+            max_connections=settings.GOTENBERG_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.GOTENBERG_MAX_CONNECTIONS,
+            keepalive_expiry=settings.HTTP_KEEPALIVE_SECONDS,
+        ),
+        # Anthropic / Adobe IMS / Google: ít request, chủ yếu tiết kiệm TLS handshake
+        "providers": httpx.Limits(
+            max_connections=settings.HTTP_PROVIDER_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.HTTP_PROVIDER_MAX_CONNECTIONS,
+            keepalive_expiry=settings.HTTP_KEEPALIVE_SECONDS,
+        ),
+    }
+
+
+# event loop → {upstream: client}
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, httpx.AsyncClient]]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def get_http_client(upstream: str) -> httpx.AsyncClient:
+    """
+    Client dùng chung của upstream cho event loop hiện tại
+
+    Timeout mặc định: connect HTTP_CONNECT_TIMEOUT_SECONDS, còn lại 60s
+    → truyền timeout= theo từng request nếu cần khác.
+    """
+    limits = _upstream_limits()
+    if upstream not in limits:
+        raise ValueError(f"Unknown upstream: {upstream} (có: {', '.join(limits)})")
+
+    loop = asyncio.get_running_loop()
+    clients = _clients.setdefault(loop, {})
+    client = clients.get(upstream)
+    if client is None or client.is_closed:
+        client = clients[upstream] = httpx.AsyncClient(
+            limits=limits[upstream],
+            timeout=httpx.Timeout(60.0, connect=settings.HTTP_CONNECT_TIMEOUT_SECONDS),
+        )
+        logger.info(f"🌐 HTTP client '{upstream}' created (max {limits[upstream].max_connections} connections)")
+    return client
+
+
+async def close_http_clients() -> None:
+    """Đóng mọi client của event loop hiện tại (gọi khi shutdown)"""
+    clients = _clients.pop(asyncio.get_running_loop(), {})
+    for client in clients.values():
+        await client.aclose()
+
+
+_thread_state = threading.local()
+
+
+def run_on_thread_loop(func: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+    """
+    Chạy coroutine function trên event loop sống lâu của thread hiện tại (blocking)
+
+    Dùng thay asyncio.run() trong thread pool / job worker: loop (và HTTP client
+    của nó) được giữ lại cho lần gọi sau trên cùng thread. Số loop = số thread.
+    """
+    loop = getattr(_thread_state, "loop", None)
+    if loop is None or loop.is_closed():
+        loop = _thread_state.loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    return loop.run_until_complete(func(*args, **kwargs))
@@ -10,7 +10,8 @@ from PIL import Image, ImageEnhance, ImageFilter
 import pillow_heif
 # from rembg import remove  # DISABLED: Requires PyTorch (900MB)
 from fastapi import UploadFile, HTTPException
-import aiofiles
+
+from app.services.upload_ingest import ingest_upload, new_output_dir, remove_output, remove_upload
 
 
 # Register HEIF opener (for iPhone photos)
@@ -33,14 +34,9 @@ class ImageService:
         }
     
     async def save_upload_file(self, upload_file: UploadFile) -> Path:
-        """Save uploaded image file"""
-        file_path = self.upload_dir / upload_file.filename
-        
-        async with aiofiles.open(file_path, 'wb') as out_file:
-            content = await upload_file.read()
-            await out_file.write(content)
-            
-        return file_path
+        """Save uploaded image file (streamed, unique path per upload)"""
+        upload = await ingest_upload(upload_file, self.upload_dir)
+        return upload.path
     
     def _load_image(self, input_path: Path) -> Image.Image:
         """Load image with format auto-detection"""
@@ -103,7 +99,7 @@ class ImageService:
         img_resized = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
         
         # Save
-        output_path = self.output_dir / f"{input_path.stem}_resized.{output_format}"
+        output_path = self._output_path(f"{input_path.stem}_resized.{output_format}")
         img_resized.save(output_path, quality=95)
         
         return output_path
@@ -133,7 +129,7 @@ class ImageService:
         img_cropped = img.crop((left, top, right, bottom))
         
         # Save
-        output_path = self.output_dir / f"{input_path.stem}_cropped.{output_format}"
+        output_path = self._output_path(f"{input_path.stem}_cropped.{output_format}")
         img_cropped.save(output_path, quality=95)
         
         return output_path
@@ -159,7 +155,7 @@ class ImageService:
         img_rotated = img.rotate(angle, expand=expand, fillcolor=(255, 255, 255))
         
         # Save
-        output_path = self.output_dir / f"{input_path.stem}_rotated.{output_format}"
+        output_path = self._output_path(f"{input_path.stem}_rotated.{output_format}")
         img_rotated.save(output_path, quality=95)
         
         return output_path
@@ -180,10 +176,10 @@ class ImageService:
         
         # Handle WebP
         if output_format.lower() == 'webp':
-            output_path = self.output_dir / f"{input_path.stem}.webp"
+            output_path = self._output_path(f"{input_path.stem}.webp")
             img.save(output_path, 'WebP', quality=quality)
         else:
-            output_path = self.output_dir / f"{input_path.stem}.{output_format}"
+            output_path = self._output_path(f"{input_path.stem}.{output_format}")
             img.save(output_path, quality=quality if output_format.lower() in ['jpg', 'jpeg'] else None)
         
         return output_path
@@ -263,7 +259,7 @@ class ImageService:
             img = enhancer.enhance(sharpness)
         
         # Save
-        output_path = self.output_dir / f"{input_path.stem}_enhanced.{output_format}"
+        output_path = self._output_path(f"{input_path.stem}_enhanced.{output_format}")
         img.save(output_path, quality=95)
         
         return output_path
@@ -303,7 +299,7 @@ class ImageService:
             img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
         
         # Save with compression
-        output_path = self.output_dir / f"{input_path.stem}_compressed.{output_format}"
+        output_path = self._output_path(f"{input_path.stem}_compressed.{output_format}")
         
         if output_format.lower() == 'webp':
             img.save(output_path, 'WebP', quality=quality, method=6)  # method=6 = best compression
@@ -347,7 +343,7 @@ class ImageService:
             raise HTTPException(400, f"Unknown filter: {filter_name}")
         
         # Save
-        output_path = self.output_dir / f"{input_path.stem}_{filter_name}.{output_format}"
+        output_path = self._output_path(f"{input_path.stem}_{filter_name}.{output_format}")
         img.save(output_path, quality=95)
         
         return output_path
@@ -369,7 +365,13 @@ class ImageService:
     
     # ==================== Cleanup ====================
     
+    def _output_path(self, filename: str) -> Path:
+        """outputs/<uuid>/<filename>: request song song cùng tên ảnh không ghi đè output của nhau"""
+        return new_output_dir(self.output_dir) / filename
+    
     async def cleanup_file(self, file_path: Path) -> None:
-        """Delete a file"""
-        if file_path.exists():
-            file_path.unlink()
+        """Delete a file (+ thư mục upload / output riêng của nó)"""
+        if Path(file_path).parent.parent.resolve() == self.output_dir.resolve():
+            remove_output(file_path, self.output_dir)
+        else:
+            remove_upload(file_path, self.upload_dir)
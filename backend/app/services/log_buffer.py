@@ -0,0 +1,341 @@
+"""
+Log Buffer - Ghi usage/audit log kiểu write-behind (gom batch, ghi nền)
+
+Usage:
+    from app.services.log_buffer import get_log_buffer
+
+    # Request chỉ append vào RAM (không query, không commit)
+    get_log_buffer().add(ActivityLog, {"user_id": 1, "action": "login", ...}, db=db)
+    get_log_buffer().add_gemini_quota(key_id, tokens=1234, db=db)
+    get_log_buffer().add_provider_usage("gemini", {"operation": "ocr", ...}, db=db)
+
+    # Shutdown (main_simple.py): flush nốt record còn trong hàng đợi
+    get_log_buffer().stop()
+
+Tại sao:
+- log_activity / log_usage / _log_gemini_usage / track_usage / log_ocr_usage
+  đều db.add() + commit() (+ refresh, + query tìm key) ngay trong request
+  → thêm vài round trip DB cho mỗi AI call, giữ connection của pool
+- Ghi nền: 1 thread gom tối đa LOG_BUFFER_BATCH_SIZE record → 1 transaction
+  (executemany INSERT theo từng bảng)
+
+Quota Gemini key:
+- Token của cùng 1 key trong 1 batch được cộng dồn → 1 UPDATE atomic
+  quota_used = quota_used + :tokens (không đọc-sửa-ghi trong Python)
+- Key xuống dưới 5% quota tháng → rotate (như track_usage cũ)
+
+Session:
+- `db` của request: record được ghi vào cùng database (bind của session đó)
+  → override get_db (test, script) áp dụng cho cả log
+- LOG_BUFFER_ENABLED=False / hàng đợi đầy / đang shutdown: ghi + commit ngay
+  bằng chính `db` đó (như trước khi có buffer)
+- Không có `db`: session_factory của buffer (mặc định SessionLocal)
+
+Giới hạn:
+- Hàng đợi tối đa LOG_BUFFER_MAX_SIZE record; đầy → record đó ghi trực tiếp
+  (chậm lại thay vì mất log)
+- Log xuất hiện trong DB sau tối đa LOG_BUFFER_FLUSH_SECONDS
+- Process bị kill -9 → mất phần chưa flush
+"""
+import atexit
+import logging
+import queue
+import threading
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+from sqlalchemy import and_, func, insert, update
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.gemini_keys import GeminiAPIKey, GeminiKeyQuota, KeyStatus, QuotaType
+
+logger = logging.getLogger(__name__)
+
+# Quota tháng còn dưới tỉ lệ này → rotate key
+ROTATE_REMAINING_RATIO = 0.05
+
+
+@dataclass
+class _InsertRecord:
+    model: Any
+    values: Dict[str, Any]
+
+
+@dataclass
+class _GeminiQuotaRecord:
+    key_id: int
+    tokens: int
+    used_at: datetime
+
+
+@dataclass
+class _ProviderUsageRecord:
+    """AIUsageLog: provider_key_id (key primary) được resolve lúc flush"""
+    provider: str
+    values: Dict[str, Any]
+
+
+_Record = Union[_InsertRecord, _GeminiQuotaRecord, _ProviderUsageRecord]
+# (bind của session request hoặc None = session_factory mặc định, record)
+_QueuedRecord = Tuple[Any, _Record]
+
+
+class LogBuffer:
+    """Hàng đợi log có giới hạn + thread flush nền (1 instance / process)"""
+
+    def __init__(
+        self,
+        enabled: bool,
+        max_size: int,
+        batch_size: int,
+        flush_seconds: float,
+        session_factory: Callable[..., Session] = SessionLocal
+    ):
+        self.enabled = enabled
+        self.batch_size = max(1, batch_size)
+        self.flush_seconds = max(0.1, flush_seconds)
+        self.session_factory = session_factory
+        self._queue: "queue.Queue[_QueuedRecord]" = queue.Queue(maxsize=max(1, max_size))
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    # ========== ENQUEUE (gọi từ request) ==========
+
+    def add(self, model: Any, values: Dict[str, Any], db: Optional[Session] = None) -> None:
+        """Thêm 1 row cho bảng log `model` (created_at = lúc gọi, không phải lúc flush)"""
+        if hasattr(model, "created_at"):
+            values.setdefault("created_at", datetime.utcnow())
+        self._put(_InsertRecord(model, values), db)
+
+    def add_gemini_quota(self, key_id: int, tokens: int, db: Optional[Session] = None) -> None:
+        """Cộng tokens vào quota (monthly + daily) của Gemini key + cập nhật last_used_at"""
+        self._put(_GeminiQuotaRecord(key_id, tokens, datetime.utcnow()), db)
+
+    def add_provider_usage(self, provider: str, values: Dict[str, Any], db: Optional[Session] = None) -> None:
+        """Thêm 1 AIUsageLog cho key primary của provider (+ last_used_at, error_count)"""
+        values.setdefault("created_at", datetime.utcnow())
+        self._put(_ProviderUsageRecord(provider, values), db)
+
+    def _put(self, record: _Record, db: Optional[Session]) -> None:
+        if not self.enabled or self._stopping.is_set():
+            self._write([record], db=db)
+            return
+
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((db.get_bind() if db is not None else None, record))
+        except queue.Full:
+            logger.warning(f"⚠️ Log buffer full ({self._queue.maxsize}) → writing synchronously")
+            self._write([record], db=db)
+            return
+
+        if self._queue.qsize() >= self.batch_size:
+            self._wakeup.set()
+
+    # ========== LIFECYCLE ==========
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="log-buffer", daemon=True)
+                self._thread.start()
+                # Celery worker / script không có shutdown hook của FastAPI
+                atexit.register(self.stop)
+                logger.info(
+                    f"📝 Log buffer started (batch {self.batch_size}, every {self.flush_seconds:.1f}s, "
+                    f"max {self._queue.maxsize})"
+                )
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            self._wakeup.wait(self.flush_seconds)
+            self._wakeup.clear()
+            self.flush()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Dừng thread nền + flush toàn bộ record còn lại (gọi khi shutdown)"""
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self.flush()
+
+    def flush(self) -> int:
+        """Ghi mọi record đang chờ (theo batch), trả số record đã xử lý"""
+        total = 0
+        while True:
+            batch: List[_QueuedRecord] = []
+            try:
+                while len(batch) < self.batch_size:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+            if not batch:
+                return total
+
+            # Thường chỉ có 1 database; test / script override get_db → bind khác
+            by_bind: Dict[Any, List[_Record]] = defaultdict(list)
+            for bind, record in batch:
+                by_bind[bind].append(record)
+            for bind, records in by_bind.items():
+                self._write(records, bind=bind)
+            total += len(batch)
+
+    def _open_session(self, bind: Any) -> Session:
+        return self.session_factory(bind=bind) if bind is not None else self.session_factory()
+
+    # ========== WRITE (thread nền) ==========
+
+    def _write(self, records: List[_Record], db: Optional[Session] = None, bind: Any = None) -> None:
+        """
+        Ghi 1 batch trong 1 transaction
+
+        db: session của request (ghi trực tiếp, commit luôn cả session đó như trước khi có buffer)
+        bind: database của request lúc enqueue (ghi nền bằng session mới trên bind đó)
+        """
+        inserts: Dict[Any, List[Dict[str, Any]]] = defaultdict(list)
+        provider_usage: Dict[str, List[_ProviderUsageRecord]] = defaultdict(list)
+        gemini_tokens: Dict[int, int] = defaultdict(int)
+        gemini_used_at: Dict[int, datetime] = {}
+
+        for record in records:
+            if isinstance(record, _InsertRecord):
+                inserts[record.model].append(record.values)
+            elif isinstance(record, _ProviderUsageRecord):
+                provider_usage[record.provider].append(record)
+            else:
+                gemini_tokens[record.key_id] += record.tokens
+                gemini_used_at[record.key_id] = max(record.used_at, gemini_used_at.get(record.key_id, record.used_at))
+
+        session = db if db is not None else self._open_session(bind)
+        try:
+            if provider_usage:
+                self._apply_provider_usage(session, provider_usage, inserts)
+            for model, rows in inserts.items():
+                session.execute(insert(model), rows)
+            for key_id, tokens in gemini_tokens.items():
+                self._apply_gemini_quota(session, key_id, tokens, gemini_used_at[key_id])
+            session.commit()
+            error = None
+        except Exception as e:
+            session.rollback()
+            error = e
+        finally:
+            if db is None:
+                session.close()
+
+        if error is not None:
+            if len(records) == 1:
+                logger.error(f"❌ Dropping log record {type(records[0]).__name__}: {error}")
+                return
+            # 1 record lỗi (VD: FK) không được kéo cả batch theo
+            logger.warning(f"⚠️ Log batch of {len(records)} failed ({error}), retrying one by one")
+            for record in records:
+                self._write([record], db=db, bind=bind)
+            return
+
+        if gemini_tokens:
+            self._rotate_exhausted_keys(list(gemini_tokens), db=db, bind=bind)
+
+    def _apply_provider_usage(
+        self,
+        db,
+        provider_usage: Dict[str, List[_ProviderUsageRecord]],
+        inserts: Dict[Any, List[Dict[str, Any]]]
+    ) -> None:
+        from app.models.models import AIProviderKey, AIUsageLog
+        from app.services.ai_usage_service import get_primary_key
+
+        for provider, records in provider_usage.items():
+            # 1 lần tìm key / provider / batch (thay vì 1 lần / AI call)
+            key = get_primary_key(provider, db)
+            if not key:
+                logger.debug(f"No active {provider} key, skipping {len(records)} usage logs")
+                continue
+
+            for record in records:
+                inserts[AIUsageLog].append({**record.values, "provider_key_id": key.id})
+
+            errors = [record.values.get("error_message") for record in records if record.values.get("status") == "error"]
+            values: Dict[str, Any] = {"last_used_at": max(record.values["created_at"] for record in records)}
+            if errors:
+                values["error_count"] = func.coalesce(AIProviderKey.error_count, 0) + len(errors)
+                values["last_error"] = errors[-1]
+            db.execute(
+                update(AIProviderKey).where(AIProviderKey.id == key.id).values(**values),
+                execution_options={"synchronize_session": False}
+            )
+
+    def _apply_gemini_quota(self, db, key_id: int, tokens: int, used_at: datetime) -> None:
+        db.execute(
+            update(GeminiKeyQuota)
+            .where(GeminiKeyQuota.key_id == key_id)
+            .values(
+                quota_used=GeminiKeyQuota.quota_used + tokens,
+                quota_remaining=GeminiKeyQuota.quota_limit - GeminiKeyQuota.quota_used - tokens,
+                last_updated=used_at
+            ),
+            execution_options={"synchronize_session": False}
+        )
+        db.execute(
+            update(GeminiAPIKey).where(GeminiAPIKey.id == key_id).values(last_used_at=used_at),
+            execution_options={"synchronize_session": False}
+        )
+
+    def _rotate_exhausted_keys(self, key_ids: List[int], db: Optional[Session] = None, bind: Any = None) -> None:
+        from app.services.gemini_key_service import GeminiKeyService
+
+        own_session = db is None
+        if own_session:
+            db = self._open_session(bind)
+        try:
+            exhausted = (
+                db.query(GeminiKeyQuota)
+                .join(GeminiAPIKey, GeminiAPIKey.id == GeminiKeyQuota.key_id)
+                .filter(
+                    and_(
+                        GeminiKeyQuota.key_id.in_(key_ids),
+                        GeminiKeyQuota.quota_type == QuotaType.MONTHLY,
+                        GeminiKeyQuota.quota_remaining < GeminiKeyQuota.quota_limit * ROTATE_REMAINING_RATIO,
+                        GeminiAPIKey.status == KeyStatus.ACTIVE
+                    )
+                )
+                .all()
+            )
+            if not exhausted:
+                return
+
+            key_service = GeminiKeyService(db)
+            for quota in exhausted:
+                logger.warning(f"⚠️ Key {quota.key_id} gần hết quota: {quota.quota_remaining:,} tokens")
+                key_service.rotate_key(quota.key_id, "quota_exceeded")
+        except Exception as e:
+            db.rollback()
+            logger.error(f"❌ Gemini key rotation check failed: {e}")
+        finally:
+            if own_session:
+                db.close()
+
+
+_log_buffer: Optional[LogBuffer] = None
+
+
+def get_log_buffer() -> LogBuffer:
+    """Get process-wide log buffer"""
+    global _log_buffer
+    if _log_buffer is None:
+        _log_buffer = LogBuffer(
+            enabled=settings.LOG_BUFFER_ENABLED,
+            max_size=settings.LOG_BUFFER_MAX_SIZE,
+            batch_size=settings.LOG_BUFFER_BATCH_SIZE,
+            flush_seconds=settings.LOG_BUFFER_FLUSH_SECONDS,
+        )
+    return _log_buffer
@@ -4,18 +4,29 @@
 Service for Mẫu 2C-TCTW-98 (Sơ yếu lý lịch)
 """
 
-from docxtpl import DocxTemplate
-from docx import Document
-import os
+import io
 import re
+import threading
+import uuid
 from datetime import datetime
 from pathlib import Path
+from typing import Any, Dict
+
+from app.services.docx_render import get_cached_template
+
+TEMPLATE_PATH = Path(__file__).parent.parent / "templates" / "mau_2c_V10_WITH_LOOPS.docx"
+
+DOTS_PATTERN = re.compile(r'[.…]{3,}')
+
+# DocxTemplate cache bị thay đổi khi render → 1 render / process tại 1 thời điểm
+_render_lock = threading.Lock()
+
 
 class Mau2CService:
     """Service to generate Mẫu 2C-TCTW-98 documents"""
     
     def __init__(self):
-        self.template_path = Path(__file__).parent.parent / "templates" / "mau_2c_V10_WITH_LOOPS.docx"
+        self.template_path = TEMPLATE_PATH
         
         if not self.template_path.exists():
             raise FileNotFoundError(f"Template not found: {self.template_path}")
@@ -89,8 +100,8 @@ class Mau2CService:
         # Clean paragraphs
         for para in doc.paragraphs:
             for run in para.runs:
-                if re.search(r'[.…]{3,}', run.text):
-                    run.text = re.sub(r'[.…]{3,}', '', run.text).strip()
+                if DOTS_PATTERN.search(run.text):
+                    run.text = DOTS_PATTERN.sub('', run.text).strip()
                     cleaned_count += 1
         
         # Clean tables
@@ -99,12 +110,37 @@ class Mau2CService:
                 for cell in row.cells:
                     for para in cell.paragraphs:
                         for run in para.runs:
-                            if re.search(r'[.…]{3,}', run.text):
-                                run.text = re.sub(r'[.…]{3,}', '', run.text).strip()
+                            if DOTS_PATTERN.search(run.text):
+                                run.text = DOTS_PATTERN.sub('', run.text).strip()
                                 cleaned_count += 1
         
         return cleaned_count
     
+    def build_render_data(self, data: dict) -> Dict[str, Any]:
+        """Flatten simple fields + map arrays with correct keys"""
+        render_data = {**self.flatten_dict(data)}
+        render_data.update(self.map_arrays_for_template(data))
+        return render_data
+    
+    def render_bytes(self, data: dict) -> bytes:
+        """
+        Render Mẫu 2C → bytes .docx trong 1 lượt
+        
+        Template được parse/compile 1 lần mỗi process (docx_render cache),
+        clean_dots chạy thẳng trên document vừa render (không save → mở lại).
+        """
+        render_data = self.build_render_data(data)
+        cache_key = f"mau_2c:{self.template_path}:{self.template_path.stat().st_mtime_ns}"
+        
+        with _render_lock:
+            doc_template, jinja_env = get_cached_template(self.template_path, cache_key)
+            doc_template.render(render_data, jinja_env, autoescape=True)
+            self.clean_dots(doc_template.docx)
+            
+            buffer = io.BytesIO()
+            doc_template.save(buffer)
+        return buffer.getvalue()
+    
     def generate(self, data: dict, output_dir: str = None) -> str:
         """
         Generate Mẫu 2C document from data
@@ -117,23 +153,8 @@ class Mau2CService:
             Path to generated file
         """
         try:
-            # Load template
-            doc_template = DocxTemplate(str(self.template_path))
-            
-            # Flatten simple fields
-            flat_data = self.flatten_dict(data)
-            
-            # Prepare render data
-            render_data = {**flat_data}
+            content = self.render_bytes(data)
             
-            # Map arrays with correct keys
-            array_mappings = self.map_arrays_for_template(data)
-            render_data.update(array_mappings)
-            
-            # Render template
-            doc_template.render(render_data)
-            
-            # Save to temporary file
             if output_dir is None:
                 output_dir = Path(__file__).parent.parent.parent / "output"
             else:
@@ -141,26 +162,18 @@ class Mau2CService:
             
             output_dir.mkdir(parents=True, exist_ok=True)
             
-            # Generate filename with timestamp (ASCII-safe)
+            # Generate filename with timestamp (ASCII-safe) + suffix riêng
+            # (2 request cùng giây không ghi đè nhau)
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            # Use timestamp only for filename to avoid encoding issues
-            filename = f"Mau_2C_{timestamp}.docx"
-            temp_path = output_dir / filename
-            
-            doc_template.save(str(temp_path))
-            
-            # Clean dots
-            doc = Document(str(temp_path))
-            cleaned = self.clean_dots(doc)
-            
-            # Save cleaned version
-            final_path = output_dir / filename.replace('.docx', '_cleaned.docx')
-            doc.save(str(final_path))
-            
-            # Remove temp file
-            temp_path.unlink()
+            final_path = output_dir / f"Mau_2C_{timestamp}_{uuid.uuid4().hex[:8]}_cleaned.docx"
+            final_path.write_bytes(content)
             
             return str(final_path)
             
         except Exception as e:
             raise Exception(f"Failed to generate Mẫu 2C: {str(e)}")
+
+
+def render_mau_2c(data: dict) -> bytes:
+    """[Worker process] Render 1 sơ yếu lý lịch → bytes .docx (dùng cho batch)"""
+    return Mau2CService().render_bytes(data)
@@ -9,6 +9,7 @@ import json
 import logging
 
 from app.models.ocr_analytics import OCRUsageLog, OCRUserAction, OCRConversionFunnel
+from app.services.log_buffer import get_log_buffer
 
 logger = logging.getLogger(__name__)
 
@@ -38,37 +39,34 @@ class OCRAnalyticsService:
         error_type: Optional[str] = None,
         downloaded: bool = False,
         download_format: Optional[str] = None
-    ) -> OCRUsageLog:
+    ) -> None:
         """
         Log chi tiết mỗi lần xử lý OCR
         → Data cho sales analytics, performance monitoring
-        """
-        log = OCRUsageLog(
-            user_id=user_id,
-            file_name=file_name,
-            file_size_bytes=file_size_bytes,
-            file_type=file_type,
-            total_pages=total_pages,
-            detection_method=detection_method,
-            is_scanned=is_scanned,
-            processing_time_seconds=processing_time_seconds,
-            gemini_model_used=gemini_model_used,
-            tokens_used=tokens_used,
-            cost_usd=cost_usd,
-            success=success,
-            error_message=error_message,
-            error_type=error_type,
-            downloaded=downloaded,
-            download_format=download_format,
-            completed_at=datetime.utcnow() if success or error_message else None
-        )
-        
-        db.add(log)
-        db.commit()
-        db.refresh(log)
         
-        logger.info(f"📊 OCR log created: user={user_id}, file={file_name}, success={success}")
-        return log
+        Write-behind: ghi nền theo batch (log buffer), không commit trong request
+        """
+        get_log_buffer().add(OCRUsageLog, {
+            "user_id": user_id,
+            "file_name": file_name,
+            "file_size_bytes": file_size_bytes,
+            "file_type": file_type,
+            "total_pages": total_pages,
+            "detection_method": detection_method,
+            "is_scanned": is_scanned,
+            "processing_time_seconds": processing_time_seconds,
+            "gemini_model_used": gemini_model_used,
+            "tokens_used": tokens_used,
+            "cost_usd": cost_usd,
+            "success": success,
+            "error_message": error_message,
+            "error_type": error_type,
+            "downloaded": downloaded,
+            "download_format": download_format,
+            "completed_at": datetime.utcnow() if success or error_message else None
+        }, db=db)
+        
+        logger.info(f"📊 OCR log queued: user={user_id}, file={file_name}, success={success}")
     
     @staticmethod
     def log_user_action(
@@ -80,7 +78,7 @@ class OCRAnalyticsService:
         page_url: Optional[str] = None,
         user_agent: Optional[str] = None,
         ip_address: Optional[str] = None
-    ) -> OCRUserAction:
+    ) -> None:
         """
         Log mọi hành động của user trong OCR workflow
         
@@ -94,22 +92,17 @@ class OCRAnalyticsService:
         - quota_warning_shown: Hiện cảnh báo hết quota
         - error_occurred: Gặp lỗi
         """
-        action = OCRUserAction(
-            user_id=user_id,
-            session_id=session_id,
-            action_type=action_type,
-            action_metadata=json.dumps(action_metadata) if action_metadata else None,
-            page_url=page_url,
-            user_agent=user_agent,
-            ip_address=ip_address
-        )
-        
-        db.add(action)
-        db.commit()
-        db.refresh(action)
-        
-        logger.info(f"👤 User action logged: {action_type} by user {user_id}")
-        return action
+        get_log_buffer().add(OCRUserAction, {
+            "user_id": user_id,
+            "session_id": session_id,
+            "action_type": action_type,
+            "action_metadata": json.dumps(action_metadata) if action_metadata else None,
+            "page_url": page_url,
+            "user_agent": user_agent,
+            "ip_address": ip_address
+        }, db=db)
+        
+        logger.info(f"👤 User action queued: {action_type} by user {user_id}")
     
     @staticmethod
     def update_conversion_funnel(db: Session, date: Optional[datetime] = None):
@@ -0,0 +1,171 @@
+"""
+Page Fan-out - OCR từng trang PDF song song bằng AI vision (Claude/Gemini)
+
+Usage:
+    from app.services.page_fanout import get_page_fanout
+
+    pages = await get_page_fanout().run(
+        "claude", api_key, [0, 3, 4],   # chỉ OCR các trang cần (index 0-based)
+        render_page=render,          # async (page_index) -> PNG bytes
+        ocr_page=ocr,                # async (page_index, png_bytes) -> dict
+    )
+    # ✅ pages[i] là kết quả của page_indices[i] (đúng thứ tự), dù các trang xong lệch nhau
+
+Giới hạn concurrency (dùng chung mọi request trong process):
+- Per-provider: AI_OCR_PAGE_CONCURRENCY_{CLAUDE,GEMINI}
+- Per-API-key: AI_OCR_PER_KEY_CONCURRENCY (rate limit tính theo key)
+
+Pipeline:
+- Producer render trang lazy → queue có giới hạn (không render trước cả PDF)
+- N worker lấy trang từ queue, gọi AI, trang lỗi được retry riêng
+  (AI_OCR_PAGE_RETRIES, backoff 1s, 2s, 4s...)
+"""
+import asyncio
+import hashlib
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence
+
+from fastapi import HTTPException
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+RenderPage = Callable[[int], Awaitable[bytes]]
+OcrPage = Callable[[int, bytes], Awaitable[Dict[str, Any]]]
+
+
+class PageFanout:
+    """Fan-out OCR theo trang với semaphore theo provider + theo API key"""
+
+    def __init__(
+        self,
+        provider_limits: Dict[str, int],
+        per_key_limit: int,
+        retries: int,
+        retry_backoff_seconds: float = 1.0,
+    ):
+        self.provider_limits = {name: max(1, limit) for name, limit in provider_limits.items()}
+        self.per_key_limit = max(1, per_key_limit)
+        self.retries = max(0, retries)
+        self.retry_backoff_seconds = retry_backoff_seconds
+
+        # Semaphores tạo lazy (cần event loop đang chạy)
+        self._provider_semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._key_semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    def _get_provider_semaphore(self, provider: str) -> asyncio.Semaphore:
+        if provider not in self.provider_limits:
+            raise ValueError(f"Unknown OCR provider '{provider}'. Available: {', '.join(self.provider_limits)}")
+        if provider not in self._provider_semaphores:
+            self._provider_semaphores[provider] = asyncio.Semaphore(self.provider_limits[provider])
+        return self._provider_semaphores[provider]
+
+    def _get_key_semaphore(self, provider: str, api_key: Optional[str]) -> asyncio.Semaphore:
+        # Không giữ API key dạng plain text làm dict key
+        key_id = f"{provider}:{hashlib.sha256((api_key or '').encode()).hexdigest()[:16]}"
+        if key_id not in self._key_semaphores:
+            self._key_semaphores[key_id] = asyncio.Semaphore(self.per_key_limit)
+        return self._key_semaphores[key_id]
+
+    async def _ocr_with_retry(
+        self,
+        provider: str,
+        api_key: Optional[str],
+        page_index: int,
+        image: bytes,
+        ocr_page: OcrPage,
+    ) -> Dict[str, Any]:
+        last_error: Optional[Exception] = None
+        for attempt in range(self.retries + 1):
+            # Thứ tự acquire: key → provider (trang chờ key bận không giữ slot provider)
+            async with self._get_key_semaphore(provider, api_key):
+                async with self._get_provider_semaphore(provider):
+                    try:
+                        return await ocr_page(page_index, image)
+                    except HTTPException as e:
+                        # 4xx (trừ 429) là lỗi input → retry cũng vô ích
+                        if e.status_code < 500 and e.status_code != 429:
+                            raise
+                        last_error = e
+                    except Exception as e:
+                        last_error = e
+
+            if attempt < self.retries:
+                delay = self.retry_backoff_seconds * (2 ** attempt)
+                logger.warning(
+                    f"🔁 Page {page_index + 1} {provider} OCR failed ({last_error}), "
+                    f"retry {attempt + 1}/{self.retries} in {delay:.0f}s"
+                )
+                await asyncio.sleep(delay)
+
+        raise HTTPException(500, f"OCR trang {page_index + 1} thất bại sau {self.retries + 1} lần thử: {last_error}")
+
+    async def run(
+        self,
+        provider: str,
+        api_key: Optional[str],
+        page_indices: Sequence[int],
+        render_page: RenderPage,
+        ocr_page: OcrPage,
+    ) -> List[Dict[str, Any]]:
+        """
+        OCR các trang page_indices song song, trả kết quả theo đúng thứ tự page_indices
+
+        Raises:
+            HTTPException: Nếu 1 trang vẫn lỗi sau khi retry (các trang khác bị hủy)
+        """
+        page_count = len(page_indices)
+        workers = min(self.provider_limits[provider], self.per_key_limit, page_count) or 1
+        # Chỉ render trước tối đa `workers` trang → RAM không phụ thuộc số trang
+        queue: asyncio.Queue = asyncio.Queue(maxsize=workers)
+        results: List[Optional[Dict[str, Any]]] = [None] * page_count
+        started_at = time.perf_counter()
+
+        async def produce():
+            for position, page_index in enumerate(page_indices):
+                await queue.put((position, page_index, await render_page(page_index)))
+            for _ in range(workers):
+                await queue.put(None)
+
+        async def consume():
+            while (item := await queue.get()) is not None:
+                position, page_index, image = item
+                results[position] = await self._ocr_with_retry(provider, api_key, page_index, image, ocr_page)
+                logger.info(f"🔍 Page {page_index + 1} done ({provider}, {position + 1}/{page_count})")
+
+        tasks = [asyncio.create_task(produce())]
+        tasks += [asyncio.create_task(consume()) for _ in range(workers)]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            pending = [task for task in tasks if not task.done()]
+            for task in pending:
+                task.cancel()
+            # Chờ worker bị hủy thoát hẳn → không còn request AI nào chạy sau khi run() raise
+            await asyncio.gather(*pending, return_exceptions=True)
+
+        logger.info(
+            f"✅ {provider} OCR: {page_count} pages in {time.perf_counter() - started_at:.1f}s "
+            f"({workers} parallel)"
+        )
+        return results
+
+
+_page_fanout: Optional[PageFanout] = None
+
+
+def get_page_fanout() -> PageFanout:
+    """Get shared page fan-out (1 instance per process)"""
+    global _page_fanout
+    if _page_fanout is None:
+        _page_fanout = PageFanout(
+            provider_limits={
+                "claude": settings.AI_OCR_PAGE_CONCURRENCY_CLAUDE,
+                "gemini": settings.AI_OCR_PAGE_CONCURRENCY_GEMINI,
+            },
+            per_key_limit=settings.AI_OCR_PER_KEY_CONCURRENCY,
+            retries=settings.AI_OCR_PAGE_RETRIES,
+        )
+    return _page_fanout
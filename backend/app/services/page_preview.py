@@ -0,0 +1,228 @@
+"""
+Page Preview - Thumbnail / preview từng trang PDF cho các trang công cụ (split, rotate, merge, OCR review)
+
+Usage:
+    from app.services.page_preview import register_preview_document, get_page_preview
+
+    # 1. Upload 1 lần → document_id (SHA-256 nội dung) + kích thước từng trang
+    info = await register_preview_document(upload)
+
+    # 2. Lấy từng trang theo chiều rộng (GET, <img src> dùng được trực tiếp)
+    preview = await get_page_preview(info.document_id, page=3, width=240, format="png")
+    return Response(preview.content, media_type=preview.media_type, headers=preview.headers())
+
+Tại sao:
+- Trước đây chỉ có /pdf/to-images: render TẤT CẢ trang full-resolution rồi ZIP
+  → page picker phải tải + render lại cả tài liệu chỉ để xem vài thumbnail
+- Cùng 1 trang được xem lại nhiều lần (kéo thả, mở lại tool) → render 1 lần
+
+Lưu trữ (ResultCache riêng, PREVIEW_CACHE_DIR, LRU theo PREVIEW_CACHE_MAX_MB):
+- PDF gốc: key = hash(SHA-256 file, "preview_source")
+- Ảnh trang: key = hash(SHA-256 file, "page_preview", page, width, format)
+  → key cũng là ETag (cùng nội dung + tham số = cùng ảnh) → If-None-Match trả 304
+    mà không cần đọc disk
+- PDF gốc bị evict → 404, client upload lại (document_id không đổi)
+"""
+import asyncio
+import logging
+import re
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+from app.core.config import settings
+from app.services.page_workers import IMAGE_FORMATS, get_page_pool, render_page_thumbnail
+from app.services.result_cache import ResultCache
+from app.services.upload_ingest import IngestedUpload
+
+logger = logging.getLogger(__name__)
+
+SOURCE_OPERATION = "preview_source"
+PAGE_OPERATION = "page_preview"
+MIN_WIDTH = 32
+
+_DOCUMENT_ID_RE = re.compile(r"^[0-9a-f]{64}$")
+
+MEDIA_TYPES = {"png": "image/png", "jpg": "image/jpeg", "jpeg": "image/jpeg"}
+
+
+@dataclass
+class PreviewDocument:
+    """PDF đã đăng ký để preview"""
+    document_id: str
+    filename: str
+    page_count: int
+    page_sizes: List[Tuple[float, float]]  # (width, height) points, đã tính /Rotate
+
+    def to_dict(self) -> Dict:
+        return {
+            "document_id": self.document_id,
+            "filename": self.filename,
+            "page_count": self.page_count,
+            "pages": [
+                {"page": index + 1, "width": round(width, 2), "height": round(height, 2)}
+                for index, (width, height) in enumerate(self.page_sizes)
+            ],
+        }
+
+
+@dataclass
+class PagePreview:
+    """Ảnh preview 1 trang (thumbnail nhỏ → giữ bytes, không phụ thuộc file cache bị evict)"""
+    content: bytes
+    etag: str
+    media_type: str
+    cached: bool
+
+    def headers(self) -> Dict[str, str]:
+        headers = preview_headers(self.etag)
+        headers["X-Cache"] = "HIT" if self.cached else "MISS"
+        return headers
+
+
+def preview_headers(etag: str) -> Dict[str, str]:
+    """ETag + Cache-Control (nội dung theo URL không bao giờ đổi)"""
+    return {
+        "ETag": f'"{etag}"',
+        "Cache-Control": f"private, max-age={settings.PREVIEW_HTTP_MAX_AGE_SECONDS}, immutable",
+    }
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match: "a", W/"b" hoặc * """
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate.strip('"') == etag:
+            return True
+    return False
+
+
+_preview_cache: Optional[ResultCache] = None
+
+
+def get_preview_cache() -> ResultCache:
+    """Get shared preview cache (tách khỏi result cache: thumbnail không đẩy kết quả convert ra ngoài)"""
+    global _preview_cache
+    if _preview_cache is None:
+        _preview_cache = ResultCache(
+            Path(settings.PREVIEW_CACHE_DIR),
+            max_bytes=settings.PREVIEW_CACHE_MAX_MB * 1024 * 1024
+        )
+        logger.info(f"✅ Preview cache: {settings.PREVIEW_CACHE_DIR} (max {settings.PREVIEW_CACHE_MAX_MB} MB)")
+    return _preview_cache
+
+
+def normalize_preview_params(width: Optional[int], format: str) -> Tuple[int, str]:
+    """Chuẩn hóa width/format (jpeg → jpg) để cùng 1 ảnh luôn có cùng key"""
+    format = format.lower()
+    if format not in IMAGE_FORMATS:
+        raise HTTPException(400, f"Invalid format. Must be one of: {sorted(IMAGE_FORMATS)}")
+    if format == "jpeg":
+        format = "jpg"
+
+    width = width or settings.PREVIEW_DEFAULT_WIDTH
+    if not MIN_WIDTH <= width <= settings.PREVIEW_MAX_WIDTH:
+        raise HTTPException(400, f"Width must be between {MIN_WIDTH} and {settings.PREVIEW_MAX_WIDTH}")
+    return width, format
+
+
+def page_preview_etag(document_id: str, page: int, width: int, format: str) -> str:
+    """ETag = cache key của ảnh trang (tính được mà không cần đọc disk)"""
+    return ResultCache.make_key(document_id, PAGE_OPERATION, page=page, width=width, format=format)
+
+
+def _read_page_sizes(pdf_path: Path) -> List[Tuple[float, float]]:
+    import pypdfium2 as pdfium
+
+    pdf = pdfium.PdfDocument(str(pdf_path))
+    try:
+        sizes = []
+        for page_index in range(len(pdf)):
+            page = pdf[page_index]
+            sizes.append(page.get_size())
+            page.close()
+        return sizes
+    finally:
+        pdf.close()
+
+
+async def register_preview_document(upload: IngestedUpload) -> PreviewDocument:
+    """
+    Lưu PDF vào preview cache (nếu chưa có) + đọc kích thước trang
+
+    Raises:
+        HTTPException 400: không phải PDF hợp lệ
+    """
+    try:
+        page_sizes = await asyncio.to_thread(_read_page_sizes, upload.path)
+    except Exception as e:
+        raise HTTPException(400, f"Invalid PDF: {str(e)}")
+
+    cache = get_preview_cache()
+    source_key = cache.make_key(upload.sha256, SOURCE_OPERATION)
+    if await asyncio.to_thread(cache.get, source_key) is None:
+        await asyncio.to_thread(
+            cache.put_file, source_key, upload.path,
+            operation=SOURCE_OPERATION, filename=upload.filename, pages=len(page_sizes)
+        )
+
+    return PreviewDocument(
+        document_id=upload.sha256,
+        filename=upload.filename,
+        page_count=len(page_sizes),
+        page_sizes=page_sizes,
+    )
+
+
+async def get_page_preview(document_id: str, page: int, width: int, format: str) -> PagePreview:
+    """
+    Ảnh trang `page` (bắt đầu từ 1) rộng `width` px - cache hit hoặc render trên page process pool
+
+    Raises:
+        HTTPException 404: document_id không tồn tại / PDF gốc đã bị evict
+        HTTPException 400: page ngoài phạm vi
+    """
+    if not _DOCUMENT_ID_RE.match(document_id):
+        raise HTTPException(404, "Preview document not found")
+
+    cache = get_preview_cache()
+    etag = page_preview_etag(document_id, page, width, format)
+    media_type = MEDIA_TYPES[format]
+
+    hit = await asyncio.to_thread(cache.get, etag)
+    if hit is not None:
+        try:
+            content = await asyncio.to_thread(hit.path.read_bytes)
+            return PagePreview(content=content, etag=etag, media_type=media_type, cached=True)
+        except FileNotFoundError:
+            pass  # Bị evict ngay sau khi tra cache → render lại
+
+    source = await asyncio.to_thread(cache.get, cache.make_key(document_id, SOURCE_OPERATION))
+    if source is None:
+        raise HTTPException(404, "Preview document not found or expired - upload it again")
+    page_count = source.meta.get("pages") or 0
+    if not 1 <= page <= page_count:
+        raise HTTPException(400, f"Page {page} out of range (1-{page_count})")
+
+    try:
+        image_bytes = await get_page_pool().run(
+            render_page_thumbnail, str(source.path), page - 1, width, format
+        )
+    except FileNotFoundError:
+        # PDF gốc bị evict giữa lúc tra cache và lúc render
+        raise HTTPException(404, "Preview document not found or expired - upload it again")
+
+    await asyncio.to_thread(
+        cache.put_bytes, etag, image_bytes,
+        operation=PAGE_OPERATION, document_id=document_id, page=page, width=width, format=format
+    )
+    logger.info(f"🖼️ Page preview rendered: {document_id[:12]} p{page} @ {width}px {format}")
+    return PagePreview(content=image_bytes, etag=etag, media_type=media_type, cached=False)
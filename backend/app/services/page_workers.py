@@ -0,0 +1,452 @@
+"""
+Page Workers - Xử lý PDF theo từng trang trên process pool (tận dụng mọi core)
+
+Usage:
+    from app.services.page_workers import ocr_pdf_to_searchable_pdf
+
+    # Sync + CPU-bound → chạy trong thread để không block event loop
+    pages = await asyncio.to_thread(
+        ocr_pdf_to_searchable_pdf, input_file, output_path, "vie"
+    )
+
+    # Render lazy từng trang cho AI OCR (xem page_fanout.py)
+    png_bytes = await render_page(input_file, page_index=0, dpi=200)
+
+    # Trang nào scan, trang nào có text layer (smart OCR hybrid)
+    pages = await asyncio.to_thread(classify_pdf_pages, input_file)
+
+    # PDF → ảnh: render song song, nhận bytes theo thứ tự trang (stream thẳng vào ZIP)
+    async for page_index, image_bytes in iter_page_images(input_file, "jpg", dpi=150):
+        ...
+
+Tại sao:
+- pdf2image.convert_from_path() render TẤT CẢ trang vào RAM cùng lúc
+  (200 trang scan @300dpi ≈ vài GB)
+- pytesseract chạy tuần tự trên 1 core
+
+Pipeline:
+- Worker process tự mở PDF bằng pypdfium2 và render đúng 1 trang
+  → process chính không giữ raster nào
+- Chỉ WINDOW trang (≈ 2 x số worker) được render/OCR cùng lúc
+- Kết quả được ghi vào PDF theo thứ tự trang ngay khi trang đó xong
+
+Worker chết (OOM killer, crash trong pdfium/tesseract) làm hỏng cả ProcessPoolExecutor
+→ mọi chỗ dùng pool đi qua PageProcessPool.acquire() / run(): pool hỏng bị bỏ, lần sau
+tạo lại, request hiện tại nhận 503.
+"""
+import asyncio
+import io
+import logging
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+from fastapi import HTTPException
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Số trang đang xử lý / chờ ghi cho mỗi worker
+PAGES_IN_FLIGHT_PER_WORKER = 2
+
+# PDF → ảnh: format API → format Pillow
+IMAGE_FORMATS = {"png": "PNG", "jpg": "JPEG", "jpeg": "JPEG"}
+
+# Số trang tối đa 1 task render (dùng chung 1 document handle trong worker)
+MAX_PAGES_PER_RENDER_TASK = 4
+
+
+def _init_worker():
+    # Tesseract tự dùng OpenMP nhiều thread → N process x N thread tranh core
+    os.environ["OMP_THREAD_LIMIT"] = "1"
+
+
+def _render_page(pdf_path: str, page_index: int, dpi: int):
+    """Render 1 trang → (PIL image, width_pt, height_pt)"""
+    import pypdfium2 as pdfium
+
+    # Mở/đóng mỗi lần: không giữ file handle (Windows không xóa được temp file)
+    pdf = pdfium.PdfDocument(pdf_path)
+    try:
+        return _render_loaded_page(pdf, page_index, dpi)
+    finally:
+        pdf.close()
+
+
+def _capped_scale(width_pt: float, height_pt: float, scale: float) -> float:
+    """Hạ scale để ảnh không vượt PAGE_RENDER_MAX_PIXELS (trang A0 @600dpi ≈ 1.4 tỉ pixel)"""
+    pixels = width_pt * height_pt * scale * scale
+    if pixels <= settings.PAGE_RENDER_MAX_PIXELS:
+        return scale
+    return scale * (settings.PAGE_RENDER_MAX_PIXELS / pixels) ** 0.5
+
+
+def _render_loaded_page(pdf, page_index: int, dpi: int):
+    page = pdf[page_index]
+    try:
+        width_pt, height_pt = page.get_size()
+        scale = _capped_scale(width_pt, height_pt, dpi / 72.0)
+        if scale < dpi / 72.0:
+            logger.warning(f"Page {page_index + 1} too large for {dpi}dpi - rendered at {scale * 72:.0f}dpi")
+        image = page.render(scale=scale).to_pil()
+    finally:
+        page.close()
+    return image, width_pt, height_pt
+
+
+def _encode_image(image, format: str) -> bytes:
+    """PIL image → bytes theo format (png/jpg), đóng image sau khi encode"""
+    pil_format = IMAGE_FORMATS[format.lower()]
+    if pil_format == "JPEG" and image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+
+    buffer = io.BytesIO()
+    if pil_format == "JPEG":
+        image.save(buffer, format="JPEG", quality=95)
+    else:
+        image.save(buffer, format=pil_format)
+    image.close()
+    return buffer.getvalue()
+
+
+def ocr_page(pdf_path: str, page_index: int, dpi: int, lang: str) -> Dict[str, Any]:
+    """
+    [Worker process] Render + OCR 1 trang
+
+    Returns:
+        dict: page_index, text, image (JPEG bytes), width, height (points)
+    """
+    import pytesseract
+
+    image, width_pt, height_pt = _render_page(pdf_path, page_index, dpi)
+    text = pytesseract.image_to_string(image, lang=lang)
+
+    # JPEG: ReportLab nhúng thẳng, không decode/encode lại như PNG
+    buffer = io.BytesIO()
+    image.convert("RGB").save(buffer, format="JPEG", quality=90)
+    image.close()
+
+    return {
+        "page_index": page_index,
+        "text": text,
+        "image": buffer.getvalue(),
+        "width": width_pt,
+        "height": height_pt,
+    }
+
+
+def render_page_png(pdf_path: str, page_index: int, dpi: int) -> bytes:
+    """[Worker process] Render 1 trang → PNG bytes (cho AI vision OCR)"""
+    image, _, _ = _render_page(pdf_path, page_index, dpi)
+    return _encode_image(image, "png")
+
+
+def render_page_images(pdf_path: str, page_indices: Sequence[int], dpi: int, format: str) -> List[bytes]:
+    """[Worker process] Render vài trang liên tiếp (1 document handle) → bytes ảnh theo thứ tự"""
+    import pypdfium2 as pdfium
+
+    pdf = pdfium.PdfDocument(pdf_path)
+    try:
+        images = []
+        for page_index in page_indices:
+            image, _, _ = _render_loaded_page(pdf, page_index, dpi)
+            images.append(_encode_image(image, format))
+        return images
+    finally:
+        pdf.close()
+
+
+class PageProcessPool:
+    """Process pool (spawn) dùng chung cho việc CPU-bound: xử lý PDF theo trang, render template (docx_render)"""
+
+    def __init__(self, max_workers: int):
+        self.max_workers = max(1, max_workers)
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def get(self) -> ProcessPoolExecutor:
+        # Gọi từ event loop lẫn asyncio.to_thread() → lock để không tạo 2 pool
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker
+                )
+            return self._pool
+
+    def discard(self, pool: ProcessPoolExecutor) -> None:
+        """Bỏ pool đã hỏng (chỉ khi chưa bị thread khác thay) → get() kế tiếp tạo pool mới"""
+        with self._lock:
+            if self._pool is not pool:
+                return
+            self._pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+        logger.error("💥 Page process pool broken (worker process died) - recreating on next use")
+
+    @contextmanager
+    def acquire(self) -> Iterator[ProcessPoolExecutor]:
+        """
+        Dùng pool cho 1 lượt submit/result
+
+        BrokenProcessPool (lúc submit hoặc lúc lấy result) → discard + HTTP 503
+        """
+        pool = self.get()
+        try:
+            yield pool
+        except BrokenProcessPool as e:
+            self.discard(pool)
+            raise HTTPException(503, "Document worker crashed - please retry") from e
+
+    async def run(self, func: Callable, *args) -> Any:
+        """Chạy 1 task trên pool (không block event loop)"""
+        with self.acquire() as pool:
+            return await asyncio.get_running_loop().run_in_executor(pool, func, *args)
+
+
+_page_pool: Optional[PageProcessPool] = None
+
+
+def get_page_pool() -> PageProcessPool:
+    """Get shared page process pool (PAGE_WORKERS, 0 = số CPU)"""
+    global _page_pool
+    if _page_pool is None:
+        _page_pool = PageProcessPool(settings.PAGE_WORKERS or os.cpu_count() or 1)
+    return _page_pool
+
+
+async def render_page(pdf_path: Union[str, Path], page_index: int, dpi: int, format: str = "png") -> bytes:
+    """Render 1 trang trên page process pool (không block event loop)"""
+    if format == "png":
+        return await get_page_pool().run(render_page_png, str(pdf_path), page_index, dpi)
+    images = await get_page_pool().run(render_page_images, str(pdf_path), [page_index], dpi, format)
+    return images[0]
+
+
+def render_page_thumbnail(pdf_path: str, page_index: int, width: int, format: str) -> bytes:
+    """[Worker process] Render 1 trang theo chiều rộng pixel (đã tính /Rotate) → bytes ảnh"""
+    import pypdfium2 as pdfium
+
+    pdf = pdfium.PdfDocument(pdf_path)
+    try:
+        page = pdf[page_index]
+        try:
+            width_pt, height_pt = page.get_size()
+            image = page.render(scale=_capped_scale(width_pt, height_pt, width / width_pt)).to_pil()
+        finally:
+            page.close()
+    finally:
+        pdf.close()
+    return _encode_image(image, format)
+
+
+async def iter_page_images(
+    pdf_path: Union[str, Path],
+    format: str = "png",
+    dpi: int = 200,
+    page_indices: Optional[Sequence[int]] = None
+) -> AsyncIterator[Tuple[int, bytes]]:
+    """
+    Render PDF → ảnh trên page process pool, yield (page_index, bytes) theo thứ tự trang
+
+    - Mỗi task render tối đa MAX_PAGES_PER_RENDER_TASK trang với 1 document handle
+      (worker tự mở PDF, process chính không giữ raster nào)
+    - Chỉ (số worker x PAGES_IN_FLIGHT_PER_WORKER) task đang chạy / chờ lấy cùng lúc
+      → 300 trang vẫn chỉ giữ vài chục ảnh đã encode trong RAM
+    - Caller dừng giữa chừng (client ngắt kết nối) → các task chưa chạy bị hủy
+    """
+    if format.lower() not in IMAGE_FORMATS:
+        raise ValueError(f"Unsupported image format: {format}")
+
+    pdf_path = str(pdf_path)
+    if page_indices is None:
+        page_indices = range(await asyncio.to_thread(count_pages, pdf_path))
+    page_indices = list(page_indices)
+    if not page_indices:
+        return
+
+    page_pool = get_page_pool()
+    window = page_pool.max_workers * PAGES_IN_FLIGHT_PER_WORKER
+    # Đủ task để mọi worker luôn có việc, gộp trang khi PDF dài (ít lần mở document)
+    per_task = max(1, min(MAX_PAGES_PER_RENDER_TASK, len(page_indices) // (window * 2)))
+    tasks = [page_indices[i:i + per_task] for i in range(0, len(page_indices), per_task)]
+
+    loop = asyncio.get_running_loop()
+    pending = deque()
+    next_task = 0
+    with page_pool.acquire() as pool:
+        try:
+            while next_task < len(tasks) or pending:
+                while next_task < len(tasks) and len(pending) < window:
+                    indices = tasks[next_task]
+                    future = loop.run_in_executor(pool, render_page_images, pdf_path, indices, dpi, format)
+                    pending.append((indices, future))
+                    next_task += 1
+
+                indices, future = pending.popleft()
+                for page_index, image_bytes in zip(indices, await future):
+                    yield page_index, image_bytes
+        finally:
+            for _, future in pending:
+                future.cancel()
+
+
+def count_pages(pdf_path: Union[str, Path]) -> int:
+    """Số trang PDF (pypdfium2, không parse nội dung trang)"""
+    import pypdfium2 as pdfium
+
+    pdf = pdfium.PdfDocument(str(pdf_path))
+    try:
+        return len(pdf)
+    finally:
+        pdf.close()
+
+
+@dataclass
+class PageClassification:
+    """Kết quả phân loại 1 trang PDF (text layer hay scan)"""
+    page_index: int
+    text: str
+    char_count: int
+    image_coverage: float  # Tỉ lệ diện tích trang bị ảnh phủ (0..1)
+    scanned: bool
+
+
+def classify_pdf_pages(
+    pdf_path: Union[str, Path],
+    min_text_chars: Optional[int] = None,
+    min_image_coverage: Optional[float] = None
+) -> List[PageClassification]:
+    """
+    Phân loại TỪNG trang: scan (cần OCR) hay có text layer (trích xuất trực tiếp)
+
+    Trang scan = ít text (< min_text_chars) VÀ ảnh phủ >= min_image_coverage.
+    Trang trắng / vẽ vector không có ảnh → coi là text (không có gì để OCR).
+
+    Blocking - gọi qua asyncio.to_thread() từ code async.
+    """
+    import pypdfium2 as pdfium
+    import pypdfium2.raw as pdfium_c
+
+    if min_text_chars is None:
+        min_text_chars = settings.OCR_PAGE_MIN_TEXT_CHARS
+    if min_image_coverage is None:
+        min_image_coverage = settings.OCR_PAGE_MIN_IMAGE_COVERAGE
+
+    pages = []
+    pdf = pdfium.PdfDocument(str(pdf_path))
+    try:
+        for page_index in range(len(pdf)):
+            page = pdf[page_index]
+            textpage = page.get_textpage()
+            text = textpage.get_text_range().replace("\r\n", "\n").strip()
+            textpage.close()
+
+            width_pt, height_pt = page.get_size()
+            image_area = 0.0
+            for obj in page.get_objects(filter=[pdfium_c.FPDF_PAGEOBJ_IMAGE]):
+                left, bottom, right, top = obj.get_pos()
+                image_area += max(0.0, right - left) * max(0.0, top - bottom)
+            page.close()
+
+            page_area = width_pt * height_pt
+            coverage = min(1.0, image_area / page_area) if page_area else 0.0
+            char_count = len(text)
+
+            pages.append(PageClassification(
+                page_index=page_index,
+                text=text,
+                char_count=char_count,
+                image_coverage=round(coverage, 3),
+                scanned=char_count < min_text_chars and coverage >= min_image_coverage
+            ))
+    finally:
+        pdf.close()
+
+    scanned = sum(1 for page in pages if page.scanned)
+    logger.info(f"📑 Page classification: {scanned}/{len(pages)} scanned pages")
+    return pages
+
+
+def ocr_pdf_to_searchable_pdf(
+    input_path: Union[str, Path],
+    output_path: Union[str, Path],
+    lang: str,
+    dpi: Optional[int] = None,
+    on_page: Optional[Callable[[int, int], None]] = None
+) -> int:
+    """
+    OCR PDF scan → PDF có text layer (ảnh trang + text ẩn để search)
+
+    Blocking - gọi qua asyncio.to_thread() từ code async.
+
+    Args:
+        input_path: PDF scan
+        output_path: PDF output
+        lang: Tesseract language (vie, eng, ...)
+        dpi: Độ phân giải render (mặc định TESSERACT_OCR_DPI)
+        on_page: Callback(trang_đã_xong, tổng_số_trang)
+
+    Returns:
+        Số trang đã OCR
+    """
+    from reportlab.pdfgen import canvas
+    from reportlab.lib.utils import ImageReader
+
+    dpi = dpi or settings.TESSERACT_OCR_DPI
+    input_path = str(input_path)
+
+    total_pages = count_pages(input_path)
+
+    page_pool = get_page_pool()
+    window = page_pool.max_workers * PAGES_IN_FLIGHT_PER_WORKER
+    logger.info(f"🔍 Tesseract OCR: {total_pages} pages @ {dpi}dpi, {page_pool.max_workers} workers")
+
+    c = canvas.Canvas(str(output_path))
+    pending = deque()
+    next_page = 0
+    with page_pool.acquire() as pool:
+        try:
+            while next_page < total_pages or pending:
+                # Giữ tối đa `window` trang đang xử lý
+                while next_page < total_pages and len(pending) < window:
+                    pending.append(pool.submit(ocr_page, input_path, next_page, dpi, lang))
+                    next_page += 1
+
+                # Ghi theo thứ tự trang (các trang sau vẫn tiếp tục OCR song song)
+                page = pending.popleft().result()
+
+                c.setPageSize((page["width"], page["height"]))
+                c.drawImage(
+                    ImageReader(io.BytesIO(page["image"])),
+                    0, 0, width=page["width"], height=page["height"]
+                )
+
+                # Add invisible text layer (for searchability)
+                c.setFillColorRGB(1, 1, 1, alpha=0.01)  # Almost invisible
+                c.setFont("Helvetica", 8)
+                text_object = c.beginText(10, page["height"] - 20)
+                for line in page["text"].split('\n'):
+                    text_object.textLine(line)
+                c.drawText(text_object)
+                c.showPage()
+
+                done = page["page_index"] + 1
+                if on_page:
+                    on_page(done, total_pages)
+                if done % 10 == 0 or done == total_pages:
+                    logger.info(f"  OCR progress: {done}/{total_pages} pages")
+        finally:
+            for future in pending:
+                future.cancel()
+
+    c.save()
+    return total_pages
@@ -0,0 +1,189 @@
+"""
+PDF Chunks - Cắt PDF lớn thành các đoạn N trang để gọi Gemini song song
+
+Usage:
+    from app.services.pdf_chunks import split_pdf_chunks, stitch_chunk_texts, run_chunks, remove_chunks
+
+    chunks = await asyncio.to_thread(split_pdf_chunks, input_file, chunk_pages=10)
+    try:
+        texts = await run_chunks(chunks, extract_one, concurrency=4)
+        text = stitch_chunk_texts(texts)
+    finally:
+        remove_chunks(chunks)
+
+Tại sao:
+- 1 lần generate_content cho cả PDF 100+ trang → chạm max_output_tokens,
+  văn bản bị cắt cụt ở cuối
+- Toàn bộ latency nằm trên 1 request tuần tự
+- Mỗi chunk dùng key riêng (key pool xoay vòng) → throughput tăng theo số chunk
+
+Nối chunk:
+- Prompt mỗi chunk ghi rõ trang X-Y / tổng số trang (chunk_context_prompt)
+- Bảng kéo dài qua ranh giới chunk → nối liền, bỏ hàng tiêu đề bị lặp lại
+- Câu bị ngắt giữa 2 chunk (dòng sau bắt đầu bằng chữ thường) → nối lại
+"""
+import asyncio
+import logging
+import shutil
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Awaitable, Callable, List, Optional, TypeVar, Union
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+TABLE_HEADER_TAG = "[TABLE_HEADER]"
+# Dòng kết thúc bằng các ký tự này → đoạn văn đã trọn vẹn
+SENTENCE_END = (".", "!", "?", ":", ";", "…", ")", "\"", "”")
+
+
+@dataclass
+class PdfChunk:
+    """1 đoạn trang của PDF gốc (start_page/end_page tính từ 1)"""
+    index: int
+    path: Path
+    start_page: int
+    end_page: int
+    total_pages: int
+
+    @property
+    def page_count(self) -> int:
+        return self.end_page - self.start_page + 1
+
+
+def split_pdf_chunks(
+    input_file: Union[str, Path],
+    chunk_pages: int,
+    out_dir: Optional[Path] = None
+) -> List[PdfChunk]:
+    """
+    Cắt PDF thành các file chunk_pages trang (pypdf, không render)
+
+    Blocking - gọi qua asyncio.to_thread() từ code async.
+    """
+    from pypdf import PdfReader, PdfWriter
+
+    chunk_pages = max(1, chunk_pages)
+    out_dir = Path(out_dir or tempfile.mkdtemp(prefix="pdf_chunks_", dir=settings.TEMP_DIR))
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    reader = PdfReader(str(input_file))
+    total_pages = len(reader.pages)
+    stem = Path(input_file).stem
+
+    chunks = []
+    for index, start in enumerate(range(0, total_pages, chunk_pages)):
+        end = min(start + chunk_pages, total_pages)
+        writer = PdfWriter()
+        for page_index in range(start, end):
+            writer.add_page(reader.pages[page_index])
+
+        path = out_dir / f"{stem}_p{start + 1}-{end}.pdf"
+        with open(path, "wb") as f:
+            writer.write(f)
+        chunks.append(PdfChunk(index, path, start + 1, end, total_pages))
+
+    logger.info(f"✂️ Split {total_pages} pages into {len(chunks)} chunks of ≤{chunk_pages} pages")
+    return chunks
+
+
+def remove_chunks(chunks: List[PdfChunk]) -> None:
+    """Xóa thư mục chứa các file chunk"""
+    for chunk_dir in {chunk.path.parent for chunk in chunks}:
+        shutil.rmtree(chunk_dir, ignore_errors=True)
+
+
+def chunk_context_prompt(chunk: PdfChunk) -> str:
+    """Ghi chú thêm vào prompt để model biết đây là 1 phần của tài liệu lớn"""
+    return (
+        f"\n\nLƯU Ý: File này là trang {chunk.start_page}-{chunk.end_page} "
+        f"của một tài liệu {chunk.total_pages} trang (phần {chunk.index + 1}).\n"
+        "- Nếu trang đầu bắt đầu giữa câu hoặc giữa bảng → trích xuất tiếp, KHÔNG thêm tiêu đề\n"
+        "- Bảng tiếp nối từ trang trước → KHÔNG lặp lại hàng tiêu đề nếu PDF không lặp lại\n"
+        "- KHÔNG thêm lời mở đầu/kết thúc cho phần này\n"
+    )
+
+
+def _is_table_row(line: str) -> bool:
+    return line.count("|") >= 1 and len([c for c in line.split("|") if c.strip()]) >= 2
+
+
+def _normalize_row(line: str) -> str:
+    return "|".join(cell.strip() for cell in line.replace(TABLE_HEADER_TAG, "").split("|")).strip("|")
+
+
+def _last_table_header(lines: List[str]) -> Optional[str]:
+    """Hàng tiêu đề của bảng đang mở ở cuối đoạn (None nếu đoạn không kết thúc bằng bảng)"""
+    for line in reversed(lines):
+        if not _is_table_row(line):
+            return None
+        if TABLE_HEADER_TAG in line:
+            return _normalize_row(line)
+    return None
+
+
+def stitch_chunk_texts(texts: List[str]) -> str:
+    """
+    Nối text các chunk theo thứ tự, giữ liền mạch qua ranh giới chunk
+
+    - Bảng: chunk trước kết thúc bằng hàng bảng + chunk sau bắt đầu bằng hàng
+      bảng → nối bằng 1 newline (vẫn là 1 bảng), bỏ header trùng
+    - Câu bị ngắt: dòng cuối chưa có dấu kết câu + dòng đầu chữ thường → nối bằng space
+    - Còn lại: ngăn cách bằng 1 dòng trống như giữa các đoạn văn
+    """
+    result = ""
+    for text in texts:
+        text = (text or "").strip()
+        if not text:
+            continue
+        if not result:
+            result = text
+            continue
+
+        prev_lines = result.split("\n")
+        next_lines = text.split("\n")
+        prev_last = prev_lines[-1].strip()
+        next_first = next_lines[0].strip()
+
+        if _is_table_row(prev_last) and _is_table_row(next_first):
+            header = _last_table_header(prev_lines)
+            if header and TABLE_HEADER_TAG in next_first and _normalize_row(next_first) == header:
+                next_lines = next_lines[1:]
+            result += "\n" + "\n".join(next_lines)
+        elif prev_last and not prev_last.endswith(SENTENCE_END) and next_first[:1].islower():
+            result += " " + text
+        else:
+            result += "\n\n" + text
+
+    return result
+
+
+async def run_chunks(
+    chunks: List[PdfChunk],
+    worker: Callable[[PdfChunk], Awaitable[T]],
+    concurrency: Optional[int] = None
+) -> List[T]:
+    """
+    Chạy worker cho mọi chunk song song (tối đa `concurrency`), trả kết quả theo thứ tự chunk
+
+    Raises:
+        Lỗi của chunk đầu tiên thất bại (các chunk còn lại bị hủy)
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency or settings.GEMINI_CHUNK_CONCURRENCY))
+
+    async def run_one(chunk: PdfChunk) -> T:
+        async with semaphore:
+            logger.info(f"   🧩 Chunk {chunk.index + 1}/{len(chunks)}: pages {chunk.start_page}-{chunk.end_page}")
+            return await worker(chunk)
+
+    tasks = [asyncio.create_task(run_one(chunk)) for chunk in chunks]
+    try:
+        return await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
@@ -0,0 +1,551 @@
+"""
+PDF Compress - Nén ảnh nhúng trong PDF (downsample + JPEG / CCITT G4) trên process pool
+
+Usage:
+    from app.services.pdf_compress import compress_pdf_images
+
+    reader = pypdf.PdfReader(f)
+    stats = compress_pdf_images(reader.pages, quality="medium")   # sửa ảnh ngay trong reader
+    stats = compress_pdf_images(reader.pages, target_size=2_000_000, base_size=file_size)
+    # → rồi copy trang sang PdfWriter như bình thường (pdf_pipeline.py)
+
+Tại sao:
+- compress_content_streams chỉ nén content stream (text/vector) → PDF scan
+  (gần như toàn ảnh) hầu như không nhỏ đi, user phải dùng Adobe (tính phí)
+
+Cách làm:
+- Tìm image XObject trên mọi trang (kể cả trong Form XObject), tính DPI hiển thị
+  thật từ ma trận CTM trong content stream
+- Ảnh giống hệt nhau (cùng bytes + tham số) → giữ 1 object, các trang trỏ chung
+- Worker (page_workers pool): decode → downsample về DPI mục tiêu → encode
+  + Ảnh màu / xám: JPEG
+  + Ảnh 1-bit, scan văn bản xám gần như đen/trắng (quality=low): CCITT G4
+- Ảnh mới không nhỏ hơn đáng kể → giữ nguyên ảnh gốc
+
+Target size:
+- Thử lần lượt TARGET_SIZE_LADDER (nhẹ → mạnh) tới khi ước lượng dung lượng
+  file ≤ target; chỉ encode lại ảnh, KHÔNG parse / ghi lại PDF mỗi lần
+
+Không xử lý (giữ nguyên): ảnh có SMask/Mask/Decode, ImageMask, Indexed/CMYK,
+JPX/JBIG2/CCITT sẵn có, ảnh nhỏ hơn MIN_IMAGE_BYTES.
+"""
+import hashlib
+import io
+import logging
+import math
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.services.page_workers import PAGES_IN_FLIGHT_PER_WORKER, get_page_pool
+
+logger = logging.getLogger(__name__)
+
+# Ảnh nhỏ hơn → không đáng encode lại (icon, logo)
+MIN_IMAGE_BYTES = 8 * 1024
+# Ảnh mới phải nhỏ hơn ít nhất 10% mới thay
+MIN_SAVING_RATIO = 0.9
+# Chỉ downsample khi DPI hiện tại vượt DPI mục tiêu > 10%
+DOWNSAMPLE_TOLERANCE = 1.1
+# Scan xám: tỉ lệ pixel gần đen/trắng để coi là văn bản đen trắng (→ 1-bit)
+BILEVEL_PIXEL_RATIO = 0.97
+MAX_FORM_DEPTH = 5
+
+# Filter decode được trong worker (tên viết tắt → tên đầy đủ); DCTDecode chỉ được ở cuối
+FILTER_NAMES = {
+    "/ASCII85Decode": "/ASCII85Decode", "/A85": "/ASCII85Decode",
+    "/ASCIIHexDecode": "/ASCIIHexDecode", "/AHx": "/ASCIIHexDecode",
+    "/FlateDecode": "/FlateDecode", "/Fl": "/FlateDecode",
+    "/DCTDecode": "/DCTDecode", "/DCT": "/DCTDecode",
+}
+
+
+@dataclass(frozen=True)
+class ImagePreset:
+    dpi: int  # DPI mục tiêu cho ảnh màu / xám
+    jpeg_quality: int
+    bilevel_dpi: int  # DPI mục tiêu cho ảnh 1-bit
+    to_bilevel: bool  # Scan xám gần như đen/trắng → 1-bit G4
+
+
+PRESETS = {
+    "high": ImagePreset(dpi=200, jpeg_quality=80, bilevel_dpi=300, to_bilevel=False),
+    "medium": ImagePreset(dpi=150, jpeg_quality=65, bilevel_dpi=300, to_bilevel=False),
+    "low": ImagePreset(dpi=110, jpeg_quality=50, bilevel_dpi=200, to_bilevel=True),
+}
+
+# Target size: nhẹ → mạnh
+TARGET_SIZE_LADDER = [
+    PRESETS["high"],
+    PRESETS["medium"],
+    ImagePreset(dpi=130, jpeg_quality=55, bilevel_dpi=300, to_bilevel=True),
+    PRESETS["low"],
+    ImagePreset(dpi=90, jpeg_quality=40, bilevel_dpi=150, to_bilevel=True),
+    ImagePreset(dpi=72, jpeg_quality=30, bilevel_dpi=150, to_bilevel=True),
+]
+
+
+@dataclass(frozen=True)
+class ImageJob:
+    """Dữ liệu 1 ảnh gửi sang worker (picklable, không chứa object pypdf)"""
+    data: bytes
+    filters: Tuple[str, ...]
+    decode_parms: Tuple[Optional[Dict[str, int]], ...]
+    width: int
+    height: int
+    bits: int
+    components: int
+    effective_dpi: float
+
+
+@dataclass(frozen=True)
+class EncodedImage:
+    data: bytes
+    filter: str
+    decode_parms: Optional[Dict[str, Any]]
+    width: int
+    height: int
+    bits: int
+
+
+@dataclass
+class ImageCompressionStats:
+    images: int = 0
+    duplicates_removed: int = 0
+    recompressed: int = 0
+    bytes_before: int = 0
+    bytes_after: int = 0
+    preset: Optional[ImagePreset] = None
+    estimated_size: Optional[int] = None
+
+
+# ========== WORKER ==========
+
+@contextmanager
+def _single_tiff_strip():
+    """G4 phải nằm trong 1 strip (PDF cần 1 stream CCITT liền)"""
+    from PIL import TiffImagePlugin
+
+    original = TiffImagePlugin.STRIP_SIZE
+    TiffImagePlugin.STRIP_SIZE = 2 ** 31
+    try:
+        yield
+    finally:
+        TiffImagePlugin.STRIP_SIZE = original
+
+
+def _decode(job: ImageJob, target_size: Tuple[int, int]):
+    from PIL import Image
+    from pypdf.filters import ASCII85Decode, ASCIIHexDecode, FlateDecode
+    from pypdf.generic import DictionaryObject, NameObject, NumberObject
+
+    data = job.data
+    for name, parms in zip(job.filters, job.decode_parms):
+        if name == "/DCTDecode":
+            image = Image.open(io.BytesIO(data))
+            # Decode JPEG ở độ phân giải thấp hơn luôn (DCT scaling) khi sẽ downsample
+            image.draft(image.mode, target_size)
+            return image
+        if name == "/ASCII85Decode":
+            data = ASCII85Decode.decode(data)
+        elif name == "/ASCIIHexDecode":
+            data = ASCIIHexDecode.decode(data)
+        else:
+            pdf_parms = DictionaryObject(
+                {NameObject(key): NumberObject(value) for key, value in (parms or {}).items()}
+            )
+            data = FlateDecode.decode(data, pdf_parms)
+
+    mode = "1" if job.bits == 1 else ("L" if job.components == 1 else "RGB")
+    return Image.frombytes(mode, (job.width, job.height), data)
+
+
+def _is_bilevel_scan(image) -> bool:
+    histogram = image.histogram()
+    total = sum(histogram) or 1
+    return (sum(histogram[:64]) + sum(histogram[192:])) / total >= BILEVEL_PIXEL_RATIO
+
+
+def _encode_g4(image) -> Optional[EncodedImage]:
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    with _single_tiff_strip():
+        image.save(buffer, format="TIFF", compression="group4")
+    tiff = Image.open(io.BytesIO(buffer.getvalue()))
+    offsets, counts = tiff.tag_v2.get(273), tiff.tag_v2.get(279)
+    if not offsets or len(offsets) != 1:
+        return None
+    width, height = image.size
+    return EncodedImage(
+        data=buffer.getvalue()[offsets[0]:offsets[0] + counts[0]],
+        filter="/CCITTFaxDecode",
+        # Pillow ghi ảnh "1" với PhotometricInterpretation = MinIsBlack
+        decode_parms={"/K": -1, "/Columns": width, "/Rows": height, "/BlackIs1": True},
+        width=width,
+        height=height,
+        bits=1,
+    )
+
+
+def _target_size(job: ImageJob, target_dpi: int) -> Tuple[int, int]:
+    """Kích thước pixel sau downsample (giữ nguyên nếu DPI không vượt mục tiêu)"""
+    scale = 1.0
+    if job.effective_dpi > target_dpi * DOWNSAMPLE_TOLERANCE:
+        scale = target_dpi / job.effective_dpi
+    return max(1, round(job.width * scale)), max(1, round(job.height * scale))
+
+
+def recompress_image(job: ImageJob, preset: ImagePreset) -> Optional[EncodedImage]:
+    """
+    [Worker process] Decode → downsample → JPEG / G4
+
+    Returns:
+        None nếu không encode được hoặc không nhỏ hơn đáng kể
+    """
+    from PIL import Image, features
+
+    bilevel = job.bits == 1
+    size = _target_size(job, preset.bilevel_dpi if bilevel else preset.dpi)
+    # Scan xám có thể thành 1-bit (DPI cao hơn) → decode đủ lớn cho trường hợp đó
+    may_be_bilevel = not bilevel and job.components == 1 and preset.to_bilevel
+
+    try:
+        image = _decode(job, _target_size(job, preset.bilevel_dpi) if may_be_bilevel else size)
+        if image.mode not in ("1", "L", "RGB"):
+            return None
+
+        if may_be_bilevel and image.mode == "L" and _is_bilevel_scan(image):
+            bilevel = True
+            size = _target_size(job, preset.bilevel_dpi)
+
+        if image.size != size:
+            source = image.convert("L") if image.mode == "1" else image
+            image = source.resize(size, Image.LANCZOS)
+
+        if bilevel:
+            if image.mode != "1":
+                image = image.point(lambda value: 255 if value >= 128 else 0, mode="1")
+            encoded = _encode_g4(image) if features.check("libtiff") else None
+            if encoded is None:
+                return None
+        else:
+            buffer = io.BytesIO()
+            image.save(buffer, format="JPEG", quality=preset.jpeg_quality, optimize=True)
+            encoded = EncodedImage(
+                data=buffer.getvalue(),
+                filter="/DCTDecode",
+                decode_parms=None,
+                width=image.width,
+                height=image.height,
+                bits=8,
+            )
+    except Exception as e:
+        logger.debug(f"Image recompress skipped: {e}")
+        return None
+
+    if len(encoded.data) >= len(job.data) * MIN_SAVING_RATIO:
+        return None
+    return encoded
+
+
+# ========== THU THẬP ẢNH (process chính) ==========
+
+def _multiply(m: Tuple[float, ...], n: Tuple[float, ...]) -> Tuple[float, ...]:
+    return (
+        m[0] * n[0] + m[1] * n[2],
+        m[0] * n[1] + m[1] * n[3],
+        m[2] * n[0] + m[3] * n[2],
+        m[2] * n[1] + m[3] * n[3],
+        m[4] * n[0] + m[5] * n[2] + n[4],
+        m[4] * n[1] + m[5] * n[3] + n[5],
+    )
+
+
+@dataclass
+class _PdfImage:
+    """1 image XObject duy nhất (theo idnum) + kích thước hiển thị lớn nhất (points)"""
+    obj: Any
+    ref: Any  # IndirectObject (None nếu ảnh là direct object)
+    width: int
+    height: int
+    fallback_size: Tuple[float, float]  # Kích thước trang chứa ảnh
+    display_width: float = 0.0
+    display_height: float = 0.0
+
+    def effective_dpi(self) -> float:
+        width_pt, height_pt = (
+            (self.display_width, self.display_height) if self.display_width > 0 and self.display_height > 0
+            else self.fallback_size
+        )
+        if width_pt <= 0 or height_pt <= 0:
+            return 0.0
+        return min(self.width * 72.0 / width_pt, self.height * 72.0 / height_pt)
+
+
+def _name_list(value) -> Tuple[Any, ...]:
+    if value is None:
+        return ()
+    value = value.get_object()
+    return tuple(item.get_object() for item in value) if isinstance(value, list) else (value,)
+
+
+def _image_job_fields(obj) -> Optional[Dict[str, Any]]:
+    """Tham số decode nếu ảnh thuộc loại hỗ trợ, None = bỏ qua"""
+    if obj.get("/ImageMask") or "/SMask" in obj or "/Mask" in obj or "/Decode" in obj:
+        return None
+
+    names = [str(name) for name in _name_list(obj.get("/Filter"))]
+    if any(name not in FILTER_NAMES for name in names):
+        return None
+    filters = tuple(FILTER_NAMES[name] for name in names)
+    if "/DCTDecode" in filters[:-1]:
+        return None
+
+    bits = int(obj.get("/BitsPerComponent", 8))
+    color_space = obj.get("/ColorSpace")
+    color_space = color_space.get_object() if color_space is not None else None
+    if color_space == "/DeviceGray":
+        components = 1
+    elif color_space == "/DeviceRGB":
+        components = 3
+    elif isinstance(color_space, list) and color_space and color_space[0] == "/ICCBased":
+        components = int(color_space[1].get_object().get("/N", 0))
+    else:
+        return None
+
+    if components not in (1, 3) or bits not in (1, 8) or (bits == 1 and components != 1):
+        return None
+
+    parms_list = list(_name_list(obj.get("/DecodeParms")))
+    parms_list += [None] * (len(filters) - len(parms_list))
+    decode_parms = []
+    for parms in parms_list[:len(filters)]:
+        if parms is None or not hasattr(parms, "items"):
+            decode_parms.append(None)
+        else:
+            decode_parms.append({str(key): int(value) for key, value in parms.items() if isinstance(value, int)})
+
+    return {
+        "filters": filters,
+        "decode_parms": tuple(decode_parms),
+        "bits": bits,
+        "components": components,
+    }
+
+
+class _ImageCollector:
+    """Đi qua content stream của trang, ghi nhận ảnh + kích thước hiển thị"""
+
+    def __init__(self):
+        self.images: Dict[int, _PdfImage] = {}  # idnum → ảnh (object trùng trỏ về ảnh gốc)
+        self.duplicates_removed = 0
+        self.duplicate_bytes = 0
+        self._by_hash: Dict[str, _PdfImage] = {}
+        self._visited_forms: set = set()
+
+    def collect(self, pages) -> List[_PdfImage]:
+        for page in pages:
+            resources = page.get("/Resources")
+            if resources is None or not self._has_images(resources.get_object(), 0):
+                continue
+            page_size = (float(page.mediabox.width), float(page.mediabox.height))
+            self._walk(page.get_contents(), resources.get_object(), (1, 0, 0, 1, 0, 0), page_size, 0, page.pdf)
+        return list({id(image): image for image in self.images.values()}.values())
+
+    def _has_images(self, resources, depth: int) -> bool:
+        xobjects = resources.get("/XObject")
+        if xobjects is None or depth > MAX_FORM_DEPTH:
+            return False
+        for ref in xobjects.get_object().values():
+            obj = ref.get_object()
+            subtype = obj.get("/Subtype")
+            if subtype == "/Image":
+                return True
+            if subtype == "/Form" and "/Resources" in obj and self._has_images(obj["/Resources"].get_object(), depth + 1):
+                return True
+        return False
+
+    def _register(self, xobjects, name: str, ref, page_size) -> Optional[_PdfImage]:
+        obj = ref.get_object()
+        key = getattr(ref, "idnum", None) or id(obj)
+        image = self.images.get(key)
+        if image is not None:
+            return image
+
+        raw = obj._data
+        digest = hashlib.sha256(
+            raw + repr(sorted((str(k), repr(v)) for k, v in obj.items() if k != "/Length")).encode()
+        ).hexdigest()
+        original = self._by_hash.get(digest)
+        if original is not None and original.ref is not None and hasattr(ref, "idnum"):
+            # Cùng nội dung, khác object → trỏ về object đã có (object trùng không được copy)
+            xobjects[name] = original.ref
+            self.duplicates_removed += 1
+            self.duplicate_bytes += len(raw)
+            self.images[key] = original
+            return original
+
+        image = _PdfImage(
+            obj=obj,
+            ref=ref if hasattr(ref, "idnum") else None,
+            width=int(obj.get("/Width", 0)),
+            height=int(obj.get("/Height", 0)),
+            fallback_size=page_size,
+        )
+        self._by_hash[digest] = image
+        self.images[key] = image
+        return image
+
+    def _walk(self, contents, resources, ctm, page_size, depth: int, pdf) -> None:
+        from pypdf.generic import ContentStream
+
+        if contents is None:
+            return
+        xobjects = resources.get("/XObject")
+        xobjects = xobjects.get_object() if xobjects is not None else {}
+        if not isinstance(contents, ContentStream):
+            contents = ContentStream(contents, pdf)
+
+        stack = []
+        for operands, operator in contents.operations:
+            if operator == b"q":
+                stack.append(ctm)
+            elif operator == b"Q":
+                ctm = stack.pop() if stack else ctm
+            elif operator == b"cm" and len(operands) == 6:
+                ctm = _multiply(tuple(float(value) for value in operands), ctm)
+            elif operator == b"Do" and operands:
+                name = operands[0]
+                ref = xobjects.get(name)
+                if ref is None:
+                    continue
+                obj = ref.get_object()
+                subtype = obj.get("/Subtype")
+                if subtype == "/Image":
+                    image = self._register(xobjects, name, ref, page_size)
+                    image.display_width = max(image.display_width, math.hypot(ctm[0], ctm[1]))
+                    image.display_height = max(image.display_height, math.hypot(ctm[2], ctm[3]))
+                elif subtype == "/Form" and depth < MAX_FORM_DEPTH:
+                    form_key = (getattr(ref, "idnum", id(obj)), ctm)
+                    if form_key in self._visited_forms:
+                        continue
+                    self._visited_forms.add(form_key)
+                    matrix = tuple(float(value) for value in obj.get("/Matrix", (1, 0, 0, 1, 0, 0)))
+                    form_resources = obj.get("/Resources")
+                    self._walk(
+                        ContentStream(obj, pdf),
+                        form_resources.get_object() if form_resources is not None else resources,
+                        _multiply(matrix, ctm), page_size, depth + 1, pdf
+                    )
+
+
+# ========== ENCODE + ÁP DỤNG ==========
+
+def _encode_all(jobs: List[ImageJob], preset: ImagePreset) -> List[Optional[EncodedImage]]:
+    """Encode trên page process pool, tối đa `window` ảnh đang xử lý (giới hạn RAM)"""
+    page_pool = get_page_pool()
+    window = page_pool.max_workers * PAGES_IN_FLIGHT_PER_WORKER
+
+    results: List[Optional[EncodedImage]] = []
+    pending = deque()
+    next_job = 0
+    with page_pool.acquire() as pool:
+        try:
+            while next_job < len(jobs) or pending:
+                while next_job < len(jobs) and len(pending) < window:
+                    pending.append(pool.submit(recompress_image, jobs[next_job], preset))
+                    next_job += 1
+                results.append(pending.popleft().result())
+        finally:
+            for future in pending:
+                future.cancel()
+    return results
+
+
+def _apply(image: _PdfImage, encoded: EncodedImage) -> None:
+    from pypdf.generic import BooleanObject, DictionaryObject, NameObject, NumberObject
+
+    obj = image.obj
+    obj._data = encoded.data
+    if hasattr(obj, "decoded_self"):
+        obj.decoded_self = None
+    obj[NameObject("/Filter")] = NameObject(encoded.filter)
+    obj[NameObject("/Width")] = NumberObject(encoded.width)
+    obj[NameObject("/Height")] = NumberObject(encoded.height)
+    obj[NameObject("/BitsPerComponent")] = NumberObject(encoded.bits)
+    if encoded.bits == 1:
+        obj[NameObject("/ColorSpace")] = NameObject("/DeviceGray")
+    if encoded.decode_parms:
+        obj[NameObject("/DecodeParms")] = DictionaryObject({
+            NameObject(key): BooleanObject(value) if isinstance(value, bool) else NumberObject(value)
+            for key, value in encoded.decode_parms.items()
+        })
+    else:
+        obj.pop("/DecodeParms", None)
+
+
+def compress_pdf_images(
+    pages,
+    quality: str = "medium",
+    target_size: Optional[int] = None,
+    base_size: int = 0
+) -> ImageCompressionStats:
+    """
+    Nén ảnh của `pages` (PdfReader.pages), sửa trực tiếp image object
+
+    Gọi TRƯỚC khi copy trang sang PdfWriter (ảnh trùng đã bỏ sẽ không bị copy).
+    Blocking - gọi qua asyncio.to_thread() từ code async.
+
+    Args:
+        quality: low / medium / high (PRESETS), bỏ qua nếu có target_size
+        target_size: Dung lượng file mong muốn (bytes)
+        base_size: Dung lượng file gốc (bytes) - để ước lượng khi có target_size
+    """
+    collector = _ImageCollector()
+    images = collector.collect(pages)
+
+    stats = ImageCompressionStats(images=len(images), duplicates_removed=collector.duplicates_removed)
+
+    candidates: List[Tuple[_PdfImage, ImageJob]] = []
+    for image in images:
+        stats.bytes_before += len(image.obj._data)
+        params = _image_job_fields(image.obj)
+        if params is None or len(image.obj._data) < MIN_IMAGE_BYTES or image.width <= 0 or image.height <= 0:
+            continue
+        candidates.append((image, ImageJob(
+            data=image.obj._data,
+            width=image.width,
+            height=image.height,
+            effective_dpi=image.effective_dpi(),
+            **params
+        )))
+
+    presets = TARGET_SIZE_LADDER if target_size else [PRESETS.get(quality, PRESETS["medium"])]
+    jobs = [job for _, job in candidates]
+    results: List[Optional[EncodedImage]] = []
+    for preset in presets:
+        results = _encode_all(jobs, preset) if jobs else []
+        stats.preset = preset
+        saved = collector.duplicate_bytes + sum(
+            len(job.data) - len(result.data) for job, result in zip(jobs, results) if result is not None
+        )
+        stats.estimated_size = max(0, base_size - saved) if base_size else None
+        if not target_size or (stats.estimated_size is not None and stats.estimated_size <= target_size):
+            break
+
+    stats.bytes_after = stats.bytes_before
+    for (image, job), result in zip(candidates, results):
+        if result is None:
+            continue
+        _apply(image, result)
+        stats.recompressed += 1
+        stats.bytes_after -= len(job.data) - len(result.data)
+
+    logger.info(
+        f"🗜️ PDF images: {stats.recompressed}/{stats.images} recompressed, "
+        f"{stats.duplicates_removed} duplicates removed, "
+        f"{stats.bytes_before:,} → {stats.bytes_after:,} bytes (dpi {stats.preset.dpi if stats.preset else '-'})"
+    )
+    return stats
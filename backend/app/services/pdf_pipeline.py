@@ -0,0 +1,335 @@
+"""
+PDF Pipeline - Nhiều thao tác trang PDF trong 1 lần đọc → biến đổi → ghi
+
+Usage:
+    from app.services.pdf_pipeline import parse_pipeline, run_pdf_pipeline
+
+    operations = parse_pipeline([
+        {"op": "watermark", "text": "MẬT", "position": "center", "opacity": 0.3},
+        {"op": "page_numbers", "format": "Trang {page}/{total}"},
+        {"op": "rotate", "rotation": 90, "pages": [1, 3]},
+        {"op": "compress", "quality": "medium"},   # + "target_size_kb": 2048
+        {"op": "protect", "user_password": "1234"},
+    ])  # ValueError nếu sai
+
+    # Blocking - gọi qua asyncio.to_thread() từ code async
+    total_pages = run_pdf_pipeline(input_path, output_path, operations)
+
+Tại sao:
+- watermark / page numbers / rotate / compress / protect mỗi thao tác 1 lần
+  PdfReader + copy mọi trang sang PdfWriter + serialize cả file
+  → chuỗi N thao tác = N lần parse + N lần ghi (+ N lần upload/download)
+- add_page_numbers cũ: 1 canvas ReportLab + 1 PdfReader cho MỖI trang
+
+Pipeline:
+- Đọc 1 lần, mọi trang vào PdfWriter 1 lần, thao tác chạy lần lượt theo thứ tự
+  trên trang đã nằm trong writer, ghi file 1 lần
+- Watermark: overlay tạo 1 lần cho mỗi kích thước trang (không phải mỗi trang)
+- Số trang: 1 canvas nhiều trang → 1 PdfReader cho cả file
+- Overlay đặt theo kích thước/hướng hiển thị thật của trang (kể cả trang đã xoay)
+- compress: ảnh nhúng được downsample/nén lại 1 lần trước khi copy trang
+  (pdf_compress.py), content stream được nén tại đúng vị trí của bước
+- protect (mã hóa) chỉ được là bước cuối; compress nên đặt sau các bước stamp
+"""
+import io
+import logging
+import os
+from dataclasses import dataclass, fields
+from pathlib import Path
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple, Union
+
+from app.services.pdf_compress import compress_pdf_images
+
+logger = logging.getLogger(__name__)
+
+WATERMARK_POSITIONS = ("center", "top-left", "top-right", "bottom-left", "bottom-right")
+PAGE_NUMBER_POSITIONS = ("bottom-center", "bottom-right", "bottom-left", "top-center", "top-right", "top-left")
+
+# pypdf compress_content_streams level theo quality (như _compress_pdf_local cũ)
+COMPRESSION_LEVELS = {"low": 4, "medium": 2, "high": 0}
+
+# Khoảng cách từ mép trang (points)
+MARGIN_X = 50
+MARGIN_Y_WATERMARK = 50
+MARGIN_Y_PAGE_NUMBER = 30
+
+
+@dataclass(frozen=True)
+class WatermarkOp:
+    text: str
+    position: str = "center"
+    opacity: float = 0.3
+    font_size: int = 40
+
+    def validate(self) -> None:
+        if not self.text:
+            raise ValueError("watermark: text không được rỗng")
+        if self.position not in WATERMARK_POSITIONS:
+            raise ValueError(f"watermark: position phải là {', '.join(WATERMARK_POSITIONS)}")
+        if not 0.0 <= self.opacity <= 1.0:
+            raise ValueError("watermark: opacity phải trong khoảng 0.0 - 1.0")
+
+
+@dataclass(frozen=True)
+class PageNumbersOp:
+    position: str = "bottom-center"
+    format: str = "Page {page}"  # {page}, {total}
+    font_size: int = 10
+
+    def validate(self) -> None:
+        if self.position not in PAGE_NUMBER_POSITIONS:
+            raise ValueError(f"page_numbers: position phải là {', '.join(PAGE_NUMBER_POSITIONS)}")
+
+
+@dataclass(frozen=True)
+class RotateOp:
+    rotation: int = 90  # 90, 180, 270, -90
+    pages: Optional[FrozenSet[int]] = None  # Số trang (bắt đầu từ 1), None = tất cả
+
+    def validate(self) -> None:
+        if self.rotation not in (90, 180, 270, -90):
+            raise ValueError("rotate: rotation phải là 90, 180 hoặc 270")
+
+
+@dataclass(frozen=True)
+class CompressOp:
+    quality: str = "medium"  # low (nén mạnh), medium, high (giữ chất lượng)
+    images: bool = True  # Downsample + nén lại ảnh nhúng (pdf_compress.py)
+    target_size_kb: Optional[int] = None  # Nén ảnh tới khi file ≈ dung lượng này (bỏ qua quality cho ảnh)
+
+    def validate(self) -> None:
+        if self.quality not in COMPRESSION_LEVELS:
+            raise ValueError(f"compress: quality phải là {', '.join(COMPRESSION_LEVELS)}")
+        if self.target_size_kb is not None and self.target_size_kb <= 0:
+            raise ValueError("compress: target_size_kb phải > 0")
+
+
+@dataclass(frozen=True)
+class ProtectOp:
+    user_password: str
+    owner_password: Optional[str] = None
+
+    def validate(self) -> None:
+        if not self.user_password:
+            raise ValueError("protect: user_password không được rỗng")
+
+
+PipelineOp = Union[WatermarkOp, PageNumbersOp, RotateOp, CompressOp, ProtectOp]
+
+OPERATIONS: Dict[str, Any] = {
+    "watermark": WatermarkOp,
+    "page_numbers": PageNumbersOp,
+    "rotate": RotateOp,
+    "compress": CompressOp,
+    "protect": ProtectOp,
+}
+
+
+def parse_pipeline(raw: Any) -> List[PipelineOp]:
+    """
+    JSON list [{"op": "...", ...tham số}] → danh sách thao tác đã kiểm tra
+
+    Raises:
+        ValueError: Sai định dạng / tham số / thứ tự (protect không ở cuối)
+    """
+    if not isinstance(raw, list) or not raw:
+        raise ValueError("operations phải là danh sách (JSON array) không rỗng")
+
+    operations: List[PipelineOp] = []
+    for index, item in enumerate(raw, start=1):
+        if not isinstance(item, dict) or "op" not in item:
+            raise ValueError(f"Bước {index}: cần object có trường 'op'")
+
+        params = dict(item)
+        name = params.pop("op")
+        op_class = OPERATIONS.get(name)
+        if op_class is None:
+            raise ValueError(f"Bước {index}: op '{name}' không hỗ trợ (có: {', '.join(OPERATIONS)})")
+
+        allowed = {field.name for field in fields(op_class)}
+        unknown = set(params) - allowed
+        if unknown:
+            raise ValueError(f"Bước {index} ({name}): tham số không hợp lệ {', '.join(sorted(unknown))}")
+        try:
+            if op_class is RotateOp and params.get("pages") is not None:
+                params["pages"] = frozenset(int(page) for page in params["pages"])
+            operation = op_class(**params)
+            operation.validate()
+        except TypeError as e:
+            # Thiếu tham số bắt buộc / sai kiểu (VD: opacity là chuỗi)
+            raise ValueError(f"Bước {index} ({name}): {e}")
+        operations.append(operation)
+
+    if any(isinstance(operation, ProtectOp) for operation in operations[:-1]):
+        raise ValueError("protect phải là bước cuối cùng (file đã mã hóa không sửa tiếp được)")
+    return operations
+
+
+# ========== OVERLAY ==========
+
+def _display_size(page) -> Tuple[float, float]:
+    """Kích thước trang khi hiển thị (đã tính /Rotate)"""
+    width, height = float(page.mediabox.width), float(page.mediabox.height)
+    if page.rotation % 180 == 90:
+        return height, width
+    return width, height
+
+
+def _display_transformation(page):
+    """Ma trận đưa overlay (toạ độ hiển thị) về không gian trang (mediabox + /Rotate)"""
+    from pypdf import Transformation
+
+    width, height = float(page.mediabox.width), float(page.mediabox.height)
+    rotation = page.rotation % 360
+    ctm = Transformation()
+    if rotation == 90:
+        ctm = ctm.rotate(90).translate(width, 0)
+    elif rotation == 180:
+        ctm = ctm.rotate(180).translate(width, height)
+    elif rotation == 270:
+        ctm = ctm.rotate(270).translate(0, height)
+    return ctm.translate(float(page.mediabox.left), float(page.mediabox.bottom))
+
+
+def _merge_overlay(page, overlay_page) -> None:
+    page.merge_transformed_page(overlay_page, _display_transformation(page), over=True, expand=False)
+
+
+def _draw_anchored(
+    can, position: str, width: float, height: float, margin_y: float, font_size: int, text: str
+) -> None:
+    vertical, _, horizontal = position.partition("-")
+    if position == "center":
+        vertical, horizontal = "middle", "center"
+
+    if vertical == "top":
+        y = height - margin_y - font_size
+    elif vertical == "bottom":
+        y = margin_y
+    else:
+        y = height / 2
+
+    if horizontal == "left":
+        can.drawString(MARGIN_X, y, text)
+    elif horizontal == "right":
+        can.drawRightString(width - MARGIN_X, y, text)
+    else:
+        can.drawCentredString(width / 2, y, text)
+
+
+def _watermark_overlay(operation: WatermarkOp, width: float, height: float):
+    from pypdf import PdfReader
+    from reportlab.lib.colors import Color
+    from reportlab.pdfgen import canvas
+
+    packet = io.BytesIO()
+    can = canvas.Canvas(packet, pagesize=(width, height))
+    can.setFillColor(Color(0, 0, 0, alpha=operation.opacity))
+    can.setFont("Helvetica", operation.font_size)
+    _draw_anchored(can, operation.position, width, height, MARGIN_Y_WATERMARK, operation.font_size, operation.text)
+    can.save()
+    packet.seek(0)
+    return PdfReader(packet).pages[0]
+
+
+def _page_number_overlays(operation: PageNumbersOp, pages) -> List[Any]:
+    """1 canvas nhiều trang (mỗi trang đúng kích thước trang gốc) → 1 PdfReader"""
+    from pypdf import PdfReader
+    from reportlab.pdfgen import canvas
+
+    total = len(pages)
+    packet = io.BytesIO()
+    can = canvas.Canvas(packet)
+    for page_num, page in enumerate(pages, start=1):
+        width, height = _display_size(page)
+        can.setPageSize((width, height))
+        can.setFont("Helvetica", operation.font_size)
+        text = operation.format.replace("{page}", str(page_num)).replace("{total}", str(total))
+        _draw_anchored(can, operation.position, width, height, MARGIN_Y_PAGE_NUMBER, operation.font_size, text)
+        can.showPage()
+    can.save()
+    packet.seek(0)
+    return list(PdfReader(packet).pages)
+
+
+# ========== RUN ==========
+
+def _apply(operation: PipelineOp, writer) -> None:
+    pages = writer.pages
+
+    if isinstance(operation, WatermarkOp):
+        overlays: Dict[Tuple[float, float], Any] = {}
+        for page in pages:
+            size = _display_size(page)
+            if size not in overlays:
+                overlays[size] = _watermark_overlay(operation, *size)
+            _merge_overlay(page, overlays[size])
+        logger.debug(f"Watermark: {len(pages)} pages, {len(overlays)} overlay(s)")
+
+    elif isinstance(operation, PageNumbersOp):
+        for page, overlay in zip(pages, _page_number_overlays(operation, pages)):
+            _merge_overlay(page, overlay)
+
+    elif isinstance(operation, RotateOp):
+        for page_num, page in enumerate(pages, start=1):
+            if operation.pages is None or page_num in operation.pages:
+                page.rotate(operation.rotation)
+
+    elif isinstance(operation, CompressOp):
+        level = COMPRESSION_LEVELS[operation.quality]
+        for page in pages:
+            page.compress_content_streams(level=level)
+
+    elif isinstance(operation, ProtectOp):
+        writer.encrypt(
+            user_password=operation.user_password,
+            owner_password=operation.owner_password or operation.user_password + "_owner",
+            permissions_flag=0b0100  # Allow printing
+        )
+
+
+def run_pdf_pipeline(
+    input_path: Union[str, Path],
+    output_path: Union[str, Path],
+    operations: List[PipelineOp]
+) -> int:
+    """
+    Áp dụng `operations` theo thứ tự: 1 lần parse, 1 lần ghi
+
+    Blocking - gọi qua asyncio.to_thread() từ code async.
+
+    Returns:
+        Số trang
+    """
+    import pypdf
+
+    with open(input_path, "rb") as f:
+        reader = pypdf.PdfReader(f)
+
+        # Ảnh được nén ngay trên reader, trước khi copy (ảnh trùng lặp không bị copy)
+        image_ops = [op for op in operations if isinstance(op, CompressOp) and op.images]
+        if image_ops:
+            operation = image_ops[-1]
+            compress_pdf_images(
+                reader.pages,
+                quality=operation.quality,
+                target_size=operation.target_size_kb * 1024 if operation.target_size_kb else None,
+                base_size=os.path.getsize(input_path)
+            )
+
+        writer = pypdf.PdfWriter()
+        for page in reader.pages:
+            writer.add_page(page)
+
+        for operation in operations:
+            _apply(operation, writer)
+
+        with open(output_path, "wb") as output_file:
+            writer.write(output_file)
+
+    total_pages = len(writer.pages)
+    logger.info(
+        f"🧩 PDF pipeline: {' → '.join(type(operation).__name__ for operation in operations)} "
+        f"({total_pages} pages)"
+    )
+    return total_pages
@@ -0,0 +1,290 @@
+"""
+PDF Tables - Trích xuất bảng PDF song song theo trang → Excel write-only / CSV / Parquet
+
+Usage:
+    from app.services.pdf_tables import pdf_tables_to_xlsx, pdf_tables_to_archive
+
+    # Blocking → gọi qua asyncio.to_thread() từ code async
+    stats = await asyncio.to_thread(pdf_tables_to_xlsx, input_file, output_path)
+    stats = await asyncio.to_thread(pdf_tables_to_archive, input_file, zip_path, "csv")
+
+Tại sao:
+- pdfplumber extract_tables() tuần tự trên 1 core → báo cáo tài chính dài mất vài phút
+- openpyxl Workbook thường giữ cả workbook trong RAM, style từng cell riêng lẻ
+
+Pipeline:
+- Worker (page process pool) tự mở PDF, trích bảng cho vài trang liên tiếp
+- Chỉ (số worker x PAGES_IN_FLIGHT_PER_WORKER) task đang chạy / chờ ghi cùng lúc
+- Process chính ghi theo thứ tự trang ngay khi trang đó xong:
+  - xlsx: Workbook(write_only=True) (ghi ra temp file) + NamedStyle dùng chung
+  - csv / parquet: mỗi bảng 1 file trong ZIP (page_3_table_1.csv)
+→ RAM không tăng theo số trang (PDF 1000 trang vẫn chỉ giữ vài chục trang)
+"""
+import csv
+import importlib.util
+import io
+import logging
+import zipfile
+from collections import deque
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Union
+
+from app.services.page_workers import PAGES_IN_FLIGHT_PER_WORKER, count_pages, get_page_pool
+
+logger = logging.getLogger(__name__)
+
+# pdfplumber dựng lại page tree mỗi lần mở PDF → mỗi task gộp nhiều trang hơn so với render ảnh
+MAX_PAGES_PER_TABLE_TASK = 16
+
+TABLE_OUTPUT_FORMATS = ("xlsx", "csv", "parquet")
+
+MAX_COLUMN_WIDTH = 50
+TEXT_COLUMN_WIDTH = 100
+
+# NamedStyle đăng ký 1 lần / workbook, cell chỉ tham chiếu tên
+STYLE_TITLE = "pdf_table_title"
+STYLE_HEADER = "pdf_table_header"
+STYLE_CELL = "pdf_table_cell"
+
+
+@dataclass
+class PageTables:
+    """Bảng (hoặc text nếu không có bảng) của 1 trang"""
+    page_index: int
+    tables: List[List[List[Optional[str]]]]
+    text: Optional[str] = None
+
+
+@dataclass
+class TableExtractionStats:
+    pages: int = 0
+    tables: int = 0
+    text_pages: int = 0
+    outputs: List[str] = field(default_factory=list)  # Tên sheet / file trong ZIP
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"pages": self.pages, "tables": self.tables, "text_pages": self.text_pages}
+
+
+def extract_page_tables(pdf_path: str, page_indices: Sequence[int]) -> List[PageTables]:
+    """[Worker process] extract_tables() cho vài trang (1 lần mở PDF); trang không có bảng → text"""
+    import pdfplumber
+
+    results = []
+    with pdfplumber.open(pdf_path) as pdf:
+        for page_index in page_indices:
+            page = pdf.pages[page_index]
+            tables = page.extract_tables()
+            text = None
+            if not tables:
+                text = (page.extract_text() or "").strip() or None
+            # Giải phóng layout/chars đã parse của trang
+            page.flush_cache()
+            results.append(PageTables(page_index=page_index, tables=tables, text=text))
+    return results
+
+
+def iter_page_tables(pdf_path: Union[str, Path]) -> Iterator[PageTables]:
+    """
+    Trích bảng trên page process pool, yield theo thứ tự trang
+
+    Blocking - gọi trong thread (asyncio.to_thread).
+    """
+    pdf_path = str(pdf_path)
+    total_pages = count_pages(pdf_path)
+    if not total_pages:
+        return
+
+    page_pool = get_page_pool()
+    window = page_pool.max_workers * PAGES_IN_FLIGHT_PER_WORKER
+    per_task = max(1, min(MAX_PAGES_PER_TABLE_TASK, total_pages // (window * 2)))
+    tasks = [range(start, min(start + per_task, total_pages)) for start in range(0, total_pages, per_task)]
+    logger.info(f"📊 Table extraction: {total_pages} pages, {page_pool.max_workers} workers, {per_task} pages/task")
+
+    pending = deque()
+    next_task = 0
+    with page_pool.acquire() as pool:
+        try:
+            while next_task < len(tasks) or pending:
+                while next_task < len(tasks) and len(pending) < window:
+                    pending.append(pool.submit(extract_page_tables, pdf_path, list(tasks[next_task])))
+                    next_task += 1
+
+                for page in pending.popleft().result():
+                    yield page
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def _clean_value(value: Optional[str]) -> Optional[str]:
+    """openpyxl từ chối ký tự điều khiển (text PDF hay có \\x00, \\x0c...)"""
+    from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+
+    if value is None:
+        return None
+    return ILLEGAL_CHARACTERS_RE.sub("", value)
+
+
+def _column_widths(tables: List[List[List[Optional[str]]]]) -> Dict[int, int]:
+    widths: Dict[int, int] = {}
+    for table in tables:
+        for row in table:
+            for col_index, value in enumerate(row, start=1):
+                if value:
+                    widths[col_index] = max(widths.get(col_index, 0), len(str(value)))
+    return {col: min(width + 2, MAX_COLUMN_WIDTH) for col, width in widths.items()}
+
+
+def _register_styles(wb) -> None:
+    from openpyxl.styles import Alignment, Font, NamedStyle, PatternFill
+
+    top_wrap = Alignment(wrap_text=True, vertical="top")
+    wb.add_named_style(NamedStyle(
+        name=STYLE_TITLE,
+        font=Font(bold=True, size=12),
+        fill=PatternFill(start_color="CCCCCC", end_color="CCCCCC", fill_type="solid"),
+    ))
+    wb.add_named_style(NamedStyle(
+        name=STYLE_HEADER,
+        font=Font(bold=True),
+        fill=PatternFill(start_color="E0E0E0", end_color="E0E0E0", fill_type="solid"),
+        alignment=top_wrap,
+    ))
+    wb.add_named_style(NamedStyle(name=STYLE_CELL, alignment=top_wrap))
+
+
+def _styled_row(ws, values: Sequence[Optional[str]], style: str) -> list:
+    from openpyxl.cell import WriteOnlyCell
+
+    row = []
+    for value in values:
+        cell = WriteOnlyCell(ws, value=_clean_value(value))
+        cell.style = style
+        row.append(cell)
+    return row
+
+
+def pdf_tables_to_xlsx(input_path: Union[str, Path], output_path: Union[str, Path]) -> TableExtractionStats:
+    """
+    PDF → .xlsx: 1 sheet / trang có bảng ("Page N"), trang không có bảng → "Page N (Text)"
+
+    Blocking - gọi qua asyncio.to_thread() từ code async.
+    """
+    from openpyxl import Workbook
+    from openpyxl.utils import get_column_letter
+
+    wb = Workbook(write_only=True)
+    _register_styles(wb)
+    stats = TableExtractionStats()
+
+    for page in iter_page_tables(input_path):
+        stats.pages += 1
+        page_num = page.page_index + 1
+
+        if page.tables:
+            ws = wb.create_sheet(title=f"Page {page_num}")
+            # Write-only: độ rộng cột phải đặt TRƯỚC khi ghi dòng đầu tiên
+            for col_index, width in _column_widths(page.tables).items():
+                ws.column_dimensions[get_column_letter(col_index)].width = width
+
+            for table_num, table in enumerate(page.tables, start=1):
+                if len(page.tables) > 1:
+                    ws.append(_styled_row(ws, [f"Table {table_num}"], STYLE_TITLE))
+                for row_index, row_data in enumerate(table):
+                    ws.append(_styled_row(ws, row_data, STYLE_HEADER if row_index == 0 else STYLE_CELL))
+                # Dòng trống giữa các bảng
+                ws.append([])
+
+            stats.tables += len(page.tables)
+            stats.outputs.append(ws.title)
+
+        elif page.text:
+            ws = wb.create_sheet(title=f"Page {page_num} (Text)")
+            ws.column_dimensions["A"].width = TEXT_COLUMN_WIDTH
+            ws.append([_clean_value(page.text)])
+            stats.text_pages += 1
+            stats.outputs.append(ws.title)
+
+    if not stats.outputs:
+        ws = wb.create_sheet(title="No Data")
+        ws.append(["No tables or text found in PDF"])
+
+    wb.save(str(output_path))
+    logger.info(f"✅ PDF→Excel: {stats.tables} tables from {stats.pages} pages")
+    return stats
+
+
+def _table_to_csv(table: List[List[Optional[str]]]) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in table:
+        writer.writerow(["" if value is None else value for value in row])
+    # BOM: Excel mở CSV UTF-8 (tiếng Việt) đúng encoding
+    return buffer.getvalue().encode("utf-8-sig")
+
+
+def _table_to_parquet(table: List[List[Optional[str]]]) -> bytes:
+    """Dòng đầu = tên cột (trống/trùng → col_N), các cột kiểu string"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    width = max(len(row) for row in table)
+    header, rows = table[0], table[1:]
+
+    names: List[str] = []
+    for col_index in range(width):
+        name = (header[col_index] if col_index < len(header) else None) or ""
+        name = " ".join(name.split()) or f"col_{col_index + 1}"
+        if name in names:
+            name = f"{name}_{col_index + 1}"
+        names.append(name)
+
+    columns = {
+        name: pa.array([row[col_index] if col_index < len(row) else None for row in rows], type=pa.string())
+        for col_index, name in enumerate(names)
+    }
+    buffer = io.BytesIO()
+    pq.write_table(pa.table(columns), buffer)
+    return buffer.getvalue()
+
+
+def parquet_available() -> bool:
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+def pdf_tables_to_archive(
+    input_path: Union[str, Path],
+    output_path: Union[str, Path],
+    output_format: str
+) -> TableExtractionStats:
+    """
+    PDF → ZIP, mỗi bảng 1 file CSV / Parquet (page_{N}_table_{K}.csv), trang không có bảng bị bỏ qua
+
+    Parquet cần pyarrow (optional, kiểm tra bằng parquet_available()).
+    Blocking - gọi qua asyncio.to_thread() từ code async.
+    """
+    if output_format not in ("csv", "parquet"):
+        raise ValueError(f"Unsupported table format: {output_format}")
+    encode = _table_to_csv if output_format == "csv" else _table_to_parquet
+
+    stats = TableExtractionStats()
+    with zipfile.ZipFile(output_path, "w", zipfile.ZIP_DEFLATED) as archive:
+        for page in iter_page_tables(input_path):
+            stats.pages += 1
+            for table_num, table in enumerate(page.tables, start=1):
+                if not table:
+                    continue
+                name = f"page_{page.page_index + 1}_table_{table_num}.{output_format}"
+                # Parquet đã nén sẵn
+                compress_type = zipfile.ZIP_STORED if output_format == "parquet" else zipfile.ZIP_DEFLATED
+                archive.writestr(name, encode(table), compress_type=compress_type)
+                stats.tables += 1
+                stats.outputs.append(name)
+
+        if not stats.tables:
+            archive.writestr("NO_TABLES.txt", "No tables found in PDF")
+
+    logger.info(f"✅ PDF→{output_format.upper()}: {stats.tables} tables from {stats.pages} pages")
+    return stats
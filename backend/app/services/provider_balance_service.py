@@ -1,11 +1,12 @@
 """
 Service to fetch balance and usage information from AI providers
 """
-import httpx
 from typing import Dict, Optional
 from datetime import datetime
 import logging
 
+from app.services.http_clients import get_http_client
+
 logger = logging.getLogger(__name__)
 
 
@@ -32,30 +33,30 @@ class ProviderBalanceService:
             }
         """
         try:
-            async with httpx.AsyncClient() as client:
-                # Check organization usage
-                response = await client.get(
-                    "https://api.anthropic.com/v1/organization/usage",
-                    headers={
-                        "x-api-key": api_key,
-                        "anthropic-version": "2023-06-01"
-                    },
-                    timeout=10.0
-                )
+            client = get_http_client("providers")
+            # Check organization usage
+            response = await client.get(
+                "https://api.anthropic.com/v1/organization/usage",
+                headers={
+                    "x-api-key": api_key,
+                    "anthropic-version": "2023-06-01"
+                },
+                timeout=10.0
+            )
                 
-                if response.status_code == 200:
-                    data = response.json()
-                    return {
-                        "provider": "claude",
-                        "status": "success",
-                        "credits_remaining": data.get("balance", {}).get("remaining", 0),
-                        "credits_used": data.get("balance", {}).get("used", 0),
-                        "currency": "USD",
-                        "last_updated": datetime.utcnow().isoformat()
-                    }
-                else:
-                    logger.warning(f"Anthropic API returned {response.status_code}")
-                    return None
+            if response.status_code == 200:
+                data = response.json()
+                return {
+                    "provider": "claude",
+                    "status": "success",
+                    "credits_remaining": data.get("balance", {}).get("remaining", 0),
+                    "credits_used": data.get("balance", {}).get("used", 0),
+                    "currency": "USD",
+                    "last_updated": datetime.utcnow().isoformat()
+                }
+            else:
+                logger.warning(f"Anthropic API returned {response.status_code}")
+                return None
                     
         except Exception as e:
             logger.error(f"Error fetching Anthropic balance: {e}")
@@ -71,35 +72,35 @@ class ProviderBalanceService:
         """
         try:
             # Adobe uses OAuth2, need to get access token first
-            async with httpx.AsyncClient() as client:
-                # Get access token
-                token_response = await client.post(
-                    "https://ims-na1.adobelogin.com/ims/token/v3",
-                    data={
-                        "client_id": client_id,
-                        "client_secret": client_secret,
-                        "grant_type": "client_credentials",
-                        "scope": "openid,AdobeID,read_organizations"
-                    },
-                    timeout=10.0
-                )
+            client = get_http_client("providers")
+            # Get access token
+            token_response = await client.post(
+                "https://ims-na1.adobelogin.com/ims/token/v3",
+                data={
+                    "client_id": client_id,
+                    "client_secret": client_secret,
+                    "grant_type": "client_credentials",
+                    "scope": "openid,AdobeID,read_organizations"
+                },
+                timeout=10.0
+            )
                 
-                if token_response.status_code != 200:
-                    logger.warning(f"Adobe auth failed: {token_response.status_code}")
-                    return None
+            if token_response.status_code != 200:
+                logger.warning(f"Adobe auth failed: {token_response.status_code}")
+                return None
                 
-                access_token = token_response.json().get("access_token")
+            access_token = token_response.json().get("access_token")
                 
-                # Adobe doesn't have public balance API
-                # Return static plan info
-                return {
-                    "provider": "adobe",
-                    "status": "limited_info",
-                    "message": "Adobe doesn't provide public balance API",
-                    "plan_type": "Standard",
-                    "estimated_monthly_quota": 5000,
-                    "last_updated": datetime.utcnow().isoformat()
-                }
+            # Adobe doesn't have public balance API
+            # Return static plan info
+            return {
+                "provider": "adobe",
+                "status": "limited_info",
+                "message": "Adobe doesn't provide public balance API",
+                "plan_type": "Standard",
+                "estimated_monthly_quota": 5000,
+                "last_updated": datetime.utcnow().isoformat()
+            }
                 
         except Exception as e:
             logger.error(f"Error fetching Adobe balance: {e}")
@@ -127,16 +128,16 @@ class ProviderBalanceService:
         
         try:
             # Test if API key is valid
-            async with httpx.AsyncClient() as client:
-                response = await client.get(
-                    "https://generativelanguage.googleapis.com/v1beta/models",
-                    params={"key": api_key},
-                    timeout=10.0
-                )
+            client = get_http_client("providers")
+            response = await client.get(
+                "https://generativelanguage.googleapis.com/v1beta/models",
+                params={"key": api_key},
+                timeout=10.0
+            )
                 
-                if response.status_code != 200:
-                    logger.warning(f"Gemini API returned {response.status_code}")
-                    return None
+            if response.status_code != 200:
+                logger.warning(f"Gemini API returned {response.status_code}")
+                return None
             
             # Get today's usage from database if session provided
             requests_today = 0
@@ -0,0 +1,161 @@
+"""
+Provider Executor - Chạy SDK đồng bộ (Gemini, Adobe) ngoài event loop
+
+Usage:
+    from app.services.provider_executor import run_blocking
+
+    # Thay vì gọi trực tiếp (block cả uvicorn worker 10-60s):
+    #   location = pdf_services.submit(job)
+    location = await run_blocking("adobe", pdf_services.submit, job)
+
+    # Timeout riêng cho 1 call
+    response = await run_blocking("gemini", model.generate_content, prompt, timeout=300)
+
+Features:
+- Thread pool riêng + giới hạn cho từng provider (GEMINI_MAX_WORKERS, ADOBE_MAX_WORKERS)
+  → provider chậm không chiếm hết thread của provider khác / default executor
+- Per-call timeout (mặc định GEMINI_CALL_TIMEOUT_SECONDS, ADOBE_CALL_TIMEOUT_SECONDS)
+  → HTTPException 504. Tính từ lúc call bắt đầu chạy trên thread: lúc pool bận, thời gian
+  xếp hàng không làm call chậm bị 504 oan (request vẫn bị giới hạn bởi TimeoutMiddleware)
+- Cancellation: request bị hủy (client ngắt, TimeoutMiddleware) thì call chưa
+  chạy bị bỏ khỏi hàng đợi; call đang chạy không kill được thread nhưng kết
+  quả bị bỏ và event loop không phải chờ
+"""
+import asyncio
+import contextvars
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from fastapi import HTTPException
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Sentinel: dùng timeout mặc định của provider
+DEFAULT_TIMEOUT = object()
+
+
+class ProviderExecutor:
+    """Thread pool có giới hạn cho từng provider + timeout theo call"""
+
+    def __init__(self, limits: Dict[str, int], timeouts: Dict[str, float]):
+        self.limits = {name: max(1, limit) for name, limit in limits.items()}
+        self.timeouts = timeouts
+        self._pools: Dict[str, ThreadPoolExecutor] = {}
+        self._in_flight: Dict[str, int] = {name: 0 for name in limits}
+        # Có thể được gọi từ nhiều event loop (VD: BatchExecutor.offload)
+        self._lock = threading.Lock()
+
+    def _get_pool(self, provider: str) -> ThreadPoolExecutor:
+        if provider not in self.limits:
+            raise ValueError(f"Unknown provider '{provider}'. Available: {', '.join(self.limits)}")
+        with self._lock:
+            if provider not in self._pools:
+                self._pools[provider] = ThreadPoolExecutor(
+                    max_workers=self.limits[provider],
+                    thread_name_prefix=f"{provider}-sdk"
+                )
+            return self._pools[provider]
+
+    async def run(
+        self,
+        provider: str,
+        func: Callable[..., Any],
+        *args,
+        timeout: Any = DEFAULT_TIMEOUT,
+        **kwargs
+    ) -> Any:
+        """
+        Chạy func(*args, **kwargs) trên thread pool của provider
+
+        Args:
+            provider: "gemini" hoặc "adobe"
+            timeout: Giây tính từ lúc call bắt đầu chạy (không tính thời gian chờ slot),
+                None = không giới hạn
+
+        Raises:
+            HTTPException(504): Nếu quá timeout
+        """
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.timeouts.get(provider)
+
+        loop = asyncio.get_running_loop()
+        # Giữ contextvars (request id, log context...) khi chạy trên thread khác
+        context = contextvars.copy_context()
+        started = asyncio.Event()
+
+        def call():
+            # Báo cho event loop: call đã ra khỏi hàng đợi → bắt đầu tính timeout
+            try:
+                loop.call_soon_threadsafe(started.set)
+            except RuntimeError:
+                pass  # Loop đã đóng, kết quả sẽ không ai nhận
+            return context.run(func, *args, **kwargs)
+
+        pool = self._get_pool(provider)
+        queued_at = started_at = time.perf_counter()
+        with self._lock:
+            self._in_flight[provider] += 1
+        try:
+            future = loop.run_in_executor(pool, call)
+            wait_started = asyncio.ensure_future(started.wait())
+            try:
+                await asyncio.wait({future, wait_started}, return_when=asyncio.FIRST_COMPLETED)
+            except asyncio.CancelledError:
+                # Request bị hủy khi còn xếp hàng → bỏ call khỏi hàng đợi
+                future.cancel()
+                raise
+            finally:
+                wait_started.cancel()
+
+            started_at = time.perf_counter()
+            return await asyncio.wait_for(future, timeout=timeout)
+        except asyncio.TimeoutError:
+            name = getattr(func, "__qualname__", repr(func))
+            logger.error(
+                f"⏰ {provider} call {name} timed out after {time.perf_counter() - started_at:.1f}s "
+                f"(queued {started_at - queued_at:.1f}s)"
+            )
+            raise HTTPException(
+                504,
+                f"{provider.capitalize()} API không phản hồi sau {timeout:.0f}s. Vui lòng thử lại sau."
+            )
+        finally:
+            with self._lock:
+                self._in_flight[provider] -= 1
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Số call đang chạy/chờ của từng provider (cho monitoring)"""
+        return {
+            provider: {"limit": limit, "in_flight": self._in_flight.get(provider, 0)}
+            for provider, limit in self.limits.items()
+        }
+
+
+_provider_executor: Optional[ProviderExecutor] = None
+
+
+def get_provider_executor() -> ProviderExecutor:
+    """Get shared provider executor (1 instance per process)"""
+    global _provider_executor
+    if _provider_executor is None:
+        _provider_executor = ProviderExecutor(
+            limits={
+                "gemini": settings.GEMINI_MAX_WORKERS,
+                "adobe": settings.ADOBE_MAX_WORKERS,
+            },
+            timeouts={
+                "gemini": settings.GEMINI_CALL_TIMEOUT_SECONDS,
+                "adobe": settings.ADOBE_CALL_TIMEOUT_SECONDS,
+            },
+        )
+    return _provider_executor
+
+
+async def run_blocking(provider: str, func: Callable[..., Any], *args, **kwargs) -> Any:
+    """Shortcut: await get_provider_executor().run(provider, func, *args, **kwargs)"""
+    return await get_provider_executor().run(provider, func, *args, **kwargs)
@@ -3,12 +3,15 @@ Quota Management Service - Phase 1 Implementation
 Kiểm tra và quản lý AI quota cho users
 """
 from datetime import datetime, timedelta
-from sqlalchemy.orm import Session
+from sqlalchemy import Select, and_, case, func, or_, select, update
+from sqlalchemy.orm import Session, aliased
 from fastapi import HTTPException, status
 
 from app.models.auth_models import User
 from app.models.subscription import Subscription, SubscriptionStatus, PlanType
 
+# Chu kỳ quota legacy (User.ai_usage_this_month)
+QUOTA_PERIOD = timedelta(days=30)
 
 class QuotaService:
     """Service để quản lý AI quota"""
@@ -90,51 +93,157 @@ class QuotaService:
             "percentage_used": round((used / quota * 100), 1) if quota > 0 else 0,
         }
     
+    # ========== ATOMIC COUNTERS ==========
+    # Mỗi thao tác quota = 1 câu UPDATE ... RETURNING (điều kiện + tăng/giảm trong SQL)
+    # → request đồng thời của cùng user không mất lượt đếm, không đọc-sửa-ghi trong Python
+
+    @staticmethod
+    def _active_subscriptions(user_id: int, now: datetime, paid_only: bool = True, sub=Subscription) -> Select:
+        """Subscription active/trial còn hạn của user (NULL current_period_end = không hết hạn)"""
+        query = select(sub.id).where(
+            sub.user_id == user_id,
+            sub.status.in_([SubscriptionStatus.ACTIVE, SubscriptionStatus.TRIAL]),
+            or_(sub.current_period_end.is_(None), sub.current_period_end >= now),
+        )
+        if paid_only:
+            query = query.where(sub.plan_type != PlanType.FREE)
+        return query
+
+    @staticmethod
+    def _active_subscription_id(user_id: int, now: datetime, paid_only: bool = True):
+        """
+        Scalar subquery: id subscription liên quan nhất (cùng thứ tự với _get_active_subscription)
+
+        Dùng alias: subquery nằm trong UPDATE subscriptions → không bị correlate với bảng ngoài
+        """
+        sub = aliased(Subscription)
+        return (
+            QuotaService._active_subscriptions(user_id, now, paid_only, sub)
+            .order_by(sub.current_period_end.desc().nullslast(), sub.id.desc())
+            .limit(1)
+            .scalar_subquery()
+        )
+
+    @staticmethod
+    def _legacy_counter_values(now: datetime, delta: int) -> dict:
+        """
+        SET cho users: reset tháng mới (lazy) + cộng delta trong cùng 1 câu UPDATE
+
+        - quota_reset_date đã qua → usage = delta, reset_date = now + 30 ngày
+        - quota_reset_date NULL → giữ usage, set reset_date lần đầu
+        """
+        reset_due = and_(User.quota_reset_date.isnot(None), User.quota_reset_date <= now)
+        return {
+            "ai_usage_this_month": case((reset_due, 0), else_=User.ai_usage_this_month) + delta,
+            "quota_reset_date": case(
+                (or_(User.quota_reset_date.is_(None), reset_due), now + QUOTA_PERIOD),
+                else_=User.quota_reset_date,
+            ),
+        }
+
+    @staticmethod
+    def _quota_info(tier: str, limit: int, used: int, reset_date) -> dict:
+        return {
+            "subscription_tier": tier,
+            "quota_monthly": limit,
+            "usage_this_month": used,
+            "remaining": max(0, limit - used),
+            "reset_date": reset_date,
+            "percentage_used": round((used / limit * 100), 1) if limit > 0 else 0,
+        }
+
+    @staticmethod
+    def reserve_subscription_request(user_id: int, db: Session, paid_only: bool = True):
+        """
+        Giữ 1 lượt premium request của subscription đang active (atomic + commit ngay)
+
+        Returns:
+            Row(premium_requests_limit, premium_requests_used, current_period_end)
+            hoặc None nếu không có subscription / đã hết lượt
+        """
+        used = func.coalesce(Subscription.premium_requests_used, 0)
+        limit = func.coalesce(Subscription.premium_requests_limit, 0)
+        row = db.execute(
+            update(Subscription)
+            .where(
+                Subscription.id == QuotaService._active_subscription_id(user_id, datetime.utcnow(), paid_only),
+                or_(limit <= 0, used < limit),
+            )
+            .values(premium_requests_used=used + 1)
+            .returning(
+                Subscription.premium_requests_limit,
+                Subscription.premium_requests_used,
+                Subscription.current_period_end,
+            ),
+            execution_options={"synchronize_session": False},
+        ).first()
+        if row is not None:
+            db.commit()
+        return row
+
+    @staticmethod
+    def get_subscription_limit(user_id: int, db: Session, paid_only: bool = True) -> int | None:
+        """premium_requests_limit của subscription đang active (None = không có subscription)"""
+        row = db.execute(
+            select(Subscription.premium_requests_limit).where(
+                Subscription.id == QuotaService._active_subscription_id(user_id, datetime.utcnow(), paid_only)
+            )
+        ).first()
+        return None if row is None else int(row.premium_requests_limit or 0)
+
     @staticmethod
     def check_and_reset_quota(user: User, db: Session) -> None:
-        """Kiểm tra và reset quota nếu đã qua tháng mới"""
+        """
+        Kiểm tra và reset quota nếu đã qua tháng mới (1 UPDATE + 1 commit)
+
+        Paid subscription: copy limit/usage sang các field legacy của User
+        (UI cũ + is_quota_warning_level đọc từ User).
+        """
         now = datetime.utcnow()
 
-        # Subscription-based quota reset (preferred for paid plans)
+        # Subscription-based quota (preferred for paid plans)
         try:
             subscription = QuotaService._get_active_subscription(user, db)
         except Exception:
             subscription = None
 
         if subscription and subscription.plan_type != PlanType.FREE:
-            # If billing period ended, reset usage and roll period forward (simple 30-day window)
-            if subscription.current_period_end and subscription.current_period_end <= now:
-                subscription.premium_requests_used = 0
-                subscription.current_period_start = now
-                subscription.current_period_end = now + timedelta(days=30)
-                db.commit()
-
             # Mirror subscription limits/usage onto legacy User fields to keep existing endpoints consistent
+            values = {"subscription_tier": QuotaService._subscription_to_tier(subscription)}
             limit = int(subscription.premium_requests_limit or 0)
-            user.subscription_tier = QuotaService._subscription_to_tier(subscription)
             if limit > 0:
-                user.ai_quota_monthly = limit
-                user.ai_usage_this_month = int(subscription.premium_requests_used or 0)
-                user.quota_reset_date = subscription.current_period_end
-                db.commit()
-            return
-        
-        # Nếu chưa có quota_reset_date, set ngày đầu tiên
-        if not user.quota_reset_date:
-            user.quota_reset_date = now + timedelta(days=30)
+                values.update(
+                    ai_quota_monthly=limit,
+                    ai_usage_this_month=int(subscription.premium_requests_used or 0),
+                    quota_reset_date=subscription.current_period_end,
+                )
+            db.execute(
+                update(User).where(User.id == user.id).values(**values),
+                execution_options={"synchronize_session": False},
+            )
             db.commit()
             return
-        
-        # Nếu đã qua ngày reset, reset quota
-        if user.quota_reset_date <= now:
-            user.ai_usage_this_month = 0
-            user.quota_reset_date = now + timedelta(days=30)
+
+        result = db.execute(
+            update(User)
+            .where(
+                User.id == user.id,
+                or_(User.quota_reset_date.is_(None), User.quota_reset_date <= now),
+            )
+            .values(**QuotaService._legacy_counter_values(now, 0)),
+            execution_options={"synchronize_session": False},
+        )
+        if result.rowcount:
             db.commit()
     
     @staticmethod
     def check_ai_quota(user: User, db: Session) -> dict:
         """
-        Kiểm tra AI quota trước khi gọi AI API
+        Kiểm tra + giữ 1 lượt AI quota trước khi gọi AI API
+
+        Lượt được commit ngay (atomic); AI call thất bại → rollback_quota_increment().
+        Paid subscription: 1 câu UPDATE. Legacy (User): thêm 1 câu UPDATE, reset
+        tháng mới nằm luôn trong câu đó.
         
         Raises:
             HTTPException: Nếu hết quota
@@ -142,99 +251,121 @@ class QuotaService:
         Returns:
             dict: Thông tin quota sau khi check
         """
-        # Reset quota nếu cần
-        QuotaService.check_and_reset_quota(user, db)
+        # Prefer paid subscription quotas when available
+        reserved = QuotaService.reserve_subscription_request(user.id, db)
+        if reserved is not None:
+            limit = int(reserved.premium_requests_limit or 0)
+            return QuotaService._quota_info(
+                "PRO", limit, int(reserved.premium_requests_used), reserved.current_period_end
+            )
+
+        # Legacy user-based quota (chỉ khi không có paid subscription)
+        now = datetime.utcnow()
+        row = db.execute(
+            update(User)
+            .where(
+                User.id == user.id,
+                ~QuotaService._active_subscriptions(user.id, now).exists(),
+                or_(
+                    and_(User.quota_reset_date.isnot(None), User.quota_reset_date <= now),
+                    User.ai_usage_this_month < User.ai_quota_monthly,
+                ),
+            )
+            .values(**QuotaService._legacy_counter_values(now, 1))
+            .returning(
+                User.subscription_tier,
+                User.ai_quota_monthly,
+                User.ai_usage_this_month,
+                User.quota_reset_date,
+            ),
+            execution_options={"synchronize_session": False},
+        ).first()
+        if row is not None:
+            db.commit()
+            return QuotaService._quota_info(
+                row.subscription_tier or "FREE",
+                int(row.ai_quota_monthly or 0),
+                int(row.ai_usage_this_month or 0),
+                row.quota_reset_date,
+            )
 
+        QuotaService._raise_quota_exceeded(user, db)
+
+    @staticmethod
+    def _raise_quota_exceeded(user: User, db: Session) -> None:
+        """Dựng lỗi QUOTA_EXCEEDED (chỉ chạy khi đã hết lượt → query thêm không ảnh hưởng hot path)"""
         subscription = None
         try:
             subscription = QuotaService._get_active_subscription(user, db)
         except Exception:
             subscription = None
 
-        # Prefer paid subscription quotas when available
         if subscription and subscription.plan_type != PlanType.FREE:
-            limit = int(subscription.premium_requests_limit or 0)
-            used = int(subscription.premium_requests_used or 0)
-
-            if limit > 0 and used >= limit:
-                quota_info = QuotaService.get_user_quota_info(user, db)
-                # Estimate days until reset using billing period end
-                reset_date = subscription.current_period_end
-                days_until_reset = (reset_date - datetime.utcnow()).days + 1 if reset_date else 30
-
-                raise HTTPException(
-                    status_code=status.HTTP_403_FORBIDDEN,
-                    detail={
-                        "error_code": "QUOTA_EXCEEDED",
-                        "message": "Bạn đã hết quota AI cho tháng này 😢",
-                        "suggestion": f"Vui lòng đợi {days_until_reset} ngày nữa hoặc nâng cấp gói.",
-                        "quota_info": quota_info,
-                        "upgrade_url": "/pricing",
-                        "reset_in_days": days_until_reset,
-                    },
-                )
+            quota_info = QuotaService.get_user_quota_info(user, db)
+            # Estimate days until reset using billing period end
+            reset_date = subscription.current_period_end
+            days_until_reset = (reset_date - datetime.utcnow()).days + 1 if reset_date else 30
 
-            # Increment usage (commit happens after the AI call succeeds)
-            subscription.premium_requests_used = used + 1
-
-            # Mirror into legacy User fields so existing UI/headers don't show FREE
-            user.subscription_tier = QuotaService._subscription_to_tier(subscription)
-            if limit > 0:
-                user.ai_quota_monthly = limit
-                user.ai_usage_this_month = subscription.premium_requests_used
-                user.quota_reset_date = subscription.current_period_end
-
-            return QuotaService.get_user_quota_info(user, db)
-
-        # Legacy user-based quota
-        db.refresh(user)
-        if user.ai_usage_this_month >= user.ai_quota_monthly:
-            quota_info = QuotaService.get_user_quota_info(user)
-            days_until_reset = (user.quota_reset_date - datetime.utcnow()).days + 1
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail={
                     "error_code": "QUOTA_EXCEEDED",
                     "message": "Bạn đã hết quota AI cho tháng này 😢",
-                    "suggestion": f"Nâng cấp lên PRO để có 100 lần/tháng, hoặc đợi {days_until_reset} ngày nữa",
+                    "suggestion": f"Vui lòng đợi {days_until_reset} ngày nữa hoặc nâng cấp gói.",
                     "quota_info": quota_info,
                     "upgrade_url": "/pricing",
                     "reset_in_days": days_until_reset,
                 },
             )
 
-        user.ai_usage_this_month += 1
-        return QuotaService.get_user_quota_info(user)
+        db.refresh(user)
+        quota_info = QuotaService.get_user_quota_info(user)
+        reset_date = user.quota_reset_date
+        days_until_reset = (reset_date - datetime.utcnow()).days + 1 if reset_date else 30
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail={
+                "error_code": "QUOTA_EXCEEDED",
+                "message": "Bạn đã hết quota AI cho tháng này 😢",
+                "suggestion": f"Nâng cấp lên PRO để có 100 lần/tháng, hoặc đợi {days_until_reset} ngày nữa",
+                "quota_info": quota_info,
+                "upgrade_url": "/pricing",
+                "reset_in_days": days_until_reset,
+            },
+        )
     
     @staticmethod
     def rollback_quota_increment(user: User, db: Session) -> None:
         """
         Rollback quota increment nếu AI call thất bại
         Gọi trong exception handler
-        """
-        subscription = None
-        try:
-            subscription = QuotaService._get_active_subscription(user, db)
-        except Exception:
-            subscription = None
 
-        if subscription and subscription.plan_type != PlanType.FREE:
-            used = int(subscription.premium_requests_used or 0)
-            if used > 0:
-                subscription.premium_requests_used = used - 1
-            # Mirror back
-            limit = int(subscription.premium_requests_limit or 0)
-            user.subscription_tier = QuotaService._subscription_to_tier(subscription)
-            if limit > 0:
-                user.ai_quota_monthly = limit
-                user.ai_usage_this_month = int(subscription.premium_requests_used or 0)
-                user.quota_reset_date = subscription.current_period_end
-            db.commit()
-            return
+        Giảm 1 bằng UPDATE atomic (không bao giờ xuống dưới 0), không query lại subscription
+        """
+        now = datetime.utcnow()
+        used = func.coalesce(Subscription.premium_requests_used, 0)
+        result = db.execute(
+            update(Subscription)
+            .where(
+                Subscription.id == QuotaService._active_subscription_id(user.id, now),
+                used > 0,
+            )
+            .values(premium_requests_used=used - 1),
+            execution_options={"synchronize_session": False},
+        )
 
-        if user.ai_usage_this_month > 0:
-            user.ai_usage_this_month -= 1
-            db.commit()
+        if not result.rowcount:
+            db.execute(
+                update(User)
+                .where(
+                    User.id == user.id,
+                    User.ai_usage_this_month > 0,
+                    ~QuotaService._active_subscriptions(user.id, now).exists(),
+                )
+                .values(ai_usage_this_month=User.ai_usage_this_month - 1),
+                execution_options={"synchronize_session": False},
+            )
+        db.commit()
     
     @staticmethod
     def upgrade_subscription(user: User, new_tier: str, db: Session) -> User:
@@ -0,0 +1,367 @@
+"""
+Result Cache - Cache kết quả conversion theo nội dung file (content-addressed)
+
+Usage:
+    from app.services.result_cache import lookup_hash, store_file
+
+    upload = await doc_service.ingest_upload(file)   # SHA-256 tính sẵn khi ghi file
+    key, hit = await lookup_hash(upload.sha256, "pdf_to_word", engine="gemini", model=model)
+    if hit:
+        return FileResponse(hit.path, headers=hit.response_headers())  # ✅ Không gọi provider
+
+    output_path = await doc_service.pdf_to_word(...)
+    await store_file(key, output_path, operation="pdf_to_word", cost_usd=0.0012)
+
+Tại sao:
+- User upload lại cùng 1 công văn / template nhiều lần
+- Mỗi lần gọi lại Adobe (500 transactions/tháng) hoặc Gemini (tokens)
+
+Key = SHA-256(input bytes) + operation + engine/model/params
+→ đổi bất kỳ tham số nào cũng là entry khác.
+
+Lưu trữ: RESULT_CACHE_DIR/<key[:2]>/<key>/{payload, meta.json}
+- LRU theo dung lượng (RESULT_CACHE_MAX_MB), entry ít dùng nhất bị xóa trước
+- RESULT_CACHE_REDIS_INDEX=true: index LRU + tổng dung lượng trong Redis
+  (nhiều API instance dùng chung 1 cache dir trên shared volume)
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+PAYLOAD_NAME = "payload"
+META_NAME = "meta.json"
+
+
+def hash_file(path: Path, chunk_size: int = 1024 * 1024) -> str:
+    """SHA-256 của file (đọc theo chunk, không load cả file vào RAM)"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hash_bytes(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+@dataclass
+class CacheHit:
+    """1 entry trong cache"""
+    key: str
+    path: Path
+    meta: Dict[str, Any]
+
+    @property
+    def saved_cost_usd(self) -> float:
+        return self.meta.get("cost_usd") or 0.0
+
+    @property
+    def saved_adobe_transactions(self) -> int:
+        return self.meta.get("adobe_transactions") or 0
+
+    def read_json(self) -> Any:
+        return json.loads(self.path.read_text(encoding="utf-8"))
+
+    def response_headers(self) -> Dict[str, str]:
+        """Header báo cache hit + chi phí đã tiết kiệm (+ header gốc của lần convert đầu)"""
+        headers = dict(self.meta.get("headers") or {})
+        headers.update({
+            "X-Cache": "HIT",
+            "X-Cache-Saved-Cost-USD": f"{self.saved_cost_usd:.6f}",
+            "X-Cache-Saved-Adobe-Transactions": str(self.saved_adobe_transactions),
+        })
+        return headers
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "status": "hit",
+            "saved_cost_usd": round(self.saved_cost_usd, 6),
+            "saved_adobe_transactions": self.saved_adobe_transactions,
+            "cached_at": self.meta.get("created_at"),
+        }
+
+
+MISS_HEADERS = {"X-Cache": "MISS"}
+MISS_INFO = {"status": "miss"}
+
+
+# ==================== LRU INDEXES ====================
+
+class DiskCacheIndex:
+    """
+    LRU index = mtime của meta.json (touch khi hit)
+
+    Tổng dung lượng được ước lượng trong RAM, chỉ quét lại thư mục khi vượt
+    giới hạn (nhiều uvicorn worker cùng ghi → ước lượng lệch nhưng tự sửa).
+    """
+
+    def __init__(self, root: Path):
+        self.root = root
+        self._total_bytes: Optional[int] = None
+
+    def _entries(self) -> List[Tuple[float, int, Path]]:
+        entries = []
+        for meta_path in self.root.glob(f"*/*/{META_NAME}"):
+            try:
+                stat = meta_path.stat()
+                payload_size = (meta_path.parent / PAYLOAD_NAME).stat().st_size
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, payload_size, meta_path.parent))
+        return entries
+
+    def touch(self, key: str, entry_dir: Path) -> None:
+        try:
+            os.utime(entry_dir / META_NAME)
+        except OSError:
+            pass
+
+    def add(self, key: str, entry_dir: Path, size: int) -> None:
+        if self._total_bytes is not None:
+            self._total_bytes += size
+
+    def remove(self, key: str, size: int) -> None:
+        if self._total_bytes is not None:
+            self._total_bytes -= size
+
+    def evict_candidates(self, max_bytes: int) -> List[Tuple[Path, int]]:
+        """Entry cần xóa (cũ nhất trước) để tổng dung lượng <= max_bytes"""
+        if self._total_bytes is not None and self._total_bytes <= max_bytes:
+            return []
+
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        self._total_bytes = total
+
+        candidates = []
+        for _, size, entry_dir in entries:
+            if total <= max_bytes:
+                break
+            candidates.append((entry_dir, size))
+            total -= size
+        return candidates
+
+
+class RedisCacheIndex:
+    """LRU index trong Redis: sorted set key → last access, counter tổng dung lượng"""
+
+    LRU_KEY = "resultcache:lru"
+    SIZE_KEY = "resultcache:sizes"
+    TOTAL_KEY = "resultcache:total_bytes"
+
+    def __init__(self, root: Path):
+        import redis
+
+        self.root = root
+        kwargs = {"decode_responses": True}
+        if settings.REDIS_PASSWORD:
+            kwargs["password"] = settings.REDIS_PASSWORD
+        self.client = redis.Redis.from_url(settings.REDIS_URL, **kwargs)
+
+    def touch(self, key: str, entry_dir: Path) -> None:
+        self.client.zadd(self.LRU_KEY, {key: time.time()}, xx=True)
+
+    def add(self, key: str, entry_dir: Path, size: int) -> None:
+        # 2 request cùng miss 1 key → ghi đè, chỉ cộng phần chênh lệch
+        previous_size = int(self.client.hget(self.SIZE_KEY, key) or 0)
+        pipe = self.client.pipeline()
+        pipe.zadd(self.LRU_KEY, {key: time.time()})
+        pipe.hset(self.SIZE_KEY, key, size)
+        pipe.incrby(self.TOTAL_KEY, size - previous_size)
+        pipe.execute()
+
+    def remove(self, key: str, size: int) -> None:
+        pipe = self.client.pipeline()
+        pipe.zrem(self.LRU_KEY, key)
+        pipe.hdel(self.SIZE_KEY, key)
+        pipe.decrby(self.TOTAL_KEY, size)
+        pipe.execute()
+
+    def evict_candidates(self, max_bytes: int) -> List[Tuple[Path, int]]:
+        total = int(self.client.get(self.TOTAL_KEY) or 0)
+        candidates = []
+        while total > max_bytes:
+            popped = self.client.zpopmin(self.LRU_KEY)
+            if not popped:
+                break
+            key = popped[0][0]
+            size = int(self.client.hget(self.SIZE_KEY, key) or 0)
+            candidates.append((_entry_dir(self.root, key), size))
+            total -= size
+        return candidates
+
+
+def _entry_dir(root: Path, key: str) -> Path:
+    return root / key[:2] / key
+
+
+# ==================== CACHE ====================
+
+class ResultCache:
+    """Content-addressed cache cho kết quả conversion (file/bytes/JSON)"""
+
+    def __init__(self, root: Path, max_bytes: int, use_redis_index: bool = False):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.index = RedisCacheIndex(root) if use_redis_index else DiskCacheIndex(root)
+        self._evict_lock = threading.Lock()
+
+    @staticmethod
+    def make_key(input_hash: str, operation: str, **params) -> str:
+        """Key = hash(input) + operation + params (None/thứ tự params không ảnh hưởng)"""
+        # param=None ≡ không truyền param (VD: gemini_model=None khi không dùng Gemini)
+        params = {name: value for name, value in params.items() if value is not None}
+        payload = json.dumps(
+            {"input": input_hash, "operation": operation, "params": params},
+            sort_keys=True,
+            default=str
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[CacheHit]:
+        entry_dir = _entry_dir(self.root, key)
+        meta_path = entry_dir / META_NAME
+        payload_path = entry_dir / PAYLOAD_NAME
+        # meta.json được ghi SAU payload → có meta là entry đã hoàn chỉnh
+        if not meta_path.exists() or not payload_path.exists():
+            return None
+        try:
+            meta = json.loads(meta_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError) as e:
+            logger.warning(f"Corrupted cache entry {key[:12]}: {e}")
+            return None
+
+        try:
+            self.index.touch(key, entry_dir)
+        except Exception as e:
+            logger.warning(f"Cache index touch failed: {e}")
+
+        logger.info(f"♻️ Cache HIT {meta.get('operation')} {key[:12]} (saved ${meta.get('cost_usd') or 0:.6f})")
+        return CacheHit(key=key, path=payload_path, meta=meta)
+
+    def put_file(self, key: str, source: Path, **meta) -> None:
+        """Copy file kết quả vào cache (file gốc giữ nguyên cho response hiện tại)"""
+        self._put(key, lambda tmp: shutil.copyfile(source, tmp), meta)
+
+    def put_bytes(self, key: str, data: bytes, **meta) -> None:
+        self._put(key, lambda tmp: tmp.write_bytes(data), meta)
+
+    def put_json(self, key: str, obj: Any, **meta) -> None:
+        data = json.dumps(obj, ensure_ascii=False, default=str).encode("utf-8")
+        self.put_bytes(key, data, **meta)
+
+    def _put(self, key: str, write_payload, meta: Dict[str, Any]) -> None:
+        """Ghi atomic: payload → meta.json (lỗi cache không bao giờ làm fail request)"""
+        entry_dir = _entry_dir(self.root, key)
+        suffix = f".{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp"
+        try:
+            entry_dir.mkdir(parents=True, exist_ok=True)
+
+            tmp_payload = entry_dir / (PAYLOAD_NAME + suffix)
+            write_payload(tmp_payload)
+            size = tmp_payload.stat().st_size
+            os.replace(tmp_payload, entry_dir / PAYLOAD_NAME)
+
+            meta = {**meta, "size": size, "created_at": time.strftime("%Y-%m-%dT%H:%M:%S")}
+            tmp_meta = entry_dir / (META_NAME + suffix)
+            tmp_meta.write_text(json.dumps(meta, ensure_ascii=False, default=str), encoding="utf-8")
+            os.replace(tmp_meta, entry_dir / META_NAME)
+
+            self.index.add(key, entry_dir, size)
+            logger.info(f"💾 Cached {meta.get('operation')} {key[:12]} ({size / 1024:.1f} KB)")
+        except Exception as e:
+            logger.warning(f"Could not cache result {key[:12]}: {e}")
+            return
+
+        self._evict()
+
+    def _evict(self) -> None:
+        """Xóa entry ít dùng nhất tới khi tổng dung lượng <= max_bytes"""
+        if not self._evict_lock.acquire(blocking=False):
+            return  # Thread khác đang evict
+        try:
+            for entry_dir, size in self.index.evict_candidates(self.max_bytes):
+                shutil.rmtree(entry_dir, ignore_errors=True)
+                self.index.remove(entry_dir.name, size)
+                logger.info(f"🗑️ Evicted cache entry {entry_dir.name[:12]} ({size / 1024:.1f} KB)")
+        except Exception as e:
+            logger.warning(f"Cache eviction failed: {e}")
+        finally:
+            self._evict_lock.release()
+
+
+_result_cache: Optional[ResultCache] = None
+
+
+def get_result_cache() -> Optional[ResultCache]:
+    """Get shared result cache (None nếu RESULT_CACHE_ENABLED=false)"""
+    global _result_cache
+    if not settings.RESULT_CACHE_ENABLED:
+        return None
+    if _result_cache is None:
+        _result_cache = ResultCache(
+            Path(settings.RESULT_CACHE_DIR),
+            max_bytes=settings.RESULT_CACHE_MAX_MB * 1024 * 1024,
+            use_redis_index=settings.RESULT_CACHE_REDIS_INDEX
+        )
+        logger.info(f"✅ Result cache: {settings.RESULT_CACHE_DIR} (max {settings.RESULT_CACHE_MAX_MB} MB)")
+    return _result_cache
+
+
+# ==================== ASYNC HELPERS (cho endpoints) ====================
+
+async def lookup_hash(input_hash: str, operation: str, **params) -> Tuple[Optional[str], Optional[CacheHit]]:
+    """
+    Tra cache theo SHA-256 đã có sẵn (VD: IngestedUpload.sha256 - không đọc lại file)
+
+    Returns:
+        (key, hit) - key None nếu cache bị tắt, hit None nếu miss
+    """
+    cache = get_result_cache()
+    if cache is None:
+        return None, None
+    key = cache.make_key(input_hash, operation, **params)
+    return key, await asyncio.to_thread(cache.get, key)
+
+
+async def lookup_file(input_path: Path, operation: str, **params) -> Tuple[Optional[str], Optional[CacheHit]]:
+    """Hash file input (trong thread) + tra cache"""
+    if get_result_cache() is None:
+        return None, None
+    input_hash = await asyncio.to_thread(hash_file, input_path)
+    return await lookup_hash(input_hash, operation, **params)
+
+
+async def lookup_bytes(data: bytes, operation: str, **params) -> Tuple[Optional[str], Optional[CacheHit]]:
+    """Như lookup_file() nhưng input là bytes (VD: text)"""
+    return await lookup_hash(hash_bytes(data), operation, **params)
+
+
+async def store_file(key: Optional[str], source: Path, **meta) -> None:
+    if key is not None:
+        await asyncio.to_thread(get_result_cache().put_file, key, source, **meta)
+
+
+async def store_bytes(key: Optional[str], data: bytes, **meta) -> None:
+    if key is not None:
+        await asyncio.to_thread(get_result_cache().put_bytes, key, data, **meta)
+
+
+async def store_json(key: Optional[str], obj: Any, **meta) -> None:
+    if key is not None:
+        await asyncio.to_thread(get_result_cache().put_json, key, obj, **meta)
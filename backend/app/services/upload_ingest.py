@@ -0,0 +1,167 @@
+"""
+Upload Ingest - Ghi file upload theo chunk (RAM giới hạn) + size limit + hash + MIME
+
+Usage:
+    from app.services.upload_ingest import ingest_upload, remove_upload
+
+    upload = await ingest_upload(file, Path("uploads/documents"))
+    # upload.path      → uploads/documents/<uuid>/<tên gốc>
+    # upload.sha256    → dùng cho result cache, không cần đọc lại file
+    # upload.mime_type → MIME thật (theo magic bytes, không tin extension)
+    ...
+    remove_upload(upload.path, Path("uploads/documents"))
+
+    # Output cũng có thư mục riêng mỗi lần convert: outputs/<uuid>/report.pdf
+    output_path = new_output_dir(Path("uploads/outputs")) / "report.pdf"
+    remove_output(output_path, Path("uploads/outputs"))
+
+Tại sao:
+- `content = await upload_file.read()` giữ cả file trong RAM (tối đa 200MB/request)
+- Ghi vào upload_dir/<filename> → 2 request cùng tên file ghi đè lẫn nhau
+- Mỗi upload có thư mục riêng nên tên file gốc (stem) được giữ nguyên cho output
+- Output đặt theo stem gốc trong outputs/ dùng chung → 2 request cùng "report.docx"
+  ghi (rồi xóa) cùng outputs/report.pdf → output cũng cần thư mục <uuid> riêng
+"""
+import hashlib
+import logging
+import mimetypes
+import shutil
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+import aiofiles
+from fastapi import HTTPException, UploadFile
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+try:
+    import filetype
+    FILETYPE_AVAILABLE = True
+except ImportError:
+    FILETYPE_AVAILABLE = False
+
+CHUNK_SIZE = 1024 * 1024
+# filetype chỉ cần 8KB đầu để nhận dạng
+SNIFF_BYTES = 8192
+
+
+@dataclass
+class IngestedUpload:
+    """File upload đã được ghi xuống disk"""
+    path: Path
+    filename: str
+    size: int
+    sha256: str
+    mime_type: Optional[str]
+
+
+def safe_filename(filename: Optional[str]) -> str:
+    """Bỏ path component (../, C:\\...) khỏi tên file client gửi lên"""
+    name = Path((filename or "").replace("\\", "/")).name
+    return name or "upload"
+
+
+def sniff_mime_type(head: bytes, filename: str) -> Optional[str]:
+    """MIME theo magic bytes; DOCX/XLSX/PPTX là ZIP → dùng extension để phân biệt"""
+    guessed_from_name = mimetypes.guess_type(filename)[0]
+    if not FILETYPE_AVAILABLE:
+        return guessed_from_name
+    sniffed = filetype.guess_mime(head)
+    if sniffed in (None, "application/zip") and guessed_from_name:
+        return guessed_from_name
+    return sniffed
+
+
+async def ingest_upload(
+    upload_file: UploadFile,
+    dest_dir: Path,
+    max_bytes: Optional[int] = None
+) -> IngestedUpload:
+    """
+    Stream file upload xuống dest_dir/<uuid>/<filename>
+
+    Args:
+        upload_file: File từ request
+        dest_dir: Thư mục gốc (VD: uploads/documents)
+        max_bytes: Giới hạn dung lượng (mặc định MAX_UPLOAD_SIZE)
+
+    Raises:
+        HTTPException 413: File vượt giới hạn (file dở dang bị xóa)
+    """
+    limit = max_bytes or settings.MAX_UPLOAD_SIZE
+    limit_mb = limit / (1024 * 1024)
+    filename = safe_filename(upload_file.filename)
+
+    # Client gửi kèm size → từ chối sớm, không cần đọc
+    if upload_file.size and upload_file.size > limit:
+        raise HTTPException(413, f"File quá lớn: {upload_file.size / (1024 * 1024):.1f}MB (tối đa {limit_mb:.0f}MB)")
+
+    path = Path(dest_dir) / uuid.uuid4().hex / filename
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    digest = hashlib.sha256()
+    head = b""
+    size = 0
+    try:
+        async with aiofiles.open(path, "wb") as out_file:
+            while chunk := await upload_file.read(CHUNK_SIZE):
+                size += len(chunk)
+                if size > limit:
+                    raise HTTPException(413, f"File quá lớn (tối đa {limit_mb:.0f}MB)")
+                if len(head) < SNIFF_BYTES:
+                    head += chunk[:SNIFF_BYTES - len(head)]
+                digest.update(chunk)
+                await out_file.write(chunk)
+    except BaseException:
+        shutil.rmtree(path.parent, ignore_errors=True)
+        raise
+
+    return IngestedUpload(
+        path=path,
+        filename=filename,
+        size=size,
+        sha256=digest.hexdigest(),
+        mime_type=sniff_mime_type(head, filename)
+    )
+
+
+def remove_upload(path: Path, upload_root: Path) -> None:
+    """Xóa file upload (+ thư mục <uuid> riêng của nó nếu nằm ngay dưới upload_root)"""
+    path = Path(path)
+    if is_ingest_dir(path.parent) and path.parent.parent.resolve() == Path(upload_root).resolve():
+        shutil.rmtree(path.parent, ignore_errors=True)
+    elif path.exists():
+        path.unlink()
+
+
+def new_output_dir(output_root: Path) -> Path:
+    """Thư mục <uuid> riêng cho output của 1 lần convert (tên file download giữ nguyên)"""
+    path = Path(output_root) / uuid.uuid4().hex
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def remove_output(path: Path, output_root: Path) -> None:
+    """
+    Xóa file output; thư mục <uuid> của nó bị xóa khi đã rỗng
+
+    1 thư mục có thể chứa nhiều output của cùng 1 lần convert (VD: split) và
+    caller xóa từng file sau khi gửi → không rmtree cả thư mục.
+    """
+    path = Path(path)
+    path.unlink(missing_ok=True)
+    if is_ingest_dir(path.parent) and path.parent.parent.resolve() == Path(output_root).resolve():
+        try:
+            path.parent.rmdir()
+        except OSError:
+            pass  # Còn file khác của cùng lần convert
+
+
+def is_ingest_dir(path: Path) -> bool:
+    """Thư mục <uuid> do ingest_upload() tạo (an toàn để xóa khi dọn file cũ)"""
+    name = path.name
+    return len(name) == 32 and all(c in "0123456789abcdef" for c in name)
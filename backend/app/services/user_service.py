@@ -9,6 +9,7 @@ from fastapi import HTTPException, status
 from app.models.auth_models import User, Role
 from app.schemas.user import UserCreate, UserUpdate
 from app.core.security import get_password_hash
+from app.services.auth_cache import get_auth_cache
 
 
 class UserService:
@@ -170,6 +171,7 @@ class UserService:
             user.roles = roles
         
         db.commit()
+        get_auth_cache().invalidate_user(user_id)
         db.refresh(user)
         
         return user
@@ -186,6 +188,7 @@ class UserService:
         
         db.delete(user)
         db.commit()
+        get_auth_cache().invalidate_user(user_id)
         
         return True
     
@@ -210,6 +213,7 @@ class UserService:
         # Replace roles
         user.roles = roles
         db.commit()
+        get_auth_cache().invalidate_user(user_id)
         db.refresh(user)
         
         return user
@@ -239,6 +243,7 @@ class UserService:
                 user.roles.append(role)
         
         db.commit()
+        get_auth_cache().invalidate_user(user_id)
         db.refresh(user)
         
         return user
@@ -257,6 +262,7 @@ class UserService:
         user.roles = [role for role in user.roles if role.id not in role_ids]
         
         db.commit()
+        get_auth_cache().invalidate_user(user_id)
         db.refresh(user)
         
         return user
@@ -72,7 +72,7 @@ class VBCheckerService:
                 prompt = PROMPT_KIEM_TRA_THE_THUC if chi_tiet_cao else PROMPT_KIEM_TRA_THE_THUC
                 prompt_filled = prompt.format(noi_dung_van_ban=text[:8000])
                 
-                response = self.gemini.generate_content(
+                response = await self.gemini.agenerate_content(
                     prompt=prompt_filled,
                     model="gemini-2.0-flash-exp",
                     operation="check_van_ban_text"
@@ -93,7 +93,7 @@ class VBCheckerService:
                 )
                 
                 if file_ext == '.pdf':
-                    response = self.gemini.generate_content_with_pdf(
+                    response = await self.gemini.agenerate_content_with_pdf(
                         prompt=prompt_direct,
                         pdf_path=file_path,
                         model="gemini-2.5-flash",
@@ -115,7 +115,7 @@ class VBCheckerService:
                         logger.info(f"✅ Converted to PDF: {pdf_path}")
                         
                         # Gemini analyze PDF
-                        response = self.gemini.generate_content_with_pdf(
+                        response = await self.gemini.agenerate_content_with_pdf(
                             prompt=prompt_direct,
                             pdf_path=str(pdf_path),
                             model="gemini-2.5-flash",
@@ -148,7 +148,7 @@ class VBCheckerService:
                             
                             # Gemini phân tích text (không có layout)
                             prompt_filled = prompt_template.format(noi_dung_van_ban=text[:8000])
-                            response = self.gemini.generate_content(
+                            response = await self.gemini.agenerate_content(
                                 prompt=prompt_filled,
                                 model="gemini-2.0-flash-exp",
                                 operation="check_van_ban_docx_text"
@@ -162,7 +162,7 @@ class VBCheckerService:
                                 "message": f"Không thể đọc file Word. Vui lòng upload file PDF hoặc kiểm tra file có hợp lệ không."
                             }
                 else:  # .jpg, .jpeg, .png
-                    response = self.gemini.generate_content_with_image(
+                    response = await self.gemini.agenerate_content_with_image(
                         prompt=prompt_direct,
                         image_path=file_path,
                         model="gemini-2.5-flash",
@@ -0,0 +1,172 @@
+"""
+Streaming ZIP Writer - Ghi ZIP thành từng chunk để stream thẳng về client
+
+Usage:
+    from app.services.zip_stream import ZipStreamWriter
+
+    writer = ZipStreamWriter()
+    for chunk in writer.write_file(pdf_path, "report.pdf"):
+        yield chunk
+    yield writer.close()
+
+    # Trong async generator (StreamingResponse): đọc + nén trên thread, không block event loop
+    async for chunk in writer.write_file_async(pdf_path, "report.pdf"):
+        yield chunk
+
+So với io.BytesIO + zipfile.ZipFile:
+- Memory phẳng (~1 chunk) bất kể batch lớn cỡ nào
+- Client nhận byte đầu tiên ngay khi file đầu tiên convert xong
+- PDF/DOCX/PNG... đã nén sẵn → dùng ZIP_STORED (không tốn CPU nén lại)
+"""
+import asyncio
+import io
+import zipfile
+from pathlib import Path
+from typing import AsyncIterator, BinaryIO, Iterator, Optional
+
+
+# Định dạng đã nén sẵn - DEFLATE gần như không giảm size, chỉ tốn CPU
+STORED_EXTENSIONS = {
+    ".pdf", ".docx", ".xlsx", ".pptx", ".odt", ".ods", ".odp",
+    ".png", ".jpg", ".jpeg", ".gif", ".webp", ".heic",
+    ".zip", ".gz", ".7z", ".parquet",
+}
+
+CHUNK_SIZE = 1024 * 1024  # 1MB
+
+
+class _ChunkSink(io.RawIOBase):
+    """
+    File-like object không seek được: zipfile ghi vào, ta lấy bytes ra bằng drain()
+
+    Vì không seekable, zipfile tự dùng data descriptor (CRC/size ghi sau data)
+    thay vì quay lại sửa local header.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return False
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class ZipStreamWriter:
+    """
+    ZIP writer dạng generator: mỗi write_* yield các chunk bytes sẵn sàng gửi đi
+
+    - Tự chọn STORED/DEFLATED theo extension
+    - Tự đổi tên file trùng trong archive (report.pdf → report_2.pdf)
+    - Hỗ trợ ZIP64 (file/archive > 4GB)
+    """
+
+    def __init__(self, chunk_size: int = CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self._sink = _ChunkSink()
+        self._zip = zipfile.ZipFile(self._sink, "w", allowZip64=True)
+        self._names = set()
+        self.bytes_written = 0
+
+    @staticmethod
+    def compress_type_for(arcname: str) -> int:
+        """STORED cho file đã nén sẵn, DEFLATED cho phần còn lại (txt, json, csv...)"""
+        if Path(arcname).suffix.lower() in STORED_EXTENSIONS:
+            return zipfile.ZIP_STORED
+        return zipfile.ZIP_DEFLATED
+
+    def unique_arcname(self, arcname: str) -> str:
+        """Tránh trùng tên trong archive: report.pdf, report_2.pdf, report_3.pdf..."""
+        candidate = arcname
+        counter = 2
+        while candidate in self._names:
+            path = Path(arcname)
+            stem = path.with_suffix("").as_posix()
+            candidate = f"{stem}_{counter}{path.suffix}"
+            counter += 1
+        self._names.add(candidate)
+        return candidate
+
+    def _drain(self) -> bytes:
+        data = self._sink.drain()
+        self.bytes_written += len(data)
+        return data
+
+    def _entry_info(self, path: Path, arcname: Optional[str]) -> zipfile.ZipInfo:
+        arcname = self.unique_arcname(arcname or path.name)
+        zinfo = zipfile.ZipInfo.from_file(path, arcname)
+        zinfo.compress_type = self.compress_type_for(arcname)
+        return zinfo
+
+    def _copy_block(self, source: BinaryIO, dest) -> bool:
+        """Đọc 1 chunk từ source và ghi (nén) vào entry, False khi hết file"""
+        block = source.read(self.chunk_size)
+        if not block:
+            return False
+        dest.write(block)
+        return True
+
+    def write_file(self, path: Path, arcname: Optional[str] = None) -> Iterator[bytes]:
+        """Ghi 1 file từ disk vào archive, đọc từng chunk (không load cả file vào RAM)"""
+        zinfo = self._entry_info(path, arcname)
+
+        with open(path, "rb") as source, self._zip.open(zinfo, "w") as dest:
+            while self._copy_block(source, dest):
+                data = self._drain()
+                if data:
+                    yield data
+
+        # Data descriptor (CRC + sizes) được ghi khi đóng entry
+        data = self._drain()
+        if data:
+            yield data
+
+    async def write_file_async(self, path: Path, arcname: Optional[str] = None) -> AsyncIterator[bytes]:
+        """
+        write_file() cho async generator: đọc disk + nén từng chunk bằng asyncio.to_thread
+
+        Các chunk vẫn được ghi tuần tự vào archive, chỉ phần I/O / CPU rời khỏi event loop.
+        """
+        zinfo = await asyncio.to_thread(self._entry_info, path, arcname)
+        source = await asyncio.to_thread(open, path, "rb")
+        try:
+            with self._zip.open(zinfo, "w") as dest:
+                while await asyncio.to_thread(self._copy_block, source, dest):
+                    data = self._drain()
+                    if data:
+                        yield data
+        finally:
+            source.close()
+
+        data = self._drain()
+        if data:
+            yield data
+
+    def write_bytes(self, arcname: str, content: bytes) -> Iterator[bytes]:
+        """Ghi nội dung nhỏ (VD: báo cáo lỗi JSON) vào archive"""
+        arcname = self.unique_arcname(arcname)
+        self._zip.writestr(arcname, content, compress_type=self.compress_type_for(arcname))
+        data = self._drain()
+        if data:
+            yield data
+
+    def close(self) -> bytes:
+        """Ghi central directory - chunk cuối cùng của archive"""
+        self._zip.close()
+        return self._drain()
@@ -0,0 +1,37 @@
+"""
+Shared fixtures
+
+Run: cd backend && python -m pytest tests -v
+"""
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import models
+from app.core.database import Base
+
+# Bảng cho auth + quota (user_usage_records trỏ tới ai_usage_logs nằm ngoài app.models)
+TEST_TABLES = ("users", "roles", "user_roles", "permissions", "organizations", "subscriptions")
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    """SQLite riêng cho mỗi test (file, không phải :memory: → nhiều thread / session dùng chung được)"""
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'test.db'}",
+        connect_args={"check_same_thread": False, "timeout": 30}
+    )
+    # Mọi model phải được import để SQLAlchemy resolve relationships
+    assert models.User.__tablename__ in Base.metadata.tables
+    Base.metadata.create_all(bind=engine, tables=[Base.metadata.tables[name] for name in TEST_TABLES])
+    yield sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    engine.dispose()
+
+
+@pytest.fixture
+def db(session_factory):
+    session = session_factory()
+    try:
+        yield session
+    finally:
+        session.close()
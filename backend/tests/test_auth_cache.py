@@ -0,0 +1,172 @@
+"""
+Test AuthCache - cache principal (user + role + permission) và invalidation
+
+Run: pytest backend/tests/test_auth_cache.py -v
+"""
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event, update
+
+from app.models.auth_models import Permission, Role, User
+from app.services.auth_cache import AuthCache
+
+
+@pytest.fixture
+def user(db):
+    role = Role(name="editor", permissions=[Permission(resource="document", action="read")])
+    user = User(username="bob", email="bob@example.com", hashed_password="x", roles=[role])
+    db.add(user)
+    db.commit()
+    return user
+
+
+@contextmanager
+def count_queries(session_factory):
+    engine = session_factory.kw["bind"]
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+def grant(db, role_name: str, resource: str, action: str) -> None:
+    role = db.query(Role).filter(Role.name == role_name).one()
+    role.permissions.append(Permission(resource=resource, action=action))
+    db.commit()
+
+
+def test_cache_hit_runs_no_queries(session_factory, user):
+    cache = AuthCache(ttl_seconds=60, max_users=10)
+    first = cache.get_principal(session_factory(), user.id)
+
+    with count_queries(session_factory) as statements:
+        second = cache.get_principal(session_factory(), user.id)
+
+    assert statements == []
+    assert second is first
+    assert second.role_names == {"editor"}
+    assert second.has_permission("document", "read")
+    assert not second.has_permission("document", "write")
+
+
+def test_unknown_user_returns_none(db):
+    assert AuthCache(ttl_seconds=60, max_users=10).get_principal(db, 999) is None
+
+
+def test_invalidate_user_reloads_permissions(db, session_factory, user):
+    cache = AuthCache(ttl_seconds=60, max_users=10)
+    assert not cache.get_principal(session_factory(), user.id).has_permission("document", "write")
+
+    grant(db, "editor", "document", "write")
+    # Chưa invalidate → vẫn là bản cache (trong TTL)
+    assert not cache.get_principal(session_factory(), user.id).has_permission("document", "write")
+
+    cache.invalidate_user(user.id)
+    assert cache.get_principal(session_factory(), user.id).has_permission("document", "write")
+
+
+def test_invalidate_all_clears_every_user(db, session_factory, user):
+    other = User(username="carol", email="carol@example.com", hashed_password="x", roles=list(user.roles))
+    db.add(other)
+    db.commit()
+
+    cache = AuthCache(ttl_seconds=60, max_users=10)
+    for user_id in (user.id, other.id):
+        cache.get_principal(session_factory(), user_id)
+
+    grant(db, "editor", "user", "delete")
+    cache.invalidate_all()
+
+    for user_id in (user.id, other.id):
+        assert cache.get_principal(session_factory(), user_id).has_permission("user", "delete")
+
+
+def test_load_racing_invalidate_is_not_cached(db, session_factory, user):
+    cache = AuthCache(ttl_seconds=60, max_users=10)
+    engine = session_factory.kw["bind"]
+    user_id = user.id  # Đọc trước: refresh sau commit cũng là 1 SELECT
+    invalidated = []
+
+    # Invalidate xảy ra trong lúc principal đang được load từ DB
+    def invalidate_during_load(*args):
+        if not invalidated:
+            invalidated.append(True)
+            cache.invalidate_user(user_id)
+
+    event.listen(engine, "before_cursor_execute", invalidate_during_load)
+    try:
+        stale = cache.get_principal(session_factory(), user_id)
+    finally:
+        event.remove(engine, "before_cursor_execute", invalidate_during_load)
+    assert stale is not None and invalidated
+
+    with count_queries(session_factory) as statements:
+        fresh = cache.get_principal(session_factory(), user_id)
+    assert statements  # Kết quả load cũ không được cache → load lại
+    assert fresh is not stale
+
+
+def test_ttl_zero_disables_cache(session_factory, user):
+    cache = AuthCache(ttl_seconds=0, max_users=10)
+    cache.get_principal(session_factory(), user.id)
+
+    with count_queries(session_factory) as statements:
+        cache.get_principal(session_factory(), user.id)
+    assert statements
+
+
+def test_expired_principal_is_reloaded(session_factory, user, monkeypatch):
+    cache = AuthCache(ttl_seconds=60, max_users=10)
+    now = [1000.0]
+    monkeypatch.setattr("app.services.auth_cache.time.monotonic", lambda: now[0])
+
+    first = cache.get_principal(session_factory(), user.id)
+    now[0] += 61
+    assert cache.get_principal(session_factory(), user.id) is not first
+
+
+def test_lru_evicts_least_recently_used(db, session_factory):
+    users = [User(username=f"u{i}", email=f"u{i}@example.com", hashed_password="x") for i in range(3)]
+    db.add_all(users)
+    db.commit()
+
+    cache = AuthCache(ttl_seconds=60, max_users=2)
+    a, b, c = (user.id for user in users)
+    cache.get_principal(session_factory(), a)
+    cache.get_principal(session_factory(), b)
+    cache.get_principal(session_factory(), a)  # a mới dùng → b bị đẩy ra khi thêm c
+    cache.get_principal(session_factory(), c)
+
+    with count_queries(session_factory) as statements:
+        cache.get_principal(session_factory(), a)
+        cache.get_principal(session_factory(), c)
+    assert statements == []
+
+    with count_queries(session_factory) as statements:
+        cache.get_principal(session_factory(), b)
+    assert statements
+
+
+def test_attach_reads_uncached_columns_fresh(db, session_factory, user):
+    cache = AuthCache(ttl_seconds=60, max_users=10)
+    principal = cache.get_principal(session_factory(), user.id)
+
+    db.execute(update(User).where(User.id == user.id).values(ai_usage_this_month=7))
+    db.commit()
+
+    session = session_factory()
+    with count_queries(session_factory) as statements:
+        attached = principal.attach(session)
+        assert attached.username == "bob"
+    assert statements == []  # Cột đã cache: không SELECT
+
+    # Quota không nằm trong snapshot → đọc từ DB
+    assert attached.ai_usage_this_month == 7
+    assert principal.snapshot not in session
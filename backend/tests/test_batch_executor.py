@@ -0,0 +1,168 @@
+"""
+Test BatchExecutor - thứ tự kết quả, giới hạn concurrency (request / backend / global), hủy item còn lại
+
+Run: pytest backend/tests/test_batch_executor.py -v
+"""
+import asyncio
+import threading
+from pathlib import Path
+
+import pytest
+
+from app.services.batch_executor import BatchExecutor, summarize_results
+
+
+def make_executor(global_limit=10, local=10, gemini=10, request_limit=10) -> BatchExecutor:
+    return BatchExecutor(
+        global_limit=global_limit,
+        backend_limits={"local": local, "gemini": gemini},
+        default_request_limit=request_limit,
+    )
+
+
+class InFlight:
+    """Worker đếm số item chạy đồng thời (tối đa)"""
+
+    def __init__(self, delay: float = 0.01):
+        self.delay = delay
+        self.current = 0
+        self.peak = 0
+
+    async def __call__(self, item):
+        self.current += 1
+        self.peak = max(self.peak, self.current)
+        try:
+            await asyncio.sleep(self.delay)
+            return Path(f"{item}.out")
+        finally:
+            self.current -= 1
+
+
+def test_run_returns_results_in_input_order():
+    async def worker(item):
+        # Item đầu xong sau cùng
+        await asyncio.sleep(0.01 * (5 - item))
+        return Path(f"{item}.pdf")
+
+    results = asyncio.run(make_executor().run(list(range(5)), worker, backend="local"))
+
+    assert [result.index for result in results] == [0, 1, 2, 3, 4]
+    assert [result.outputs for result in results] == [[Path(f"{item}.pdf")] for item in range(5)]
+    assert all(result.ok and result.backend == "local" for result in results)
+
+
+def test_failed_item_is_isolated():
+    async def worker(item):
+        if item == 1:
+            raise ValueError("broken file")
+        return [Path(f"{item}_a.png"), Path(f"{item}_b.png")]
+
+    results = asyncio.run(make_executor().run([0, 1, 2], worker, backend="local"))
+
+    assert [result.ok for result in results] == [True, False, True]
+    assert results[1].error == "broken file"
+    assert results[1].outputs == []
+    assert len(results[2].outputs) == 2
+
+    stats = summarize_results(results, wall_seconds=1.0)
+    assert (stats["total"], stats["succeeded"], stats["failed"]) == (3, 2, 1)
+
+
+def test_per_request_limit():
+    worker = InFlight()
+    asyncio.run(make_executor().run(range(8), worker, backend="local", max_concurrency=2))
+    assert worker.peak == 2
+
+
+def test_request_limit_cannot_exceed_default():
+    worker = InFlight()
+    asyncio.run(make_executor(request_limit=3).run(range(8), worker, backend="local", max_concurrency=50))
+    assert worker.peak == 3
+
+
+def test_per_backend_limit_shared_across_requests():
+    executor = make_executor(local=2)
+    worker = InFlight()
+
+    async def two_requests():
+        await asyncio.gather(
+            executor.run(range(6), worker, backend="local"),
+            executor.run(range(6), worker, backend="local"),
+        )
+
+    asyncio.run(two_requests())
+    assert worker.peak == 2
+
+
+def test_global_limit_across_backends():
+    executor = make_executor(global_limit=3, local=10, gemini=10)
+    worker = InFlight()
+
+    async def two_backends():
+        await asyncio.gather(
+            executor.run(range(6), worker, backend="local"),
+            executor.run(range(6), worker, backend="gemini"),
+        )
+
+    asyncio.run(two_backends())
+    assert worker.peak == 3
+
+
+def test_unknown_backend_is_rejected():
+    async def worker(item):
+        return None
+
+    with pytest.raises(ValueError, match="Unknown batch backend"):
+        asyncio.run(make_executor().run([1], worker, backend="adobe"))
+
+
+def test_consumer_stopping_cancels_remaining_items():
+    executor = make_executor(request_limit=2)
+    started = []
+    cancelled = []
+    finished = []
+
+    async def worker(item):
+        started.append(item)
+        try:
+            await asyncio.sleep(0 if item == 0 else 10)
+        except asyncio.CancelledError:
+            cancelled.append(item)
+            raise
+        finished.append(item)
+
+    async def take_first():
+        stream = executor.iter_completed(list(range(5)), worker, backend="local")
+        first = await stream.__anext__()
+        # Client ngắt kết nối → StreamingResponse đóng generator
+        await stream.aclose()
+        await asyncio.sleep(0)
+        return first
+
+    first = asyncio.run(take_first())
+
+    assert first.index == 0
+    assert finished == [0]
+    # Item đang chạy bị cancel, item còn chờ semaphore không bao giờ chạy
+    assert sorted(cancelled) == [1, 2]
+    assert sorted(started) == [0, 1, 2]
+
+
+def test_offload_reuses_one_loop_per_thread():
+    executor = make_executor(global_limit=1)
+    seen = []
+
+    async def step(value):
+        seen.append((threading.get_ident(), id(asyncio.get_running_loop())))
+        return value * 2
+
+    async def main():
+        caller_loop = asyncio.get_running_loop()
+        results = [await executor.offload(step, value) for value in range(3)]
+        return caller_loop, results
+
+    caller_loop, results = asyncio.run(main())
+
+    assert results == [0, 2, 4]
+    assert len(set(seen)) == 1  # 1 thread, 1 loop cho mọi item
+    assert seen[0][1] != id(caller_loop)
@@ -0,0 +1,145 @@
+"""
+Test GotenbergPool - failover giữa các instance, lỗi convert không failover, cooldown / half-open
+
+Run: pytest backend/tests/test_gotenberg_client.py -v
+"""
+import asyncio
+import time
+
+import httpx
+import pytest
+from fastapi import HTTPException
+
+from app.services import gotenberg_client
+from app.services.gotenberg_client import GotenbergPool
+
+PDF = b"%PDF-1.7 converted"
+URLS = ["http://gotenberg-1:3000", "http://gotenberg-2:3000"]
+
+
+class FakeGotenberg:
+    """2 instance giả qua httpx.MockTransport: mỗi host trả theo kịch bản riêng"""
+
+    def __init__(self):
+        self.behaviour = {"gotenberg-1": 200, "gotenberg-2": 200}
+        self.calls = []
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        host = request.url.host
+        self.calls.append(host)
+        assert request.url.path == "/forms/libreoffice/convert"
+        outcome = self.behaviour[host]
+        if isinstance(outcome, Exception):
+            raise outcome
+        if outcome == 200:
+            return httpx.Response(200, content=PDF)
+        return httpx.Response(outcome, text=f"{host} error {outcome}")
+
+
+@pytest.fixture
+def gotenberg(monkeypatch):
+    fake = FakeGotenberg()
+    client = httpx.AsyncClient(transport=httpx.MockTransport(fake.handler))
+    monkeypatch.setattr(gotenberg_client, "get_http_client", lambda name: client)
+    return fake
+
+
+@pytest.fixture
+def docx(tmp_path):
+    path = tmp_path / "report.docx"
+    path.write_bytes(b"PK fake docx")
+    return path
+
+
+def make_pool(failure_threshold=1, cooldown_seconds=60.0) -> GotenbergPool:
+    return GotenbergPool(URLS, failure_threshold=failure_threshold, cooldown_seconds=cooldown_seconds)
+
+
+def convert(pool: GotenbergPool, docx, output_path):
+    return asyncio.run(pool.convert_office(docx, output_path, "application/msword", timeout=5.0))
+
+
+def test_converts_on_healthy_instance(gotenberg, docx, tmp_path):
+    output_path = tmp_path / "out.pdf"
+
+    assert convert(make_pool(), docx, output_path) == output_path
+    assert output_path.read_bytes() == PDF
+    assert len(gotenberg.calls) == 1
+
+
+@pytest.mark.parametrize("failure", [httpx.ConnectError("refused"), 502, 503, 504])
+def test_instance_failure_fails_over(gotenberg, docx, tmp_path, failure):
+    pool = make_pool()
+    gotenberg.behaviour["gotenberg-1"] = failure
+    output_path = tmp_path / "out.pdf"
+
+    # Pool mới xoay vòng từ instance đầu tiên
+    assert convert(pool, docx, output_path).read_bytes() == PDF
+    assert gotenberg.calls == ["gotenberg-1", "gotenberg-2"]
+
+    # gotenberg-1 đang cooldown → request sau đi thẳng tới gotenberg-2
+    convert(pool, docx, output_path)
+    assert gotenberg.calls == ["gotenberg-1", "gotenberg-2", "gotenberg-2"]
+
+
+@pytest.mark.parametrize("status_code", [400, 404, 500])
+def test_conversion_error_does_not_fail_over(gotenberg, docx, tmp_path, status_code):
+    pool = make_pool()
+    gotenberg.behaviour = {"gotenberg-1": status_code, "gotenberg-2": status_code}
+    output_path = tmp_path / "out.pdf"
+
+    with pytest.raises(HTTPException) as error:
+        convert(pool, docx, output_path)
+
+    assert str(status_code) in error.value.detail
+    assert len(gotenberg.calls) == 1
+    assert not output_path.exists()
+    # File hỏng không phải lỗi instance → không bị đánh dấu down
+    assert all(instance["healthy"] and instance["consecutive_failures"] == 0 for instance in pool.status())
+
+
+def test_failure_threshold_before_cooldown(gotenberg, docx, tmp_path):
+    pool = make_pool(failure_threshold=2)
+    gotenberg.behaviour["gotenberg-1"] = httpx.ConnectError("refused")
+    gotenberg.behaviour["gotenberg-2"] = 503
+
+    with pytest.raises(httpx.ConnectError):
+        convert(pool, docx, tmp_path / "out.pdf")
+    # 1 lỗi / instance < threshold → vẫn healthy
+    assert [instance["healthy"] for instance in pool.status()] == [True, True]
+
+    with pytest.raises(httpx.ConnectError):
+        convert(pool, docx, tmp_path / "out.pdf")
+    assert [instance["healthy"] for instance in pool.status()] == [False, False]
+
+    # Tất cả đang cooldown → lỗi ngay, không gọi instance nào
+    calls = len(gotenberg.calls)
+    with pytest.raises(httpx.ConnectError, match="cooling down"):
+        convert(pool, docx, tmp_path / "out.pdf")
+    assert len(gotenberg.calls) == calls
+
+
+def test_half_open_after_cooldown(gotenberg, docx, tmp_path):
+    pool = make_pool(failure_threshold=2, cooldown_seconds=0.05)
+    gotenberg.behaviour["gotenberg-1"] = httpx.ConnectError("refused")
+    gotenberg.behaviour["gotenberg-2"] = httpx.ConnectError("refused")
+
+    for _ in range(2):
+        with pytest.raises(httpx.ConnectError):
+            convert(pool, docx, tmp_path / "out.pdf")
+    assert not any(instance["healthy"] for instance in pool.status())
+
+    # Hết cooldown: instance được thử lại; lỗi tiếp → cooldown lại ngay sau 1 lỗi (không chờ đủ threshold)
+    time.sleep(0.06)
+    gotenberg.calls.clear()
+    with pytest.raises(httpx.ConnectError):
+        convert(pool, docx, tmp_path / "out.pdf")
+    assert sorted(gotenberg.calls) == ["gotenberg-1", "gotenberg-2"]
+    assert not any(instance["healthy"] for instance in pool.status())
+
+    # gotenberg-2 sống lại → request half-open thành công, bộ đếm lỗi reset
+    time.sleep(0.06)
+    gotenberg.behaviour["gotenberg-2"] = 200
+    assert convert(pool, docx, tmp_path / "out.pdf").read_bytes() == PDF
+    recovered = {instance["url"]: instance for instance in pool.status()}[URLS[1]]
+    assert recovered["healthy"] and recovered["consecutive_failures"] == 0
@@ -0,0 +1,277 @@
+"""
+Test background jobs - FileJobStore compare-and-set, hủy job, hoàn quota 1 lần, phục hồi sau restart
+
+Run: pytest backend/tests/test_jobs.py -v
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.core.config import settings
+from app.jobs import queue, tasks
+from app.jobs.queue import (
+    JobStatus,
+    cancel_job,
+    create_job,
+    get_job_store,
+    job_dir,
+    purge_expired_jobs,
+    recover_local_jobs,
+    refund_job_quota,
+    update_job,
+)
+from app.models.auth_models import User
+
+
+class RecordingQueue:
+    """Queue giả: chỉ ghi lại job được submit / cancel, execute_job được gọi trực tiếp trong test"""
+
+    def __init__(self):
+        self.submitted = []
+        self.cancelled = []
+
+    def submit(self, job_id: str) -> None:
+        self.submitted.append(job_id)
+
+    def cancel(self, job_id: str) -> None:
+        self.cancelled.append(job_id)
+
+
+@pytest.fixture
+def job_queue(tmp_path, monkeypatch, session_factory):
+    monkeypatch.setattr(settings, "JOB_DIR", str(tmp_path / "jobs"))
+    monkeypatch.setattr(settings, "JOB_QUEUE_BACKEND", "local")
+    monkeypatch.setattr(queue, "_job_store", queue.FileJobStore())
+    recording = RecordingQueue()
+    monkeypatch.setattr(queue, "_job_queue", recording)
+    # Worker + fail_job mở session riêng → trỏ về SQLite của test
+    monkeypatch.setattr(tasks, "SessionLocal", session_factory)
+    monkeypatch.setattr("app.core.database.SessionLocal", session_factory)
+    monkeypatch.setattr(tasks, "_get_doc_service", lambda: None)
+    return recording
+
+
+@pytest.fixture
+def user(db):
+    user = User(username="alice", email="alice@example.com", hashed_password="x", ai_usage_this_month=5)
+    db.add(user)
+    db.commit()
+    return user
+
+
+def usage(session_factory, user_id: int) -> int:
+    session = session_factory()
+    try:
+        return session.get(User, user_id).ai_usage_this_month
+    finally:
+        session.close()
+
+
+def submit(job_type="test", user_id=None, refund_quota=False):
+    job_id = queue.new_job_id()
+    input_path = job_dir(job_id) / "input.pdf"
+    input_path.parent.mkdir(parents=True)
+    input_path.write_bytes(b"%PDF-1.4")
+    return create_job(
+        job_type, user_id=user_id, input_path=input_path, input_filename="report.pdf",
+        params={"refund_quota": refund_quota}, job_id=job_id
+    )
+
+
+def use_handler(monkeypatch, handler):
+    monkeypatch.setitem(tasks.JOB_HANDLERS, "test", handler)
+
+
+async def write_result(service, job, input_path, out_dir, db, progress):
+    progress(50, "half way")
+    result_path = out_dir / "result.txt"
+    result_path.write_text("done")
+    return {"path": result_path, "filename": "result.txt", "media_type": "text/plain", "metadata": None}
+
+
+def test_create_job_is_queued_and_submitted(job_queue):
+    job = submit()
+
+    assert job_queue.submitted == [job["id"]]
+    stored = get_job_store().get(job["id"])
+    assert stored["status"] == JobStatus.QUEUED.value
+    assert stored["refunded"] is False and stored["attempts"] == 0
+
+
+def test_update_job_compare_and_set(job_queue):
+    job = submit()
+
+    assert update_job(job["id"], expected_status={JobStatus.RUNNING.value}, progress=50) is None
+    assert get_job_store().get(job["id"])["progress"] == 0
+
+    updated = update_job(job["id"], expected_status={JobStatus.QUEUED.value}, progress=10)
+    assert updated["progress"] == 10
+    assert get_job_store().get(job["id"])["progress"] == 10
+    assert update_job("missing", progress=1) is None
+
+
+def test_concurrent_updates_are_not_lost(job_queue):
+    job = submit()
+
+    def bump(_):
+        get_job_store().modify(job["id"], lambda current: current.update(progress=current["progress"] + 1) or True)
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(bump, range(40)))
+    assert get_job_store().get(job["id"])["progress"] == 40
+
+
+def test_job_succeeds(job_queue, monkeypatch):
+    use_handler(monkeypatch, write_result)
+    job = submit()
+
+    assert tasks.execute_job(job["id"]) == JobStatus.SUCCEEDED.value
+    stored = get_job_store().get(job["id"])
+    assert stored["status"] == JobStatus.SUCCEEDED.value
+    assert stored["progress"] == 100 and stored["attempts"] == 1
+    assert (job_dir(job["id"]) / "result.txt").read_text() == "done"
+    assert not os.path.exists(job["input_path"])
+
+
+def test_cancelled_queued_job_never_runs(job_queue, monkeypatch):
+    calls = []
+
+    async def handler(*args):
+        calls.append(args)
+
+    use_handler(monkeypatch, handler)
+    job = submit()
+
+    assert cancel_job(job["id"])["status"] == JobStatus.CANCELLED.value
+    assert job_queue.cancelled == [job["id"]]
+    assert tasks.execute_job(job["id"]) == JobStatus.CANCELLED.value
+    assert calls == []
+    assert get_job_store().get(job["id"])["started_at"] is None
+
+
+def test_cancel_while_running_discards_result_and_refunds(job_queue, monkeypatch, session_factory, user):
+    async def cancelled_mid_run(service, job, input_path, out_dir, db, progress):
+        cancel_job(job["id"])
+        # Tick progress sau khi bị hủy không được ghi đè CANCELLED
+        progress(80, "still going")
+        return await write_result(service, job, input_path, out_dir, db, progress)
+
+    use_handler(monkeypatch, cancelled_mid_run)
+    job = submit(user_id=user.id, refund_quota=True)
+
+    assert tasks.execute_job(job["id"]) == JobStatus.CANCELLED.value
+    stored = get_job_store().get(job["id"])
+    assert stored["status"] == JobStatus.CANCELLED.value
+    assert stored["progress"] == 5
+    assert stored["result_path"] is None
+    assert not (job_dir(job["id"]) / "result.txt").exists()
+    assert stored["refunded"] is True
+    assert usage(session_factory, user.id) == 4
+
+
+def test_cancel_finished_job_keeps_status(job_queue, monkeypatch):
+    use_handler(monkeypatch, write_result)
+    job = submit()
+    tasks.execute_job(job["id"])
+
+    assert cancel_job(job["id"])["status"] == JobStatus.SUCCEEDED.value
+    assert job_queue.cancelled == []
+
+
+def test_failed_job_refunds_quota(job_queue, monkeypatch, session_factory, user):
+    async def broken(*args):
+        raise ValueError("boom")
+
+    use_handler(monkeypatch, broken)
+    job = submit(user_id=user.id, refund_quota=True)
+
+    assert tasks.execute_job(job["id"]) == JobStatus.FAILED.value
+    stored = get_job_store().get(job["id"])
+    assert stored["error"] == "boom"
+    assert stored["refunded"] is True
+    assert usage(session_factory, user.id) == 4
+
+
+def test_refund_job_quota_runs_once(job_queue, session_factory, user):
+    job = submit(user_id=user.id, refund_quota=True)
+    barrier = threading.Barrier(8)
+
+    def refund(_):
+        barrier.wait()
+        session = session_factory()
+        try:
+            return refund_job_quota(job["id"], session)
+        finally:
+            session.close()
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(refund, range(8)))
+
+    assert results.count(True) == 1
+    assert usage(session_factory, user.id) == 4
+
+
+def test_refund_job_quota_skips_jobs_without_reservation(job_queue, db, session_factory, user):
+    job = submit(user_id=user.id, refund_quota=False)
+
+    assert refund_job_quota(job["id"], db) is False
+    assert usage(session_factory, user.id) == 5
+
+
+def test_redelivered_task_reclaims_running_job(job_queue, monkeypatch):
+    use_handler(monkeypatch, write_result)
+    job = submit()
+    # Lần chạy đầu: worker chết sau khi nhận job
+    update_job(job["id"], status=JobStatus.RUNNING.value, attempts=1)
+
+    assert tasks.execute_job(job["id"]) == JobStatus.RUNNING.value  # Message thường: bỏ qua
+    assert tasks.execute_job(job["id"], redelivered=True) == JobStatus.SUCCEEDED.value
+    assert get_job_store().get(job["id"])["attempts"] == 2
+
+
+def test_redelivered_job_fails_after_max_attempts(job_queue, monkeypatch, session_factory, user):
+    use_handler(monkeypatch, write_result)
+    job = submit(user_id=user.id, refund_quota=True)
+    update_job(job["id"], status=JobStatus.RUNNING.value, attempts=settings.JOB_MAX_ATTEMPTS)
+
+    assert tasks.execute_job(job["id"], redelivered=True) == JobStatus.FAILED.value
+    stored = get_job_store().get(job["id"])
+    assert "Worker stopped" in stored["error"]
+    assert stored["refunded"] is True
+    assert usage(session_factory, user.id) == 4
+
+
+def test_recover_local_jobs_after_restart(job_queue, session_factory, user):
+    dead_pid = 2 ** 22 + 1  # Lớn hơn pid_max mặc định → không có process nào
+    queued = submit()
+    running = submit(user_id=user.id, refund_quota=True)
+    other_worker = submit()
+    update_job(queued["id"], owner_pid=dead_pid)
+    update_job(running["id"], status=JobStatus.RUNNING.value, owner_pid=dead_pid)
+    update_job(other_worker["id"], owner_pid=os.getppid())
+    job_queue.submitted.clear()
+
+    assert recover_local_jobs() == {"requeued": 1, "failed": 1}
+    assert job_queue.submitted == [queued["id"]]
+    assert get_job_store().get(queued["id"])["owner_pid"] == os.getpid()
+    assert get_job_store().get(other_worker["id"])["status"] == JobStatus.QUEUED.value
+
+    failed = get_job_store().get(running["id"])
+    assert failed["status"] == JobStatus.FAILED.value
+    assert failed["refunded"] is True
+    assert usage(session_factory, user.id) == 4
+
+
+def test_purge_expired_jobs(job_queue, monkeypatch):
+    monkeypatch.setattr(settings, "JOB_RESULT_TTL_HOURS", 1)
+    old, fresh = submit(), submit()
+    expired = time.time() - 2 * 3600
+    os.utime(job_dir(old["id"]), (expired, expired))
+
+    assert purge_expired_jobs() == 1
+    assert not job_dir(old["id"]).exists()
+    assert get_job_store().get(old["id"]) is None
+    assert get_job_store().get(fresh["id"]) is not None
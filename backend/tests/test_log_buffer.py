@@ -0,0 +1,177 @@
+"""
+Test LogBuffer - gom batch usage/audit log, cộng dồn quota Gemini, ghi trực tiếp khi hàng đợi đầy
+
+Run: pytest backend/tests/test_log_buffer.py -v
+"""
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.orm import sessionmaker
+
+from app.core.database import Base
+from app.models.auth_models import ActivityLog
+from app.models.gemini_keys import GeminiAPIKey, GeminiKeyQuota, GeminiKeyUsageLog, QuotaType
+from app.services.log_buffer import LogBuffer
+
+LOG_TABLES = ("activity_logs", "gemini_api_keys", "gemini_key_quotas", "gemini_key_usage_log")
+
+
+@pytest.fixture
+def engine(session_factory):
+    engine = session_factory.kw["bind"]
+    Base.metadata.create_all(bind=engine, tables=[Base.metadata.tables[name] for name in LOG_TABLES])
+    return engine
+
+
+@pytest.fixture
+def make_buffer():
+    buffers = []
+
+    def make(enabled=True, max_size=100, batch_size=100, flush_seconds=60.0):
+        # Factory không bind database nào: record phải đi theo bind của session request
+        buffer = LogBuffer(enabled, max_size, batch_size, flush_seconds, session_factory=sessionmaker())
+        buffers.append(buffer)
+        return buffer
+
+    yield make
+    for buffer in buffers:
+        buffer.stop()
+
+
+def activity(action="login"):
+    return {"user_id": None, "action": action, "resource_type": "user"}
+
+
+def count(session_factory, model) -> int:
+    session = session_factory()
+    try:
+        return session.query(model).count()
+    finally:
+        session.close()
+
+
+def count_commits(engine) -> list:
+    commits = []
+    event.listen(engine, "commit", lambda conn: commits.append(conn))
+    return commits
+
+
+def test_disabled_writes_through_callers_session(engine, db, session_factory, make_buffer):
+    buffer = make_buffer(enabled=False)
+
+    buffer.add(ActivityLog, activity(), db=db)
+
+    assert count(session_factory, ActivityLog) == 1
+    assert buffer._thread is None
+
+
+def test_enabled_defers_and_writes_one_transaction(engine, db, session_factory, make_buffer):
+    buffer = make_buffer()
+    for index in range(5):
+        buffer.add(ActivityLog, activity(f"action_{index}"), db=db)
+    assert count(session_factory, ActivityLog) == 0
+
+    commits = count_commits(engine)
+    assert buffer.flush() == 5
+    assert len(commits) == 1
+
+    session = session_factory()
+    try:
+        rows = session.query(ActivityLog).order_by(ActivityLog.id).all()
+        assert [row.action for row in rows] == [f"action_{index}" for index in range(5)]
+        # created_at = lúc add, không phải lúc flush
+        assert all(row.created_at is not None for row in rows)
+    finally:
+        session.close()
+
+
+def test_flush_splits_by_batch_size(engine, db, session_factory, make_buffer, monkeypatch):
+    buffer = make_buffer(batch_size=2)
+    # Không start thread nền: kiểm tra đúng số transaction của flush()
+    monkeypatch.setattr(buffer, "_ensure_started", lambda: None)
+    for _ in range(5):
+        buffer.add(ActivityLog, activity(), db=db)
+
+    commits = count_commits(engine)
+    assert buffer.flush() == 5
+    assert len(commits) == 3
+    assert count(session_factory, ActivityLog) == 5
+
+
+def test_full_queue_writes_synchronously(engine, db, session_factory, make_buffer):
+    buffer = make_buffer(max_size=1)
+
+    buffer.add(ActivityLog, activity("queued"), db=db)
+    buffer.add(ActivityLog, activity("overflow"), db=db)
+
+    session = session_factory()
+    try:
+        assert [row.action for row in session.query(ActivityLog)] == ["overflow"]
+    finally:
+        session.close()
+    assert buffer.flush() == 1
+    assert count(session_factory, ActivityLog) == 2
+
+
+def test_bad_record_does_not_drop_batch(engine, db, session_factory, make_buffer):
+    buffer = make_buffer()
+    buffer.add(ActivityLog, activity("ok_1"), db=db)
+    buffer.add(ActivityLog, {"user_id": None, "action": None, "resource_type": "user"}, db=db)  # NOT NULL
+    buffer.add(ActivityLog, activity("ok_2"), db=db)
+
+    assert buffer.flush() == 3
+    session = session_factory()
+    try:
+        assert sorted(row.action for row in session.query(ActivityLog)) == ["ok_1", "ok_2"]
+    finally:
+        session.close()
+
+
+def test_gemini_quota_aggregated_per_key(engine, db, session_factory, make_buffer):
+    key = GeminiAPIKey(key_name="primary", api_key_encrypted="x")
+    db.add(key)
+    db.flush()
+    reset_at = datetime.utcnow() + timedelta(days=30)
+    for quota_type in (QuotaType.MONTHLY, QuotaType.DAILY):
+        db.add(GeminiKeyQuota(
+            key_id=key.id, quota_type=quota_type, quota_limit=10_000,
+            quota_used=1_000, quota_remaining=9_000, reset_at=reset_at
+        ))
+    db.commit()
+
+    buffer = make_buffer()
+    for tokens in (100, 200, 300):
+        buffer.add(GeminiKeyUsageLog, {"key_id": key.id, "model": "gemini-2.5-flash", "total_tokens": tokens}, db=db)
+        buffer.add_gemini_quota(key.id, tokens, db=db)
+
+    quota_updates = []
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def record(conn, cursor, statement, *args):
+        if statement.startswith("UPDATE gemini_key_quotas"):
+            quota_updates.append(statement)
+
+    buffer.flush()
+    event.remove(engine, "before_cursor_execute", record)
+
+    assert len(quota_updates) == 1  # 3 lần dùng → 1 UPDATE cho cả monthly + daily
+    session = session_factory()
+    try:
+        quotas = session.query(GeminiKeyQuota).filter(GeminiKeyQuota.key_id == key.id).all()
+        assert {(quota.quota_used, quota.quota_remaining) for quota in quotas} == {(1_600, 8_400)}
+        assert session.get(GeminiAPIKey, key.id).last_used_at is not None
+        assert session.query(GeminiKeyUsageLog).count() == 3
+    finally:
+        session.close()
+
+
+def test_stop_flushes_and_writes_later_records_directly(engine, db, session_factory, make_buffer):
+    buffer = make_buffer()
+    buffer.add(ActivityLog, activity("before_stop"), db=db)
+
+    buffer.stop()
+    assert count(session_factory, ActivityLog) == 1
+
+    buffer.add(ActivityLog, activity("after_stop"), db=db)
+    assert count(session_factory, ActivityLog) == 2
@@ -0,0 +1,135 @@
+"""
+Test PageFanout - kết quả đúng thứ tự trang, retry theo loại lỗi, hủy worker còn lại khi 1 trang lỗi
+
+Run: pytest backend/tests/test_page_fanout.py -v
+"""
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from app.services.page_fanout import PageFanout
+
+
+def make_fanout(claude=4, per_key=4, retries=2) -> PageFanout:
+    return PageFanout(
+        provider_limits={"claude": claude, "gemini": claude},
+        per_key_limit=per_key,
+        retries=retries,
+        retry_backoff_seconds=0,
+    )
+
+
+async def render(page_index: int) -> bytes:
+    return f"png-{page_index}".encode()
+
+
+def test_results_follow_page_indices_order():
+    page_indices = [7, 2, 5, 0, 9]
+
+    async def ocr_page(page_index, image):
+        # Trang đầu xong sau cùng
+        await asyncio.sleep(0.01 * (10 - page_index))
+        return {"page": page_index, "image": image}
+
+    results = asyncio.run(make_fanout().run("claude", "key", page_indices, render, ocr_page))
+
+    assert [result["page"] for result in results] == page_indices
+    assert [result["image"] for result in results] == [f"png-{index}".encode() for index in page_indices]
+
+
+def test_concurrency_limited_by_per_key_limit():
+    in_flight = []
+    peak = []
+
+    async def ocr_page(page_index, image):
+        in_flight.append(page_index)
+        peak.append(len(in_flight))
+        await asyncio.sleep(0.01)
+        in_flight.remove(page_index)
+        return {"page": page_index}
+
+    asyncio.run(make_fanout(claude=8, per_key=2).run("claude", "key", range(6), render, ocr_page))
+
+    assert max(peak) == 2
+
+
+@pytest.mark.parametrize("error", [HTTPException(503, "overloaded"), HTTPException(429, "rate limit"), TimeoutError()])
+def test_transient_errors_are_retried(error):
+    calls = []
+
+    async def ocr_page(page_index, image):
+        calls.append(page_index)
+        if len(calls) < 3:
+            raise error
+        return {"page": page_index}
+
+    results = asyncio.run(make_fanout(retries=2).run("claude", "key", [0], render, ocr_page))
+
+    assert results == [{"page": 0}]
+    assert len(calls) == 3
+
+
+@pytest.mark.parametrize("status_code", [400, 401, 413])
+def test_client_errors_are_not_retried(status_code):
+    calls = []
+
+    async def ocr_page(page_index, image):
+        calls.append(page_index)
+        raise HTTPException(status_code, "bad input")
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(make_fanout(retries=3).run("claude", "key", [0], render, ocr_page))
+
+    assert error.value.status_code == status_code
+    assert calls == [0]
+
+
+def test_retries_exhausted_raises_500():
+    calls = []
+
+    async def ocr_page(page_index, image):
+        calls.append(page_index)
+        raise HTTPException(502, "bad gateway")
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(make_fanout(retries=2).run("claude", "key", [4], render, ocr_page))
+
+    assert error.value.status_code == 500
+    assert "trang 5" in error.value.detail
+    assert len(calls) == 3
+
+
+def test_failed_page_cancels_remaining_workers():
+    started = []
+    cancelled = []
+    rendered = []
+
+    async def render_page(page_index):
+        rendered.append(page_index)
+        return await render(page_index)
+
+    async def ocr_page(page_index, image):
+        started.append(page_index)
+        if page_index == 0:
+            await asyncio.sleep(0.01)
+            raise HTTPException(400, "unreadable page")
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(page_index)
+            raise
+        return {"page": page_index}
+
+    async def scenario():
+        with pytest.raises(HTTPException):
+            await make_fanout(claude=3, per_key=3).run("claude", "key", range(20), render_page, ocr_page)
+        # Khi run() raise, không worker nào còn gọi provider
+        return list(cancelled)
+
+    cancelled_when_raised = asyncio.run(scenario())
+
+    assert sorted(started) == [0, 1, 2]
+    assert sorted(cancelled_when_raised) == [1, 2]
+    # Producer cũng dừng: chỉ render trước tối đa `workers` trang
+    assert len(rendered) <= 3 + 3 + 1
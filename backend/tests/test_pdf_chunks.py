@@ -0,0 +1,77 @@
+"""
+Test pdf_chunks - cắt PDF thành chunk + nối text các chunk
+
+Run: pytest backend/tests/test_pdf_chunks.py -v
+"""
+import asyncio
+
+from app.services.pdf_chunks import (
+    TABLE_HEADER_TAG,
+    PdfChunk,
+    run_chunks,
+    split_pdf_chunks,
+    stitch_chunk_texts,
+)
+
+
+def test_stitch_paragraphs_separated_by_blank_line():
+    assert stitch_chunk_texts(["Đoạn một.", "Đoạn hai."]) == "Đoạn một.\n\nĐoạn hai."
+
+
+def test_stitch_skips_empty_chunks():
+    assert stitch_chunk_texts(["", "  ", None, "Nội dung.", "\n"]) == "Nội dung."
+    assert stitch_chunk_texts([]) == ""
+
+
+def test_stitch_joins_sentence_broken_across_chunks():
+    texts = ["Căn cứ quyết định số 12 của", "ủy ban nhân dân tỉnh.\n\nĐiều 1."]
+    assert stitch_chunk_texts(texts) == "Căn cứ quyết định số 12 của ủy ban nhân dân tỉnh.\n\nĐiều 1."
+
+
+def test_stitch_does_not_join_after_sentence_end_or_uppercase():
+    assert stitch_chunk_texts(["Hết câu:", "tiếp theo"]) == "Hết câu:\n\ntiếp theo"
+    assert stitch_chunk_texts(["Chưa hết câu", "Tiêu đề mới"]) == "Chưa hết câu\n\nTiêu đề mới"
+
+
+def test_stitch_continues_table_and_drops_repeated_header():
+    header = f"{TABLE_HEADER_TAG}| STT | Họ tên |"
+    texts = [
+        f"Danh sách\n\n{header}\n| 1 | An |",
+        f"{header}\n| 2 | Bình |\n\nKết thúc.",
+    ]
+
+    assert stitch_chunk_texts(texts) == f"Danh sách\n\n{header}\n| 1 | An |\n| 2 | Bình |\n\nKết thúc."
+
+
+def test_stitch_keeps_different_header_of_new_table():
+    first = f"{TABLE_HEADER_TAG}| STT | Họ tên |\n| 1 | An |"
+    second = f"{TABLE_HEADER_TAG}| Mã | Giá |\n| A | 10 |"
+
+    assert stitch_chunk_texts([first, second]) == f"{first}\n{second}"
+
+
+def test_split_pdf_chunks(tmp_path):
+    from pypdf import PdfReader, PdfWriter
+
+    source = tmp_path / "doc.pdf"
+    writer = PdfWriter()
+    for _ in range(7):
+        writer.add_blank_page(width=595, height=842)
+    with open(source, "wb") as f:
+        writer.write(f)
+
+    chunks = split_pdf_chunks(source, chunk_pages=3, out_dir=tmp_path / "chunks")
+
+    assert [(c.start_page, c.end_page, c.total_pages) for c in chunks] == [(1, 3, 7), (4, 6, 7), (7, 7, 7)]
+    assert [len(PdfReader(str(c.path)).pages) for c in chunks] == [3, 3, 1]
+
+
+def test_run_chunks_keeps_chunk_order(tmp_path):
+    chunks = [PdfChunk(i, tmp_path / f"{i}.pdf", i + 1, i + 1, 4) for i in range(4)]
+
+    async def worker(chunk):
+        # Chunk sau xong trước
+        await asyncio.sleep(0.01 * (4 - chunk.index))
+        return chunk.index
+
+    assert asyncio.run(run_chunks(chunks, worker, concurrency=4)) == [0, 1, 2, 3]
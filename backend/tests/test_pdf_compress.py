@@ -0,0 +1,201 @@
+"""
+Test pdf_compress - downsample / JPEG / CCITT G4, bỏ qua ảnh không hỗ trợ, gộp ảnh trùng, target size
+
+Run: pytest backend/tests/test_pdf_compress.py -v
+"""
+import io
+import random
+
+import pytest
+
+pypdf = pytest.importorskip("pypdf")
+pdfium = pytest.importorskip("pypdfium2")
+from PIL import Image, ImageChops, ImageDraw, ImageStat, features  # noqa: E402
+
+from app.services import pdf_compress  # noqa: E402
+from app.services.pdf_compress import (  # noqa: E402
+    PRESETS,
+    TARGET_SIZE_LADDER,
+    EncodedImage,
+    compress_pdf_images,
+)
+
+
+def text_scan(width=1654, height=2339, seed=1) -> Image.Image:
+    """Scan xám A4 @200dpi: các "từ" gần đen trên nền trắng"""
+    rnd = random.Random(seed)
+    image = Image.new("L", (width, height), 255)
+    draw = ImageDraw.Draw(image)
+    for y in range(150, height - 150, 60):
+        x = 150
+        while x < width - 200:
+            word = rnd.randint(20, 90)
+            draw.rectangle([x, y, x + word, y + 30], fill=rnd.randint(0, 40))
+            x += word + rnd.randint(15, 30)
+    return image
+
+
+def photo(width=1200, height=900, seed=2) -> Image.Image:
+    """Ảnh màu chi tiết (JPEG không nén thêm được nhiều ở cùng DPI)"""
+    rnd = random.Random(seed)
+    image = Image.new("RGB", (width, height))
+    draw = ImageDraw.Draw(image)
+    for _ in range(400):
+        x, y = rnd.randrange(width), rnd.randrange(height)
+        draw.ellipse([x, y, x + rnd.randint(10, 120), y + rnd.randint(10, 120)],
+                     fill=(rnd.randrange(256), rnd.randrange(256), rnd.randrange(256)))
+    return image
+
+
+def pdf_bytes(*images, resolution=200.0, quality=95) -> bytes:
+    buffer = io.BytesIO()
+    images[0].save(buffer, format="PDF", save_all=True, append_images=list(images[1:]),
+                   resolution=resolution, quality=quality)
+    return buffer.getvalue()
+
+
+def write_pages(reader) -> bytes:
+    writer = pypdf.PdfWriter()
+    for page in reader.pages:
+        writer.add_page(page)
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+
+def render_gray(data: bytes, width: int) -> Image.Image:
+    pdf = pdfium.PdfDocument(data)
+    try:
+        page = pdf[0]
+        scale = width / page.get_width()
+        return page.render(scale=scale).to_pil().convert("L").resize((width, round(page.get_height() * scale)))
+    finally:
+        pdf.close()
+
+
+def page_image(reader, page_index=0):
+    xobjects = reader.pages[page_index]["/Resources"]["/XObject"]
+    return next(iter(xobjects.values()))
+
+
+@pytest.mark.skipif(not features.check("libtiff"), reason="Pillow built without libtiff (G4)")
+def test_gray_text_scan_becomes_g4_with_correct_polarity():
+    source = pdf_bytes(text_scan())
+    reader = pypdf.PdfReader(io.BytesIO(source))
+
+    stats = compress_pdf_images(reader.pages, quality="low")
+    output = write_pages(reader)
+
+    image = page_image(pypdf.PdfReader(io.BytesIO(output))).get_object()
+    assert stats.recompressed == 1
+    assert image["/Filter"] == "/CCITTFaxDecode"
+    assert image["/BitsPerComponent"] == 1
+    assert image["/DecodeParms"]["/BlackIs1"].value is True
+    assert len(output) < len(source) / 5
+
+    # /BlackIs1 sai → trang bị đảo màu (chênh lệch trung bình ~200)
+    before, after = render_gray(source, 600), render_gray(output, 600)
+    assert ImageStat.Stat(ImageChops.difference(before, after)).mean[0] < 20
+    assert ImageStat.Stat(after).mean[0] > 180  # Nền vẫn trắng
+
+
+def test_color_image_downsampled_to_preset_dpi():
+    # 1200px trên trang 3 inch = 400 DPI → medium (150 DPI) = 450px
+    source = pdf_bytes(photo(), resolution=400.0)
+    reader = pypdf.PdfReader(io.BytesIO(source))
+
+    stats = compress_pdf_images(reader.pages, quality="medium")
+
+    image = page_image(reader).get_object()
+    assert stats.recompressed == 1
+    assert stats.preset == PRESETS["medium"]
+    assert image["/Filter"] == "/DCTDecode"
+    assert (image["/Width"], image["/Height"]) == (450, 338)
+    assert stats.bytes_after < stats.bytes_before
+
+
+def test_images_with_smask_or_indexed_colors_are_kept():
+    palette = Image.new("P", (400, 400))
+    palette.putpalette([value % 256 for value in range(768)])
+    ImageDraw.Draw(palette).rectangle([50, 50, 350, 350], fill=7)
+    reader = pypdf.PdfReader(io.BytesIO(pdf_bytes(photo(), palette, resolution=400.0)))
+
+    # Ảnh màu có alpha (SMask) → không được đổi (mất trong suốt / lệch màu)
+    masked = page_image(reader, 0).get_object()
+    masked[pypdf.generic.NameObject("/SMask")] = page_image(reader, 0)
+    indexed = page_image(reader, 1).get_object()
+    originals = (masked._data, indexed._data)
+
+    stats = compress_pdf_images(reader.pages, quality="low")
+
+    assert stats.images == 2
+    assert stats.recompressed == 0
+    assert (masked._data, indexed._data) == originals
+    assert indexed["/ColorSpace"][0] == "/Indexed"
+
+
+def test_duplicate_images_are_rewired_to_one_object():
+    scan = text_scan(seed=3)
+    source = pdf_bytes(scan, scan.copy(), scan.copy())
+    reader = pypdf.PdfReader(io.BytesIO(source))
+    assert len({page_image(reader, index).idnum for index in range(3)}) == 3
+
+    stats = compress_pdf_images(reader.pages, quality="high")
+    output = pypdf.PdfReader(io.BytesIO(write_pages(reader)))
+
+    assert stats.images == 1
+    assert stats.duplicates_removed == 2
+    assert len({page_image(output, index).idnum for index in range(3)}) == 1
+    assert len(write_pages(reader)) < len(source) / 2
+
+
+def test_small_images_are_skipped():
+    reader = pypdf.PdfReader(io.BytesIO(pdf_bytes(Image.new("RGB", (64, 64), "red"), resolution=20.0)))
+
+    stats = compress_pdf_images(reader.pages, quality="low")
+
+    assert stats.images == 1
+    assert stats.recompressed == 0
+
+
+def test_target_size_stops_at_first_preset_that_fits(monkeypatch):
+    reader = pypdf.PdfReader(io.BytesIO(pdf_bytes(photo(), photo(seed=4))))
+    sizes = {preset: 10_000 * (len(TARGET_SIZE_LADDER) - rank) for rank, preset in enumerate(TARGET_SIZE_LADDER)}
+    tried = []
+
+    def fake_encode_all(jobs, preset):
+        tried.append(preset)
+        return [
+            EncodedImage(data=b"x" * sizes[preset], filter="/DCTDecode", decode_parms=None,
+                         width=job.width, height=job.height, bits=8)
+            for job in jobs
+        ]
+
+    monkeypatch.setattr(pdf_compress, "_encode_all", fake_encode_all)
+    images = [page_image(reader, index).get_object() for index in range(2)]
+    image_bytes = sum(len(image._data) for image in images)
+    # Vừa đủ cho preset thứ 3 (mỗi ảnh còn 40 KB), không đủ cho preset thứ 2 (50 KB)
+    target = 1_000_000 - image_bytes + 2 * sizes[TARGET_SIZE_LADDER[2]]
+
+    stats = compress_pdf_images(reader.pages, target_size=target, base_size=1_000_000)
+
+    assert tried == TARGET_SIZE_LADDER[:3]
+    assert stats.preset == TARGET_SIZE_LADDER[2]
+    assert stats.estimated_size == target
+    assert all(len(image._data) == sizes[TARGET_SIZE_LADDER[2]] for image in images)
+
+
+def test_target_size_uses_strongest_preset_when_nothing_fits(monkeypatch):
+    reader = pypdf.PdfReader(io.BytesIO(pdf_bytes(photo())))
+    tried = []
+
+    def fake_encode_all(jobs, preset):
+        tried.append(preset)
+        return [None for _ in jobs]
+
+    monkeypatch.setattr(pdf_compress, "_encode_all", fake_encode_all)
+    stats = compress_pdf_images(reader.pages, target_size=1, base_size=1_000_000)
+
+    assert tried == TARGET_SIZE_LADDER
+    assert stats.preset == TARGET_SIZE_LADDER[-1]
+    assert stats.recompressed == 0
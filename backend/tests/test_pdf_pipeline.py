@@ -0,0 +1,88 @@
+"""
+Test pdf_pipeline - parse/validate danh sách thao tác + chạy pipeline 1 lần đọc/ghi
+
+Run: pytest backend/tests/test_pdf_pipeline.py -v
+"""
+import pytest
+
+from app.services.pdf_pipeline import (
+    CompressOp,
+    PageNumbersOp,
+    ProtectOp,
+    RotateOp,
+    WatermarkOp,
+    parse_pipeline,
+    run_pdf_pipeline,
+)
+
+
+def test_parse_pipeline_builds_operations_in_order():
+    operations = parse_pipeline([
+        {"op": "watermark", "text": "MẬT", "position": "top-left", "opacity": 0.5},
+        {"op": "page_numbers", "format": "Trang {page}/{total}"},
+        {"op": "rotate", "rotation": 90, "pages": [1, "3", 3]},
+        {"op": "compress", "quality": "low", "target_size_kb": 512},
+        {"op": "protect", "user_password": "1234"},
+    ])
+
+    assert operations == [
+        WatermarkOp(text="MẬT", position="top-left", opacity=0.5),
+        PageNumbersOp(format="Trang {page}/{total}"),
+        RotateOp(rotation=90, pages=frozenset({1, 3})),
+        CompressOp(quality="low", target_size_kb=512),
+        ProtectOp(user_password="1234"),
+    ]
+
+
+def test_parse_pipeline_defaults():
+    assert parse_pipeline([{"op": "rotate"}]) == [RotateOp(rotation=90, pages=None)]
+
+
+@pytest.mark.parametrize("raw, message", [
+    (None, "danh sách"),
+    ([], "danh sách"),
+    ({"op": "rotate"}, "danh sách"),
+    (["rotate"], "Bước 1: cần object"),
+    ([{"rotation": 90}], "Bước 1: cần object"),
+    ([{"op": "rotate"}, {"op": "ocr"}], "Bước 2: op 'ocr' không hỗ trợ"),
+    ([{"op": "rotate", "angle": 90}], "tham số không hợp lệ angle"),
+    ([{"op": "rotate", "rotation": 45}], "rotation phải là"),
+    ([{"op": "watermark"}], r"Bước 1 \(watermark\): .*missing"),
+    ([{"op": "watermark", "text": ""}], "text không được rỗng"),
+    ([{"op": "watermark", "text": "A", "position": "middle"}], "position phải là"),
+    ([{"op": "watermark", "text": "A", "opacity": 1.5}], "opacity"),
+    ([{"op": "page_numbers", "position": "center"}], "position phải là"),
+    ([{"op": "compress", "quality": "ultra"}], "quality phải là"),
+    ([{"op": "compress", "target_size_kb": 0}], "target_size_kb phải > 0"),
+    ([{"op": "protect", "user_password": ""}], "user_password không được rỗng"),
+    ([{"op": "protect", "user_password": "1"}, {"op": "rotate"}], "protect phải là bước cuối"),
+])
+def test_parse_pipeline_rejects_invalid(raw, message):
+    with pytest.raises(ValueError, match=message):
+        parse_pipeline(raw)
+
+
+def test_run_pdf_pipeline(tmp_path):
+    pypdf = pytest.importorskip("pypdf")
+    pytest.importorskip("reportlab")
+
+    source = tmp_path / "input.pdf"
+    writer = pypdf.PdfWriter()
+    for _ in range(3):
+        writer.add_blank_page(width=595, height=842)
+    with open(source, "wb") as f:
+        writer.write(f)
+
+    output = tmp_path / "output.pdf"
+    operations = parse_pipeline([
+        {"op": "rotate", "rotation": 90, "pages": [2]},
+        {"op": "page_numbers", "format": "Trang {page}/{total}"},
+        {"op": "watermark", "text": "NHAP"},
+    ])
+
+    assert run_pdf_pipeline(source, output, operations) == 3
+
+    reader = pypdf.PdfReader(str(output))
+    assert [page.rotation for page in reader.pages] == [0, 90, 0]
+    assert "Trang 2/3" in reader.pages[1].extract_text()
+    assert "NHAP" in reader.pages[2].extract_text()
@@ -0,0 +1,120 @@
+"""
+Test pdf_tables - trích bảng trên page process pool → Excel write-only (NamedStyle) / ZIP CSV
+
+Run: pytest backend/tests/test_pdf_tables.py -v
+"""
+import csv
+import io
+import zipfile
+
+import pytest
+
+pytest.importorskip("pdfplumber")
+openpyxl = pytest.importorskip("openpyxl")
+pytest.importorskip("reportlab")
+from reportlab.lib import colors  # noqa: E402
+from reportlab.lib.pagesizes import A4  # noqa: E402
+from reportlab.lib.styles import getSampleStyleSheet  # noqa: E402
+from reportlab.platypus import PageBreak, Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle  # noqa: E402
+
+from app.services import pdf_tables  # noqa: E402
+from app.services.page_workers import PageProcessPool  # noqa: E402
+from app.services.pdf_tables import (  # noqa: E402
+    STYLE_CELL,
+    STYLE_HEADER,
+    STYLE_TITLE,
+    pdf_tables_to_archive,
+    pdf_tables_to_xlsx,
+)
+
+REVENUE = [["Quarter", "Revenue", "Cost"], ["Q1", "100", "60"], ["Q2", "120", "70"]]
+STAFF = [["Name", "Role"], ["An", "Dev"], ["Binh", "QA"]]
+OFFICES = [["City", "Staff"], ["Hanoi", "12"], ["Da Nang", "5"]]
+
+
+def grid_table(rows) -> Table:
+    table = Table(rows, colWidths=120)
+    table.setStyle(TableStyle([("GRID", (0, 0), (-1, -1), 0.5, colors.black)]))
+    return table
+
+
+@pytest.fixture
+def report_pdf(tmp_path):
+    """4 trang: bảng / chỉ text / 2 bảng / trang trắng"""
+    path = tmp_path / "report.pdf"
+    styles = getSampleStyleSheet()
+    story = [
+        grid_table(REVENUE), PageBreak(),
+        Paragraph("Annual summary without any table", styles["Normal"]), PageBreak(),
+        grid_table(STAFF), Spacer(1, 60), grid_table(OFFICES), PageBreak(),
+        Spacer(1, 1),
+    ]
+    SimpleDocTemplate(str(path), pagesize=A4).build(story)
+    return path
+
+
+@pytest.fixture(autouse=True)
+def page_pool(monkeypatch):
+    """Pool spawn riêng cho test (2 worker → các trang xong lệch thứ tự)"""
+    pool = PageProcessPool(2)
+    monkeypatch.setattr(pdf_tables, "get_page_pool", lambda: pool)
+    yield pool
+    if pool._pool is not None:
+        pool._pool.shutdown()
+
+
+def test_xlsx_sheets_and_named_styles(report_pdf, tmp_path):
+    output_path = tmp_path / "report.xlsx"
+
+    stats = pdf_tables_to_xlsx(report_pdf, output_path)
+
+    assert (stats.pages, stats.tables, stats.text_pages) == (4, 3, 1)
+    wb = openpyxl.load_workbook(output_path)
+    assert wb.sheetnames == ["Page 1", "Page 2 (Text)", "Page 3"]
+    assert {STYLE_TITLE, STYLE_HEADER, STYLE_CELL} <= set(wb.style_names)
+
+    page_1 = wb["Page 1"]
+    assert [[cell.value for cell in row] for row in page_1.iter_rows(max_row=3)] == REVENUE
+    assert all(cell.style == STYLE_HEADER for cell in page_1[1])
+    assert page_1["A1"].font.bold
+    assert all(cell.style == STYLE_CELL for row in page_1.iter_rows(min_row=2, max_row=3) for cell in row)
+
+    assert "Annual summary" in wb["Page 2 (Text)"]["A1"].value
+
+    # Nhiều bảng trên 1 trang → dòng tiêu đề "Table K" trước mỗi bảng
+    page_3 = wb["Page 3"]
+    titles = [row[0] for row in page_3.iter_rows() if row[0].value in ("Table 1", "Table 2")]
+    assert [cell.value for cell in titles] == ["Table 1", "Table 2"]
+    assert all(cell.style == STYLE_TITLE for cell in titles)
+    assert page_3.cell(row=titles[1].row + 1, column=1).value == "City"
+
+
+def test_csv_archive_entries(report_pdf, tmp_path):
+    output_path = tmp_path / "tables.zip"
+
+    stats = pdf_tables_to_archive(report_pdf, output_path, "csv")
+
+    assert stats.tables == 3
+    with zipfile.ZipFile(output_path) as archive:
+        assert archive.namelist() == ["page_1_table_1.csv", "page_3_table_1.csv", "page_3_table_2.csv"]
+        data = archive.read("page_3_table_2.csv")
+
+    assert data.startswith(b"\xef\xbb\xbf")  # BOM cho Excel
+    assert list(csv.reader(io.StringIO(data.decode("utf-8-sig")))) == OFFICES
+
+
+def test_archive_without_tables(tmp_path):
+    path = tmp_path / "text.pdf"
+    SimpleDocTemplate(str(path), pagesize=A4).build([Paragraph("Only text", getSampleStyleSheet()["Normal"])])
+    output_path = tmp_path / "tables.zip"
+
+    stats = pdf_tables_to_archive(path, output_path, "csv")
+
+    assert stats.tables == 0
+    with zipfile.ZipFile(output_path) as archive:
+        assert archive.namelist() == ["NO_TABLES.txt"]
+
+
+def test_unknown_archive_format(report_pdf, tmp_path):
+    with pytest.raises(ValueError, match="Unsupported table format"):
+        pdf_tables_to_archive(report_pdf, tmp_path / "tables.zip", "xlsx")
@@ -0,0 +1,166 @@
+"""
+Test QuotaService - giữ / hoàn lượt AI quota bằng UPDATE atomic
+
+Run: pytest backend/tests/test_quota_service.py -v
+"""
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+
+from app.models.auth_models import User
+from app.models.subscription import PlanType, Subscription, SubscriptionStatus
+from app.services.quota_service import QUOTA_PERIOD, QuotaService
+
+
+def make_user(db, quota=3, used=0, reset_date=None, username="alice") -> User:
+    user = User(
+        username=username,
+        email=f"{username}@example.com",
+        hashed_password="x",
+        ai_quota_monthly=quota,
+        ai_usage_this_month=used,
+        quota_reset_date=reset_date or datetime.utcnow() + timedelta(days=10),
+    )
+    db.add(user)
+    db.commit()
+    return user
+
+
+def make_subscription(db, user, plan=PlanType.INDIVIDUAL, limit=5, used=0, period_end=None) -> Subscription:
+    subscription = Subscription(
+        user_id=user.id,
+        plan_type=plan,
+        status=SubscriptionStatus.ACTIVE,
+        premium_requests_limit=limit,
+        premium_requests_used=used,
+        current_period_end=period_end or datetime.utcnow() + timedelta(days=20),
+    )
+    db.add(subscription)
+    db.commit()
+    return subscription
+
+
+def counters(db, user, subscription=None):
+    """(premium_requests_used, ai_usage_this_month) đọc lại từ DB"""
+    db.expire_all()
+    sub_used = db.get(Subscription, subscription.id).premium_requests_used if subscription else None
+    return sub_used, db.get(User, user.id).ai_usage_this_month
+
+
+def test_concurrent_reserve_stops_at_limit(db, session_factory):
+    user = make_user(db)
+    subscription = make_subscription(db, user, limit=5)
+    results = []
+    start = threading.Barrier(20)
+
+    def reserve():
+        session = session_factory()
+        try:
+            start.wait()
+            results.append(QuotaService.reserve_subscription_request(user.id, session))
+        finally:
+            session.close()
+
+    threads = [threading.Thread(target=reserve) for _ in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    reserved = [row for row in results if row is not None]
+    assert len(reserved) == 5
+    assert sorted(row.premium_requests_used for row in reserved) == [1, 2, 3, 4, 5]
+    assert counters(db, user, subscription) == (5, 0)
+
+
+@pytest.mark.parametrize("limit", [0, -1, None])
+def test_reserve_unlimited_subscription(db, limit):
+    user = make_user(db)
+    subscription = make_subscription(db, user, limit=limit, used=1000)
+
+    for _ in range(3):
+        assert QuotaService.reserve_subscription_request(user.id, db) is not None
+        info = QuotaService.check_ai_quota(user, db)
+        assert info["subscription_tier"] == "PRO"
+
+    assert counters(db, user, subscription) == (1006, 0)
+
+
+def test_reserve_expired_subscription_returns_none(db):
+    user = make_user(db)
+    make_subscription(db, user, period_end=datetime.utcnow() - timedelta(days=1))
+
+    assert QuotaService.reserve_subscription_request(user.id, db) is None
+
+
+def test_check_ai_quota_uses_paid_subscription(db):
+    user = make_user(db, quota=3, used=3)
+    subscription = make_subscription(db, user, limit=2)
+
+    assert QuotaService.check_ai_quota(user, db)["usage_this_month"] == 1
+    assert QuotaService.check_ai_quota(user, db)["remaining"] == 0
+    with pytest.raises(HTTPException) as exc:
+        QuotaService.check_ai_quota(user, db)
+    assert exc.value.status_code == 403
+    assert exc.value.detail["error_code"] == "QUOTA_EXCEEDED"
+    # Có paid subscription → counter legacy không bị đụng tới
+    assert counters(db, user, subscription) == (2, 3)
+
+
+def test_legacy_quota_exceeded(db):
+    user = make_user(db, quota=3, used=3)
+
+    with pytest.raises(HTTPException) as exc:
+        QuotaService.check_ai_quota(user, db)
+    assert exc.value.status_code == 403
+    assert counters(db, user) == (None, 3)
+
+
+def test_legacy_rollover_when_reset_date_passed(db):
+    user = make_user(db, quota=3, used=3, reset_date=datetime.utcnow() - timedelta(days=1))
+
+    before = datetime.utcnow()
+    info = QuotaService.check_ai_quota(user, db)
+
+    # Tháng mới: usage reset về 0 rồi +1 trong cùng câu UPDATE
+    assert info["usage_this_month"] == 1
+    assert info["remaining"] == 2
+    assert before + QUOTA_PERIOD <= info["reset_date"] <= datetime.utcnow() + QUOTA_PERIOD
+    assert counters(db, user) == (None, 1)
+
+
+def test_free_subscription_falls_through_to_legacy_counters(db):
+    user = make_user(db, quota=3, used=0)
+    subscription = make_subscription(db, user, plan=PlanType.FREE, limit=100)
+
+    for expected in (1, 2, 3):
+        assert QuotaService.check_ai_quota(user, db)["usage_this_month"] == expected
+    with pytest.raises(HTTPException):
+        QuotaService.check_ai_quota(user, db)
+
+    assert counters(db, user, subscription) == (0, 3)
+
+
+def test_refund_subscription_then_never_below_zero(db):
+    user = make_user(db, used=2)
+    subscription = make_subscription(db, user, limit=5, used=0)
+
+    QuotaService.check_ai_quota(user, db)
+    QuotaService.rollback_quota_increment(user, db)
+    assert counters(db, user, subscription) == (0, 2)
+
+    # Subscription đã về 0 → không âm, và không hoàn nhầm sang counter legacy
+    QuotaService.rollback_quota_increment(user, db)
+    assert counters(db, user, subscription) == (0, 2)
+
+
+def test_refund_legacy_never_below_zero(db):
+    user = make_user(db, used=0)
+
+    QuotaService.check_ai_quota(user, db)
+    QuotaService.rollback_quota_increment(user, db)
+    QuotaService.rollback_quota_increment(user, db)
+
+    assert counters(db, user) == (None, 0)
@@ -0,0 +1,188 @@
+"""
+Test ResultCache - key ổn định, LRU theo dung lượng, lookup_hash hit/miss, không cache file dự phòng của PDF → Word
+
+Run: pytest backend/tests/test_result_cache.py -v
+"""
+import asyncio
+import io
+import os
+import time
+from pathlib import Path
+
+import pytest
+from starlette.datastructures import Headers, UploadFile
+
+from app.core.config import settings
+from app.services import result_cache
+from app.services.result_cache import ResultCache, lookup_hash, store_bytes
+
+INPUT_HASH = "ab" * 32
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ResultCache(tmp_path / "cache", max_bytes=1024 * 1024)
+
+
+@pytest.fixture
+def shared_cache(tmp_path, monkeypatch):
+    """Bật cache dùng chung (get_result_cache) trỏ về tmp_path"""
+    monkeypatch.setattr(settings, "RESULT_CACHE_ENABLED", True)
+    monkeypatch.setattr(settings, "RESULT_CACHE_DIR", str(tmp_path / "shared"))
+    monkeypatch.setattr(settings, "RESULT_CACHE_REDIS_INDEX", False)
+    monkeypatch.setattr(result_cache, "_result_cache", None)
+    yield
+    result_cache._result_cache = None
+
+
+def age(cache: ResultCache, key: str, seconds_ago: float) -> None:
+    """Đặt mtime meta.json (thứ tự LRU) không phụ thuộc độ phân giải đồng hồ"""
+    stamp = time.time() - seconds_ago
+    os.utime(result_cache._entry_dir(cache.root, key) / result_cache.META_NAME, (stamp, stamp))
+
+
+def test_make_key_ignores_param_order_and_none():
+    key = ResultCache.make_key(INPUT_HASH, "pdf_to_word", start_page=0, end_page=None, engine="gemini")
+
+    assert key == ResultCache.make_key(INPUT_HASH, "pdf_to_word", engine="gemini", start_page=0)
+    assert key == ResultCache.make_key(INPUT_HASH, "pdf_to_word", engine="gemini", end_page=None, start_page=0)
+
+
+@pytest.mark.parametrize("changed", [
+    {"input_hash": "cd" * 32},
+    {"operation": "pdf_to_excel"},
+    {"engine": "pdf2docx"},
+    {"start_page": 1},
+    {"end_page": 3},
+])
+def test_make_key_changes_with_any_param(changed):
+    base = {"input_hash": INPUT_HASH, "operation": "pdf_to_word", "engine": "gemini", "start_page": 0}
+
+    assert ResultCache.make_key(**{**base, **changed}) != ResultCache.make_key(**base)
+
+
+def test_put_and_get_round_trip(cache):
+    key = cache.make_key(INPUT_HASH, "ocr")
+    assert cache.get(key) is None
+
+    cache.put_bytes(key, b"payload", operation="ocr", cost_usd=0.0012,
+                    headers={"X-Technology-Engine": "gemini"})
+    hit = cache.get(key)
+
+    assert hit.path.read_bytes() == b"payload"
+    assert hit.meta["size"] == 7
+    headers = hit.response_headers()
+    assert headers["X-Cache"] == "HIT"
+    assert headers["X-Technology-Engine"] == "gemini"
+    assert headers["X-Cache-Saved-Cost-USD"] == "0.001200"
+
+
+def test_lru_eviction_keeps_recently_used_entries(tmp_path):
+    cache = ResultCache(tmp_path / "cache", max_bytes=250)
+    keys = [cache.make_key(INPUT_HASH, "ocr", page=page) for page in range(3)]
+    for rank, key in enumerate(keys[:2]):
+        cache.put_bytes(key, bytes(100), operation="ocr")
+        age(cache, key, seconds_ago=100 - rank)
+
+    # Hit → entry đầu (cũ nhất) thành mới dùng nhất
+    assert cache.get(keys[0]) is not None
+    cache.put_bytes(keys[2], bytes(100), operation="ocr")
+
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) is not None
+    assert cache.get(keys[2]) is not None
+    assert not result_cache._entry_dir(cache.root, keys[1]).exists()
+
+
+def test_entry_larger_than_cache_is_not_kept(tmp_path):
+    cache = ResultCache(tmp_path / "cache", max_bytes=50)
+    key = cache.make_key(INPUT_HASH, "ocr")
+
+    cache.put_bytes(key, bytes(100), operation="ocr")
+
+    assert cache.get(key) is None
+
+
+def test_lookup_hash_miss_then_hit(shared_cache):
+    async def scenario():
+        key, hit = await lookup_hash(INPUT_HASH, "ocr", language="vi")
+        assert hit is None
+        await store_bytes(key, b'{"text": "xin chao"}', operation="ocr")
+
+        again_key, again = await lookup_hash(INPUT_HASH, "ocr", language="vi")
+        _, other = await lookup_hash(INPUT_HASH, "ocr", language="en")
+        return key, again_key, again, other
+
+    key, again_key, again, other = asyncio.run(scenario())
+
+    assert again_key == key
+    assert again.path.read_bytes() == b'{"text": "xin chao"}'
+    assert other is None
+
+
+def test_lookup_hash_disabled(monkeypatch):
+    monkeypatch.setattr(settings, "RESULT_CACHE_ENABLED", False)
+
+    assert asyncio.run(lookup_hash(INPUT_HASH, "ocr")) == (None, None)
+    # store_* với key None (cache tắt) không làm gì
+    asyncio.run(store_bytes(None, b"ignored"))
+
+
+# ==================== PDF → WORD: fallback không được cache ====================
+
+@pytest.fixture
+def pdf_to_word(shared_cache, tmp_path, monkeypatch):
+    """Gọi endpoint convert_pdf_to_word với ingest + conversion giả, đếm số lần convert"""
+    from app.api.v1.endpoints import documents
+    from app.services.document_service import PdfToWordResult
+    from app.services.upload_ingest import IngestedUpload
+
+    service = documents.doc_service
+    conversions = []
+
+    async def ingest_upload(file):
+        path = tmp_path / f"upload_{len(conversions)}.pdf"
+        path.write_bytes(b"%PDF-1.4")
+        return IngestedUpload(path=path, filename=file.filename, size=8, sha256=INPUT_HASH, mime_type="application/pdf")
+
+    async def pdf_to_word_result(input_path, **kwargs):
+        output = tmp_path / f"result_{len(conversions)}.docx"
+        output.write_bytes(b"docx")
+        conversions.append(kwargs)
+        return engine_result(output)
+
+    engine_result = None
+    monkeypatch.setattr(service, "ingest_upload", ingest_upload)
+    monkeypatch.setattr(service, "pdf_to_word_result", pdf_to_word_result)
+
+    def convert(result_factory):
+        nonlocal engine_result
+        engine_result = lambda output: result_factory(PdfToWordResult, output)
+        upload = UploadFile(io.BytesIO(b"%PDF-1.4"), filename="report.pdf",
+                            headers=Headers({"content-type": "application/pdf"}))
+        return asyncio.run(documents.convert_pdf_to_word(
+            file=upload, start_page=0, end_page=None, enable_ocr=False, ocr_language="vi-VN",
+            auto_detect_scanned=True, use_gemini=True, gemini_model="gemini-2.5-flash", db=None
+        ))
+
+    convert.conversions = conversions
+    return convert
+
+
+def test_pdf_to_word_fallback_result_is_not_cached(pdf_to_word):
+    # Gemini lỗi → pdf2docx tạo file: không được lưu dưới key Gemini
+    first = pdf_to_word(lambda result, output: result(output, "pdf2docx", fallback=True))
+    assert first.headers["X-Cache"] == "MISS"
+    assert first.headers["X-Technology-Engine"] == "pdf2docx"
+
+    second = pdf_to_word(lambda result, output: result(output, "gemini"))
+    assert second.headers["X-Cache"] == "MISS"
+    assert second.headers["X-Technology-Engine"] == "gemini"
+    assert len(pdf_to_word.conversions) == 2
+
+    # Lần này Gemini thành công → được cache kèm header Gemini
+    third = pdf_to_word(lambda result, output: result(output, "pdf2docx", fallback=True))
+    assert third.headers["X-Cache"] == "HIT"
+    assert third.headers["X-Technology-Engine"] == "gemini"
+    assert Path(third.path).read_bytes() == b"docx"
+    assert len(pdf_to_word.conversions) == 2
@@ -0,0 +1,127 @@
+"""
+Test ZipStreamWriter - ZIP ghi thành chunk (non-seekable, data descriptor)
+
+Run: pytest backend/tests/test_zip_stream.py -v
+"""
+import asyncio
+import io
+import os
+import threading
+import zipfile
+
+from app.services.zip_stream import ZipStreamWriter
+
+
+def build_archive(writer: ZipStreamWriter, *parts) -> bytes:
+    chunks = []
+    for part in parts:
+        chunks.extend(part)
+    chunks.append(writer.close())
+    return b"".join(chunks)
+
+
+def test_archive_round_trip(tmp_path):
+    big = os.urandom(300 * 1024)
+    source = tmp_path / "scan.pdf"
+    source.write_bytes(big)
+    text = "Báo cáo tài chính quý 3\n".encode("utf-8") * 2000
+
+    writer = ZipStreamWriter(chunk_size=64 * 1024)
+    data = build_archive(
+        writer,
+        writer.write_file(source),
+        writer.write_bytes("báo_cáo.txt", text),
+        writer.write_bytes("empty.json", b""),
+    )
+
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        assert archive.testzip() is None  # CRC của mọi entry đúng
+        assert archive.namelist() == ["scan.pdf", "báo_cáo.txt", "empty.json"]
+        assert archive.read("scan.pdf") == big
+        assert archive.read("báo_cáo.txt") == text
+        assert archive.read("empty.json") == b""
+    assert writer.bytes_written == len(data)
+
+
+def test_large_file_is_streamed_in_chunks(tmp_path):
+    source = tmp_path / "big.bin"
+    source.write_bytes(os.urandom(1024 * 1024))
+
+    writer = ZipStreamWriter(chunk_size=64 * 1024)
+    chunks = list(writer.write_file(source))
+
+    # Không build cả file trong RAM: mỗi chunk ≈ chunk_size
+    assert len(chunks) >= 16
+    assert max(len(chunk) for chunk in chunks) <= 64 * 1024 + 1024
+
+
+def test_write_file_async_reads_off_the_event_loop(tmp_path, monkeypatch):
+    content = os.urandom(200 * 1024)
+    text = b"csv,row\n" * 20000
+    (tmp_path / "scan.pdf").write_bytes(content)
+    (tmp_path / "table.csv").write_bytes(text)
+
+    writer = ZipStreamWriter(chunk_size=64 * 1024)
+    copy_threads = set()
+    copy_block = writer._copy_block
+
+    def record_thread(source, dest):
+        copy_threads.add(threading.get_ident())
+        return copy_block(source, dest)
+
+    monkeypatch.setattr(writer, "_copy_block", record_thread)
+
+    async def stream():
+        chunks = []
+        for name in ("scan.pdf", "table.csv", "scan.pdf"):
+            async for chunk in writer.write_file_async(tmp_path / name):
+                chunks.append(chunk)
+        chunks.append(writer.close())
+        return threading.get_ident(), b"".join(chunks)
+
+    loop_thread, data = asyncio.run(stream())
+
+    assert copy_threads and loop_thread not in copy_threads
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        assert archive.testzip() is None
+        assert archive.namelist() == ["scan.pdf", "table.csv", "scan_2.pdf"]
+        assert archive.read("scan_2.pdf") == content
+        assert archive.read("table.csv") == text
+        assert archive.getinfo("table.csv").compress_type == zipfile.ZIP_DEFLATED
+    assert writer.bytes_written == len(data)
+
+
+def test_compress_type_by_extension(tmp_path):
+    writer = ZipStreamWriter()
+    data = build_archive(
+        writer,
+        writer.write_bytes("image.PNG", b"\x89PNG" + b"\0" * 1000),
+        writer.write_bytes("errors.json", b"{}" * 1000),
+    )
+
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        assert archive.getinfo("image.PNG").compress_type == zipfile.ZIP_STORED
+        assert archive.getinfo("errors.json").compress_type == zipfile.ZIP_DEFLATED
+
+
+def test_duplicate_names_are_renamed(tmp_path):
+    writer = ZipStreamWriter()
+    data = build_archive(
+        writer,
+        writer.write_bytes("report.pdf", b"1"),
+        writer.write_bytes("report.pdf", b"2"),
+        writer.write_bytes("dir/report.pdf", b"3"),
+        writer.write_bytes("report.pdf", b"4"),
+    )
+
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        assert archive.namelist() == ["report.pdf", "report_2.pdf", "dir/report.pdf", "report_3.pdf"]
+        assert archive.read("report_3.pdf") == b"4"
+
+
+def test_empty_archive():
+    writer = ZipStreamWriter()
+    data = writer.close()
+
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        assert archive.namelist() == []
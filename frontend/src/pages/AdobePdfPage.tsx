@@ -589,10 +589,11 @@ export default function AdobePdfPage() {
       setOcrResult(response.data);
       
       const processing = response.data.processing || {};
-      const pdfType = processing.pdf_type === 'text_based' ? 'Text-based' : 'Scanned';
-      const method = processing.method === 'direct_extraction' ? 'Trích xuất trực tiếp' : 'AI OCR';
+      const pdfType = processing.pdf_type === 'text_based' ? 'Text-based' : processing.pdf_type === 'mixed' ? 'Mixed' : 'Scanned';
+      const method = processing.method === 'direct_extraction' ? 'Trích xuất trực tiếp'
+        : processing.method === 'hybrid' ? `AI OCR ${processing.scanned_pages?.length || 0} trang scan` : 'AI OCR';
       
-      if (processing.method === 'ai_ocr') {
+      if (processing.method !== 'direct_extraction') {
         const aiUsage = response.data.ai_usage || {};
         toast.success(
           `✅ ${pdfType} PDF - ${method}\n` +
@@ -1480,7 +1481,7 @@ export default function AdobePdfPage() {
                 <div className="bg-gray-50 p-2 rounded">
                   <p className="text-gray-500">Loại PDF:</p>
                   <p className="font-semibold">
-                    {ocrResult.processing?.pdf_type === 'text_based' ? '📝 Text-based' : '🖼️ Scanned'}
+                    {ocrResult.processing?.pdf_type === 'text_based' ? '📝 Text-based' : ocrResult.processing?.pdf_type === 'mixed' ? '🧩 Mixed' : '🖼️ Scanned'}
                   </p>
                 </div>
                 <div className="bg-gray-50 p-2 rounded">